@@ -0,0 +1,167 @@
+"""Timing, command line handling and output shared by the benchmarks.
+
+The benchmarks are run as scripts, so this module is imported from the
+``benchmarks`` directory that Python puts on the path for them.
+"""
+
+import argparse
+import time
+import tracemalloc
+from collections.abc import Callable, Iterable
+from functools import partial
+from typing import TypeVar
+
+from mehtap.execution import ExecutionEngine
+from mehtap.parser import parse_chunk
+from mehtap.vm import VirtualMachine
+
+T = TypeVar("T")
+
+
+def parse_args(
+    doc: str,
+    *,
+    repeat: int | None = 3,
+    engines: bool = True,
+    **counts: int,
+) -> argparse.Namespace:
+    """Parse the command line of a benchmark.
+
+    :param doc: The docstring of the benchmark,
+                whose first line describes it in ``--help``.
+    :param repeat: The default of ``--repeat N``,
+                   or :data:`None` if the benchmark runs only once.
+    :param engines: Whether the benchmark takes ``--engine ENGINE`` options.
+                    The selected engines are stored in ``engines``,
+                    all engines if none are given.
+    :param counts: Integer options of the benchmark and their defaults,
+                   such as ``calls=100_000`` for ``--calls N``.
+    """
+    arg_parser = argparse.ArgumentParser(description=doc.splitlines()[0])
+    for name, default in counts.items():
+        arg_parser.add_argument(f"--{name}", type=int, default=default)
+    if repeat is not None:
+        arg_parser.add_argument("--repeat", type=int, default=repeat)
+    if engines:
+        arg_parser.add_argument(
+            "--engine",
+            action="append",
+            choices=[engine.value for engine in ExecutionEngine],
+        )
+    args = arg_parser.parse_args()
+    if engines:
+        args.engines = (
+            [ExecutionEngine(value) for value in args.engine]
+            if args.engine
+            else list(ExecutionEngine)
+        )
+    return args
+
+
+def best_time(prepare: Callable[[], Callable[[], T]], repeat: int) \
+        -> tuple[float, T]:
+    """Time a call several times.
+
+    :param prepare: Called before every timed call, without being timed.
+                    Returns the function to time.
+    :return: The shortest time a call took
+             and the result of the last call.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        run = prepare()
+        start = time.perf_counter()
+        result = run()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def run_script(
+    engine: ExecutionEngine,
+    source: str,
+    repeat: int,
+    *,
+    optimize: bool = True,
+) -> tuple[float, list]:
+    """Time a script, running it in a new virtual machine every time.
+
+    :return: The shortest time the script took and what it returned.
+    """
+    chunk = parse_chunk(source, filename="<benchmark>", optimize=optimize)
+    return best_time(
+        lambda: partial(
+            VirtualMachine(engine=engine, optimize=optimize)
+            .root_scope._exec_chunk,
+            chunk,
+        ),
+        repeat,
+    )
+
+
+def check_results(name: str, results: Iterable[object]) -> None:
+    """
+    :raises AssertionError: if the results of a benchmark differ.
+    """
+    results = list(results)
+    if len({str(result) for result in results}) != 1:
+        raise AssertionError(f"{name}: results differ: {results}")
+
+
+def compare_engines(
+    name: str,
+    source: str,
+    engines: Iterable[ExecutionEngine],
+    repeat: int,
+    *,
+    optimize: bool = True,
+) -> list[float]:
+    """Time a script with each engine and check that they agree.
+
+    :return: The shortest time the script took with each engine.
+    """
+    timings, results = zip(*(
+        run_script(engine, source, repeat, optimize=optimize)
+        for engine in engines
+    ))
+    check_results(name, results)
+    return list(timings)
+
+
+def allocated(run: Callable[[], object]) -> tuple[int, int, int]:
+    """Trace the memory a call allocates.
+
+    :return: The number and total size of the memory blocks allocated by the
+             call that are still alive after it returned,
+             and the peak of the traced memory during the call.
+    """
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    result = run()
+    _, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    difference = after.compare_to(before, "filename")
+    del result
+    return (
+        sum(stat.count_diff for stat in difference),
+        sum(stat.size_diff for stat in difference),
+        peak,
+    )
+
+
+def milliseconds(seconds: float) -> str:
+    return f"{seconds * 1000:8.1f} ms"
+
+
+def rate(count: int, seconds: float, unit: str) -> str:
+    """
+    :return: How many thousands of ``unit`` happened per second,
+             such as ``"  812.3 kcall/s"``.
+    """
+    return f"{count / seconds / 1000:7.1f} k{unit}/s"
+
+
+def print_row(label: str, cells: Iterable[str], *, width: int) -> None:
+    """Print a row of a table, the cells aligned to the given width."""
+    print(f"{label:>12}  " + "  ".join(f"{cell:>{width}}" for cell in cells))
@@ -0,0 +1,73 @@
+"""Measure the memory allocated for the values of numeric loops.
+
+The scripts fill tables with small integers and booleans computed in loops
+and return the tables,
+so the values they hold are still alive when the script finishes.
+:mod:`tracemalloc` then counts the memory blocks that were allocated
+while the script ran and that are still alive,
+which is where sharing :class:`LuaNumber` and :class:`LuaBool` objects
+instead of creating new ones shows.
+
+Usage::
+
+    python benchmarks/allocations.py [--engine ENGINE ...]
+"""
+
+from functools import partial
+
+from _harness import allocated, parse_args, print_row
+from mehtap.execution import ExecutionEngine
+from mehtap.parser import parse_chunk
+from mehtap.vm import VirtualMachine
+
+ITERATIONS = 20000
+
+SCRIPTS = {
+    "integers": """
+        local t = {}
+        for i = 1, %d do
+            t[i] = i %% 256 * 2 + 1
+        end
+        return t
+    """ % ITERATIONS,
+    "booleans": """
+        local t = {}
+        for i = 1, %d do
+            t[i] = i %% 3 == 0 and i > 10
+        end
+        return t
+    """ % ITERATIONS,
+}
+
+
+def measure(engine: ExecutionEngine, source: str) -> tuple[int, int, int]:
+    """
+    :return: The number and total size of the memory blocks that are still
+             alive after the script ran, and the peak of the traced memory.
+    """
+    chunk = parse_chunk(source, filename="<benchmark>")
+    run = partial(VirtualMachine(engine=engine).root_scope._exec_chunk, chunk)
+    # Warm up, so that caches and lazily imported modules are not counted.
+    run()
+    return allocated(run)
+
+
+def main():
+    args = parse_args(__doc__, repeat=None)
+
+    print_row(
+        "script", ["engine", "live blocks", "live KiB", "peak KiB"], width=12
+    )
+    for name, source in SCRIPTS.items():
+        for engine in args.engines:
+            blocks, size, peak = measure(engine, source)
+            print_row(name, [
+                engine.value,
+                str(blocks),
+                f"{size / 1024:.1f}",
+                f"{peak / 1024:.1f}",
+            ], width=12)
+
+
+if __name__ == "__main__":
+    main()
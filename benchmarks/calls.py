@@ -0,0 +1,80 @@
+"""Measure the throughput of calls of Lua functions.
+
+The functions take no arguments, one argument, three arguments,
+or a variable number of arguments,
+and do next to nothing,
+so the time is spent entering and leaving them.
+The tree-walking interpreter is measured twice,
+once with the bodies of the functions compiled once they are hot,
+and once with them always interpreted.
+
+Usage::
+
+    python benchmarks/calls.py [--calls N] [--repeat N] [--engine ENGINE ...]
+"""
+
+import mehtap.source_compiler
+from _harness import check_results, parse_args, print_row, rate, run_script
+from mehtap.execution import ExecutionEngine
+
+SCRIPTS = {
+    "0 args": """
+        local function f() return 1 end
+        local n = 0
+        for i = 1, {calls} do n = n + f() end
+        return n
+    """,
+    "1 arg": """
+        local function f(a) return a end
+        local n = 0
+        for i = 1, {calls} do n = n + f(i) end
+        return n
+    """,
+    "3 args": """
+        local function f(a, b, c) return b end
+        local n = 0
+        for i = 1, {calls} do n = n + f(n, i, n) end
+        return n
+    """,
+    "variadic": """
+        local function f(...) local a, b = ... return b end
+        local n = 0
+        for i = 1, {calls} do n = n + f(n, i, n) end
+        return n
+    """,
+}
+
+
+def main():
+    args = parse_args(__doc__, calls=200_000)
+    # (column name, engine, whether hot functions are compiled)
+    columns = [(engine.value, engine, True) for engine in args.engines]
+    if ExecutionEngine.TREE_WALKING in args.engines:
+        columns.insert(1, ("interpreted", ExecutionEngine.TREE_WALKING, False))
+
+    hot_call_count = mehtap.source_compiler.HOT_CALL_COUNT
+    print(f"{args.calls} calls")
+    print_row("script", (name for name, _, _ in columns), width=15)
+    for name, source in SCRIPTS.items():
+        source = source.format(calls=args.calls)
+        timings = []
+        results = []
+        for _, engine, compiled in columns:
+            mehtap.source_compiler.HOT_CALL_COUNT = (
+                hot_call_count if compiled else float("inf")
+            )
+            # Calls of small functions would be inlined.
+            timing, result = run_script(
+                engine, source, args.repeat, optimize=False
+            )
+            timings.append(timing)
+            results.append(result)
+        mehtap.source_compiler.HOT_CALL_COUNT = hot_call_count
+        check_results(name, results)
+        print_row(name, (
+            rate(args.calls, timing, "call") for timing in timings
+        ), width=15)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Measure how much jump tables speed up long if/elseif chains.
+
+The script interprets a list of operations with an ``if`` statement that has
+an arm for each operation name,
+like the generated configuration scripts that this optimization is for.
+It is run with every engine,
+once with the conditions evaluated arm by arm
+and once with the jump table that the optimizer makes for the chain.
+See :class:`mehtap.ast_nodes.Dispatch`.
+
+Usage::
+
+    python benchmarks/dispatch.py [--arms N] [--repeat N]
+"""
+
+import mehtap.optimizer
+from _harness import check_results, milliseconds, parse_args, print_row, \
+    run_script
+from mehtap.execution import ExecutionEngine
+
+STEPS = 20000
+
+
+def script(arms: int) -> str:
+    chain = "\n        else".join(
+        f'if op == "op{i}" then acc = acc + {i}' for i in range(arms)
+    )
+    return f"""
+        local ops = {{}}
+        for i = 1, {arms} do ops[i] = "op" .. (i - 1) end
+        local acc = 0
+        for step = 1, {STEPS} do
+            local op = ops[step % {arms} + 1]
+            {chain}
+            else acc = -1 end
+        end
+        return acc
+    """
+
+
+def measure(source: str, engine: ExecutionEngine, min_dispatch_arms: float,
+            repeat: int) -> tuple[float, list]:
+    mehtap.optimizer.MIN_DISPATCH_ARMS = min_dispatch_arms
+    return run_script(engine, source, repeat)
+
+
+def main():
+    args = parse_args(__doc__, engines=False, arms=30)
+
+    min_dispatch_arms = mehtap.optimizer.MIN_DISPATCH_ARMS
+    source = script(args.arms)
+    print(f"{args.arms} arms, {STEPS} steps")
+    print_row("engine", ["arm by arm", "jump table", "speedup"], width=11)
+    for engine in ExecutionEngine:
+        chain, expected = measure(source, engine, float("inf"), args.repeat)
+        table, result = measure(source, engine, min_dispatch_arms,
+                                args.repeat)
+        check_results(engine.value, [expected, result])
+        print_row(engine.value, [
+            milliseconds(chain), milliseconds(table), f"{chain / table:4.1f}x"
+        ], width=11)
+    mehtap.optimizer.MIN_DISPATCH_ARMS = min_dispatch_arms
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Compare the run time of loop-heavy Lua scripts on the execution engines.
+
+Every script is parsed once and then run with each
+:class:`~mehtap.execution.ExecutionEngine`.
+
+Usage::
+
+    python benchmarks/engines.py [--repeat N] [--engine ENGINE ...]
+"""
+
+from _harness import compare_engines, milliseconds, parse_args, print_row
+
+SCRIPTS = {
+    "numeric for": """
+        local sum = 0
+        for i = 1, 200000 do
+            sum = sum + i % 7
+        end
+        return sum
+    """,
+    "while": """
+        local i, n = 0, 0
+        while i < 100000 do
+            if i % 3 == 0 then n = n + 1 elseif i % 3 == 1 then n = n - 1 end
+            i = i + 1
+        end
+        return n
+    """,
+    "calls": """
+        local function fib(n)
+            if n < 2 then return n end
+            return fib(n - 1) + fib(n - 2)
+        end
+        return fib(20)
+    """,
+    "tables": """
+        local t = {}
+        for i = 1, 50000 do t[i] = i * 2 end
+        local sum = 0
+        for i, v in ipairs(t) do sum = sum + v end
+        return sum
+    """,
+    "closures": """
+        local function counter()
+            local n = 0
+            return function() n = n + 1; return n end
+        end
+        local c = counter()
+        for i = 1, 50000 do c() end
+        return c()
+    """,
+}
+
+
+def main():
+    args = parse_args(__doc__)
+
+    print_row("script", (engine.value for engine in args.engines), width=17)
+    for name, source in SCRIPTS.items():
+        timings = compare_engines(name, source, args.engines, args.repeat)
+        print_row(name, (
+            f"{milliseconds(timing)} {timings[0] / timing:4.1f}x"
+            for timing in timings
+        ), width=17)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Measure how much compiling hot functions speeds up the tree-walking engine.
+
+Each script calls a small function many times,
+like a scoring function that is run for every item of a data set.
+It is run once with the bodies of hot functions compiled to Python,
+which is the default,
+and once with every function body interpreted.
+See :mod:`mehtap.source_compiler`.
+
+Usage::
+
+    python benchmarks/hot_functions.py [--repeat N]
+"""
+
+from functools import partial
+
+import mehtap.source_compiler
+from _harness import best_time, check_results, milliseconds, parse_args, \
+    print_row, rate
+from mehtap.execution import ExecutionEngine
+from mehtap.parser import parse_chunk
+from mehtap.vm import VirtualMachine
+
+SCRIPTS = {
+    # Name: (source, number of calls of the hot function)
+    "arithmetic": ("""
+        local function score(x, y)
+            local s = x * 3 + y // 2
+            if s % 2 == 0 then s = s - x else s = s + y end
+            return s
+        end
+        local total = 0
+        for i = 1, 30000 do total = total + score(i, 7) end
+        return total
+    """, 30000),
+    "fields": ("""
+        local weights = {price = 2, rating = 5}
+        local function score(item)
+            return item.price * weights.price + item.rating * weights.rating
+        end
+        local items = {}
+        for i = 1, 100 do items[i] = {price = i, rating = i % 5} end
+        local best = 0
+        for round = 1, 300 do
+            for i = 1, #items do
+                local s = score(items[i])
+                if s > best then best = s end
+            end
+        end
+        return best
+    """, 30000),
+    "loop": ("""
+        local function checksum(t)
+            local sum = 0
+            for i = 1, #t do sum = (sum * 31 + t[i]) % 1000003 end
+            return sum
+        end
+        local t = {}
+        for i = 1, 20 do t[i] = i end
+        local r = 0
+        for i = 1, 2000 do r = r + checksum(t) end
+        return r
+    """, 2000),
+    "recursion": ("""
+        local function fib(n)
+            if n < 2 then return n end
+            return fib(n - 1) + fib(n - 2)
+        end
+        return fib(20)
+    """, 21891),
+}
+
+
+def measure(source: str, repeat: int, hot_call_count: float) \
+        -> tuple[float, list]:
+    mehtap.source_compiler.HOT_CALL_COUNT = hot_call_count
+    return best_time(
+        # Parse again, so that every run starts interpreted.
+        lambda: partial(
+            VirtualMachine(engine=ExecutionEngine.TREE_WALKING)
+            .root_scope._exec_chunk,
+            parse_chunk(source, filename="<benchmark>"),
+        ),
+        repeat,
+    )
+
+
+def main():
+    args = parse_args(__doc__, engines=False)
+
+    hot_call_count = mehtap.source_compiler.HOT_CALL_COUNT
+    print_row("script", ["interpreted", "compiled"], width=33)
+    for name, (source, calls) in SCRIPTS.items():
+        interpreted, expected = measure(source, args.repeat, float("inf"))
+        compiled, result = measure(source, args.repeat, hot_call_count)
+        check_results(name, [expected, result])
+        print_row(name, [
+            f"{milliseconds(interpreted)} {rate(calls, interpreted, 'call')}",
+            f"{milliseconds(compiled)} {rate(calls, compiled, 'call')}"
+            f" {interpreted / compiled:4.1f}x",
+        ], width=33)
+    mehtap.source_compiler.HOT_CALL_COUNT = hot_call_count
+
+
+if __name__ == "__main__":
+    main()
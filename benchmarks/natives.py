@@ -0,0 +1,65 @@
+"""Measure the overhead of calls of functions of the standard library.
+
+The functions called are ``select``, ``type``, ``rawget`` and ``ipairs``,
+which do little work of their own,
+so the time is spent passing the arguments and the values they return.
+
+Usage::
+
+    python benchmarks/natives.py [--calls N] [--repeat N] [--engine ENGINE ...]
+"""
+
+from _harness import compare_engines, parse_args, print_row, rate
+
+SCRIPTS = {
+    "select #": """
+        local n = 0
+        for i = 1, {calls} do n = n + select("#", i, i) end
+        return n
+    """,
+    "select n": """
+        local n = 0
+        for i = 1, {calls} do n = n + select(2, i, i) end
+        return n
+    """,
+    "type": """
+        local n = 0
+        for i = 1, {calls} do
+            if type(i) == "number" then n = n + 1 end
+        end
+        return n
+    """,
+    "rawget": """
+        local t = {{1, 2, 3}}
+        local n = 0
+        for i = 1, {calls} do n = n + rawget(t, 2) end
+        return n
+    """,
+    "ipairs": """
+        local t = {{1, 2, 3}}
+        local n = 0
+        for i = 1, {calls} do
+            local f, s, c = ipairs(t)
+            n = n + c
+        end
+        return n
+    """,
+}
+
+
+def main():
+    args = parse_args(__doc__, calls=200_000)
+
+    print(f"{args.calls} calls")
+    print_row("script", (engine.value for engine in args.engines), width=15)
+    for name, source in SCRIPTS.items():
+        timings = compare_engines(
+            name, source.format(calls=args.calls), args.engines, args.repeat
+        )
+        print_row(name, (
+            rate(args.calls, timing, "call") for timing in timings
+        ), width=15)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Compare the parse throughput of the parser backends.
+
+Every ``.lua`` file of the ``tests/lua_by_example`` corpus is parsed into an
+abstract syntax tree with each :class:`~mehtap.parser.ParserBackend`.
+
+Usage::
+
+    python benchmarks/parse_throughput.py [--repeat N]
+"""
+
+from functools import partial
+from pathlib import Path
+
+from _harness import best_time, parse_args
+from mehtap.parser import ParserBackend, parse_chunk
+
+CORPUS = Path(__file__).parent.parent / "tests" / "lua_by_example"
+
+
+def load_corpus() -> list[tuple[str, str]]:
+    sources = []
+    for path in sorted(CORPUS.rglob("*.lua")):
+        source = path.read_text(encoding="utf-8")
+        if source.startswith("#"):
+            source = "--" + source
+        sources.append((path.name, source))
+    return sources
+
+
+def parse_all(
+    backend: ParserBackend, sources: list[tuple[str, str]]
+) -> None:
+    for name, source in sources:
+        parse_chunk(source, filename=name, backend=backend)
+
+
+def main():
+    args = parse_args(__doc__, repeat=5, engines=False)
+
+    sources = load_corpus()
+    total_bytes = sum(len(source.encode("utf-8")) for _, source in sources)
+    total_lines = sum(source.count("\n") + 1 for _, source in sources)
+    print(
+        f"corpus: {len(sources)} files, {total_lines} lines, "
+        f"{total_bytes} bytes"
+    )
+    results = {}
+    for backend in ParserBackend:
+        seconds, _ = best_time(
+            lambda: partial(parse_all, backend, sources), args.repeat
+        )
+        results[backend] = seconds
+        print(
+            f"{backend.value:>18}: {seconds * 1000:9.2f} ms  "
+            f"{total_lines / seconds:12.0f} lines/s  "
+            f"{total_bytes / seconds / 1024:10.1f} KiB/s"
+        )
+    speedup = (
+        results[ParserBackend.EARLEY]
+        / results[ParserBackend.RECURSIVE_DESCENT]
+    )
+    print(f"recursive-descent speedup over earley: {speedup:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
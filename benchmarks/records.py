@@ -0,0 +1,92 @@
+"""Measure the memory and the time it takes to make small record tables.
+
+The scripts make tables with a few string keys, like objects or structs,
+and return a list of them,
+so the tables are still alive when the script finishes.
+:mod:`tracemalloc` then counts the memory that was allocated while the
+script ran and that is still alive,
+which divided by the number of records is the size of one record
+(and of its entry in the list).
+Records with the same keys share a :class:`~mehtap.values.TableShape`,
+the record with a boolean key keeps its fields in a dictionary.
+
+Usage::
+
+    python benchmarks/records.py [--records N] [--repeat N] \\
+        [--engine ENGINE ...]
+"""
+
+from functools import partial
+
+from _harness import allocated, best_time, parse_args, print_row
+from mehtap.execution import ExecutionEngine
+from mehtap.parser import parse_chunk
+from mehtap.vm import VirtualMachine
+
+SCRIPTS = {
+    "3 fields": """
+        local t = {{}}
+        for i = 1, {records} do t[i] = {{x = i, y = i, name = "p"}} end
+        return t
+    """,
+    "8 fields": """
+        local t = {{}}
+        for i = 1, {records} do
+            t[i] = {{a = i, b = i, c = i, d = i, e = i, f = i, g = i, h = i}}
+        end
+        return t
+    """,
+    "assigned": """
+        local t = {{}}
+        for i = 1, {records} do
+            local p = {{}}
+            p.x = i
+            p.y = i
+            p.name = "p"
+            t[i] = p
+        end
+        return t
+    """,
+    "bool key": """
+        local t = {{}}
+        for i = 1, {records} do t[i] = {{x = i, y = i, [true] = "p"}} end
+        return t
+    """,
+}
+
+
+def measure(engine: ExecutionEngine, source: str, repeat: int) \
+        -> tuple[float, int]:
+    """
+    :return: The time the script took and the total size of the memory
+             blocks that are still alive after it ran.
+    """
+    chunk = parse_chunk(source, filename="<benchmark>")
+    run = partial(VirtualMachine(engine=engine).root_scope._exec_chunk, chunk)
+    # Warm up, so that caches and lazily imported modules are not counted.
+    run()
+    best, _ = best_time(lambda: run, repeat)
+    _, size, _ = allocated(run)
+    return best, size
+
+
+def main():
+    # Fewer records than there are cached small integers,
+    # so that the values of the fields don't take memory of their own.
+    args = parse_args(__doc__, records=20_000)
+
+    print(f"{args.records} records")
+    print_row("script", ["engine", "bytes/record", "krecord/s"], width=12)
+    for name, source in SCRIPTS.items():
+        source = source.format(records=args.records)
+        for engine in args.engines:
+            timing, size = measure(engine, source, args.repeat)
+            print_row(name, [
+                engine.value,
+                f"{size / args.records:.1f}",
+                f"{args.records / timing / 1000:.1f}",
+            ], width=12)
+
+
+if __name__ == "__main__":
+    main()
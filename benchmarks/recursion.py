@@ -0,0 +1,66 @@
+"""Measure the cost of recursive Lua function calls.
+
+Every call of these scripts returns through a ``return`` statement,
+and some of them leave loops with ``return`` or ``break``,
+so they are dominated by how calls and control transfers are implemented.
+
+Usage::
+
+    python benchmarks/recursion.py [--repeat N] [--engine ENGINE ...]
+"""
+
+from _harness import compare_engines, milliseconds, parse_args, print_row, rate
+
+SCRIPTS = {
+    # Name: (source, number of Lua function calls the script makes)
+    "fib": ("""
+        local function fib(n)
+            if n < 2 then return n end
+            return fib(n - 1) + fib(n - 2)
+        end
+        return fib(22)
+    """, 57313),
+    "ackermann": ("""
+        local function ack(m, n)
+            if m == 0 then return n + 1 end
+            if n == 0 then return ack(m - 1, 1) end
+            return ack(m - 1, ack(m, n - 1))
+        end
+        local r
+        for i = 1, 200 do r = ack(2, 10) end
+        return r
+    """, 200 * 275),
+    "early exit": ("""
+        local function find(t, x, depth)
+            if depth == 0 then
+                for i = 1, #t do
+                    if t[i] == x then return i end
+                end
+                return nil
+            end
+            local r = find(t, x, depth - 1)
+            while true do break end
+            return r
+        end
+        local t = {1, 2, 3, 4, 5}
+        local n = 0
+        for i = 1, 5000 do n = n + find(t, 3, 8) end
+        return n
+    """, 45000),
+}
+
+
+def main():
+    args = parse_args(__doc__)
+
+    print_row("script", (engine.value for engine in args.engines), width=27)
+    for name, (source, calls) in SCRIPTS.items():
+        timings = compare_engines(name, source, args.engines, args.repeat)
+        print_row(name, (
+            f"{milliseconds(timing)} {rate(calls, timing, 'call')}"
+            for timing in timings
+        ), width=27)
+
+
+if __name__ == "__main__":
+    main()
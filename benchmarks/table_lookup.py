@@ -0,0 +1,94 @@
+"""Measure the cost of looking up and assigning table fields.
+
+The first group of measurements calls :meth:`LuaTable.rawget` and
+:meth:`LuaTable.rawput` directly with string, integer and float keys that are
+stored in the hash part of the table,
+so it shows the cost of hashing and comparing keys without the overhead of
+an execution engine.
+The second group runs Lua scripts dominated by field accesses.
+
+Usage::
+
+    python benchmarks/table_lookup.py [--repeat N] [--engine ENGINE ...]
+"""
+
+from functools import partial
+
+from _harness import best_time, compare_engines, milliseconds, parse_args, \
+    print_row
+from mehtap.values import LuaTable, LuaString, LuaNumber
+
+KEY_COUNT = 1000
+ROUNDS = 100
+
+KEYS = {
+    "string": [LuaString(b"field%d" % i) for i in range(KEY_COUNT)],
+    "integer": [LuaNumber(-i) for i in range(KEY_COUNT)],
+    "float": [LuaNumber(i + 0.5) for i in range(KEY_COUNT)],
+}
+
+SCRIPTS = {
+    "fields": """
+        local point = {x = 1, y = 2, z = 3}
+        local sum = 0
+        for i = 1, 50000 do
+            sum = sum + point.x + point.y + point.z
+            point.x = point.y
+        end
+        return sum
+    """,
+    "string keys": """
+        local names = {}
+        for i = 1, 200 do names[i] = "key" .. i end
+        local t = {}
+        for round = 1, 50 do
+            for i = 1, #names do
+                local name = names[i]
+                t[name] = (t[name] or 0) + 1
+            end
+        end
+        return t.key200
+    """,
+}
+
+
+def measure_raw(keys: list, repeat: int) -> tuple[float, float]:
+    def put_all(table: LuaTable) -> None:
+        for _ in range(ROUNDS):
+            for key in keys:
+                table.rawput(key, key)
+
+    def get_all(table: LuaTable) -> None:
+        rawget = table.rawget
+        for _ in range(ROUNDS):
+            for key in keys:
+                rawget(key)
+
+    best_put, _ = best_time(lambda: partial(put_all, LuaTable()), repeat)
+    table = LuaTable()
+    put_all(table)
+    best_get, _ = best_time(lambda: partial(get_all, table), repeat)
+    return best_get, best_put
+
+
+def main():
+    args = parse_args(__doc__)
+
+    operations = KEY_COUNT * ROUNDS
+    print_row("keys", ["rawget", "rawput"], width=20)
+    for name, keys in KEYS.items():
+        get, put = measure_raw(keys, args.repeat)
+        print_row(name, [
+            f"{get * 1e9 / operations:8.1f} ns/lookup",
+            f"{put * 1e9 / operations:8.1f} ns/assign",
+        ], width=20)
+    print()
+
+    print_row("script", (engine.value for engine in args.engines), width=12)
+    for name, source in SCRIPTS.items():
+        timings = compare_engines(name, source, args.engines, args.repeat)
+        print_row(name, map(milliseconds, timings), width=12)
+
+
+if __name__ == "__main__":
+    main()
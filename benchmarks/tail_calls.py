@@ -0,0 +1,74 @@
+"""Measure tail calls a million deep and deep non-tail recursion.
+
+A tail call (``return f(x)``) doesn't grow the stack,
+so every engine runs these chains of tail calls in constant stack space.
+The non-tail recursion nests one call per level,
+as deep as :data:`mehtap.vm.DEFAULT_MAX_CALL_DEPTH` lets it.
+
+Usage::
+
+    python benchmarks/tail_calls.py [--depth N] [--repeat N] \\
+        [--engine ENGINE ...]
+"""
+
+from _harness import compare_engines, milliseconds, parse_args, print_row, rate
+from mehtap.vm import DEFAULT_MAX_CALL_DEPTH
+
+
+def scripts(depth: int) -> dict[str, tuple[str, int]]:
+    # Name: (source, number of Lua function calls the script makes)
+    nested = min(depth, DEFAULT_MAX_CALL_DEPTH - 1)
+    return {
+        "loop": (f"""
+            local function loop(n, acc)
+                if n == 0 then return acc end
+                return loop(n - 1, acc + n)
+            end
+            return loop({depth}, 0)
+        """, depth + 1),
+        "even/odd": (f"""
+            local is_even, is_odd
+            function is_even(n)
+                if n == 0 then return true end
+                return is_odd(n - 1)
+            end
+            function is_odd(n)
+                if n == 0 then return false end
+                return is_even(n - 1)
+            end
+            return is_even({depth})
+        """, depth + 1),
+        "method": (f"""
+            local counter = {{n = 0}}
+            function counter:count(n)
+                if n == 0 then return self.n end
+                self.n = self.n + 1
+                return self:count(n - 1)
+            end
+            return counter:count({depth})
+        """, depth + 1),
+        "non-tail": (f"""
+            local function sum(n)
+                if n == 0 then return 0 end
+                return n + sum(n - 1)
+            end
+            local r = sum({nested})
+            return r
+        """, nested + 1),
+    }
+
+
+def main():
+    args = parse_args(__doc__, repeat=1, depth=1_000_000)
+
+    print_row("script", (engine.value for engine in args.engines), width=27)
+    for name, (source, calls) in scripts(args.depth).items():
+        timings = compare_engines(name, source, args.engines, args.repeat)
+        print_row(name, (
+            f"{milliseconds(timing)} {rate(calls, timing, 'call')}"
+            for timing in timings
+        ), width=27)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Measure functions that pass their variable arguments along.
+
+Each script calls a variadic function with five arguments,
+which counts them with ``select('#', ...)``, reads them with
+``select(i, ...)``, puts them in a table with ``{...}`` or
+``table.pack(...)``, or returns them.
+
+Usage::
+
+    python benchmarks/varargs.py [--calls N] [--repeat N] [--engine ENGINE ...]
+"""
+
+from _harness import compare_engines, parse_args, print_row, rate
+
+SCRIPTS = {
+    "select #": """
+        local function count(...) return select("#", ...) end
+        local n = 0
+        for i = 1, {calls} do n = n + count(i, 2, 3, 4, 5) end
+        return n
+    """,
+    "select i": """
+        local function sum(...)
+            local s = 0
+            for i = 1, select("#", ...) do s = s + (select(i, ...)) end
+            return s
+        end
+        local n = 0
+        for i = 1, {calls} do n = n + sum(i, 2, 3, 4, 5) end
+        return n
+    """,
+    "{...}": """
+        local function pack(...) return {{...}} end
+        local n = 0
+        for i = 1, {calls} do n = n + #pack(i, 2, 3, 4, 5) end
+        return n
+    """,
+    "table.pack": """
+        local pack = table.pack
+        local n = 0
+        for i = 1, {calls} do n = n + pack(i, 2, 3, 4, 5).n end
+        return n
+    """,
+    "return ...": """
+        local function pass(...) return ... end
+        local n = 0
+        for i = 1, {calls} do
+            local a, b, c, d, e = pass(i, 2, 3, 4, 5)
+            n = n + e
+        end
+        return n
+    """,
+}
+
+
+def main():
+    args = parse_args(__doc__, calls=100_000)
+
+    print(f"{args.calls} calls")
+    print_row("script", (engine.value for engine in args.engines), width=15)
+    for name, source in SCRIPTS.items():
+        timings = compare_engines(
+            name,
+            source.format(calls=args.calls),
+            args.engines,
+            args.repeat,
+            # Calls of small functions would be inlined.
+            optimize=False,
+        )
+        print_row(name, (
+            rate(args.calls, timing, "call") for timing in timings
+        ), width=15)
+
+
+if __name__ == "__main__":
+    main()
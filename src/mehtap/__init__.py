@@ -10,6 +10,8 @@ __all__ = [
     "LuaNil",
     "LuaNumber",
     "LuaBool",
+    "LuaTrue",
+    "LuaFalse",
     "LuaString",
     "LuaTable",
     "LuaFunction",
@@ -24,6 +26,8 @@ from mehtap.values import (
     LuaNil,
     LuaNumber,
     LuaBool,
+    LuaTrue,
+    LuaFalse,
     LuaString,
     LuaTable,
     LuaFunction
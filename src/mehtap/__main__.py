@@ -1,4 +1,5 @@
 import argparse
+import functools
 import os
 import sys
 import traceback
@@ -14,9 +15,10 @@ from prompt_toolkit.validation import Validator, ValidationError, \
 
 from mehtap import __version__ as __version__
 from mehtap.control_structures import LuaError
+from mehtap.descent_parser import LuaSyntaxError
 from mehtap.library.stdlib.basic_library import basic_print
 from mehtap.operations import str_to_lua_string
-from mehtap.parser import repl_parser
+from mehtap.parser import get_parser
 from mehtap.vm import VirtualMachine
 from mehtap.values import LuaValue, LuaTable, LuaNumber, LuaString
 
@@ -91,9 +93,29 @@ def _main():
         action="store_true",
         help="show verbose traceback",
     )
+    arg_parser.add_argument(
+        "--no-optimize",
+        action="store_false",
+        help="don't fold constants when loading chunks",
+        dest="optimize",
+    )
+    arg_parser.add_argument(
+        "--translate",
+        metavar="file",
+        help="translate Lua file 'file' to a Python module",
+    )
+    arg_parser.add_argument(
+        "-o",
+        metavar="file",
+        help="write the translated module to 'file' instead of stdout",
+        dest="output",
+    )
 
     args = arg_parser.parse_args()
-    vm = VirtualMachine()
+    if args.translate:
+        translate(args.translate, args.output)
+        return
+    vm = VirtualMachine(optimize=args.optimize)
     vm.verbose_tb = bool(args.verbose)
 
     arg_table = LuaTable()
@@ -161,10 +183,30 @@ def _main():
         enter_interactive(vm)
 
 
+def translate(path: str, output_path: str | None) -> None:
+    from mehtap.module_translator import translate, translate_file
+
+    try:
+        if output_path is not None:
+            translate_file(path, output_path)
+        else:
+            with open(path, encoding="utf-8") as file:
+                source = file.read()
+            sys.stdout.write(
+                translate(source, filename=os.path.basename(path))
+            )
+    except OSError as e:
+        print(f"mehtap: {e}", file=sys.stderr)
+        sys.exit(1)
+    except LuaError as le:
+        print(f"mehtap: {le.message}", file=sys.stderr)
+        sys.exit(1)
+
+
 class MehtapValidator(Validator):
     def validate(self, document: Document) -> None:
         try:
-            repl_parser.parse(document.text)
+            get_parser("repl_input").parse(document.text)
         except lark.exceptions.UnexpectedEOF as e:
             raise ValidationError(
                 e.column,
@@ -182,14 +224,17 @@ class MehtapValidator(Validator):
             )
 
 
-terminal_patterns = {
-    d.name: d.pattern.value
-    for d in repl_parser.terminals
-    if d.pattern.type == "str"
-}
+@functools.cache
+def get_terminal_patterns() -> dict[str, str]:
+    return {
+        d.name: d.pattern.value
+        for d in get_parser("repl_input").terminals
+        if d.pattern.type == "str"
+    }
 
 
 def get_expected_terminals(tokens: Iterable[str]) -> str:
+    terminal_patterns = get_terminal_patterns()
     seen_tokens = []
     results = []
     for token in tokens:
@@ -270,10 +315,10 @@ def enter_interactive(vm: VirtualMachine) -> None:
         try:
             try:
                 return_value = vm.exec(line)
-            except lark.exceptions.UnexpectedInput as e:
+            except (lark.exceptions.UnexpectedInput, LuaSyntaxError) as e:
                 try:
                     return_value = vm.eval(line)
-                except lark.exceptions.UnexpectedInput:
+                except (lark.exceptions.UnexpectedInput, LuaSyntaxError):
                     continue
         except LuaError as lua_error:
             print_lua_error(lua_error, vm)
@@ -4,16 +4,20 @@ import enum
 import io
 import string
 from abc import ABC, abstractmethod
-from collections.abc import Sequence, Iterable, Callable
-from typing import TYPE_CHECKING, NoReturn
+from collections.abc import Sequence, Callable
+from typing import TYPE_CHECKING
 
 import attrs
 
 import mehtap.values as m_values
-from mehtap.control_structures import BreakException, GotoException, \
-    ReturnException, LuaError
+from mehtap.control_structures import BREAK, Completion, CompletionType, \
+    LuaError, TailCall
 from mehtap.values import (
     LuaNumber,
+    LuaTrue,
+    LuaFalse,
+    LuaNil,
+    lua_integer,
     LuaValue,
     LuaNumberType,
     LuaString,
@@ -25,24 +29,22 @@ from mehtap.operations import (
     int_wrap_overflow,
     str_to_lua_string,
     adjust,
-    coerce_to_bool,
     adjust_to_one,
     adjust_flatten,
 )
 import mehtap.operations as m_operations
 
 if TYPE_CHECKING:
+    from mehtap.operations import Multires
+    from mehtap.quickening import TypeFeedback
     from mehtap.scope import Scope
 
 
-def flatten(v: Iterable[LuaValue | Iterable[LuaValue]]) -> list[LuaValue]:
-    result = []
-    for elem in v:
-        if isinstance(elem, Iterable):
-            result.extend(flatten(elem))
-        else:
-            result.append(elem)
-    return result
+adaptive_handlers: dict[type[Node], Callable] = {}
+"""The handler that each kind of node that can be specialized starts with,
+by the class of the node.
+Filled in by :mod:`mehtap.quickening`.
+"""
 
 
 @attrs.define(slots=True)
@@ -70,15 +72,27 @@ class AbstractSyntaxTree:
 @attrs.define(slots=True)
 class Chunk(NonTerminal):
     block: Block
+    exported_locals: bool | None = attrs.field(
+        default=None, init=False, eq=False, repr=False
+    )
+    """Whether the names in the chunk were resolved for running it as a main
+    chunk, whose local variables are also put in the scope it runs in,
+    or :data:`None` if they weren't resolved yet.
+    See :func:`mehtap.resolver.resolve`.
+    """
 
 
 @attrs.define(slots=True)
 class Statement(NonTerminal, ABC):
+    # Statements that complete normally return None or, if they are the last
+    # statement of a main chunk, the values that it returns.
+    # Statements that transfer control elsewhere return a Completion.
     @abstractmethod
-    def _execute(self, scope: Scope) -> Sequence[LuaValue] | None:
+    def _execute(self, scope: Scope) \
+            -> Sequence[LuaValue] | Completion | None:
         pass
 
-    def execute(self, scope: Scope) -> Sequence[LuaValue] | None:
+    def execute(self, scope: Scope) -> Sequence[LuaValue] | Completion | None:
         if not scope.vm.verbose_tb:
             return self._execute(scope)
         try:
@@ -144,54 +158,87 @@ class ParenExpression(Expression):
 
 @attrs.define(slots=True)
 class Block(Statement, Expression):
+    # Local variables live in the slots of the frame of their function,
+    # so blocks don't need a scope of their own.
     def _evaluate(self, scope: Scope) -> list[LuaValue]:
-        return self.evaluate_without_inner_scope(
-            scope.push(file=self.file, line=self.line)
-        )
-
-    def _execute(self, scope: Scope) -> Sequence[LuaValue] | None:
-        return self.execute_without_inner_scope(
-            scope.push(file=self.file, line=self.line)
-        )
-
-    def evaluate_without_inner_scope(self, scope: Scope) -> list[LuaValue]:
-        try:
-            r = self.execute_without_inner_scope(scope)
-        except ReturnException as re:
-            if re.values:
-                return re.values
-            return []
-        return r
+        return self.evaluate_without_inner_scope(scope)
+
+    def _execute(self, scope: Scope) -> list[LuaValue] | Completion:
+        return self.execute_without_inner_scope(scope)
+
+    def evaluate_without_inner_scope(
+        self,
+        scope: Scope,
+        *,
+        echo: bool = True,
+    ) -> list[LuaValue]:
+        """Run the block as the body of a function or a chunk.
+
+        :param echo: Whether to return the values of the last statement if
+                     the block doesn't return any values,
+                     like main chunks do.
+        :return: The values returned by the block.
+        """
+        r = self.execute_without_inner_scope(scope)
+        if r.__class__ is Completion:
+            if r.type is CompletionType.RETURN:
+                return r.values
+            if r.type is CompletionType.BREAK:
+                raise LuaError("break outside a loop")
+            raise LuaError(f"no visible label '{r.label.name.text}' for goto")
+        if echo:
+            return r
+        return []
 
     def execute_without_inner_scope(
         self, scope: Scope
-    ) -> NoReturn | list[LuaValue]:
+    ) -> list[LuaValue] | Completion:
         v = None
+        statements = self.statements
+        count = len(statements)
         index = 0
-        try:
-            while index < len(self.statements):
-                v = self.statements[index].execute(scope)
-                index += 1
-        except GotoException as ge:
-            requested_name = ge.label.name.text
-            # TODO: This sucks.
-            found = False
-            for index, stmt in enumerate(self.statements):
-                if not isinstance(stmt, Label):
-                    continue
-                if stmt.name.name.text == requested_name:
-                    found = True
-                    break
-            if not found:
-                raise ge
+        while index < count:
+            v = statements[index].execute(scope)
+            index += 1
+            if v.__class__ is Completion:
+                if v.type is not CompletionType.GOTO:
+                    return v
+                index = self.labels.get(v.label.name.text)
+                if index is None:
+                    return v
         if self.return_statement:
-            self.return_statement.execute(scope)
+            return self.return_statement.execute(scope)
         if v is not None:
             return v
         return []
 
     statements: Sequence[Statement]
     return_statement: ReturnStatement | None = None
+    frame_size: int | None = attrs.field(
+        default=None, kw_only=True, eq=False, repr=False
+    )
+    """If the block is the body of a function or a chunk,
+    the number of local variable slots the frame of the function needs.
+    Filled in by :func:`mehtap.resolver.resolve`.
+    """
+    labels: dict[str, int] = attrs.field(
+        init=False, factory=dict, eq=False, repr=False
+    )
+    """The index of the statement of each label of the block, by name."""
+    compiled: Callable | bool | None = attrs.field(
+        init=False, default=None, eq=False, repr=False
+    )
+    """If the block is the body of a function,
+    the Python function it was compiled to once the function got hot,
+    :data:`False` if it can't be compiled,
+    or :data:`None` if it wasn't compiled yet.
+    See :mod:`mehtap.source_compiler`.
+    """
+
+    def __attrs_post_init__(self):
+        for index, statement in enumerate(self.statements):
+            if isinstance(statement, Label):
+                self.labels.setdefault(statement.name.name.text, index)
 
 
 @attrs.define(slots=True)
@@ -251,7 +298,22 @@ class NumeralDec(Numeral):
         whole_val = int(self.digits.text)
         if whole_val > MAX_INT64:
             return LuaNumber(float(self.digits.text), LuaNumberType.FLOAT)
-        return LuaNumber(whole_val, LuaNumberType.INTEGER)
+        return lua_integer(whole_val)
+
+
+@attrs.define(slots=True)
+class NumeralConstant(Numeral):
+    """
+    Not included in the Lua grammar.
+    A number that was computed when the chunk was loaded,
+    from a numeral or from an expression of constants.
+    See :mod:`mehtap.optimizer`.
+    """
+
+    value: LuaNumber
+
+    def _evaluate(self, scope: Scope) -> LuaValue:
+        return self.value
 
 
 @attrs.define(slots=True)
@@ -390,13 +452,13 @@ class LiteralString(Expression):
 @attrs.define(slots=True)
 class LiteralFalse(Expression):
     def _evaluate(self, scope: Scope) -> LuaValue:
-        return m_values.LuaBool(False)
+        return LuaFalse
 
 
 @attrs.define(slots=True)
 class LiteralTrue(Expression):
     def _evaluate(self, scope: Scope) -> LuaValue:
-        return m_values.LuaBool(True)
+        return LuaTrue
 
 
 @attrs.define(slots=True)
@@ -408,9 +470,86 @@ class LiteralNil(Expression):
 @attrs.define(slots=True)
 class Name(NonTerminal):
     name: Terminal
-
-    def as_lua_string(self):
-        return str_to_lua_string(self.name.text)
+    # The lexical address of the variable that the name refers to,
+    # filled in by mehtap.resolver.resolve().
+    # The variable is in slot `slot` of the frame `depth` functions outside
+    # the running one; a negative depth means that it is looked up by name.
+    depth: int = attrs.field(default=-1, init=False, eq=False, repr=False)
+    slot: int = attrs.field(default=-1, init=False, eq=False, repr=False)
+    # Exported variables are kept in a Variable that is shared with a scope.
+    exported: bool = attrs.field(default=False, init=False, eq=False,
+                                 repr=False)
+    constant: bool = attrs.field(default=False, init=False, eq=False,
+                                 repr=False)
+    _lua_string: LuaString | None = attrs.field(
+        default=None, init=False, eq=False, repr=False
+    )
+
+    def as_lua_string(self) -> LuaString:
+        if self._lua_string is None:
+            self._lua_string = str_to_lua_string(self.name.text)
+        return self._lua_string
+
+    def set_address(
+        self,
+        depth: int,
+        slot: int,
+        exported: bool,
+        constant: bool,
+    ) -> None:
+        self.depth = depth
+        self.slot = slot
+        self.exported = exported
+        self.constant = constant
+
+    def load(self, scope: Scope) -> LuaValue:
+        depth = self.depth
+        if depth < 0:
+            return scope.get_ls(self.as_lua_string())
+        while depth:
+            scope = scope.parent
+            depth -= 1
+        value = scope.slots[self.slot]
+        if self.exported:
+            return value.value
+        return value
+
+    def store(self, scope: Scope, value: LuaValue) -> None:
+        depth = self.depth
+        if depth < 0:
+            scope.put_nonlocal_ls(self.as_lua_string(), value)
+            return
+        if self.constant:
+            raise LuaError("attempt to change constant variable")
+        while depth:
+            scope = scope.parent
+            depth -= 1
+        if self.exported:
+            scope.slots[self.slot].value = value
+        else:
+            scope.slots[self.slot] = value
+
+    def declare(
+        self,
+        scope: Scope,
+        value: LuaValue,
+        *,
+        constant: bool = False,
+        to_be_closed: bool = False,
+    ) -> None:
+        if self.slot < 0:
+            scope.put_local_ls(
+                self.as_lua_string(),
+                m_values.Variable(value, constant, to_be_closed),
+            )
+        elif self.exported:
+            variable = m_values.Variable(value, constant, to_be_closed)
+            scope.slots[self.slot] = variable
+            # Exported variables are declared in the outermost block of a
+            # main chunk, whose frame is pushed on the scope it runs in.
+            scope.parent.put_local_ls(self.as_lua_string(), variable)
+        else:
+            scope.slots[self.slot] = value
 
 
 @attrs.define(slots=True)
@@ -430,7 +569,7 @@ class Variable(Expression, ABC):
 @attrs.define(slots=True)
 class VarName(Variable):
     def _evaluate(self, scope: Scope) -> LuaValue:
-        return scope.get_ls(str_to_lua_string(self.name.name.text))
+        return self.name.load(scope)
 
     name: Name
 
@@ -438,13 +577,29 @@ class VarName(Variable):
 @attrs.define(slots=True)
 class VarIndex(Variable):
     def _evaluate(self, scope: Scope) -> LuaValue:
+        return self.handler(self, scope)
+
+    def _evaluate_generic(self, scope: Scope) -> LuaValue:
         return m_operations.index(
             a=self.base.evaluate_single(scope),
             b=self.index.evaluate_single(scope)
         )
 
+    def __attrs_post_init__(self):
+        self.handler = adaptive_handlers[VarIndex]
+
     base: Expression
     index: Expression
+    handler: Callable[[VarIndex, Scope], LuaValue] = attrs.field(
+        init=False, eq=False, repr=False
+    )
+    """The function that evaluates the node.
+    See :mod:`mehtap.quickening`.
+    """
+    feedback: TypeFeedback | None = attrs.field(
+        init=False, default=None, eq=False, repr=False
+    )
+    """The values the node has seen, if it was evaluated."""
 
 
 @attrs.define(slots=True)
@@ -469,14 +624,14 @@ class TableConstructor(Expression):
             key: LuaValue
             if isinstance(field, FieldWithKey):
                 if isinstance(field.key, Name):
-                    key = str_to_lua_string(field.key.name.text)
+                    key = field.key.as_lua_string()
                 elif isinstance(field.key, Expression):
                     key = field.key.evaluate_single(scope)
                 else:
                     raise ValueError(f"{type(field.key)=}")
                 table.rawput(key, field.value.evaluate_single(scope))
             elif isinstance(field, FieldCounterKey):
-                key = LuaNumber(counter, LuaNumberType.INTEGER)
+                key = lua_integer(counter)
                 counter += 1
                 table.rawput(key, field.value.evaluate_single(scope))
             else:
@@ -484,16 +639,9 @@ class TableConstructor(Expression):
         if last_field and isinstance(last_field, FieldCounterKey):
             last_field_value = last_field.value.evaluate(scope)
             if isinstance(last_field_value, Sequence):
-                for counter, val in enumerate(last_field_value, start=counter):
-                    table.rawput(
-                        LuaNumber(counter, LuaNumberType.INTEGER),
-                        val,
-                    )
+                table.put_sequence(counter, last_field_value)
             else:
-                table.rawput(
-                    LuaNumber(counter, LuaNumberType.INTEGER),
-                    last_field_value,
-                )
+                table.rawput(lua_integer(counter), last_field_value)
         return table
 
 
@@ -546,19 +694,47 @@ class FuncDef(Expression):
 @attrs.define(slots=True)
 class FuncCallRegular(Expression, Statement):
     def _evaluate(self, scope: Scope) -> list[LuaValue]:
+        return self.handler(self, scope)
+
+    def _evaluate_generic(self, scope: Scope) -> list[LuaValue]:
         function = self.name.evaluate_single(scope)
-        args = [arg.evaluate(scope) for arg in self.args]
+        return self._call(
+            function, [arg.evaluate(scope) for arg in self.args], scope
+        )
+
+    def _call(
+        self,
+        function: LuaValue,
+        args: Multires,
+        scope: Scope,
+    ) -> list[LuaValue]:
         try:
             r = m_operations.call(function, args, scope, modify_tb=False)
         except LuaError as le:
-            le.push_tb(
-                f"call of {function}",
-                file=self.file,
-                line=self.line,
-            )
+            self._push_tb(le, function)
             raise le
         return r
 
+    def _push_tb(self, le: LuaError, function: LuaValue) -> None:
+        le.push_tb(
+            f"call of {function}",
+            file=self.file,
+            line=self.line,
+        )
+
+    def tail_call(self, scope: Scope) -> TailCall:
+        """Evaluate the function and the arguments of the call without making
+        it."""
+        return TailCall(
+            self.name.evaluate_single(scope),
+            [arg.evaluate(scope) for arg in self.args],
+            self,
+            scope,
+        )
+
+    def __attrs_post_init__(self):
+        self.handler = adaptive_handlers[FuncCallRegular]
+
     def _execute(self, scope: Scope) -> None | list[LuaValue]:
         r = self.evaluate(scope)
         if isinstance(r, Sequence):
@@ -569,30 +745,69 @@ class FuncCallRegular(Expression, Statement):
 
     name: Expression
     args: Sequence[Expression]
+    handler: Callable[[FuncCallRegular, Scope], list[LuaValue]] = attrs.field(
+        init=False, eq=False, repr=False
+    )
+    """The function that evaluates the node.
+    See :mod:`mehtap.quickening`.
+    """
+    feedback: TypeFeedback | None = attrs.field(
+        init=False, default=None, eq=False, repr=False
+    )
+    """The values the node has seen, if it was evaluated."""
 
 
 @attrs.define(slots=True)
 class FuncCallMethod(Expression, Statement):
     def _evaluate(self, scope: Scope) -> Sequence[LuaValue]:
+        return self.handler(self, scope)
+
+    def _evaluate_generic(self, scope: Scope) -> Sequence[LuaValue]:
         # A call v:name(args) is syntactic sugar for v.name(v,args),
         # except that v is evaluated only once.
         v = self.object.evaluate_single(scope)
         function = m_operations.index(
             a=v,
-            b=str_to_lua_string(self.method.name.text)
+            b=self.method.as_lua_string()
         )
-        args = [v, *(arg.evaluate(scope) for arg in self.args)]
+        return self._call(
+            function, [v, *(arg.evaluate(scope) for arg in self.args)], scope
+        )
+
+    def _call(
+        self,
+        function: LuaValue,
+        args: Multires,
+        scope: Scope,
+    ) -> list[LuaValue]:
         try:
             r = m_operations.call(function, args, scope, modify_tb=False)
         except LuaError as le:
-            le.push_tb(
-                f"method call of {function}",
-                file=self.file,
-                line=self.line,
-            )
+            self._push_tb(le, function)
             raise le
         return r
 
+    def _push_tb(self, le: LuaError, function: LuaValue) -> None:
+        le.push_tb(
+            f"method call of {function}",
+            file=self.file,
+            line=self.line,
+        )
+
+    def tail_call(self, scope: Scope) -> TailCall:
+        """Evaluate the function and the arguments of the call without making
+        it."""
+        v = self.object.evaluate_single(scope)
+        return TailCall(
+            m_operations.index(a=v, b=self.method.as_lua_string()),
+            [v, *[arg.evaluate(scope) for arg in self.args]],
+            self,
+            scope,
+        )
+
+    def __attrs_post_init__(self):
+        self.handler = adaptive_handlers[FuncCallMethod]
+
     def _execute(self, scope: Scope) -> None | list[LuaValue]:
         r = self.evaluate(scope)
         if isinstance(r, Sequence):
@@ -604,6 +819,16 @@ class FuncCallMethod(Expression, Statement):
     object: Expression
     method: Name
     args: Sequence[Expression]
+    handler: Callable[[FuncCallMethod, Scope], list[LuaValue]] = attrs.field(
+        init=False, eq=False, repr=False
+    )
+    """The function that evaluates the node.
+    See :mod:`mehtap.quickening`.
+    """
+    feedback: TypeFeedback | None = attrs.field(
+        init=False, default=None, eq=False, repr=False
+    )
+    """The values the node has seen, if it was evaluated."""
 
 
 class UnaryOperator(enum.Enum):
@@ -627,11 +852,16 @@ unary_operator_functions: dict[
 class UnaryOperation(Expression):
     op: UnaryOperator
     exp: Expression
+    function: Callable[[LuaValue], LuaValue] = attrs.field(
+        init=False, eq=False, repr=False
+    )
+    """The function that implements the operator."""
+
+    def __attrs_post_init__(self):
+        self.function = unary_operator_functions[self.op]
 
     def _evaluate(self, scope: Scope) -> LuaValue:
-        return unary_operator_functions[self.op](
-            self.exp.evaluate_single(scope)
-        )
+        return self.function(self.exp.evaluate_single(scope))
 
 
 class BinaryOperator(enum.Enum):
@@ -688,43 +918,83 @@ class BinaryOperation(Expression, ABC):
     lhs: Expression
     op: BinaryOperator
     rhs: Expression
+    function: Callable[[LuaValue, LuaValue], LuaValue] | None = attrs.field(
+        init=False, eq=False, repr=False
+    )
+    """The function that implements the operator,
+    or ``None`` for ``and`` and ``or``, which are evaluated in place.
+    """
+    handler: Callable[[BinaryOperation, Scope], LuaValue] = attrs.field(
+        init=False, eq=False, repr=False
+    )
+    """The function that evaluates the node.
+    See :mod:`mehtap.quickening`.
+    """
+    feedback: TypeFeedback | None = attrs.field(
+        init=False, default=None, eq=False, repr=False
+    )
+    """The values the node has seen, if it was evaluated."""
+
+    def __attrs_post_init__(self):
+        self.function = binary_operator_functions.get(self.op)
+        if self.function is None:
+            # and and or don't always evaluate their second operand,
+            # so they aren't specialized.
+            self.handler = BinaryOperation._evaluate_generic
+        else:
+            self.handler = adaptive_handlers[BinaryOperation]
 
     def _evaluate(self, scope: Scope) -> LuaValue:
-        op = self.op
+        return self.handler(self, scope)
+
+    def _evaluate_generic(self, scope: Scope) -> LuaValue:
+        function = self.function
+        if function is not None:
+            return function(
+                self.lhs.evaluate_single(scope),
+                self.rhs.evaluate_single(scope),
+            )
         # Both and and or use short-circuit evaluation;
         # that is, the second operand is evaluated only if necessary.
-        if op == BinaryOperator.AND:
+        if self.op is BinaryOperator.AND:
             # The conjunction operator "and" returns its first argument if this
             # value is false or nil;
             l_val = self.lhs.evaluate_single(scope)
-            if l_val is m_values.LuaNil or l_val == m_values.LuaBool(False):
+            if l_val is LuaNil or l_val is LuaFalse:
                 return l_val
             # otherwise, and returns its second argument.
             return self.rhs.evaluate_single(scope)
-        if op == BinaryOperator.OR:
-            # The disjunction operator "or" returns its first argument if this
-            # value is different from nil and false;
-            l_val = self.lhs.evaluate_single(scope)
-            if l_val is not m_values.LuaNil and l_val != m_values.LuaBool(
-                False
-            ):
-                return l_val
-            # otherwise, or returns its second argument.
-            return self.rhs.evaluate_single(scope)
-
-        left = self.lhs.evaluate_single(scope)
-        right = self.rhs.evaluate_single(scope)
-        return binary_operator_functions[op](left, right)
+        # The disjunction operator "or" returns its first argument if this
+        # value is different from nil and false;
+        l_val = self.lhs.evaluate_single(scope)
+        if l_val is not LuaNil and l_val is not LuaFalse:
+            return l_val
+        # otherwise, or returns its second argument.
+        return self.rhs.evaluate_single(scope)
 
 
 @attrs.define(slots=True)
 class ReturnStatement(Statement):
-    def _execute(self, scope: Scope) -> NoReturn:
-        raise ReturnException(
-            flatten(
-                expr.evaluate(scope)
-                for expr in self.values
+    def _execute(self, scope: Scope) -> Completion:
+        values = self.values
+        if len(values) == 1 and (
+            values[0].__class__ is FuncCallRegular
+            or values[0].__class__ is FuncCallMethod
+        ):
+            # A tail call is made by the caller of the function.
+            return Completion(
+                CompletionType.RETURN, values[0].tail_call(scope)
+            )
+        if len(values) == 1:
+            value = values[0].evaluate(scope)
+            # The list is copied, since varargs stay in the scope.
+            return Completion(
+                CompletionType.RETURN,
+                [*value] if value.__class__ is list else [value],
             )
+        return Completion(
+            CompletionType.RETURN,
+            adjust_flatten([expr.evaluate(scope) for expr in values]),
         )
 
     values: Sequence[Expression]
@@ -744,8 +1014,7 @@ class Assignment(Statement):
         )
         for variable, value in zip(self.names, values):
             if isinstance(variable, VarName):
-                var_name = str_to_lua_string(variable.name.name.text)
-                scope.put_nonlocal_ls(var_name, value)
+                variable.name.store(scope, value)
             elif isinstance(variable, VarIndex):
                 table = variable.base.evaluate_single(scope)
                 if not isinstance(table, LuaIndexableABC):
@@ -775,35 +1044,43 @@ class Label(Statement):
 
 @attrs.define(slots=True)
 class Break(Statement):
-    def _execute(self, scope: Scope) -> None:
-        raise BreakException()
+    def _execute(self, scope: Scope) -> Completion:
+        return BREAK
 
 
 @attrs.define(slots=True)
 class Goto(Statement):
-    def _execute(self, scope: Scope) -> None:
-        raise GotoException(self.name)
+    def _execute(self, scope: Scope) -> Completion:
+        return Completion(CompletionType.GOTO, label=self.name)
 
     name: Name
 
 
 @attrs.define(slots=True)
 class Do(Statement):
-    def _execute(self, scope: Scope) -> None:
-        self.block.execute(scope)
+    def _execute(self, scope: Scope) -> Completion | None:
+        r = self.block.execute(scope)
+        if r.__class__ is Completion:
+            return r
+        return None
 
     block: Block
 
 
 @attrs.define(slots=True)
 class While(Statement):
-    def _execute(self, scope: Scope) -> None:
-        new_vm = scope.push(file=self.file, line=self.line)
-        try:
-            while coerce_to_bool(self.condition.evaluate_single(scope)).true:
-                self.block.execute_without_inner_scope(new_vm)
-        except BreakException:
-            pass
+    def _execute(self, scope: Scope) -> Completion | None:
+        condition = self.condition
+        while True:
+            value = condition.evaluate_single(scope)
+            if value is LuaNil or value is LuaFalse:
+                break
+            r = self.block.execute_without_inner_scope(scope)
+            if r.__class__ is Completion:
+                if r is BREAK:
+                    break
+                return r
+        return None
 
     condition: Expression
     block: Block
@@ -811,32 +1088,78 @@ class While(Statement):
 
 @attrs.define(slots=True)
 class Repeat(Statement):
-    def _execute(self, scope: Scope) -> None:
-        new_vm = scope.push(file=self.file, line=self.line)
-        try:
-            while True:
-                self.block.execute_without_inner_scope(new_vm)
-                if coerce_to_bool(self.condition.evaluate_single(new_vm)).true:
+    def _execute(self, scope: Scope) -> Completion | None:
+        while True:
+            r = self.block.execute_without_inner_scope(scope)
+            if r.__class__ is Completion:
+                if r is BREAK:
                     break
-        except BreakException:
-            pass
+                return r
+            value = self.condition.evaluate_single(scope)
+            if value is not LuaNil and value is not LuaFalse:
+                break
+        return None
 
     block: Block
     condition: Expression
 
 
+@attrs.define(slots=True, frozen=True)
+class Dispatch:
+    """A jump table for an :class:`If` statement whose conditions all compare
+    the same local variable with a number or a string constant.
+
+    Comparing a value with a number or a string can't call the ``__eq``
+    metamethod,
+    so the arm to run is the one whose constant is equal to the value of the
+    variable if it is a number or a string,
+    and the ``else`` block otherwise.
+    See :mod:`mehtap.optimizer`.
+    """
+
+    subject: VarName
+    """The variable that the conditions compare."""
+    arms: dict[LuaValue, int]
+    """The index of the first arm that compares with each constant."""
+
+
 @attrs.define(slots=True)
 class If(Statement):
-    def _execute(self, scope: Scope) -> None:
-        for cnd, blk in self.blocks:
-            if coerce_to_bool(cnd.evaluate_single(scope)).true:
-                blk.execute(scope)
-                return
-        if self.else_block:
-            self.else_block.execute(scope)
+    def _execute(self, scope: Scope) -> Completion | None:
+        dispatch = self.dispatch
+        if dispatch is not None:
+            value = dispatch.subject.evaluate(scope)
+            cls = value.__class__
+            if cls is LuaNumber or cls is LuaString:
+                i = dispatch.arms.get(value)
+            else:
+                i = None
+            if i is not None:
+                r = self.blocks[i][1].execute(scope)
+            elif self.else_block:
+                r = self.else_block.execute(scope)
+            else:
+                return None
+        else:
+            for cnd, blk in self.blocks:
+                value = cnd.evaluate_single(scope)
+                if value is not LuaNil and value is not LuaFalse:
+                    r = blk.execute(scope)
+                    break
+            else:
+                if not self.else_block:
+                    return None
+                r = self.else_block.execute(scope)
+        if r.__class__ is Completion:
+            return r
+        return None
 
     blocks: Sequence[tuple[Expression, Block]]
     else_block: Block | None = None
+    dispatch: Dispatch | None = attrs.field(
+        init=False, default=None, eq=False, repr=False
+    )
+    """The jump table of the statement, if the optimizer made one."""
 
 
 @attrs.define(slots=True)
@@ -847,17 +1170,11 @@ class For(Statement):
     step: Expression | None
     block: Block
 
-    def _execute(self, scope: Scope) -> None:
-        try:
-            self._execute_internal(scope)
-        except BreakException:
-            pass
-
-    def _execute_internal(self, scope: Scope) -> None:
+    def _execute(self, scope: Scope) -> Completion | None:
         # This for loop is the "numerical" for loop explained in 3.3.5.
         # The given identifier (Name) defines the control variable,
         # which is a new variable local to the loop body (block).
-        control_varname = self.name.as_lua_string()
+        control_name = self.name
         # The loop starts by evaluating once the three control expressions.
         # Their values are called respectively
         # the initial value,
@@ -874,7 +1191,7 @@ class For(Statement):
             if not isinstance(step, LuaNumber):
                 raise LuaError("the step value must be a number")
         else:
-            step = LuaNumber(1, LuaNumberType.INTEGER)
+            step = lua_integer(1)
         # If both the initial value and the step are integers,
         # the loop is done with integers;
         # note that the limit may not be an integer.
@@ -912,17 +1229,19 @@ class For(Statement):
         # If you need its value after the loop, assign it to another variable
         # before exiting the loop.
         control_val = initial_value
-        inner_scope = scope.push(file=self.file, line=self.line)
-        while condition_func(control_val, limit).true:
-            inner_scope.put_local_ls(
-                control_varname, m_values.Variable(control_val)
-            )
-            self.block.execute_without_inner_scope(inner_scope)
+        while condition_func(control_val, limit) is LuaTrue:
+            control_name.declare(scope, control_val)
+            r = self.block.execute_without_inner_scope(scope)
+            if r.__class__ is Completion:
+                if r is BREAK:
+                    break
+                return r
             overflow, control_val = m_operations.overflow_arith_add(
                 control_val, step
             )
             if overflow and is_integer_loop:
                 break
+        return None
 
 
 @attrs.define(slots=True)
@@ -931,13 +1250,7 @@ class ForIn(Statement):
     exprs: Sequence[Expression]
     block: Block
 
-    def _execute(self, scope: Scope) -> None:
-        try:
-            self._execute_internal(scope)
-        except BreakException:
-            pass
-
-    def _execute_internal(self, outer_scope: Scope) -> None:
+    def _execute(self, scope: Scope) -> Completion | None:
         # The generic for statement works over functions, called iterators.
         # On each iteration, the iterator function is called to produce a new
         # value, stopping when this new value is nil.
@@ -946,55 +1259,62 @@ class ForIn(Statement):
         #      for var_1, ···, var_n in explist do body end
         # works as follows.
         # The names var_i declare loop variables local to the loop body.
-        body_scope = outer_scope.push(file=self.file, line=self.line)
-        name_count = len(self.names)
-        names = [name.as_lua_string() for name in self.names]
-        for name in names:
-            body_scope.put_local_ls(name, m_values.Variable(m_values.LuaNil))
-        # The first of these variables is the control variable.
-        control_variable_name = names[0]
+        names = self.names
+        name_count = len(names)
         # The loop starts by evaluating explist to produce four values:
-        exp_vals = adjust([exp.evaluate(outer_scope) for exp in self.exprs], 4)
+        exp_vals = adjust([exp.evaluate(scope) for exp in self.exprs], 4)
         # an iterator function,
         iterator_function = exp_vals[0]
         # a state,
         state = exp_vals[1]
         # an initial value for the control variable,
-        initial_value = exp_vals[2]
-        body_scope.put_local_ls(
-            control_variable_name, m_values.Variable(initial_value)
-        )
+        # which is kept apart from the first loop variable, so that assigning
+        # to the variable in the body doesn't change the iteration.
+        control_value = exp_vals[2]
         # and a closing value.
         closing_value = exp_vals[3]
 
+        from mehtap.library.stdlib.basic_library import native_table_step
+
+        # The iterators of next, pairs and ipairs are replaced by a direct
+        # traversal of the table.
+        step = native_table_step(iterator_function, state)
         nil = m_values.LuaNil
         while True:
             # Then, at each iteration, Lua calls the iterator function with two
             # arguments: the state and the control variable.
-            results = adjust(
-                m_operations.call(
-                    iterator_function,
-                    [state, body_scope.get_ls(control_variable_name)],
-                    outer_scope,
-                ),
-                name_count,
-            )
+            if step is not None:
+                results = adjust(step(state, control_value) or [], name_count)
+            else:
+                results = adjust(
+                    m_operations.call(
+                        iterator_function,
+                        [state, control_value],
+                        scope,
+                    ),
+                    name_count,
+                )
             # The results from this call are then assigned to the loop
             # variables, following the rules of multiple assignments.
             for name, value in zip(names, results):
-                body_scope.put_local_ls(name, m_values.Variable(value))
+                name.declare(scope, value)
             # If the control variable becomes nil, the loop terminates.
-            if results[0] is nil:
+            control_value = results[0]
+            if control_value is nil:
                 break
             # Otherwise, the body is executed and the loop goes to the next
             # iteration.
-            self.block.execute_without_inner_scope(body_scope)
-            continue
+            r = self.block.execute_without_inner_scope(scope)
+            if r.__class__ is Completion:
+                if r is BREAK:
+                    return None
+                return r
         if closing_value is not nil:
             # The closing value behaves like a to-be-closed variable,
             # which can be used to release resources when the loop ends.
             # Otherwise, it does not interfere with the loop.
             raise NotImplementedError()
+        return None
 
 
 @attrs.define(slots=True)
@@ -1013,11 +1333,11 @@ class FunctionStatement(Statement):
         if self.name.method:
             function.param_names.insert(0, LuaString(b"self"))
         if len(self.name.names) == 1:
-            name = self.name.names[0].as_lua_string()
-            function.name = name
-            scope.put_nonlocal_ls(name, function)
+            name = self.name.names[0]
+            function.name = name.as_lua_string()
+            name.store(scope, function)
         else:
-            table = scope.get_ls(self.name.names[0].as_lua_string())
+            table = self.name.names[0].load(scope)
             for name in self.name.names[1:-1]:
                 table = m_operations.index(
                     a=table,
@@ -1046,11 +1366,10 @@ class LocalFunctionStatement(Statement):
         #      local f = function () body end
         # (This only makes a difference
         # when the body of the function contains references to f.)
-        name = self.name.as_lua_string()
-        scope.put_local_ls(name, m_values.Variable(m_values.LuaNil))
+        self.name.declare(scope, m_values.LuaNil)
         function = self.body.evaluate_single(scope)
-        function.name = name
-        scope.put_local_ls(name, m_values.Variable(function))
+        function.name = self.name.as_lua_string()
+        self.name.store(scope, function)
         return [function]
 
 
@@ -1075,22 +1394,18 @@ class LocalAssignment(Statement):
             exp_vals = [m_values.LuaNil] * len(self.names)
         used_closed = False
         for attname, exp_val in zip(self.names, exp_vals):
-            var_name = attname.name.as_lua_string()
+            name = attname.name
             if attname.attrib is None:
-                scope.put_local_ls(var_name, m_values.Variable(exp_val))
+                name.declare(scope, exp_val)
             else:
                 attrib = attname.attrib.as_lua_string()
                 if attrib.content == b"close":
                     if used_closed:
                         raise NotImplementedError()
                     used_closed = True
-                    scope.put_local_ls(
-                        var_name, m_values.Variable(exp_val, to_be_closed=True)
-                    )
+                    name.declare(scope, exp_val, to_be_closed=True)
                 elif attrib.content == b"const":
-                    scope.put_local_ls(
-                        var_name, m_values.Variable(exp_val, constant=True)
-                    )
+                    name.declare(scope, exp_val, constant=True)
                 else:
                     raise LuaError(
                         f"unknown attribute '{attrib.content.decode('ascii')}'"
@@ -1111,3 +1426,7 @@ class ParsedLiteralLuaStringExpr(Expression):
 
     def _evaluate(self, scope: Scope) -> LuaValue | Sequence[LuaValue]:
         return self.value
+
+
+# Fill in adaptive_handlers.
+import mehtap.quickening  # noqa: E402
@@ -366,7 +366,11 @@ class LuaTransformer(lark.Transformer):
         return nodes.Label(name=name)
 
     @staticmethod
-    def retstat(_, values: Sequence[nodes.Expression]) -> nodes.ReturnStatement:
+    def retstat(
+        _, values: Sequence[nodes.Expression] | None
+    ) -> nodes.ReturnStatement:
+        if values is None:
+            return nodes.ReturnStatement(values=tuple())
         return nodes.ReturnStatement(values=values)
 
     def parlist(self, namelist) -> nodes.Parlist:
@@ -438,6 +442,18 @@ class LuaTransformer(lark.Transformer):
             block=block,
         )
 
+    @staticmethod
+    def stat_repeat(
+        REPEAT,
+        block: nodes.Block,
+        UNTIL,
+        cond: nodes.Expression,
+    ):
+        return nodes.Repeat(
+            block=block,
+            condition=cond,
+        )
+
     @staticmethod
     def stat_for(FOR, name, start, stop, step, DO, block, END):
         return nodes.For(
@@ -485,7 +501,12 @@ class LuaTransformer(lark.Transformer):
         return explist
 
     @staticmethod
-    def args_value(value: nodes.Expression) -> Sequence[nodes.Expression]:
+    def args_value(
+        value: nodes.Expression | nodes.Terminal,
+    ) -> Sequence[nodes.Expression]:
+        if isinstance(value, nodes.Terminal):
+            # f"string" is parsed without going through the literalstring rule.
+            return (nodes.LiteralString(text=value),)
         return (value,)
 
     @staticmethod
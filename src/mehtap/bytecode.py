@@ -0,0 +1,329 @@
+"""The register-based bytecode of mehtap.
+
+A compiled function is a :class:`Prototype`: an array of instructions,
+a pool of constants, and the prototypes of the functions defined inside it.
+
+Every instruction is a tuple ``(opcode, a, b, c)`` of integers.
+Most operands name *registers*, the slots of the frame of the running
+function, where local variables and temporary values live.
+Operands described as ``RK`` name a register if they are non-negative,
+and the constant ``K[~x]`` if they are negative.
+
+Instructions that produce or consume a variable number of values
+(function calls, ``...``, ``return``) pass them through a list that is not a
+register, called *multires* below.
+
+See :mod:`mehtap.bytecode_compiler` for the compiler and
+:mod:`mehtap.bytecode_interpreter` for the dispatch loop.
+"""
+
+from __future__ import annotations
+
+import enum
+
+import attrs
+
+from mehtap.values import LuaString, LuaValue
+
+
+class Opcode(enum.IntEnum):
+    """Opcode(value)
+    Enumeration of the operations of instructions.
+
+    ``R[x]`` is a register, ``K[x]`` is a constant,
+    ``U[x]`` is an upvalue of the running function.
+    """
+
+    MOVE = 0
+    """``R[A] = R[B]``"""
+    LOADK = 1
+    """``R[A] = K[B]``"""
+    GETCELL = 2
+    """``R[A] = R[B].value``"""
+    SETCELL = 3
+    """``R[A].value = R[B]``"""
+    GETUPVAL = 4
+    """``R[A] = U[B].value``"""
+    SETUPVAL = 5
+    """``U[B].value = R[A]``"""
+    GETGLOBAL = 6
+    """``R[A] = K[B]`` looked up in the scope of the function"""
+    SETGLOBAL = 7
+    """Assign ``R[A]`` to ``K[B]`` in the scope of the function"""
+    GETTABLE = 8
+    """``R[A] = R[B][RK[C]]``"""
+    SETTABLE = 9
+    """``R[A][RK[B]] = RK[C]``"""
+    SELF = 10
+    """``R[A + 1] = R[B]; R[A] = R[B][RK[C]]``"""
+    CALL = 11
+    """Call ``R[A]`` with the arguments ``R[A + 1]`` to ``R[A + B]``.
+
+    If ``B`` is negative, ``~B`` arguments are taken from registers and
+    multires is appended to them.
+    The results are adjusted to ``C`` values and put in ``R[A]`` to
+    ``R[A + C - 1]``, or put in multires if ``C`` is ``-1``.
+    """
+    RETURN = 12
+    """Return ``R[A]`` to ``R[A + B - 1]``.
+
+    If ``B`` is negative, ``~B`` values are taken from registers and multires
+    is appended to them.
+    """
+    JMP = 13
+    """``pc += B``"""
+    JMPIF = 14
+    """If ``R[A]`` is neither ``false`` nor ``nil``, ``pc += B``"""
+    JMPIFNOT = 15
+    """If ``R[A]`` is ``false`` or ``nil``, ``pc += B``"""
+    FORPREP = 16
+    """Start a numeric ``for`` loop with the initial value, the limit and the
+    step in ``R[A]`` to ``R[A + 2]``, then ``pc += B``.
+
+    ``R[A]`` is replaced by an iterator over the values of the control
+    variable.
+    """
+    FORLOOP = 17
+    """If the iterator in ``R[A]`` has a next value, put it in ``R[A + 1]``
+    and ``pc += B``"""
+    TFORCALL = 18
+    """Call ``R[A](R[A + 1], R[A + 2])`` and put ``C`` results in
+    ``R[A + 4]`` to ``R[A + 3 + C]``"""
+    TFORLOOP = 19
+    """If ``R[A + 4]`` isn't ``nil``, ``R[A + 2] = R[A + 4]`` and
+    ``pc += B``"""
+    TFORCLOSE = 20
+    """End a generic ``for`` loop whose closing value is in ``R[A + 3]``"""
+    NEWTABLE = 21
+    """``R[A] = {}``"""
+    SETLIST = 22
+    """``R[A][C + i] = multires[i]`` for every value in multires"""
+    CLOSURE = 23
+    """``R[A]`` = a new function of the prototype ``P[B]``"""
+    VARARG = 24
+    """Put ``B`` variable arguments in ``R[A]`` to ``R[A + B - 1]``,
+    or all of them in multires if ``B`` is ``-1``"""
+    NEWCELL = 25
+    """``R[A]`` = a new local variable containing ``R[A]``.
+
+    ``B`` is ``1`` for constant and ``2`` for to-be-closed variables.
+    """
+    EXPORT = 26
+    """Put the local variable ``R[A]`` in the scope of the function with the
+    name ``K[B]``"""
+    LOADNIL = 27
+    """``R[A]`` to ``R[A + B - 1]`` = ``nil``"""
+    JMPTABLE = 28
+    """If ``R[A]`` is a number or a string in the jump table ``T[B]``,
+    ``pc += T[B][R[A]]``, otherwise ``pc += C``"""
+    TAILCALL = 29
+    """Like :attr:`CALL` with ``C`` of ``-1``, for a ``return`` statement
+    with a single call.
+
+    A function compiled to bytecode takes the place of the running function
+    and returns to its caller.
+    The results of other functions are put in multires,
+    which the :attr:`RETURN` after the instruction returns.
+    """
+    ERROR = 30
+    """Raise an error with the message ``K[B]``"""
+
+    # Arithmetic, bitwise, relational and concatenation operators are
+    # contiguous so that they can share their implementation.
+    ADD = 32
+    """``R[A] = RK[B] + RK[C]``, and so on for the other binary operators."""
+    SUB = 33
+    MUL = 34
+    DIV = 35
+    IDIV = 36
+    MOD = 37
+    POW = 38
+    CONCAT = 39
+    BAND = 40
+    BOR = 41
+    BXOR = 42
+    SHL = 43
+    SHR = 44
+    EQ = 45
+    NE = 46
+    LT = 47
+    LE = 48
+    GT = 49
+    GE = 50
+
+    UNM = 56
+    """``R[A] = -R[B]``, and so on for the other unary operators."""
+    NOT = 57
+    LEN = 58
+    BNOT = 59
+
+
+FIRST_BINARY_OPCODE = Opcode.ADD
+LAST_BINARY_OPCODE = Opcode.GE
+FIRST_UNARY_OPCODE = Opcode.UNM
+LAST_UNARY_OPCODE = Opcode.BNOT
+
+_RK_OPERANDS = {
+    Opcode.GETTABLE: "c",
+    Opcode.SETTABLE: "bc",
+    Opcode.SELF: "c",
+}
+_K_OPERANDS = {
+    Opcode.LOADK: "b",
+    Opcode.GETGLOBAL: "b",
+    Opcode.SETGLOBAL: "b",
+    Opcode.EXPORT: "b",
+    Opcode.ERROR: "b",
+}
+_JUMP_OPERANDS = {
+    Opcode.JMP,
+    Opcode.JMPIF,
+    Opcode.JMPIFNOT,
+    Opcode.FORPREP,
+    Opcode.FORLOOP,
+    Opcode.TFORLOOP,
+}
+
+
+Instruction = tuple[int, int, int, int]
+
+
+@attrs.define(slots=True, eq=False, repr=False)
+class Prototype:
+    """A function compiled to bytecode."""
+
+    code: list[Instruction] = attrs.field(factory=list)
+    """The instructions of the function."""
+    lines: list[int] = attrs.field(factory=list)
+    """The source line of each instruction."""
+    constants: list[LuaValue] = attrs.field(factory=list)
+    """The constant pool of the function."""
+    prototypes: list[Prototype] = attrs.field(factory=list)
+    """The functions defined directly inside the function."""
+    jump_tables: list[dict[LuaValue, int]] = attrs.field(factory=list)
+    """The jump tables of the function,
+    which map values to the offsets of :attr:`Opcode.JMPTABLE` jumps."""
+    upvalues: list[tuple[bool, int]] = attrs.field(factory=list)
+    """How each upvalue is captured when a function is created.
+
+    ``(True, x)`` captures the cell in register ``x`` of the enclosing
+    function, ``(False, x)`` captures upvalue ``x`` of the enclosing
+    function.
+    """
+    upvalue_names: list[str] = attrs.field(factory=list)
+    """The names of the upvalues, for debugging."""
+    param_names: list[LuaString] = attrs.field(factory=list)
+    """The names of the parameters."""
+    variadic: bool = False
+    """Whether the function accepts variable arguments."""
+    register_count: int = 0
+    """The number of registers the frame of the function needs."""
+    name: LuaString | None = None
+    """The name of the function, if it is known statically."""
+    file: str = "<?>"
+    """The name of the chunk the function is defined in."""
+    line: int = -1
+    """The line the function is defined in."""
+
+    @property
+    def param_count(self) -> int:
+        return len(self.param_names)
+
+    def __repr__(self):
+        return (
+            f"<Prototype {self.name or 'function'} "
+            f"<{self.file}:{self.line}>>"
+        )
+
+
+def _format_constant(value: LuaValue) -> str:
+    if isinstance(value, LuaString):
+        return repr(value.content)[1:]
+    return str(value)
+
+
+def _format_operand(
+    prototype: Prototype,
+    pc: int,
+    opcode: Opcode,
+    name: str,
+    value: int,
+) -> str | None:
+    if opcode in _K_OPERANDS and name in _K_OPERANDS[opcode]:
+        return _format_constant(prototype.constants[value])
+    if (
+        (opcode in _RK_OPERANDS and name in _RK_OPERANDS[opcode])
+        or (
+            FIRST_BINARY_OPCODE <= opcode <= LAST_BINARY_OPCODE
+            and name in "bc"
+        )
+    ) and value < 0:
+        return _format_constant(prototype.constants[~value])
+    if opcode in _JUMP_OPERANDS and name == "b":
+        return f"to {pc + 1 + value + 1}"
+    if opcode is Opcode.JMPTABLE:
+        return f"to {pc + 1 + value + 1}" if name == "c" else None
+    if opcode is Opcode.CLOSURE and name == "b":
+        return repr(prototype.prototypes[value])
+    if opcode in (Opcode.GETUPVAL, Opcode.SETUPVAL) and name == "b":
+        return prototype.upvalue_names[value]
+    return None
+
+
+def disassemble(prototype: Prototype, *, nested: bool = True) -> str:
+    """Make a human-readable listing of the bytecode of a function.
+
+    :param prototype: The function to list.
+    :param nested: Whether to also list the functions defined inside it.
+    :return: The listing, similar to the output of ``luac -l``.
+    """
+    params = len(prototype.param_names)
+    lines = [
+        f"{'main' if prototype.line == 0 else 'function'}"
+        f" <{prototype.file}:{prototype.line}>"
+        f" ({len(prototype.code)} instructions)",
+        f"{params}{'+' if prototype.variadic else ''} params, "
+        f"{prototype.register_count} registers, "
+        f"{len(prototype.upvalues)} upvalues, "
+        f"{len(prototype.constants)} constants, "
+        f"{len(prototype.prototypes)} functions",
+    ]
+    for pc, (op, a, b, c) in enumerate(prototype.code):
+        opcode = Opcode(op)
+        comments = [
+            comment
+            for comment in (
+                _format_operand(prototype, pc, opcode, name, value)
+                for name, value in (("b", b), ("c", c))
+            )
+            if comment is not None
+        ]
+        line = prototype.lines[pc] if pc < len(prototype.lines) else -1
+        listing = (
+            f"\t{pc + 1}\t[{line}]\t{opcode.name:<10}\t{a} {b} {c}"
+        )
+        if comments:
+            listing += "\t; " + " ".join(comments)
+        lines.append(listing)
+    if prototype.constants:
+        lines.append(f"constants ({len(prototype.constants)}):")
+        for i, constant in enumerate(prototype.constants):
+            lines.append(f"\t{i}\t{_format_constant(constant)}")
+    if prototype.jump_tables:
+        lines.append(f"jump tables ({len(prototype.jump_tables)}):")
+        for i, table in enumerate(prototype.jump_tables):
+            lines.append(f"\t{i}\t" + ", ".join(
+                f"{_format_constant(value)}: {offset}"
+                for value, offset in table.items()
+            ))
+    if prototype.upvalues:
+        lines.append(f"upvalues ({len(prototype.upvalues)}):")
+        for i, ((in_parent_frame, index), name) in enumerate(
+            zip(prototype.upvalues, prototype.upvalue_names)
+        ):
+            lines.append(f"\t{i}\t{name}\t{int(in_parent_frame)}\t{index}")
+    text = "\n".join(lines)
+    if nested:
+        for child in prototype.prototypes:
+            text += "\n\n" + disassemble(child)
+    return text
@@ -0,0 +1,1011 @@
+"""Compilation of abstract syntax trees to :mod:`mehtap.bytecode`.
+
+Registers are allocated like a stack.
+The local variables of a block occupy consecutive registers from the first
+register that was free when they were declared,
+and temporary values are put in the registers above them,
+which are released as soon as they are used.
+Local variables that are captured by nested functions hold a
+:class:`~mehtap.values.Variable` in their register,
+which the nested functions share.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Sequence
+
+import attrs
+
+import mehtap.ast_nodes as nodes
+from mehtap.ast_nodes import BinaryOperator, UnaryOperator
+from mehtap.bytecode import Opcode, Prototype
+from mehtap.control_structures import LuaError
+from mehtap.operations import str_to_lua_string
+from mehtap.resolver import (
+    FunctionInfo,
+    LocalVariable,
+    NameKind,
+    Resolution,
+    resolve,
+)
+from mehtap.values import (
+    LuaBool,
+    LuaNil,
+    LuaNumber,
+    LuaString,
+    LuaValue,
+    lua_integer,
+)
+
+BINARY_OPCODES = {
+    BinaryOperator.ADD: Opcode.ADD,
+    BinaryOperator.SUBTRACT: Opcode.SUB,
+    BinaryOperator.MULTIPLY: Opcode.MUL,
+    BinaryOperator.FLOAT_DIV: Opcode.DIV,
+    BinaryOperator.FLOOR_DIV: Opcode.IDIV,
+    BinaryOperator.MODULO: Opcode.MOD,
+    BinaryOperator.EXP: Opcode.POW,
+    BinaryOperator.CONCAT: Opcode.CONCAT,
+    BinaryOperator.BIT_AND: Opcode.BAND,
+    BinaryOperator.BIT_OR: Opcode.BOR,
+    BinaryOperator.BIT_XOR: Opcode.BXOR,
+    BinaryOperator.SHIFT_LEFT: Opcode.SHL,
+    BinaryOperator.SHIFT_RIGHT: Opcode.SHR,
+    BinaryOperator.EQ: Opcode.EQ,
+    BinaryOperator.NE: Opcode.NE,
+    BinaryOperator.LT: Opcode.LT,
+    BinaryOperator.LE: Opcode.LE,
+    BinaryOperator.GT: Opcode.GT,
+    BinaryOperator.GE: Opcode.GE,
+}
+"""The opcodes of the binary operators other than ``and`` and ``or``."""
+UNARY_OPCODES = {
+    UnaryOperator.NEG: Opcode.UNM,
+    UnaryOperator.NOT: Opcode.NOT,
+    UnaryOperator.LENGTH: Opcode.LEN,
+    UnaryOperator.BIT_NOT: Opcode.BNOT,
+}
+"""The opcodes of the unary operators."""
+
+_MULTIRES_NODES = (
+    nodes.FuncCallRegular,
+    nodes.FuncCallMethod,
+    nodes.VarArgExpr,
+)
+_CONSTANT_NODES = (
+    nodes.NumeralDec,
+    nodes.NumeralHex,
+    nodes.NumeralConstant,
+    nodes.LiteralString,
+    nodes.LiteralTrue,
+    nodes.LiteralFalse,
+    nodes.LiteralNil,
+    nodes.ParsedLiteralLuaStringExpr,
+)
+_TRUE_NODES = (
+    nodes.LiteralTrue,
+    nodes.NumeralDec,
+    nodes.NumeralHex,
+    nodes.NumeralConstant,
+    nodes.LiteralString,
+    nodes.ParsedLiteralLuaStringExpr,
+)
+"""The nodes of constants that are neither ``false`` nor ``nil``."""
+_CELL_FLAGS = {None: 0, "const": 1, "close": 2}
+
+
+@attrs.define(slots=True)
+class _BlockScope:
+    free: int
+    """The first free register when the block started."""
+    labels: dict[str, int] = attrs.field(factory=dict)
+    gotos: list[tuple[int, str]] = attrs.field(factory=list)
+    """Jumps to labels that are not resolved yet."""
+
+
+@attrs.define(slots=True)
+class _FunctionState:
+    prototype: Prototype
+    info: FunctionInfo
+    parent: _FunctionState | None
+    free: int = 0
+    """The first register that is not reserved."""
+    active: int = 0
+    """The first register above the active local variables."""
+    registers: dict[int, int] = attrs.field(factory=dict)
+    constant_indices: dict[tuple, int] = attrs.field(factory=dict)
+    blocks: list[_BlockScope] = attrs.field(factory=list)
+    breaks: list[list[int]] = attrs.field(factory=list)
+    """The jumps of the ``break`` statements of each enclosing loop."""
+
+
+def _constant_key(value: LuaValue) -> tuple:
+    if isinstance(value, LuaNumber):
+        return LuaNumber, value.type, repr(value.value)
+    if isinstance(value, LuaString):
+        return LuaString, value.content
+    if isinstance(value, LuaBool):
+        return LuaBool, value.true
+    if value is LuaNil:
+        return "nil",
+    raise TypeError(f"not a constant: {value!r}")
+
+
+def _is_direct(expression: nodes.Expression) -> bool:
+    """
+    :return: Whether the expression can be compiled straight into a register
+             that other parts of the expression may read,
+             because the register is written only once, at the end.
+    """
+    while isinstance(expression, nodes.ParenExpression):
+        expression = expression.exp
+    if isinstance(expression, nodes.BinaryOperation):
+        return expression.op not in (BinaryOperator.AND, BinaryOperator.OR)
+    return isinstance(
+        expression,
+        _CONSTANT_NODES + (
+            nodes.VarName,
+            nodes.VarIndex,
+            nodes.UnaryOperation,
+            nodes.VarArgExpr,
+            nodes.FuncDef,
+            nodes.FuncBody,
+        ),
+    )
+
+
+class _Compiler:
+    fs: _FunctionState
+    """The state of the function that is being compiled,
+    set by :meth:`chunk` and :meth:`function`."""
+
+    def __init__(self, resolution: Resolution):
+        self.resolution = resolution
+        self.line = -1
+
+    # region Emitting code
+
+    def emit(self, op: Opcode, a: int = 0, b: int = 0, c: int = 0) -> int:
+        prototype = self.fs.prototype
+        prototype.code.append((op.value, a, b, c))
+        prototype.lines.append(self.line)
+        return len(prototype.code) - 1
+
+    def here(self) -> int:
+        return len(self.fs.prototype.code)
+
+    def patch(self, pc: int, target: int | None = None) -> None:
+        """Make the jump instruction at *pc* jump to *target*,
+        or to the next instruction that will be emitted."""
+        if target is None:
+            target = self.here()
+        code = self.fs.prototype.code
+        op, a, _, c = code[pc]
+        code[pc] = (op, a, target - pc - 1, c)
+
+    def jump_to(self, target: int) -> None:
+        self.emit(Opcode.JMP, 0, target - self.here() - 1)
+
+    def constant(self, value: LuaValue) -> int:
+        fs = self.fs
+        key = _constant_key(value)
+        index = fs.constant_indices.get(key)
+        if index is None:
+            index = len(fs.prototype.constants)
+            fs.prototype.constants.append(value)
+            fs.constant_indices[key] = index
+        return index
+
+    def name_constant(self, name: str) -> int:
+        return self.constant(str_to_lua_string(name))
+
+    def reserve(self, count: int = 1) -> int:
+        fs = self.fs
+        register = fs.free
+        fs.free += count
+        if fs.free > fs.prototype.register_count:
+            fs.prototype.register_count = fs.free
+        return register
+
+    def set_line(self, node: nodes.Node) -> None:
+        if node.line > 0:
+            self.line = node.line
+
+    # endregion
+
+    # region Blocks
+
+    def open_block(self) -> None:
+        self.fs.blocks.append(_BlockScope(self.fs.free))
+
+    def close_block(self) -> None:
+        fs = self.fs
+        block = fs.blocks.pop()
+        for pc, label in block.gotos:
+            if label in block.labels:
+                self.patch(pc, block.labels[label])
+            elif fs.blocks:
+                fs.blocks[-1].gotos.append((pc, label))
+            else:
+                raise LuaError(f"no visible label '{label}' for goto")
+        fs.free = fs.active = block.free
+
+    def block(self, block: nodes.Block, *, echo: bool = False) -> None:
+        self.open_block()
+        self.statements(block, echo=echo)
+        self.close_block()
+
+    def statements(self, block: nodes.Block, *, echo: bool = False) -> None:
+        statements = list(block.statements)
+        echoed = None
+        if (
+            echo
+            and block.return_statement is None
+            and statements
+            and isinstance(statements[-1], (
+                nodes.FuncCallRegular, nodes.FuncCallMethod,
+                nodes.Assignment, nodes.LocalAssignment,
+                nodes.FunctionStatement, nodes.LocalFunctionStatement,
+            ))
+        ):
+            # VirtualMachine.exec returns the values of the last statement of
+            # a chunk when it doesn't return anything.
+            echoed = statements.pop()
+        for statement in statements:
+            self.statement(statement)
+        if echoed is not None:
+            self.statement(echoed, echo=True)
+        if block.return_statement is not None:
+            self.statement(block.return_statement)
+
+    def declare(self, name: nodes.Name, register: int) -> LocalVariable:
+        variable = self.resolution.declaration(name)
+        self.fs.registers[id(variable)] = register
+        self.fs.active = max(self.fs.active, register + 1)
+        return variable
+
+    def activate(self, variable: LocalVariable, register: int) -> None:
+        """Emit the code that makes the value in *register* a local variable.
+        """
+        if variable.captured:
+            self.emit(Opcode.NEWCELL, register, _CELL_FLAGS[variable.attrib])
+        if variable.exported:
+            self.emit(
+                Opcode.EXPORT, register, self.name_constant(variable.name)
+            )
+
+    # endregion
+
+    # region Statements
+
+    def statement(self, statement: nodes.Statement, *, echo: bool = False) \
+            -> None:
+        self.set_line(statement)
+        method = getattr(self, f"stat_{type(statement).__name__}")
+        if echo:
+            method(statement, echo=True)
+        else:
+            method(statement)
+        # Temporary values don't outlive statements.
+        self.fs.free = self.fs.active
+
+    def stat_EmptyStatement(self, statement: nodes.EmptyStatement) -> None:
+        pass
+
+    def stat_Label(self, statement: nodes.Label) -> None:
+        self.fs.blocks[-1].labels[statement.name.name.text] = self.here()
+
+    def stat_Goto(self, statement: nodes.Goto) -> None:
+        self.fs.blocks[-1].gotos.append(
+            (self.emit(Opcode.JMP), statement.name.name.text)
+        )
+
+    def stat_Break(self, statement: nodes.Break) -> None:
+        if not self.fs.breaks:
+            raise LuaError("break outside a loop")
+        self.fs.breaks[-1].append(self.emit(Opcode.JMP))
+
+    def stat_Do(self, statement: nodes.Do) -> None:
+        self.block(statement.block)
+
+    def stat_Block(self, statement: nodes.Block) -> None:
+        self.block(statement)
+
+    def stat_ReturnStatement(self, statement: nodes.ReturnStatement) -> None:
+        values = statement.values
+        if len(values) == 1 and isinstance(
+            values[0], (nodes.FuncCallRegular, nodes.FuncCallMethod)
+        ):
+            base = self.reserve()
+            self.call(values[0], base, -1, tail=True)
+            self.emit(Opcode.RETURN, base, ~0)
+            return
+        base = self.fs.free
+        count, multires = self.expression_list(statement.values)
+        self.set_line(statement)
+        self.emit(Opcode.RETURN, base, ~count if multires else count)
+
+    def _call_statement(self, statement, *, echo: bool = False) -> None:
+        base = self.reserve()
+        self.call(statement, base, -1 if echo else 0)
+        if echo:
+            self.emit(Opcode.RETURN, base, ~0)
+
+    stat_FuncCallRegular = _call_statement
+    stat_FuncCallMethod = _call_statement
+
+    def stat_While(self, statement: nodes.While) -> None:
+        start = self.here()
+        exits = self.jump_if_false(statement.condition)
+        self.fs.breaks.append(exits)
+        self.block(statement.block)
+        self.jump_to(start)
+        for pc in self.fs.breaks.pop():
+            self.patch(pc)
+
+    def stat_Repeat(self, statement: nodes.Repeat) -> None:
+        start = self.here()
+        self.fs.breaks.append([])
+        # The condition can refer to the local variables of the block.
+        self.open_block()
+        self.statements(statement.block)
+        self.set_line(statement)
+        for pc in self.jump_if_false(statement.condition):
+            self.patch(pc, start)
+        self.close_block()
+        for pc in self.fs.breaks.pop():
+            self.patch(pc)
+
+    def stat_If(self, statement: nodes.If) -> None:
+        if statement.dispatch is not None:
+            self.dispatch(statement)
+            return
+        ends = []
+        arm_count = len(statement.blocks)
+        for i, (condition, block) in enumerate(statement.blocks):
+            nexts = self.jump_if_false(condition)
+            self.block(block)
+            if i < arm_count - 1 or statement.else_block is not None:
+                ends.append(self.emit(Opcode.JMP))
+            for pc in nexts:
+                self.patch(pc)
+        if statement.else_block is not None:
+            self.block(statement.else_block)
+        for pc in ends:
+            self.patch(pc)
+
+    def dispatch(self, statement: nodes.If) -> None:
+        dispatch = statement.dispatch
+        assert dispatch is not None
+        free = self.fs.free
+        register = self.expression_any(dispatch.subject)
+        self.fs.free = free
+        jump_tables = self.fs.prototype.jump_tables
+        table: dict[LuaValue, int] = {}
+        jump_tables.append(table)
+        self.set_line(statement)
+        switch = self.emit(Opcode.JMPTABLE, register, len(jump_tables) - 1)
+        starts = []
+        ends = []
+        arm_count = len(statement.blocks)
+        for i, (_, block) in enumerate(statement.blocks):
+            starts.append(self.here())
+            self.block(block)
+            if i < arm_count - 1 or statement.else_block is not None:
+                ends.append(self.emit(Opcode.JMP))
+        code = self.fs.prototype.code
+        op, a, b, _ = code[switch]
+        code[switch] = (op, a, b, self.here() - switch - 1)
+        if statement.else_block is not None:
+            self.block(statement.else_block)
+        for pc in ends:
+            self.patch(pc)
+        for value, i in dispatch.arms.items():
+            table[value] = starts[i] - switch - 1
+
+    def stat_For(self, statement: nodes.For) -> None:
+        self.open_block()
+        base = self.reserve()
+        self.expression_to(statement.start, base)
+        self.expression_to(statement.stop, self.reserve())
+        if statement.step is not None:
+            self.expression_to(statement.step, self.reserve())
+        else:
+            self.reserve()
+            self.emit(
+                Opcode.LOADK,
+                base + 2,
+                self.constant(lua_integer(1)),
+            )
+        self.set_line(statement)
+        prepare = self.emit(Opcode.FORPREP, base)
+        variable = self.declare(statement.name, base + 1)
+        body = self.here()
+        self.activate(variable, base + 1)
+        self.fs.breaks.append([])
+        self.block(statement.block)
+        self.patch(prepare)
+        self.set_line(statement)
+        self.emit(Opcode.FORLOOP, base, body - self.here() - 1)
+        for pc in self.fs.breaks.pop():
+            self.patch(pc)
+        self.close_block()
+
+    def stat_ForIn(self, statement: nodes.ForIn) -> None:
+        self.open_block()
+        base = self.fs.free
+        self.expression_list(statement.exprs, 4)
+        names = self.reserve(len(statement.names))
+        variables = [
+            self.declare(name, names + i)
+            for i, name in enumerate(statement.names)
+        ]
+        enter = self.emit(Opcode.JMP)
+        body = self.here()
+        for i, variable in enumerate(variables):
+            self.activate(variable, names + i)
+        self.fs.breaks.append([])
+        self.block(statement.block)
+        self.patch(enter)
+        self.set_line(statement)
+        self.emit(Opcode.TFORCALL, base, 0, len(variables))
+        self.emit(Opcode.TFORLOOP, base, body - self.here() - 1)
+        self.emit(Opcode.TFORCLOSE, base)
+        for pc in self.fs.breaks.pop():
+            self.patch(pc)
+        self.close_block()
+
+    def stat_LocalAssignment(
+        self,
+        statement: nodes.LocalAssignment,
+        *,
+        echo: bool = False,
+    ) -> None:
+        count = len(statement.names)
+        for attname in statement.names:
+            attrib = self.resolution.declaration(attname.name).attrib
+            if attrib not in _CELL_FLAGS:
+                raise LuaError(f"unknown attribute '{attrib}'")
+        base = self.fs.free
+        self.expression_list(statement.exprs or (), count)
+        if echo:
+            copies = self.reserve(count)
+            for i in range(count):
+                self.emit(Opcode.MOVE, copies + i, base + i)
+        for i, attname in enumerate(statement.names):
+            self.activate(self.declare(attname.name, base + i), base + i)
+        if echo:
+            self.emit(Opcode.RETURN, copies, count)
+        self.fs.free = base + count
+
+    def stat_Assignment(
+        self,
+        statement: nodes.Assignment,
+        *,
+        echo: bool = False,
+    ) -> None:
+        targets = statement.names
+        if not echo and len(targets) == 1 and len(statement.exprs) == 1:
+            self.assign_expression(targets[0], statement.exprs[0])
+            return
+        base = self.fs.free
+        self.expression_list(statement.exprs, len(targets))
+        for i, target in enumerate(targets):
+            self.assign_register(target, base + i)
+        if echo:
+            self.emit(Opcode.RETURN, base, len(targets))
+
+    def stat_LocalFunctionStatement(
+        self,
+        statement: nodes.LocalFunctionStatement,
+        *,
+        echo: bool = False,
+    ) -> None:
+        register = self.reserve()
+        variable = self.declare(statement.name, register)
+        name = statement.name.as_lua_string()
+        if not variable.captured:
+            self.function(statement.body, register, name=name)
+            result = register
+        else:
+            # The function can refer to itself through the variable.
+            self.emit(Opcode.LOADNIL, register, 1)
+            self.activate(variable, register)
+            result = self.reserve()
+            self.function(statement.body, result, name=name)
+            self.emit(Opcode.SETCELL, register, result)
+        if echo:
+            self.emit(Opcode.RETURN, result, 1)
+
+    def stat_FunctionStatement(
+        self,
+        statement: nodes.FunctionStatement,
+        *,
+        echo: bool = False,
+    ) -> None:
+        names = statement.name.names
+        function_name = names[-1].as_lua_string()
+        if len(names) == 1:
+            register = self.reserve()
+            self.function(
+                statement.body,
+                register,
+                name=function_name,
+                method=statement.name.method,
+            )
+            self.store_name(names[0], register)
+        else:
+            table = self.reserve()
+            self.load_name(names[0], table)
+            for name in names[1:-1]:
+                self.emit(
+                    Opcode.GETTABLE,
+                    table,
+                    table,
+                    ~self.constant(name.as_lua_string()),
+                )
+            register = self.reserve()
+            self.function(
+                statement.body,
+                register,
+                name=function_name,
+                method=statement.name.method,
+            )
+            self.emit(
+                Opcode.SETTABLE,
+                table,
+                ~self.constant(function_name),
+                register,
+            )
+        if echo:
+            self.emit(Opcode.RETURN, register, 1)
+
+    # endregion
+
+    # region Variables
+
+    def load_name(self, name: nodes.Name, register: int) -> None:
+        resolution = self.resolution.use(name)
+        if resolution.kind is NameKind.LOCAL:
+            variable = resolution.variable
+            assert variable is not None
+            source = self.fs.registers[id(variable)]
+            if variable.captured:
+                self.emit(Opcode.GETCELL, register, source)
+            elif source != register:
+                self.emit(Opcode.MOVE, register, source)
+        elif resolution.kind is NameKind.UPVALUE:
+            self.emit(Opcode.GETUPVAL, register, resolution.index)
+        else:
+            self.emit(
+                Opcode.GETGLOBAL, register, self.name_constant(resolution.name)
+            )
+
+    def store_constant(self) -> None:
+        # Like in the other engines,
+        # assigning to a constant variable is an error when it runs.
+        self.emit(
+            Opcode.ERROR,
+            0,
+            self.constant(LuaString(b"attempt to change constant variable")),
+        )
+
+    def store_name(self, name: nodes.Name, register: int) -> None:
+        resolution = self.resolution.use(name)
+        variable = resolution.variable
+        if variable is not None and variable.attrib == "const":
+            self.store_constant()
+            return
+        if resolution.kind is NameKind.LOCAL:
+            assert variable is not None
+            target = self.fs.registers[id(variable)]
+            if variable.captured:
+                self.emit(Opcode.SETCELL, target, register)
+            elif target != register:
+                self.emit(Opcode.MOVE, target, register)
+        elif resolution.kind is NameKind.UPVALUE:
+            self.emit(Opcode.SETUPVAL, register, resolution.index)
+        else:
+            self.emit(
+                Opcode.SETGLOBAL, register, self.name_constant(resolution.name)
+            )
+
+    def assign_register(self, target: nodes.Variable, register: int) -> None:
+        """Assign the value in *register* to the target of an assignment."""
+        if isinstance(target, nodes.VarName):
+            self.store_name(target.name, register)
+            return
+        if not isinstance(target, nodes.VarIndex):
+            raise ValueError(f"{type(target)=}")
+        free = self.fs.free
+        table = self.expression_any(target.base)
+        key = self.expression_rk(target.index)
+        self.emit(Opcode.SETTABLE, table, key, register)
+        self.fs.free = free
+
+    def assign_expression(
+        self,
+        target: nodes.Variable,
+        expression: nodes.Expression,
+    ) -> None:
+        free = self.fs.free
+        if isinstance(target, nodes.VarName):
+            resolution = self.resolution.use(target.name)
+            variable = resolution.variable
+            if (
+                resolution.kind is NameKind.LOCAL
+                and variable is not None
+                and not variable.captured
+                and variable.attrib != "const"
+                and _is_direct(expression)
+            ):
+                self.expression_to(
+                    expression, self.fs.registers[id(variable)]
+                )
+                return
+            self.store_name(target.name, self.expression_any(expression))
+            self.fs.free = free
+            return
+        if not isinstance(target, nodes.VarIndex):
+            raise ValueError(f"{type(target)=}")
+        value = self.expression_rk(expression)
+        table = self.expression_any(target.base)
+        key = self.expression_rk(target.index)
+        self.emit(Opcode.SETTABLE, table, key, value)
+        self.fs.free = free
+
+    # endregion
+
+    # region Expressions
+
+    def expression_to(self, expression: nodes.Expression, register: int) \
+            -> None:
+        """Put the value of an expression, adjusted to one value,
+        in a register.
+
+        Unless the expression is :func:`direct <_is_direct>`,
+        the register must be the last reserved register.
+        """
+        while isinstance(expression, nodes.ParenExpression):
+            expression = expression.exp
+        free = self.fs.free
+        if isinstance(expression, _CONSTANT_NODES):
+            self.emit(
+                Opcode.LOADK,
+                register,
+                self.constant(expression._evaluate(None)),
+            )
+        elif isinstance(expression, nodes.VarName):
+            self.load_name(expression.name, register)
+        elif isinstance(expression, nodes.VarIndex):
+            table = self.expression_any(expression.base)
+            key = self.expression_rk(expression.index)
+            self.emit(Opcode.GETTABLE, register, table, key)
+        elif isinstance(expression, nodes.BinaryOperation):
+            self.binary_operation(expression, register)
+        elif isinstance(expression, nodes.UnaryOperation):
+            operand = self.expression_any(expression.exp)
+            self.emit(UNARY_OPCODES[expression.op], register, operand)
+        elif isinstance(expression, (nodes.FuncCallRegular,
+                                     nodes.FuncCallMethod)):
+            self.call(expression, register, 1)
+        elif isinstance(expression, nodes.VarArgExpr):
+            self.emit(Opcode.VARARG, register, 1)
+        elif isinstance(expression, nodes.FuncDef):
+            self.function(expression.body, register)
+        elif isinstance(expression, nodes.FuncBody):
+            self.function(expression, register)
+        elif isinstance(expression, nodes.TableConstructor):
+            self.table_constructor(expression, register)
+        else:
+            raise TypeError(f"unexpected expression {expression!r}")
+        self.fs.free = max(free, register + 1)
+
+    def expression_any(self, expression: nodes.Expression) -> int:
+        """Put the value of an expression in some register.
+
+        :return: The register.
+        """
+        while isinstance(expression, nodes.ParenExpression):
+            expression = expression.exp
+        if isinstance(expression, nodes.VarName):
+            resolution = self.resolution.use(expression.name)
+            variable = resolution.variable
+            if (
+                resolution.kind is NameKind.LOCAL
+                and variable is not None
+                and not variable.captured
+            ):
+                return self.fs.registers[id(variable)]
+        register = self.reserve()
+        self.expression_to(expression, register)
+        return register
+
+    def expression_rk(self, expression: nodes.Expression) -> int:
+        """Put the value of an expression in some register or the constant
+        pool.
+
+        :return: The register, or the index of the constant inverted.
+        """
+        while isinstance(expression, nodes.ParenExpression):
+            expression = expression.exp
+        if isinstance(expression, _CONSTANT_NODES):
+            return ~self.constant(expression._evaluate(None))
+        return self.expression_any(expression)
+
+    def expression_list(
+        self,
+        expressions: Sequence[nodes.Expression],
+        count: int = -1,
+    ) -> tuple[int, bool]:
+        """Put the values of expressions in consecutive registers,
+        starting at the first free register.
+
+        :param count: The number of values to adjust the values to,
+                      or ``-1`` to leave the values of a multires expression
+                      at the end in multires.
+        :return: The number of values put in registers and whether multires
+                 holds more values.
+        """
+        base = self.fs.free
+        last = len(expressions) - 1
+        for i, expression in enumerate(expressions):
+            if i == last and isinstance(expression, _MULTIRES_NODES):
+                wanted = -1 if count < 0 else max(count - i, 0)
+                register = self.reserve()
+                if isinstance(expression, nodes.VarArgExpr):
+                    self.emit(Opcode.VARARG, register, wanted)
+                else:
+                    self.call(expression, register, wanted)
+                if count < 0:
+                    self.fs.free = base + i
+                    return i, True
+                self.fs.free = register
+                self.reserve(wanted)
+                break
+            self.expression_to(expression, self.reserve())
+        if count < 0:
+            return len(expressions), False
+        if self.fs.free < base + count:
+            missing = base + count - self.fs.free
+            self.emit(Opcode.LOADNIL, self.reserve(missing), missing)
+        self.fs.free = base + count
+        return count, False
+
+    def binary_operation(
+        self,
+        expression: nodes.BinaryOperation,
+        register: int,
+    ) -> None:
+        if expression.op in (BinaryOperator.AND, BinaryOperator.OR):
+            self.expression_to(expression.lhs, register)
+            jump = self.emit(
+                Opcode.JMPIFNOT
+                if expression.op is BinaryOperator.AND
+                else Opcode.JMPIF,
+                register,
+            )
+            self.expression_to(expression.rhs, register)
+            self.patch(jump)
+            return
+        lhs = self.expression_rk(expression.lhs)
+        rhs = self.expression_rk(expression.rhs)
+        self.emit(BINARY_OPCODES[expression.op], register, lhs, rhs)
+
+    def jump_if_false(self, expression: nodes.Expression) -> list[int]:
+        """Emit code that jumps if the expression is ``false`` or ``nil``.
+
+        :return: The jumps, to be patched with the target.
+        """
+        while isinstance(expression, nodes.ParenExpression):
+            expression = expression.exp
+        if isinstance(expression, _TRUE_NODES):
+            return []
+        if isinstance(expression, (nodes.LiteralFalse, nodes.LiteralNil)):
+            return [self.emit(Opcode.JMP)]
+        if isinstance(expression, nodes.UnaryOperation) \
+                and expression.op is UnaryOperator.NOT:
+            return self.jump_if_true(expression.exp)
+        if isinstance(expression, nodes.BinaryOperation):
+            if expression.op is BinaryOperator.AND:
+                return (
+                    self.jump_if_false(expression.lhs)
+                    + self.jump_if_false(expression.rhs)
+                )
+            if expression.op is BinaryOperator.OR:
+                skips = self.jump_if_true(expression.lhs)
+                jumps = self.jump_if_false(expression.rhs)
+                for pc in skips:
+                    self.patch(pc)
+                return jumps
+        free = self.fs.free
+        register = self.expression_any(expression)
+        self.fs.free = free
+        return [self.emit(Opcode.JMPIFNOT, register)]
+
+    def jump_if_true(self, expression: nodes.Expression) -> list[int]:
+        """Emit code that jumps if the expression is neither ``false`` nor
+        ``nil``.
+
+        :return: The jumps, to be patched with the target.
+        """
+        while isinstance(expression, nodes.ParenExpression):
+            expression = expression.exp
+        if isinstance(expression, (nodes.LiteralFalse, nodes.LiteralNil)):
+            return []
+        if isinstance(expression, _TRUE_NODES):
+            return [self.emit(Opcode.JMP)]
+        if isinstance(expression, nodes.UnaryOperation) \
+                and expression.op is UnaryOperator.NOT:
+            return self.jump_if_false(expression.exp)
+        if isinstance(expression, nodes.BinaryOperation):
+            if expression.op is BinaryOperator.OR:
+                return (
+                    self.jump_if_true(expression.lhs)
+                    + self.jump_if_true(expression.rhs)
+                )
+            if expression.op is BinaryOperator.AND:
+                skips = self.jump_if_false(expression.lhs)
+                jumps = self.jump_if_true(expression.rhs)
+                for pc in skips:
+                    self.patch(pc)
+                return jumps
+        free = self.fs.free
+        register = self.expression_any(expression)
+        self.fs.free = free
+        return [self.emit(Opcode.JMPIF, register)]
+
+    def call(
+        self,
+        expression: nodes.FuncCallRegular | nodes.FuncCallMethod,
+        base: int,
+        results: int,
+        *,
+        tail: bool = False,
+    ) -> None:
+        """Emit a call whose function is put in *base*,
+        which must be the last reserved register.
+
+        :param results: The number of results to put in registers from
+                        *base*, or ``-1`` to put them in multires.
+        :param tail: Whether to emit a :attr:`~Opcode.TAILCALL`,
+                     which must be followed by a return of multires.
+        """
+        if isinstance(expression, nodes.FuncCallMethod):
+            free = self.fs.free
+            obj = self.expression_any(expression.object)
+            self.fs.free = free
+            self.reserve()
+            self.set_line(expression)
+            self.emit(
+                Opcode.SELF,
+                base,
+                obj,
+                ~self.constant(expression.method.as_lua_string()),
+            )
+            count, multires = self.expression_list(expression.args)
+            count += 1
+        else:
+            self.expression_to(expression.name, base)
+            count, multires = self.expression_list(expression.args)
+        self.set_line(expression)
+        self.emit(
+            Opcode.TAILCALL if tail else Opcode.CALL,
+            base,
+            ~count if multires else count,
+            results,
+        )
+        self.fs.free = base + 1
+
+    def table_constructor(
+        self,
+        expression: nodes.TableConstructor,
+        register: int,
+    ) -> None:
+        self.emit(Opcode.NEWTABLE, register)
+        counter = 1
+        fields = expression.fields
+        for i, field in enumerate(fields):
+            free = self.fs.free
+            if isinstance(field, nodes.FieldWithKey):
+                if isinstance(field.key, nodes.Name):
+                    key = ~self.constant(field.key.as_lua_string())
+                else:
+                    key = self.expression_rk(field.key)
+                value = self.expression_rk(field.value)
+                self.emit(Opcode.SETTABLE, register, key, value)
+            elif i == len(fields) - 1 and isinstance(
+                field.value, _MULTIRES_NODES
+            ):
+                self.expression_list([field.value])
+                self.emit(Opcode.SETLIST, register, 0, counter)
+            else:
+                key = ~self.constant(
+                    lua_integer(counter)
+                )
+                value = self.expression_rk(field.value)
+                self.emit(Opcode.SETTABLE, register, key, value)
+                counter += 1
+            self.fs.free = free
+
+    def function(
+        self,
+        body: nodes.FuncBody,
+        register: int,
+        *,
+        name: LuaString | None = None,
+        method: bool = False,
+    ) -> None:
+        """Compile a function body and emit the code that creates a function
+        of it in *register*."""
+        info = self.resolution.function(body)
+        parent = self.fs
+        param_names = [param.as_lua_string() for param in body.params]
+        if method:
+            param_names.insert(0, LuaString(b"self"))
+        prototype = Prototype(
+            param_names=param_names,
+            variadic=body.vararg,
+            name=name,
+            file=body.file,
+            line=body.line,
+            upvalues=[
+                (
+                    upvalue.in_parent_frame,
+                    parent.registers[id(upvalue.variable)]
+                    if upvalue.in_parent_frame
+                    else upvalue.index,
+                )
+                for upvalue in info.upvalues
+            ],
+            upvalue_names=[upvalue.variable.name for upvalue in info.upvalues],
+        )
+        line = self.line
+        self.fs = _FunctionState(prototype, info, parent)
+        self.reserve(len(info.parameters))
+        self.fs.active = self.fs.free
+        self.open_block()
+        for i, parameter in enumerate(info.parameters):
+            self.fs.registers[id(parameter)] = i
+            self.activate(parameter, i)
+        self.statements(body.body)
+        self.close_block()
+        self.emit(Opcode.RETURN, 0, 0)
+        self.fs = parent
+        self.line = line
+        parent.prototype.prototypes.append(prototype)
+        self.emit(
+            Opcode.CLOSURE, register, len(parent.prototype.prototypes) - 1
+        )
+
+    # endregion
+
+    def chunk(self, chunk: nodes.Chunk, *, echo: bool) -> Prototype:
+        prototype = Prototype(variadic=True, file=chunk.file, line=0)
+        self.fs = _FunctionState(
+            prototype, self.resolution.function(chunk), None
+        )
+        self.open_block()
+        self.statements(chunk.block, echo=echo)
+        self.close_block()
+        self.emit(Opcode.RETURN, 0, 0)
+        return prototype
+
+
+def compile_chunk(
+    chunk: nodes.Chunk,
+    *,
+    export_chunk_locals: bool = True,
+) -> Prototype:
+    """Compile a main chunk to bytecode.
+
+    :param export_chunk_locals: Whether the local variables declared in the
+                                outermost block of the chunk are put in the
+                                scope that the chunk runs in,
+                                like in :meth:`VirtualMachine.exec`.
+                                If so, the chunk also returns the values of
+                                its last statement if it doesn't return
+                                anything.
+    """
+    resolution = resolve(chunk, export_chunk_locals=export_chunk_locals)
+    return _Compiler(resolution).chunk(chunk, echo=export_chunk_locals)
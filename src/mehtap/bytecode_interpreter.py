@@ -0,0 +1,573 @@
+"""The dispatch loop that runs :mod:`mehtap.bytecode`.
+
+Calls from Lua functions to Lua functions don't recurse in Python:
+the frame of the caller is saved on a stack and the loop goes on with the
+frame of the callee.
+The loop only recurses when Lua code is called from Python,
+for example by :func:`pcall` or by metamethods.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Iterator, Sequence
+from typing import TYPE_CHECKING
+
+import attrs
+
+from mehtap.bytecode import (
+    FIRST_BINARY_OPCODE,
+    FIRST_UNARY_OPCODE,
+    LAST_BINARY_OPCODE,
+    LAST_UNARY_OPCODE,
+    Opcode,
+    Prototype,
+)
+from mehtap.bytecode_compiler import BINARY_OPCODES, UNARY_OPCODES
+from mehtap.ast_nodes import binary_operator_functions, unary_operator_functions
+from mehtap.control_structures import LuaError
+from mehtap.library.stdlib.basic_library import native_table_step
+from mehtap.operations import (
+    adjust_flatten,
+    call,
+    coerce_int_to_float,
+    index,
+    new_index,
+)
+from mehtap.values import (
+    LuaFalse,
+    LuaFunction,
+    LuaIndexableABC,
+    LuaNil,
+    LuaNumber,
+    LuaNumberType,
+    LuaString,
+    LuaTable,
+    LuaValue,
+    MAX_INT64,
+    MIN_INT64,
+    Variable,
+    lua_integer,
+    type_of_lv,
+)
+
+if TYPE_CHECKING:
+    from mehtap.scope import Scope
+
+
+def _operator_table(first, last, opcodes, functions) -> tuple:
+    table = [None] * (last - first + 1)
+    for operator, opcode in opcodes.items():
+        table[opcode - first] = functions[operator]
+    return tuple(table)
+
+
+_BINARY_FUNCTIONS = _operator_table(
+    FIRST_BINARY_OPCODE,
+    LAST_BINARY_OPCODE,
+    BINARY_OPCODES,
+    binary_operator_functions,
+)
+_UNARY_FUNCTIONS = _operator_table(
+    FIRST_UNARY_OPCODE,
+    LAST_UNARY_OPCODE,
+    UNARY_OPCODES,
+    unary_operator_functions,
+)
+
+
+@attrs.define(slots=True, eq=False, repr=False)
+class BytecodeFunction(LuaFunction):
+    """A Lua function that was compiled to bytecode."""
+
+    prototype: Prototype = None
+    """The compiled code of the function."""
+    upvalues: tuple[Variable, ...] = ()
+    """The variables of enclosing functions that the function refers to."""
+
+    def rawcall(
+        self,
+        args,
+        scope: Scope | None,
+        *,
+        modify_tb: bool = True,
+    ) -> list[LuaValue]:
+        try:
+            return execute(self, adjust_flatten(args))
+        except LuaError as le:
+            if modify_tb:
+                le.push_tb(str(self))
+            raise le
+        except Exception as e:
+            le = LuaError(
+                LuaString(f"{self!s}: {e!s}".encode("utf-8")),
+                caused_by=e,
+            )
+            if modify_tb:
+                le.push_tb(str(self))
+            raise le from e
+
+
+def _new_function(
+    prototype: Prototype,
+    registers: list,
+    upvalues: tuple[Variable, ...],
+    scope: Scope,
+) -> BytecodeFunction:
+    return BytecodeFunction(
+        param_names=prototype.param_names,
+        variadic=prototype.variadic,
+        parent_scope=scope,
+        block=prototype,
+        gets_scope=False,
+        name=prototype.name,
+        min_req=0,
+        prototype=prototype,
+        upvalues=tuple(
+            registers[i] if in_parent_frame else upvalues[i]
+            for in_parent_frame, i in prototype.upvalues
+        ),
+    )
+
+
+def _enter(function: BytecodeFunction, args: list[LuaValue]) \
+        -> tuple[list[LuaValue], list[LuaValue] | None]:
+    """
+    :return: The registers and the variable arguments of a new frame of the
+             function.
+    """
+    prototype = function.prototype
+    param_count = len(prototype.param_names)
+    given = len(args)
+    if given >= param_count:
+        registers = args[:param_count]
+    else:
+        registers = args + [LuaNil] * (param_count - given)
+    registers.extend([LuaNil] * (prototype.register_count - param_count))
+    if prototype.variadic:
+        return registers, args[param_count:]
+    return registers, None
+
+
+def _call_other(
+    function: LuaValue,
+    args: list[LuaValue],
+    scope: Scope,
+) -> Sequence[LuaValue]:
+    """Call a value that is not a :class:`BytecodeFunction`."""
+    if function.__class__ is LuaFunction and function.fastcall:
+        r = function.fastcall_with(args, scope)
+    else:
+        r = call(function, args, scope, modify_tb=False)
+    if r.__class__ is list:
+        return r
+    # Native functions may return a single value or nothing.
+    if r is None:
+        return []
+    if isinstance(r, LuaValue):
+        return [r]
+    return adjust_flatten(r)
+
+
+def _numeric_for(
+    initial_value: LuaValue,
+    limit: LuaValue,
+    step: LuaValue,
+) -> Iterator[LuaNumber]:
+    if not isinstance(initial_value, LuaNumber):
+        raise LuaError("the initial value must be a number")
+    if not isinstance(limit, LuaNumber):
+        raise LuaError("the limit value must be a number")
+    if not isinstance(step, LuaNumber):
+        raise LuaError("the step value must be a number")
+    if step.value == 0:
+        raise LuaError("step must not be zero")
+    if (
+        initial_value.type is LuaNumberType.INTEGER
+        and step.type is LuaNumberType.INTEGER
+    ):
+        # The loop is done with integers and never wraps around.
+        last = limit.value
+        if step.value > 0:
+            if isinstance(last, float):
+                last = min(last, MAX_INT64) // 1
+            values = range(initial_value.value, int(last) + 1, step.value)
+        else:
+            if isinstance(last, float):
+                last = -(-max(last, MIN_INT64) // 1)
+            values = range(initial_value.value, int(last) - 1, step.value)
+        return map(lua_integer, values)
+    return _float_for(
+        coerce_int_to_float(initial_value).value,
+        coerce_int_to_float(limit).value,
+        coerce_int_to_float(step).value,
+    )
+
+
+def _float_for(value: float, last: float, increment: float) \
+        -> Iterator[LuaNumber]:
+    floating = LuaNumberType.FLOAT
+    while value <= last if increment > 0 else value >= last:
+        yield LuaNumber(value, floating)
+        value += increment
+
+
+def _returned(
+    registers: list,
+    a: int,
+    b: int,
+    multires: Sequence[LuaValue],
+) -> list[LuaValue]:
+    if b >= 0:
+        return registers[a:a + b]
+    values = registers[a:a + ~b]
+    values.extend(multires)
+    return values
+
+
+def execute(function: BytecodeFunction, args: list[LuaValue]) \
+        -> list[LuaValue]:
+    """Call a function compiled to bytecode.
+
+    :param args: The arguments, which must not contain multires lists.
+    :return: The values returned by the function.
+    """
+    vm = function.parent_scope.vm
+    depth = vm.call_depth
+    if depth >= vm.max_call_depth:
+        raise LuaError("stack overflow")
+    vm.call_depth = depth + 1
+    try:
+        registers, varargs = _enter(function, args)
+        return _run(
+            function,
+            registers,
+            varargs,
+            function.parent_scope,
+        )
+    finally:
+        vm.call_depth = depth
+
+
+def execute_main(prototype: Prototype, scope: Scope) -> list[LuaValue]:
+    """Run a compiled main chunk in a scope.
+
+    :return: The values returned by the chunk.
+    """
+    depth = scope.vm.call_depth
+    try:
+        return _run(
+            BytecodeFunction(
+                param_names=[],
+                variadic=True,
+                parent_scope=scope,
+                block=prototype,
+                prototype=prototype,
+            ),
+            [LuaNil] * prototype.register_count,
+            scope.varargs,
+            scope,
+        )
+    finally:
+        scope.vm.call_depth = depth
+
+
+def _run(
+    function: BytecodeFunction,
+    registers: list,
+    varargs: list[LuaValue] | None,
+    scope: Scope,
+) -> list[LuaValue]:
+    MOVE = Opcode.MOVE.value
+    LOADK = Opcode.LOADK.value
+    GETCELL = Opcode.GETCELL.value
+    SETCELL = Opcode.SETCELL.value
+    GETUPVAL = Opcode.GETUPVAL.value
+    SETUPVAL = Opcode.SETUPVAL.value
+    GETGLOBAL = Opcode.GETGLOBAL.value
+    SETGLOBAL = Opcode.SETGLOBAL.value
+    GETTABLE = Opcode.GETTABLE.value
+    SETTABLE = Opcode.SETTABLE.value
+    SELF = Opcode.SELF.value
+    CALL = Opcode.CALL.value
+    TAILCALL = Opcode.TAILCALL.value
+    RETURN = Opcode.RETURN.value
+    JMP = Opcode.JMP.value
+    JMPIF = Opcode.JMPIF.value
+    JMPIFNOT = Opcode.JMPIFNOT.value
+    FORPREP = Opcode.FORPREP.value
+    FORLOOP = Opcode.FORLOOP.value
+    TFORCALL = Opcode.TFORCALL.value
+    TFORLOOP = Opcode.TFORLOOP.value
+    TFORCLOSE = Opcode.TFORCLOSE.value
+    NEWTABLE = Opcode.NEWTABLE.value
+    SETLIST = Opcode.SETLIST.value
+    CLOSURE = Opcode.CLOSURE.value
+    VARARG = Opcode.VARARG.value
+    NEWCELL = Opcode.NEWCELL.value
+    EXPORT = Opcode.EXPORT.value
+    LOADNIL = Opcode.LOADNIL.value
+    JMPTABLE = Opcode.JMPTABLE.value
+    ERROR = Opcode.ERROR.value
+    FIRST_BINARY = FIRST_BINARY_OPCODE.value
+    LAST_BINARY = LAST_BINARY_OPCODE.value
+    FIRST_UNARY = FIRST_UNARY_OPCODE.value
+    binary_functions = _BINARY_FUNCTIONS
+    unary_functions = _UNARY_FUNCTIONS
+    nil = LuaNil
+    false = LuaFalse
+    bytecode_function = BytecodeFunction
+    # Calls of functions compiled to bytecode are counted in the call depth
+    # of the virtual machine when their frames are saved,
+    # and when they are made through other functions.
+    vm = scope.vm
+    max_call_depth = vm.max_call_depth
+
+    prototype = function.prototype
+    code = prototype.code
+    constants = prototype.constants
+    upvalues = function.upvalues
+    pc = 0
+    multires: Sequence[LuaValue] = ()
+    # The saved state of the callers of the running function.
+    frames = []
+
+    while True:
+        try:
+            while True:
+                op, a, b, c = code[pc]
+                pc += 1
+                if op == MOVE:
+                    registers[a] = registers[b]
+                elif op == LOADK:
+                    registers[a] = constants[b]
+                elif op == GETCELL:
+                    registers[a] = registers[b].value
+                elif FIRST_BINARY <= op <= LAST_BINARY:
+                    registers[a] = binary_functions[op - FIRST_BINARY](
+                        registers[b] if b >= 0 else constants[~b],
+                        registers[c] if c >= 0 else constants[~c],
+                    )
+                elif op == JMPIFNOT:
+                    value = registers[a]
+                    if value is nil or value is false:
+                        pc += b
+                elif op == JMP:
+                    pc += b
+                elif op == FORLOOP:
+                    value = next(registers[a], None)
+                    if value is not None:
+                        registers[a + 1] = value
+                        pc += b
+                elif op == GETUPVAL:
+                    registers[a] = upvalues[b].value
+                elif op == GETTABLE:
+                    registers[a] = index(
+                        registers[b],
+                        registers[c] if c >= 0 else constants[~c],
+                    )
+                elif op == GETGLOBAL:
+                    registers[a] = scope.get_ls(constants[b])
+                elif op == SETCELL:
+                    registers[a].value = registers[b]
+                elif op == SETUPVAL:
+                    upvalues[b].value = registers[a]
+                elif op == CALL:
+                    callee = registers[a]
+                    if b >= 0:
+                        args = registers[a + 1:a + 1 + b]
+                    else:
+                        args = registers[a + 1:a + 1 + ~b]
+                        args.extend(multires)
+                    if callee.__class__ is bytecode_function:
+                        depth = vm.call_depth
+                        if depth >= max_call_depth:
+                            raise LuaError("stack overflow")
+                        vm.call_depth = depth + 1
+                        frames.append((
+                            function, registers, varargs, scope, upvalues,
+                            pc, a, c,
+                        ))
+                        function = callee
+                        prototype = callee.prototype
+                        code = prototype.code
+                        constants = prototype.constants
+                        upvalues = callee.upvalues
+                        scope = callee.parent_scope
+                        registers, varargs = _enter(callee, args)
+                        pc = 0
+                        continue
+                    values = _call_other(callee, args, scope)
+                    if c < 0:
+                        multires = values
+                    elif c:
+                        if len(values) < c:
+                            values = list(values)
+                            values.extend([nil] * (c - len(values)))
+                        registers[a:a + c] = values[:c]
+                elif op == RETURN:
+                    values = _returned(registers, a, b, multires)
+                    if not frames:
+                        return values
+                    vm.call_depth -= 1
+                    (
+                        function, registers, varargs, scope, upvalues,
+                        pc, a, c,
+                    ) = frames.pop()
+                    prototype = function.prototype
+                    code = prototype.code
+                    constants = prototype.constants
+                    if c < 0:
+                        multires = values
+                    elif c:
+                        if len(values) < c:
+                            values.extend([nil] * (c - len(values)))
+                        registers[a:a + c] = values[:c]
+                elif op == TAILCALL:
+                    callee = registers[a]
+                    if b >= 0:
+                        args = registers[a + 1:a + 1 + b]
+                    else:
+                        args = registers[a + 1:a + 1 + ~b]
+                        args.extend(multires)
+                    if callee.__class__ is bytecode_function:
+                        # The frame of the running function is reused,
+                        # and the callee returns to its caller.
+                        function = callee
+                        prototype = callee.prototype
+                        code = prototype.code
+                        constants = prototype.constants
+                        upvalues = callee.upvalues
+                        scope = callee.parent_scope
+                        registers, varargs = _enter(callee, args)
+                        pc = 0
+                        continue
+                    multires = _call_other(callee, args, scope)
+                elif op == SETTABLE:
+                    table = registers[a]
+                    if not isinstance(table, LuaIndexableABC):
+                        raise LuaError(
+                            f"attempt to index {type_of_lv(table)} value"
+                        )
+                    new_index(
+                        table,
+                        registers[b] if b >= 0 else constants[~b],
+                        registers[c] if c >= 0 else constants[~c],
+                    )
+                elif op == JMPIF:
+                    value = registers[a]
+                    if value is not nil and value is not false:
+                        pc += b
+                elif op == JMPTABLE:
+                    value = registers[a]
+                    cls = value.__class__
+                    if cls is LuaNumber or cls is LuaString:
+                        pc += prototype.jump_tables[b].get(value, c)
+                    else:
+                        pc += c
+                elif op == SETGLOBAL:
+                    scope.put_nonlocal_ls(constants[b], registers[a])
+                elif op == SELF:
+                    obj = registers[b]
+                    registers[a + 1] = obj
+                    registers[a] = index(
+                        obj, registers[c] if c >= 0 else constants[~c]
+                    )
+                elif op >= FIRST_UNARY:
+                    registers[a] = unary_functions[op - FIRST_UNARY](
+                        registers[b]
+                    )
+                elif op == NEWTABLE:
+                    registers[a] = LuaTable()
+                elif op == CLOSURE:
+                    registers[a] = _new_function(
+                        prototype.prototypes[b], registers, upvalues, scope
+                    )
+                elif op == NEWCELL:
+                    registers[a] = Variable(registers[a], b == 1, b == 2)
+                elif op == TFORCALL:
+                    callee = registers[a]
+                    args = [registers[a + 1], registers[a + 2]]
+                    if callee.__class__ is bytecode_function:
+                        depth = vm.call_depth
+                        if depth >= max_call_depth:
+                            raise LuaError("stack overflow")
+                        vm.call_depth = depth + 1
+                        frames.append((
+                            function, registers, varargs, scope, upvalues,
+                            pc, a + 4, c,
+                        ))
+                        function = callee
+                        prototype = callee.prototype
+                        code = prototype.code
+                        constants = prototype.constants
+                        upvalues = callee.upvalues
+                        scope = callee.parent_scope
+                        registers, varargs = _enter(callee, args)
+                        pc = 0
+                        continue
+                    step = native_table_step(callee, args[0])
+                    if step is not None:
+                        values = step(args[0], args[1]) or (nil,)
+                    else:
+                        values = _call_other(callee, args, scope)
+                    if len(values) < c:
+                        values = list(values)
+                        values.extend([nil] * (c - len(values)))
+                    registers[a + 4:a + 4 + c] = values[:c]
+                elif op == TFORLOOP:
+                    value = registers[a + 4]
+                    if value is not nil:
+                        registers[a + 2] = value
+                        pc += b
+                elif op == TFORCLOSE:
+                    if registers[a + 3] is not nil:
+                        # The closing value behaves like a to-be-closed
+                        # variable, which isn't supported.
+                        raise NotImplementedError()
+                elif op == FORPREP:
+                    registers[a] = _numeric_for(
+                        registers[a], registers[a + 1], registers[a + 2]
+                    )
+                    pc += b
+                elif op == VARARG:
+                    if varargs is None:
+                        raise LuaError(
+                            "cannot use '...' outside a vararg function"
+                        )
+                    if b < 0:
+                        multires = varargs
+                    else:
+                        for i in range(b):
+                            registers[a + i] = (
+                                varargs[i] if i < len(varargs) else nil
+                            )
+                elif op == SETLIST:
+                    registers[a].put_sequence(c, multires)
+                elif op == LOADNIL:
+                    for i in range(a, a + b):
+                        registers[i] = nil
+                elif op == EXPORT:
+                    scope.put_local_ls(constants[b], registers[a])
+                elif op == ERROR:
+                    raise LuaError(constants[b])
+                else:
+                    raise ValueError(f"unknown opcode {op}")
+        except LuaError as le:
+            # Add the calls that the error passes through to the traceback,
+            # like the other engines do.
+            while True:
+                op, a, _, _ = code[pc - 1]
+                if op == CALL or op == TFORCALL or op == TAILCALL:
+                    le.push_tb(
+                        f"call of {registers[a]}",
+                        file=prototype.file,
+                        line=prototype.lines[pc - 1],
+                    )
+                if not frames:
+                    raise le
+                (
+                    function, registers, varargs, scope, upvalues,
+                    pc, _, _,
+                ) = frames.pop()
+                prototype = function.prototype
+                code = prototype.code
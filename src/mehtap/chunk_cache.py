@@ -0,0 +1,291 @@
+"""Persistent cache of parsed and transformed Lua chunks.
+
+Like Python's ``__pycache__``, the abstract syntax tree of a Lua file is
+written to a cache file after it is parsed for the first time,
+so that loading the same file again doesn't need to parse it.
+
+Cache files start with a fixed-size header, followed by the pickled
+:class:`~mehtap.ast_nodes.Chunk`:
+
+* :data:`MAGIC`,
+* a digest of the mehtap version, the grammar version,
+  the source of the modules that make and define syntax trees
+  (see :data:`TREE_MODULES`), the parser backend,
+  whether the chunk is optimized and the name of the chunk,
+* the modification time and the size of the source file,
+* the SHA-256 digest of the contents of the source file.
+
+A cache file is used without reading the source file if the modification time
+and the size of the source file match the header,
+and after hashing the source file otherwise.
+A file that is loaded under different chunk names has a cache file per name,
+since the name of the chunk is stored in its syntax tree.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import pickle
+import struct
+from os import PathLike
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import attrs
+
+from mehtap.parser import GRAMMAR_VERSION, ParserBackend, parse_chunk
+
+if TYPE_CHECKING:
+    from mehtap.ast_nodes import Chunk
+    from mehtap.vm import VirtualMachine
+
+
+MAGIC = b"MEHTAPC\x08"
+"""Magic bytes that cache files start with.
+
+The last byte is increased whenever the format of cache files changes.
+Changes to the syntax trees are detected through :data:`TREE_MODULES`.
+"""
+CACHE_DIRECTORY_NAME = "__luacache__"
+"""Name of the directory that cache files are stored in by default."""
+
+TREE_MODULES = (
+    "ast_nodes.py",
+    "ast_transformer.py",
+    "descent_parser.py",
+    "jump_checker.py",
+    "optimizer.py",
+    "parser.py",
+    "resolver.py",
+    "values.py",
+)
+"""The modules of mehtap whose source is part of the key of cache files,
+because they make the syntax trees that are cached or define their classes.
+"""
+
+_HEADER = struct.Struct("<8s32sQQ32s")
+_tree_version: str | None = None
+
+
+def _get_tree_version() -> str:
+    # Digest of the source of the modules in TREE_MODULES, computed once.
+    global _tree_version
+    if _tree_version is None:
+        digest = hashlib.sha256()
+        directory = Path(__file__).parent
+        for name in TREE_MODULES:
+            try:
+                digest.update((directory / name).read_bytes())
+            except OSError:
+                # Only the compiled module is installed,
+                # the version of mehtap identifies it instead.
+                digest.update(name.encode("utf-8"))
+        _tree_version = digest.hexdigest()[:16]
+    return _tree_version
+
+
+def read_source(path: str | bytes | PathLike) -> tuple[str, bytes]:
+    """Read a Lua source file.
+
+    Line endings are normalized like in Python's text mode,
+    and a first line starting with ``#`` (such as a shebang line) is blanked
+    out.
+
+    :return: A tuple of the source code and the raw contents of the file.
+    """
+    with open(path, "rb") as f:
+        content = f.read()
+    source = content.decode("utf-8")
+    source = source.replace("\r\n", "\n").replace("\r", "\n")
+    if source.startswith("#"):
+        newline = source.find("\n")
+        source = "" if newline == -1 else source[newline:]
+    return source, content
+
+
+def _key_digest(
+    filename: str,
+    backend: ParserBackend,
+    optimize: bool,
+) -> bytes:
+    from mehtap import __version__
+
+    key = "\0".join((
+        __version__,
+        GRAMMAR_VERSION,
+        _get_tree_version(),
+        backend.value,
+        str(optimize),
+        filename,
+    ))
+    return hashlib.sha256(key.encode("utf-8")).digest()
+
+
+@attrs.define(slots=True)
+class ChunkCache:
+    """Cache of parsed chunks of Lua files.
+
+    :param directory: The directory to store cache files in.
+                      If :data:`None`, cache files are stored in a
+                      ``__luacache__`` directory next to each source file.
+    """
+
+    directory: str | PathLike[str] | None = None
+    """The directory cache files are stored in."""
+    hits: int = 0
+    """The number of chunks that were loaded from the cache."""
+    misses: int = 0
+    """The number of chunks that had to be parsed."""
+
+    def cache_path(
+        self,
+        source_path: str | bytes | PathLike,
+        *,
+        filename: str | None = None,
+    ) -> Path:
+        """
+        :param filename: The name of the chunk.
+                         Defaults to the name of the source file,
+                         which is what files are loaded as by default.
+        :return: The path of the cache file of the given source file
+                 when it is loaded as a chunk with the given name.
+        """
+        source_path = Path(os.fsdecode(source_path)).absolute()
+        if filename is None:
+            filename = source_path.name
+        if self.directory is None:
+            if filename == source_path.name:
+                name = source_path.name
+            else:
+                name_digest = hashlib.sha256(
+                    filename.encode("utf-8")
+                ).hexdigest()[:16]
+                name = f"{source_path.name}.{name_digest}"
+            return (
+                source_path.parent
+                / CACHE_DIRECTORY_NAME
+                / f"{name}.mehtapc"
+            )
+        path_digest = hashlib.sha256(
+            os.fsencode(source_path) + b"\0" + filename.encode("utf-8")
+        ).hexdigest()[:16]
+        return (
+            Path(self.directory)
+            / f"{source_path.name}.{path_digest}.mehtapc"
+        )
+
+    def load(
+        self,
+        path: str | bytes | PathLike,
+        *,
+        filename: str,
+        backend: ParserBackend = ParserBackend.EARLEY,
+        optimize: bool = True,
+    ) -> Chunk:
+        """Load a Lua file, using the cache if possible.
+
+        :param path: The path of the source file.
+        :param filename: The name of the chunk, used in tracebacks.
+        :param backend: The parser to use if the file has to be parsed.
+        :param optimize: Whether the constants of the chunk are folded.
+        :return: The chunk of the file.
+        """
+        stat = os.stat(path)
+        cache_path = self.cache_path(path, filename=filename)
+        key = _key_digest(filename, backend, optimize)
+        header = None
+        try:
+            with open(cache_path, "rb") as f:
+                header = _HEADER.unpack(f.read(_HEADER.size))
+                if (
+                    header[0] == MAGIC
+                    and header[1] == key
+                    and header[2] == stat.st_mtime_ns
+                    and header[3] == stat.st_size
+                ):
+                    chunk = pickle.load(f)
+                    self.hits += 1
+                    return chunk
+        except Exception:
+            # A missing, truncated or stale cache file is treated as a miss.
+            header = None
+
+        source, content = read_source(path)
+        content_digest = hashlib.sha256(content).digest()
+        if (
+            header is not None
+            and header[0] == MAGIC
+            and header[1] == key
+            and header[4] == content_digest
+        ):
+            try:
+                with open(cache_path, "rb") as f:
+                    f.seek(_HEADER.size)
+                    chunk = pickle.load(f)
+            except Exception:
+                pass
+            else:
+                self.hits += 1
+                self._write(cache_path, key, stat, content_digest, chunk)
+                return chunk
+
+        chunk = parse_chunk(
+            source, filename=filename, backend=backend, optimize=optimize
+        )
+        self.misses += 1
+        self._write(cache_path, key, stat, content_digest, chunk)
+        return chunk
+
+    @staticmethod
+    def _write(
+        cache_path: Path,
+        key: bytes,
+        stat: os.stat_result,
+        content_digest: bytes,
+        chunk: Chunk,
+    ) -> None:
+        header = _HEADER.pack(
+            MAGIC, key, stat.st_mtime_ns, stat.st_size, content_digest
+        )
+        temporary_path = cache_path.with_name(
+            f"{cache_path.name}.{os.getpid()}.tmp"
+        )
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(temporary_path, "wb") as f:
+                f.write(header)
+                pickle.dump(chunk, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary_path, cache_path)
+        except OSError:
+            # Like Python's __pycache__, an unwritable cache is not an error.
+            try:
+                os.remove(temporary_path)
+            except OSError:
+                pass
+
+
+def load_chunk_file(
+    vm: VirtualMachine,
+    path: int | str | bytes | PathLike,
+    *,
+    filename: str,
+) -> Chunk:
+    """Load the chunk of a Lua file with the settings of a virtual machine.
+
+    Goes through :attr:`VirtualMachine.chunk_cache` if it is set.
+    """
+    if vm.chunk_cache is not None and not isinstance(path, int):
+        return vm.chunk_cache.load(
+            path,
+            filename=filename,
+            backend=vm.parser_backend,
+            optimize=vm.optimize,
+        )
+    source, _ = read_source(path)
+    return parse_chunk(
+        source,
+        filename=filename,
+        backend=vm.parser_backend,
+        optimize=vm.optimize,
+    )
@@ -0,0 +1,1312 @@
+"""Compilation of abstract syntax trees to nested Python closures.
+
+Instead of asking every node to evaluate itself,
+this engine turns every node into a Python closure once,
+with its operands and operator functions already bound.
+Running the code is then a matter of calling the closure of the outermost
+block.
+
+Every closure takes a single argument, the *frame* of the running function,
+which is a list laid out as follows:
+
+* ``frame[0]``: the :class:`Scope` that names which are not local variables
+  are looked up in,
+* ``frame[1]``: the variable arguments of the function,
+  or :data:`None` if it is not variadic,
+* ``frame[2]``: the tuple of the upvalues of the function,
+* ``frame[3:]``: the local variables of the function,
+  in the slots that :mod:`mehtap.resolver` assigned them.
+
+Local variables that are captured by nested functions are stored inside a
+:class:`Variable`, which the nested functions share.
+So are the local variables of the outermost block of a main chunk,
+which are also put in the scope that the chunk runs in.
+
+Statements return :data:`None` when they complete normally,
+a list of values when the function returns,
+and a :class:`_Jump` when they ``break`` or ``goto``.
+A ``return`` statement with a single call returns a
+:class:`~mehtap.control_structures.TailCall` instead of making the call,
+which the caller of the function makes after the function has returned.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Callable, Sequence
+from typing import TYPE_CHECKING
+
+import attrs
+
+import mehtap.ast_nodes as nodes
+from mehtap.ast_nodes import (
+    BinaryOperator,
+    binary_operator_functions,
+    unary_operator_functions,
+)
+from mehtap.control_structures import LuaError, TailCall
+from mehtap.operations import (
+    adjust_flatten,
+    call,
+    coerce_int_to_float,
+    index,
+    new_index,
+    str_to_lua_string,
+)
+from mehtap.library.stdlib.basic_library import native_table_step
+from mehtap.resolver import NameKind, Resolution, resolve
+from mehtap.values import (
+    LuaFalse,
+    LuaFunction,
+    LuaIndexableABC,
+    LuaNil,
+    LuaNumber,
+    LuaNumberType,
+    LuaString,
+    LuaTable,
+    LuaTrue,
+    LuaValue,
+    MAX_INT64,
+    MIN_INT64,
+    Variable,
+    lua_integer,
+    type_of_lv,
+)
+
+if TYPE_CHECKING:
+    from mehtap.scope import Scope
+
+
+_SCOPE = 0
+_VARARGS = 1
+_UPVALUES = 2
+_FIRST_SLOT = 3
+
+Frame = list
+Evaluator = Callable[[Frame], LuaValue]
+MultiEvaluator = Callable[[Frame], Sequence[LuaValue]]
+Executor = Callable[[Frame], "Sequence[LuaValue] | _Jump | None"]
+
+
+@attrs.define(slots=True, frozen=True)
+class _Jump:
+    """The completion of a ``break`` or a ``goto`` statement."""
+
+    label: str | None
+    """The name of the label to go to, or :data:`None` for ``break``."""
+
+
+_BREAK = _Jump(None)
+
+
+@attrs.define(slots=True, eq=False, repr=False)
+class ClosureFunction(LuaFunction):
+    """A Lua function that was compiled by :mod:`mehtap.closure_compiler`."""
+
+    upvalues: tuple[Variable, ...] = ()
+    """The variables of enclosing functions that the function refers to."""
+    entry: Callable[
+        [ClosureFunction, list[LuaValue]], Sequence[LuaValue] | TailCall
+    ] = None
+    """Runs the body of the function with a flat list of arguments.
+
+    Returns the values that the function returns,
+    or the tail call that it ends with.
+    """
+
+    def rawcall(
+        self,
+        args,
+        scope: Scope | None,
+        *,
+        modify_tb: bool = True,
+    ) -> list[LuaValue]:
+        try:
+            return self._run(adjust_flatten(args))
+        except LuaError as le:
+            if modify_tb:
+                le.push_tb(str(self))
+            raise le
+        except Exception as e:
+            le = LuaError(
+                LuaString(f"{self!s}: {e!s}".encode("utf-8")),
+                caused_by=e,
+            )
+            if modify_tb:
+                le.push_tb(str(self))
+            raise le from e
+
+    def _run(self, args: list[LuaValue]) -> list[LuaValue]:
+        r = self.entry(self, args)
+        if r.__class__ is TailCall:
+            r = _finish_tail_calls(r)
+        return list(r)
+
+
+def _is_true(value: LuaValue) -> bool:
+    return value is not LuaNil and value is not LuaFalse
+
+
+def _call_other(
+    function: LuaValue,
+    args: list[LuaValue],
+    scope: Scope,
+) -> Sequence[LuaValue]:
+    """Call a value that is not a :class:`ClosureFunction`."""
+    if function.__class__ is LuaFunction and function.fastcall:
+        r = function.fastcall_with(args, scope)
+    else:
+        r = call(function, args, scope, modify_tb=False)
+    if r.__class__ is list:
+        return r
+    # Native functions may return a single value or nothing.
+    if r is None:
+        return []
+    if isinstance(r, LuaValue):
+        return [r]
+    return adjust_flatten(r)
+
+
+def _tail_call_finisher(
+    function_class: type[ClosureFunction],
+    call_other: Callable[[LuaValue, list[LuaValue], Scope], Sequence],
+) -> Callable[[TailCall], Sequence[LuaValue]]:
+    """
+    :return: A function that makes a tail call,
+             and the tail calls that the functions it calls end with,
+             until a function returns values,
+             without nesting the calls.
+    """
+
+    def finish_tail_calls(r: TailCall) -> Sequence[LuaValue]:
+        while r.__class__ is TailCall:
+            function = r.function
+            try:
+                if function.__class__ is function_class:
+                    r = function.entry(function, r.args)
+                else:
+                    r = call_other(function, r.args, r.scope)
+            except LuaError as le:
+                r.site._push_tb(le, function)
+                raise le
+        return r
+
+    return finish_tail_calls
+
+
+_finish_tail_calls = _tail_call_finisher(ClosureFunction, _call_other)
+
+
+def _unfinished_jump(jump: _Jump) -> LuaError:
+    if jump.label is None:
+        return LuaError("break outside a loop")
+    return LuaError(f"no visible label '{jump.label}' for goto")
+
+
+_MULTIRES_NODES = (
+    nodes.FuncCallRegular,
+    nodes.FuncCallMethod,
+    nodes.VarArgExpr,
+)
+_COMPARISON_OPERATORS = {
+    BinaryOperator.LT,
+    BinaryOperator.LE,
+    BinaryOperator.GT,
+    BinaryOperator.GE,
+    BinaryOperator.EQ,
+    BinaryOperator.NE,
+}
+
+
+class _Compiler:
+    function_class: type[ClosureFunction] = ClosureFunction
+    """The class of the functions that compiled code creates,
+    and calls without going through :func:`call`."""
+    call_other = staticmethod(_call_other)
+    get_index = staticmethod(index)
+    set_index = staticmethod(new_index)
+    table_step = staticmethod(native_table_step)
+    finish_tail_calls = staticmethod(_finish_tail_calls)
+    dispatch_classes: frozenset[type] = frozenset({LuaNumber, LuaString})
+    """The classes of the values that can be looked up in the jump tables of
+    ``if`` statements."""
+
+    @staticmethod
+    def jump_table(arms: dict[LuaValue, int]) -> dict:
+        """:return: The jump table of a :class:`~mehtap.ast_nodes.Dispatch`
+                    as compiled code looks it up."""
+        return arms
+
+    def __init__(self, resolution: Resolution):
+        self.resolution = resolution
+
+    # region Blocks and statements
+
+    def block(self, block: nodes.Block, *, echo: bool = False) -> Executor:
+        executors: list[Executor] = []
+        labels: dict[str, int] = {}
+        statements = list(block.statements)
+        echoed = None
+        if (
+            echo
+            and block.return_statement is None
+            and statements
+            and isinstance(statements[-1], (
+                nodes.FuncCallRegular, nodes.FuncCallMethod,
+                nodes.Assignment, nodes.LocalAssignment,
+                nodes.FunctionStatement, nodes.LocalFunctionStatement,
+            ))
+        ):
+            # VirtualMachine.exec returns the values of the last statement of
+            # a chunk when it doesn't return anything.
+            echoed = statements.pop()
+        for statement in statements:
+            if isinstance(statement, nodes.Label):
+                labels[statement.name.name.text] = len(executors)
+            elif not isinstance(statement, nodes.EmptyStatement):
+                executors.append(self.statement(statement))
+        if echoed is not None:
+            executors.append(self.echoed_statement(echoed))
+        if block.return_statement is not None:
+            executors.append(self.return_statement(block.return_statement))
+
+        if labels:
+            return self._block_with_labels(tuple(executors), labels)
+        if not executors:
+            return lambda frame: None
+        if len(executors) == 1:
+            return executors[0]
+        if len(executors) == 2:
+            first, second = executors
+
+            def execute_two(frame: Frame):
+                r = first(frame)
+                if r is not None:
+                    return r
+                return second(frame)
+
+            return execute_two
+        executors = tuple(executors)
+
+        def execute_block(frame: Frame):
+            for executor in executors:
+                r = executor(frame)
+                if r is not None:
+                    return r
+            return None
+
+        return execute_block
+
+    @staticmethod
+    def _block_with_labels(
+        executors: tuple[Executor, ...],
+        labels: dict[str, int],
+    ) -> Executor:
+        count = len(executors)
+
+        def execute_block(frame: Frame):
+            i = 0
+            while i < count:
+                r = executors[i](frame)
+                i += 1
+                if r is not None:
+                    if r.__class__ is _Jump and r.label in labels:
+                        i = labels[r.label]
+                        continue
+                    return r
+            return None
+
+        return execute_block
+
+    def statement(self, statement: nodes.Statement) -> Executor:
+        method = getattr(self, f"stat_{type(statement).__name__}")
+        return method(statement)
+
+    def echoed_statement(self, statement: nodes.Statement) -> Executor:
+        if isinstance(statement, (nodes.FuncCallRegular,
+                                  nodes.FuncCallMethod)):
+            return self.multires(statement)
+        method = getattr(self, f"stat_{type(statement).__name__}")
+        return method(statement, echo=True)
+
+    def stat_Block(self, block: nodes.Block) -> Executor:
+        return self.block(block)
+
+    def stat_Do(self, statement: nodes.Do) -> Executor:
+        return self.block(statement.block)
+
+    def stat_Break(self, statement: nodes.Break) -> Executor:
+        return lambda frame: _BREAK
+
+    def stat_Goto(self, statement: nodes.Goto) -> Executor:
+        jump = _Jump(statement.name.name.text)
+        return lambda frame: jump
+
+    def return_statement(self, statement: nodes.ReturnStatement) -> Executor:
+        values = statement.values
+        if not values:
+            return lambda frame: []
+        if len(values) == 1:
+            if values[0].__class__ is nodes.FuncCallRegular:
+                return self.tail_call(values[0])
+            if values[0].__class__ is nodes.FuncCallMethod:
+                return self.tail_method_call(values[0])
+            if isinstance(values[0], _MULTIRES_NODES):
+                return self.multires(values[0])
+            evaluate = self.expression(values[0])
+            return lambda frame: [evaluate(frame)]
+        return self.expression_list(values)
+
+    def stat_ReturnStatement(self, statement: nodes.ReturnStatement) \
+            -> Executor:
+        return self.return_statement(statement)
+
+    def stat_FuncCallRegular(self, statement: nodes.FuncCallRegular) \
+            -> Executor:
+        call_function = self.multires(statement)
+
+        def execute_call(frame: Frame):
+            call_function(frame)
+
+        return execute_call
+
+    stat_FuncCallMethod = stat_FuncCallRegular
+
+    def stat_While(self, statement: nodes.While) -> Executor:
+        condition = self.condition(statement.condition)
+        body = self.block(statement.block)
+
+        def execute_while(frame: Frame):
+            while condition(frame):
+                r = body(frame)
+                if r is not None:
+                    if r is _BREAK:
+                        break
+                    return r
+            return None
+
+        return execute_while
+
+    def stat_Repeat(self, statement: nodes.Repeat) -> Executor:
+        body = self.block(statement.block)
+        condition = self.condition(statement.condition)
+
+        def execute_repeat(frame: Frame):
+            while True:
+                r = body(frame)
+                if r is not None:
+                    if r is _BREAK:
+                        break
+                    return r
+                if condition(frame):
+                    break
+            return None
+
+        return execute_repeat
+
+    def stat_If(self, statement: nodes.If) -> Executor:
+        if statement.dispatch is not None:
+            return self.dispatch(statement)
+        arms = tuple(
+            (self.condition(condition), self.block(block))
+            for condition, block in statement.blocks
+        )
+        else_body = (
+            self.block(statement.else_block)
+            if statement.else_block is not None
+            else None
+        )
+        if len(arms) == 1:
+            (condition, body), = arms
+            if else_body is None:
+                def execute_if(frame: Frame):
+                    if condition(frame):
+                        return body(frame)
+                    return None
+            else:
+                def execute_if(frame: Frame):
+                    if condition(frame):
+                        return body(frame)
+                    return else_body(frame)
+            return execute_if
+
+        def execute_if_chain(frame: Frame):
+            for condition, body in arms:
+                if condition(frame):
+                    return body(frame)
+            if else_body is not None:
+                return else_body(frame)
+            return None
+
+        return execute_if_chain
+
+    def dispatch(self, statement: nodes.If) -> Executor:
+        subject = self.expression(statement.dispatch.subject)
+        table = self.jump_table(statement.dispatch.arms)
+        classes = self.dispatch_classes
+        bodies = tuple(self.block(block) for _, block in statement.blocks)
+        else_body = (
+            self.block(statement.else_block)
+            if statement.else_block is not None
+            else None
+        )
+
+        def execute_dispatch(frame: Frame):
+            value = subject(frame)
+            if value.__class__ in classes:
+                i = table.get(value)
+                if i is not None:
+                    return bodies[i](frame)
+            if else_body is not None:
+                return else_body(frame)
+            return None
+
+        return execute_dispatch
+
+    def stat_For(self, statement: nodes.For) -> Executor:
+        start = self.expression(statement.start)
+        stop = self.expression(statement.stop)
+        step = (
+            self.expression(statement.step)
+            if statement.step is not None
+            else None
+        )
+        variable = self.resolution.declaration(statement.name)
+        slot = _FIRST_SLOT + variable.slot
+        captured = variable.captured
+        body = self.block(statement.block)
+        one = lua_integer(1)
+
+        def execute_for(frame: Frame):
+            initial_value = start(frame)
+            if not isinstance(initial_value, LuaNumber):
+                raise LuaError("the initial value must be a number")
+            limit = stop(frame)
+            if not isinstance(limit, LuaNumber):
+                raise LuaError("the limit value must be a number")
+            if step is not None:
+                step_value = step(frame)
+                if not isinstance(step_value, LuaNumber):
+                    raise LuaError("the step value must be a number")
+            else:
+                step_value = one
+            if step_value.value == 0:
+                raise LuaError("step must not be zero")
+            if (
+                initial_value.type is LuaNumberType.INTEGER
+                and step_value.type is LuaNumberType.INTEGER
+            ):
+                # The loop is done with integers and never wraps around.
+                last = limit.value
+                if step_value.value > 0:
+                    if isinstance(last, float):
+                        last = min(last, MAX_INT64) // 1
+                    values = range(initial_value.value, int(last) + 1,
+                                   step_value.value)
+                else:
+                    if isinstance(last, float):
+                        last = -(-max(last, MIN_INT64) // 1)
+                    values = range(initial_value.value, int(last) - 1,
+                                   step_value.value)
+                for value in values:
+                    if captured:
+                        frame[slot] = Variable(lua_integer(value))
+                    else:
+                        frame[slot] = lua_integer(value)
+                    r = body(frame)
+                    if r is not None:
+                        if r is _BREAK:
+                            break
+                        return r
+                return None
+            value = coerce_int_to_float(initial_value).value
+            last = coerce_int_to_float(limit).value
+            increment = coerce_int_to_float(step_value).value
+            floating = LuaNumberType.FLOAT
+            while value <= last if increment > 0 else value >= last:
+                if captured:
+                    frame[slot] = Variable(LuaNumber(value, floating))
+                else:
+                    frame[slot] = LuaNumber(value, floating)
+                r = body(frame)
+                if r is not None:
+                    if r is _BREAK:
+                        break
+                    return r
+                value += increment
+            return None
+
+        return execute_for
+
+    def stat_ForIn(self, statement: nodes.ForIn) -> Executor:
+        explist = self.expression_list(statement.exprs, 4)
+        declare = tuple(
+            self.declaration(self.resolution.declaration(name))
+            for name in statement.names
+        )
+        name_count = len(declare)
+        body = self.block(statement.block)
+        function_class = self.function_class
+        call_other = self.call_other
+        table_step = self.table_step
+        finish_tail_calls = self.finish_tail_calls
+
+        def execute_for_in(frame: Frame):
+            function, state, control, closing = explist(frame)
+            scope = frame[_SCOPE]
+            step = table_step(function, state)
+            while True:
+                if step is not None:
+                    results = step(state, control) or (LuaNil,)
+                elif function.__class__ is function_class:
+                    results = function.entry(function, [state, control])
+                    if results.__class__ is TailCall:
+                        results = finish_tail_calls(results)
+                else:
+                    results = call_other(function, [state, control], scope)
+                result_count = len(results)
+                for i in range(name_count):
+                    declare[i](
+                        frame, results[i] if i < result_count else LuaNil
+                    )
+                control = results[0] if result_count else LuaNil
+                if control is LuaNil:
+                    break
+                r = body(frame)
+                if r is not None:
+                    if r is _BREAK:
+                        break
+                    return r
+            if closing is not LuaNil:
+                raise NotImplementedError()
+            return None
+
+        return execute_for_in
+
+    def stat_LocalAssignment(
+        self,
+        statement: nodes.LocalAssignment,
+        *,
+        echo: bool = False,
+    ) -> Executor:
+        count = len(statement.names)
+        declare = []
+        for attname in statement.names:
+            variable = self.resolution.declaration(attname.name)
+            if variable.attrib not in (None, "const", "close"):
+                message = f"unknown attribute '{variable.attrib}'"
+
+                def declare_unknown(frame: Frame, value: LuaValue):
+                    raise LuaError(message)
+
+                declare.append(declare_unknown)
+            else:
+                declare.append(self.declaration(variable))
+        if not echo and count == 1 and statement.exprs \
+                and len(statement.exprs) == 1 \
+                and not isinstance(statement.exprs[0], _MULTIRES_NODES):
+            declare_one, = declare
+            evaluate = self.expression(statement.exprs[0])
+
+            def execute_local_assignment_one(frame: Frame):
+                declare_one(frame, evaluate(frame))
+
+            return execute_local_assignment_one
+        if statement.exprs:
+            values = self.expression_list(statement.exprs, count)
+        else:
+            nils = [LuaNil] * count
+
+            def values(frame: Frame):
+                return list(nils)
+        declare = tuple(declare)
+
+        def execute_local_assignment(frame: Frame):
+            assigned = values(frame)
+            for declare_one, value in zip(declare, assigned):
+                declare_one(frame, value)
+            if echo:
+                return assigned
+            return None
+
+        return execute_local_assignment
+
+    def stat_Assignment(
+        self,
+        statement: nodes.Assignment,
+        *,
+        echo: bool = False,
+    ) -> Executor:
+        count = len(statement.names)
+        assign = tuple(self.assignment(target) for target in statement.names)
+        if not echo and count == 1 and len(statement.exprs) == 1 \
+                and not isinstance(statement.exprs[0], _MULTIRES_NODES):
+            assign_one, = assign
+            evaluate = self.expression(statement.exprs[0])
+
+            def execute_assignment_one(frame: Frame):
+                assign_one(frame, evaluate(frame))
+
+            return execute_assignment_one
+        values = self.expression_list(statement.exprs, count)
+
+        def execute_assignment(frame: Frame):
+            assigned = values(frame)
+            for assign_one, value in zip(assign, assigned):
+                assign_one(frame, value)
+            if echo:
+                return assigned
+            return None
+
+        return execute_assignment
+
+    def stat_LocalFunctionStatement(
+        self,
+        statement: nodes.LocalFunctionStatement,
+        *,
+        echo: bool = False,
+    ) -> Executor:
+        variable = self.resolution.declaration(statement.name)
+        declare = self.declaration(variable)
+        assign = self.store(variable)
+        make_function = self.function_body(
+            statement.body, name=statement.name.as_lua_string()
+        )
+
+        def execute_local_function(frame: Frame):
+            declare(frame, LuaNil)
+            function = make_function(frame)
+            assign(frame, function)
+            if echo:
+                return [function]
+            return None
+
+        return execute_local_function
+
+    def stat_FunctionStatement(
+        self,
+        statement: nodes.FunctionStatement,
+        *,
+        echo: bool = False,
+    ) -> Executor:
+        names = statement.name.names
+        function_name = names[-1].as_lua_string()
+        make_function = self.function_body(
+            statement.body,
+            name=function_name,
+            method=statement.name.method,
+        )
+        if len(names) == 1:
+            assign = self.name_store(names[0])
+
+            def execute_function_statement(frame: Frame):
+                function = make_function(frame)
+                assign(frame, function)
+                if echo:
+                    return [function]
+                return None
+
+            return execute_function_statement
+        load = self.name_load(names[0])
+        keys = tuple(name.as_lua_string() for name in names[1:-1])
+        get_index = self.get_index
+        set_index = self.set_index
+
+        def execute_method_statement(frame: Frame):
+            table = load(frame)
+            for key in keys:
+                table = get_index(table, key)
+            function = make_function(frame)
+            set_index(table, function_name, function)
+            if echo:
+                return [function]
+            return None
+
+        return execute_method_statement
+
+    # endregion
+
+    # region Variables
+
+    def declaration(self, variable) -> Callable[[Frame, LuaValue], None]:
+        """
+        :return: A function that creates the given local variable with a
+                 value.
+        """
+        constant = variable.attrib == "const"
+        to_be_closed = variable.attrib == "close"
+        slot = _FIRST_SLOT + variable.slot
+        if variable.exported:
+            key = str_to_lua_string(variable.name)
+
+            def declare_exported(frame: Frame, value: LuaValue):
+                cell = Variable(value, constant, to_be_closed)
+                frame[_SCOPE].put_local_ls(key, cell)
+                frame[slot] = cell
+
+            return declare_exported
+        if variable.captured:
+            def declare_captured(frame: Frame, value: LuaValue):
+                frame[slot] = Variable(value, constant, to_be_closed)
+
+            return declare_captured
+
+        def declare_local(frame: Frame, value: LuaValue):
+            frame[slot] = value
+
+        return declare_local
+
+    def name_load(self, name: nodes.Name) -> Evaluator:
+        resolution = self.resolution.use(name)
+        if resolution.kind is NameKind.LOCAL:
+            slot = _FIRST_SLOT + resolution.index
+            if resolution.variable.captured:
+                return lambda frame: frame[slot].value
+            return lambda frame: frame[slot]
+        if resolution.kind is NameKind.UPVALUE:
+            upvalue = resolution.index
+            return lambda frame: frame[_UPVALUES][upvalue].value
+        key = str_to_lua_string(resolution.name)
+        return lambda frame: frame[_SCOPE].get_ls(key)
+
+    def store(self, variable) -> Callable[[Frame, LuaValue], None]:
+        """
+        :return: A function that assigns to a local variable of the running
+                 function.
+        """
+        slot = _FIRST_SLOT + variable.slot
+        if variable.attrib == "const":
+            return self._store_constant
+        if variable.captured:
+            def store_captured(frame: Frame, value: LuaValue):
+                frame[slot].value = value
+
+            return store_captured
+
+        def store_local(frame: Frame, value: LuaValue):
+            frame[slot] = value
+
+        return store_local
+
+    @staticmethod
+    def _store_constant(frame: Frame, value: LuaValue):
+        raise LuaError("attempt to change constant variable")
+
+    def name_store(self, name: nodes.Name) \
+            -> Callable[[Frame, LuaValue], None]:
+        resolution = self.resolution.use(name)
+        if resolution.kind is NameKind.LOCAL:
+            return self.store(resolution.variable)
+        if resolution.kind is NameKind.UPVALUE:
+            if resolution.variable.attrib == "const":
+                return self._store_constant
+            upvalue = resolution.index
+
+            def store_upvalue(frame: Frame, value: LuaValue):
+                frame[_UPVALUES][upvalue].value = value
+
+            return store_upvalue
+        key = str_to_lua_string(resolution.name)
+
+        def store_global(frame: Frame, value: LuaValue):
+            frame[_SCOPE].put_nonlocal_ls(key, value)
+
+        return store_global
+
+    def assignment(self, target: nodes.Variable) \
+            -> Callable[[Frame, LuaValue], None]:
+        if isinstance(target, nodes.VarName):
+            return self.name_store(target.name)
+        if not isinstance(target, nodes.VarIndex):
+            raise ValueError(f"{type(target)=}")
+        base = self.expression(target.base)
+        key = self.expression(target.index)
+
+        def store_index(frame: Frame, value: LuaValue):
+            table = base(frame)
+            if not isinstance(table, LuaIndexableABC):
+                raise LuaError(f"attempt to index {type_of_lv(table)} value")
+            new_index(table, key(frame), value)
+
+        return store_index
+
+    # endregion
+
+    # region Expressions
+
+    def expression(self, expression: nodes.Expression) -> Evaluator:
+        """
+        :return: A function that evaluates the expression adjusted to one
+                 value.
+        """
+        method = getattr(self, f"exp_{type(expression).__name__}")
+        return method(expression)
+
+    def multires(self, expression: nodes.Expression) -> MultiEvaluator:
+        """
+        :return: A function that evaluates the expression to all of its
+                 values.
+        """
+        if isinstance(expression, nodes.FuncCallRegular):
+            return self.call(expression)
+        if isinstance(expression, nodes.FuncCallMethod):
+            return self.method_call(expression)
+        if isinstance(expression, nodes.VarArgExpr):
+            return self.varargs
+        evaluate = self.expression(expression)
+        return lambda frame: [evaluate(frame)]
+
+    def expression_list(
+        self,
+        expressions: Sequence[nodes.Expression],
+        count: int | None = None,
+    ) -> Callable[[Frame], list[LuaValue]]:
+        """
+        :param count: The number of values to adjust the results to,
+                      or :data:`None` to keep all values.
+        :return: A function that evaluates the expressions to a list of values.
+        """
+        if expressions and isinstance(expressions[-1], _MULTIRES_NODES):
+            singles = tuple(self.expression(e) for e in expressions[:-1])
+            last = self.multires(expressions[-1])
+        else:
+            singles = tuple(self.expression(e) for e in expressions)
+            last = None
+        if count is None:
+            if last is None:
+                return lambda frame: [evaluate(frame) for evaluate in singles]
+            if not singles:
+                return last
+
+            def evaluate_multires_list(frame: Frame):
+                values = [evaluate(frame) for evaluate in singles]
+                values.extend(last(frame))
+                return values
+
+            return evaluate_multires_list
+        nils = [LuaNil] * count
+
+        def evaluate_adjusted_list(frame: Frame):
+            values = [evaluate(frame) for evaluate in singles]
+            if last is not None:
+                values.extend(last(frame))
+            if len(values) < count:
+                values.extend(nils[len(values):])
+            elif len(values) > count:
+                del values[count:]
+            return values
+
+        return evaluate_adjusted_list
+
+    @staticmethod
+    def varargs(frame: Frame) -> list[LuaValue]:
+        varargs = frame[_VARARGS]
+        if varargs is None:
+            raise LuaError("cannot use '...' outside a vararg function")
+        return varargs
+
+    def constant(self, expression: nodes.Expression) -> Evaluator:
+        value = expression._evaluate(None)
+        return lambda frame: value
+
+    exp_NumeralDec = constant
+    exp_NumeralHex = constant
+    exp_NumeralConstant = constant
+    exp_LiteralString = constant
+    exp_LiteralTrue = constant
+    exp_LiteralFalse = constant
+    exp_LiteralNil = constant
+    exp_ParsedLiteralLuaStringExpr = constant
+
+    def exp_VarArgExpr(self, expression: nodes.VarArgExpr) -> Evaluator:
+        varargs = self.varargs
+
+        def evaluate_vararg(frame: Frame):
+            values = varargs(frame)
+            return values[0] if values else LuaNil
+
+        return evaluate_vararg
+
+    def exp_ParenExpression(self, expression: nodes.ParenExpression) \
+            -> Evaluator:
+        return self.expression(expression.exp)
+
+    def exp_VarName(self, expression: nodes.VarName) -> Evaluator:
+        return self.name_load(expression.name)
+
+    def exp_VarIndex(self, expression: nodes.VarIndex) -> Evaluator:
+        base = self.expression(expression.base)
+        key = self.expression(expression.index)
+        get_index = self.get_index
+        return lambda frame: get_index(base(frame), key(frame))
+
+    def exp_UnaryOperation(self, expression: nodes.UnaryOperation) \
+            -> Evaluator:
+        operation = unary_operator_functions[expression.op]
+        operand = self.expression(expression.exp)
+        return lambda frame: operation(operand(frame))
+
+    def exp_BinaryOperation(self, expression: nodes.BinaryOperation) \
+            -> Evaluator:
+        lhs = self.expression(expression.lhs)
+        rhs = self.expression(expression.rhs)
+        if expression.op is BinaryOperator.AND:
+            def evaluate_and(frame: Frame):
+                value = lhs(frame)
+                if value is LuaNil or value is LuaFalse:
+                    return value
+                return rhs(frame)
+
+            return evaluate_and
+        if expression.op is BinaryOperator.OR:
+            def evaluate_or(frame: Frame):
+                value = lhs(frame)
+                if value is LuaNil or value is LuaFalse:
+                    return rhs(frame)
+                return value
+
+            return evaluate_or
+        operation = binary_operator_functions[expression.op]
+        return lambda frame: operation(lhs(frame), rhs(frame))
+
+    def condition(self, expression: nodes.Expression) \
+            -> Callable[[Frame], bool]:
+        """
+        :return: A function that evaluates whether the expression is neither
+                 ``false`` nor ``nil``.
+        """
+        while isinstance(expression, nodes.ParenExpression):
+            expression = expression.exp
+        if isinstance(expression, nodes.BinaryOperation):
+            if expression.op in _COMPARISON_OPERATORS:
+                operation = binary_operator_functions[expression.op]
+                lhs = self.expression(expression.lhs)
+                rhs = self.expression(expression.rhs)
+
+                def compare(frame: Frame):
+                    return operation(lhs(frame), rhs(frame)) is LuaTrue
+
+                return compare
+            if expression.op is BinaryOperator.AND:
+                lhs = self.condition(expression.lhs)
+                rhs = self.condition(expression.rhs)
+                return lambda frame: lhs(frame) and rhs(frame)
+            if expression.op is BinaryOperator.OR:
+                lhs = self.condition(expression.lhs)
+                rhs = self.condition(expression.rhs)
+                return lambda frame: lhs(frame) or rhs(frame)
+        if (
+            isinstance(expression, nodes.UnaryOperation)
+            and expression.op is nodes.UnaryOperator.NOT
+        ):
+            operand = self.condition(expression.exp)
+            return lambda frame: not operand(frame)
+        evaluate = self.expression(expression)
+        return lambda frame: _is_true(evaluate(frame))
+
+    def exp_TableConstructor(self, expression: nodes.TableConstructor) \
+            -> Evaluator:
+        fields = list(expression.fields)
+        last = None
+        if fields and isinstance(fields[-1], nodes.FieldCounterKey):
+            last = fields.pop()
+        items = []
+        counter = 1
+        for field in fields:
+            if isinstance(field, nodes.FieldWithKey):
+                if isinstance(field.key, nodes.Name):
+                    items.append((
+                        field.key.as_lua_string(),
+                        None,
+                        self.expression(field.value),
+                    ))
+                else:
+                    items.append((
+                        None,
+                        self.expression(field.key),
+                        self.expression(field.value),
+                    ))
+            else:
+                items.append((
+                    lua_integer(counter),
+                    None,
+                    self.expression(field.value),
+                ))
+                counter += 1
+        items = tuple(items)
+        last_values = self.multires(last.value) if last is not None else None
+
+        def evaluate_table(frame: Frame):
+            table = LuaTable()
+            for key, evaluate_key, evaluate_value in items:
+                if evaluate_key is not None:
+                    key = evaluate_key(frame)
+                table.rawput(key, evaluate_value(frame))
+            if last_values is not None:
+                table.put_sequence(counter, last_values(frame))
+            return table
+
+        return evaluate_table
+
+    def exp_FuncDef(self, expression: nodes.FuncDef) -> Evaluator:
+        return self.function_body(expression.body)
+
+    def exp_FuncBody(self, expression: nodes.FuncBody) -> Evaluator:
+        return self.function_body(expression)
+
+    def function_body(
+        self,
+        body: nodes.FuncBody,
+        *,
+        name: LuaString | None = None,
+        method: bool = False,
+    ) -> Evaluator:
+        """
+        :return: A function that creates a closure of the function body.
+        """
+        info = self.resolution.function(body)
+        param_names = [p.as_lua_string() for p in body.params]
+        if method:
+            param_names.insert(0, LuaString(b"self"))
+        entry = _function_entry(
+            self.block(body.body),
+            param_count=len(info.parameters),
+            captured_params=tuple(
+                _FIRST_SLOT + p.slot for p in info.parameters if p.captured
+            ),
+            slot_count=info.slot_count,
+            variadic=body.vararg,
+        )
+        captures = tuple(
+            (upvalue.in_parent_frame, upvalue.index)
+            for upvalue in info.upvalues
+        )
+        variadic = body.vararg
+        block = body.body
+        function_class = self.function_class
+
+        def make_function(frame: Frame):
+            upvalues = frame[_UPVALUES]
+            return function_class(
+                param_names=param_names,
+                variadic=variadic,
+                parent_scope=frame[_SCOPE],
+                block=block,
+                gets_scope=False,
+                name=name,
+                min_req=0,
+                upvalues=tuple(
+                    frame[_FIRST_SLOT + i] if in_parent_frame else upvalues[i]
+                    for in_parent_frame, i in captures
+                ),
+                entry=entry,
+            )
+
+        return make_function
+
+    def _arguments(self, args: Sequence[nodes.Expression]) \
+            -> Callable[[Frame], list[LuaValue]]:
+        if not args:
+            return lambda frame: []
+        if len(args) == 1:
+            if isinstance(args[0], _MULTIRES_NODES):
+                return self.multires(args[0])
+            evaluate = self.expression(args[0])
+            return lambda frame: [evaluate(frame)]
+        return self.expression_list(args)
+
+    def call(self, expression: nodes.FuncCallRegular) -> MultiEvaluator:
+        function_expression = self.expression(expression.name)
+        arguments = self._arguments(expression.args)
+        file = expression.file
+        line = expression.line
+        function_class = self.function_class
+        call_other = self.call_other
+        finish_tail_calls = self.finish_tail_calls
+
+        def evaluate_call(frame: Frame):
+            function = function_expression(frame)
+            args = arguments(frame)
+            try:
+                if function.__class__ is function_class:
+                    r = function.entry(function, args)
+                    if r.__class__ is TailCall:
+                        return finish_tail_calls(r)
+                    return r
+                return call_other(function, args, frame[_SCOPE])
+            except LuaError as le:
+                le.push_tb(f"call of {function}", file=file, line=line)
+                raise le
+
+        return evaluate_call
+
+    def method_call(self, expression: nodes.FuncCallMethod) -> MultiEvaluator:
+        object_expression = self.expression(expression.object)
+        method = expression.method.as_lua_string()
+        arguments = self._arguments(expression.args)
+        file = expression.file
+        line = expression.line
+        function_class = self.function_class
+        call_other = self.call_other
+        get_index = self.get_index
+        finish_tail_calls = self.finish_tail_calls
+
+        def evaluate_method_call(frame: Frame):
+            value = object_expression(frame)
+            function = get_index(value, method)
+            args = [value]
+            args.extend(arguments(frame))
+            try:
+                if function.__class__ is function_class:
+                    r = function.entry(function, args)
+                    if r.__class__ is TailCall:
+                        return finish_tail_calls(r)
+                    return r
+                return call_other(function, args, frame[_SCOPE])
+            except LuaError as le:
+                le.push_tb(
+                    f"method call of {function}", file=file, line=line
+                )
+                raise le
+
+        return evaluate_method_call
+
+    def tail_call(self, expression: nodes.FuncCallRegular) -> Executor:
+        function_expression = self.expression(expression.name)
+        arguments = self._arguments(expression.args)
+
+        def evaluate_tail_call(frame: Frame):
+            return TailCall(
+                function_expression(frame),
+                arguments(frame),
+                expression,
+                frame[_SCOPE],
+            )
+
+        return evaluate_tail_call
+
+    def tail_method_call(self, expression: nodes.FuncCallMethod) -> Executor:
+        object_expression = self.expression(expression.object)
+        method = expression.method.as_lua_string()
+        arguments = self._arguments(expression.args)
+        get_index = self.get_index
+
+        def evaluate_tail_method_call(frame: Frame):
+            value = object_expression(frame)
+            function = get_index(value, method)
+            args = [value]
+            args.extend(arguments(frame))
+            return TailCall(function, args, expression, frame[_SCOPE])
+
+        return evaluate_tail_method_call
+
+    def _first_value(self, expression) -> Evaluator:
+        evaluate = self.multires(expression)
+
+        def evaluate_first(frame: Frame):
+            values = evaluate(frame)
+            return values[0] if values else LuaNil
+
+        return evaluate_first
+
+    exp_FuncCallRegular = _first_value
+    exp_FuncCallMethod = _first_value
+
+    # endregion
+
+
+def _function_entry(
+    body: Executor,
+    *,
+    param_count: int,
+    captured_params: tuple[int, ...],
+    slot_count: int,
+    variadic: bool,
+):
+    filler = [None] * (slot_count - param_count)
+
+    def entry(function: ClosureFunction, args: list[LuaValue]):
+        given = len(args)
+        if given == param_count:
+            params = args
+        elif given > param_count:
+            params = args[:param_count]
+        else:
+            params = args + [LuaNil] * (param_count - given)
+        frame = [
+            function.parent_scope,
+            args[param_count:] if variadic else None,
+            function.upvalues,
+            *params,
+            *filler,
+        ]
+        for slot in captured_params:
+            frame[slot] = Variable(frame[slot])
+        vm = frame[_SCOPE].vm
+        depth = vm.call_depth
+        if depth >= vm.max_call_depth:
+            raise LuaError("stack overflow")
+        vm.call_depth = depth + 1
+        try:
+            r = body(frame)
+        except RecursionError:
+            raise LuaError("stack overflow") from None
+        finally:
+            vm.call_depth = depth
+        if r is None:
+            return []
+        if r.__class__ is _Jump:
+            raise _unfinished_jump(r)
+        return r
+
+    return entry
+
+
+def compile_chunk(chunk: nodes.Chunk) -> Callable[[Scope], list[LuaValue]]:
+    """Compile a chunk to be run in a scope.
+
+    Local variables declared in the outermost block of the chunk are stored in
+    the scope, so that later chunks run in the same scope can see them.
+
+    :return: A function that runs the chunk in the given scope.
+    """
+    resolution = resolve(chunk, export_chunk_locals=True)
+    body = _Compiler(resolution).block(chunk.block, echo=True)
+    filler = [None] * resolution.function(chunk).slot_count
+
+    def execute_chunk(scope: Scope) -> list[LuaValue]:
+        r = body([scope, scope.varargs, (), *filler])
+        if r is None:
+            return []
+        if r.__class__ is _Jump:
+            raise _unfinished_jump(r)
+        if r.__class__ is TailCall:
+            r = _finish_tail_calls(r)
+        return list(r)
+
+    return execute_chunk
+
+
+def compile_chunk_function(chunk: nodes.Chunk, scope: Scope) \
+        -> ClosureFunction:
+    """Compile a chunk into a variadic function, like :func:`load` does.
+
+    :param scope: The scope that names which are not local variables are
+                  looked up in.
+    """
+    resolution = resolve(chunk, export_chunk_locals=False)
+    info = resolution.function(chunk)
+    entry = _function_entry(
+        _Compiler(resolution).block(chunk.block),
+        param_count=0,
+        captured_params=(),
+        slot_count=info.slot_count,
+        variadic=True,
+    )
+    return ClosureFunction(
+        param_names=[],
+        variadic=True,
+        parent_scope=scope,
+        block=chunk.block,
+        gets_scope=False,
+        entry=entry,
+    )
@@ -1,11 +1,14 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING
+import enum
+from typing import TYPE_CHECKING, Any
 
 import attrs
 
 if TYPE_CHECKING:
     from mehtap.ast_nodes import Name
+    from mehtap.operations import Multires
+    from mehtap.scope import Scope
     from mehtap.values import LuaValue
 
 
@@ -57,21 +60,56 @@ class LuaError(BaseException):
         self.traceback_messages.append(tb)
 
 
-@attrs.define(slots=True)
-class FlowControlException(BaseException):
-    pass
+class CompletionType(enum.Enum):
+    """CompletionType(value)
+    Enumeration of the ways a statement can transfer control elsewhere.
+    """
 
+    RETURN = "return"
+    """A ``return`` statement was executed."""
+    BREAK = "break"
+    """A ``break`` statement was executed."""
+    GOTO = "goto"
+    """A ``goto`` statement was executed."""
 
-@attrs.define(slots=True)
-class BreakException(FlowControlException):
-    pass
 
+@attrs.define(slots=True, eq=False)
+class Completion:
+    """Record of a statement that completed abruptly.
 
-@attrs.define(slots=True)
-class ReturnException(FlowControlException):
-    values: list[LuaValue] | None = None
+    Statements return one instead of completing normally,
+    and blocks and loops pass it on until it reaches the statement that
+    handles it.
+    """
 
+    type: CompletionType
+    """How the statement completed."""
+    values: list[LuaValue] | TailCall | None = None
+    """The returned values of a :attr:`CompletionType.RETURN` completion."""
+    label: Name | None = None
+    """The target label of a :attr:`CompletionType.GOTO` completion."""
 
-@attrs.define(slots=True)
-class GotoException(FlowControlException):
-    label: Name
+
+BREAK = Completion(CompletionType.BREAK)
+"""The completion of every ``break`` statement."""
+
+
+@attrs.define(slots=True, eq=False)
+class TailCall:
+    """Call in a ``return`` statement that the function returns instead of
+    making.
+
+    The caller of the function makes the call after the function has
+    returned,
+    so that a chain of tail calls doesn't grow the stack,
+    like tail calls in Lua don't.
+    """
+
+    function: LuaValue
+    """The value to call."""
+    args: Multires
+    """The arguments of the call."""
+    site: Any
+    """The call node or call site that adds the call to tracebacks."""
+    scope: Scope
+    """The scope of the function that returned the call."""
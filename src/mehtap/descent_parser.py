@@ -0,0 +1,756 @@
+"""Hand-written recursive-descent parser for Lua chunks.
+
+The parser reads the source in a single pass with a regular-expression based
+tokenizer and produces the same :mod:`mehtap.ast_nodes` tree that
+:data:`mehtap.ast_transformer.transformer` produces from the Earley parse tree,
+in time linear in the size of the input.
+
+Operator precedence and associativity follow
+`the Lua 5.4 Reference Manual, Section 3.4.8
+<https://lua.org/manual/5.4/manual.html#3.4.8>`_.
+"""
+
+from __future__ import annotations
+
+import re
+from collections.abc import Sequence
+
+import mehtap.ast_nodes as nodes
+from mehtap.ast_nodes import BinaryOperator, UnaryOperator
+from mehtap.control_structures import LuaError
+from mehtap.values import LuaString
+
+
+class LuaSyntaxError(LuaError):
+    """Raised when the source code of a chunk is not valid Lua."""
+
+    def __init__(self, message: str, *, filename: str, line: int):
+        super().__init__(
+            LuaString(f"{filename}:{line}: {message}".encode("utf-8"))
+        )
+        self.filename = filename
+        self.line = line
+
+
+KEYWORDS = frozenset({
+    "and", "break", "do", "else", "elseif", "end",
+    "false", "for", "function", "goto", "if", "in",
+    "local", "nil", "not", "or", "repeat", "return",
+    "then", "true", "until", "while",
+})
+
+NAME = "<name>"
+NUMBER = "<number>"
+STRING = "<string>"
+EOF = "<eof>"
+
+_TOKEN_PATTERN = re.compile(
+    r"(?P<space>\s+)"
+    r"|(?P<long_comment>--\[(?P<lc_level>=*)\[[\s\S]*?\](?P=lc_level)\])"
+    r"|(?P<comment>--[^\n]*)"
+    r"|(?P<name>[A-Za-z_][A-Za-z_0-9]*)"
+    r"|(?P<hex>0[xX](?=\.?[0-9a-fA-F])"
+    r"(?P<hex_digits>[0-9a-fA-F]*)"
+    r"(?:\.(?P<hex_fract>[0-9a-fA-F]*))?"
+    r"(?:[pP](?P<hex_sign>[+-]?)(?P<hex_exp>[0-9]+))?)"
+    r"|(?P<dec>(?=\.?[0-9])"
+    r"(?P<dec_digits>[0-9]*)"
+    r"(?:\.(?P<dec_fract>[0-9]*))?"
+    r"(?:[eE](?P<dec_sign>[+-]?)(?P<dec_exp>[0-9]+))?)"
+    r"|(?P<string>\"(?:[^\"\\\n]|\\[\s\S])*\"|'(?:[^'\\\n]|\\[\s\S])*')"
+    r"|(?P<long_string>\[(?P<ls_level>=*)\[[\s\S]*?\](?P=ls_level)\])"
+    r"|(?P<symbol>\.\.\.|\.\.|==|~=|<=|>=|<<|>>|//|::"
+    r"|[-+*/%^#&~|<>=(){}\[\];:,.])"
+)
+
+Token = tuple[str, "str | re.Match", int]
+"""A tuple of the token kind, the token value and the line of the token.
+
+The kind of keywords and symbols is their own text.
+The value of numerals is the match object of the numeral.
+"""
+
+
+def tokenize(source: str, *, filename: str = "<?>") -> list[Token]:
+    """Split Lua source code into a list of tokens.
+
+    :raises LuaSyntaxError: if the source contains an unrecognized character.
+    """
+    tokens: list[Token] = []
+    append = tokens.append
+    match = _TOKEN_PATTERN.match
+    position = 0
+    line = 1
+    end = len(source)
+    while position < end:
+        m = match(source, position)
+        if m is None:
+            if source.startswith(("[", "--["), position):
+                raise LuaSyntaxError(
+                    "unfinished long string or comment",
+                    filename=filename,
+                    line=line,
+                )
+            if source[position] in "\"'":
+                raise LuaSyntaxError(
+                    "unfinished string", filename=filename, line=line
+                )
+            raise LuaSyntaxError(
+                f"unexpected symbol near '{source[position]}'",
+                filename=filename,
+                line=line,
+            )
+        kind = m.lastgroup
+        text = m.group()
+        if kind == "name":
+            if text in KEYWORDS:
+                append((text, text, line))
+            else:
+                append((NAME, text, line))
+        elif kind == "symbol":
+            append((text, text, line))
+        elif kind == "dec" or kind == "hex":
+            append((NUMBER, m, line))
+        elif kind == "string" or kind == "long_string":
+            append((STRING, text, line))
+            line += text.count("\n")
+        else:
+            # whitespace or comment
+            line += text.count("\n")
+        position = m.end()
+    append((EOF, "", line))
+    return tokens
+
+
+BINARY_PRIORITY: dict[str, tuple[int, int, BinaryOperator]] = {
+    "or": (1, 1, BinaryOperator.OR),
+    "and": (2, 2, BinaryOperator.AND),
+    "<": (3, 3, BinaryOperator.LT),
+    ">": (3, 3, BinaryOperator.GT),
+    "<=": (3, 3, BinaryOperator.LE),
+    ">=": (3, 3, BinaryOperator.GE),
+    "~=": (3, 3, BinaryOperator.NE),
+    "==": (3, 3, BinaryOperator.EQ),
+    "|": (4, 4, BinaryOperator.BIT_OR),
+    "~": (5, 5, BinaryOperator.BIT_XOR),
+    "&": (6, 6, BinaryOperator.BIT_AND),
+    "<<": (7, 7, BinaryOperator.SHIFT_LEFT),
+    ">>": (7, 7, BinaryOperator.SHIFT_RIGHT),
+    # The concatenation operator ('..') and exponentiation ('^') are right
+    # associative. All other binary operators are left associative.
+    "..": (9, 8, BinaryOperator.CONCAT),
+    "+": (10, 10, BinaryOperator.ADD),
+    "-": (10, 10, BinaryOperator.SUBTRACT),
+    "*": (11, 11, BinaryOperator.MULTIPLY),
+    "/": (11, 11, BinaryOperator.FLOAT_DIV),
+    "//": (11, 11, BinaryOperator.FLOOR_DIV),
+    "%": (11, 11, BinaryOperator.MODULO),
+    "^": (14, 13, BinaryOperator.EXP),
+}
+"""Left priority, right priority and operator of every binary operator."""
+
+UNARY_PRIORITY = 12
+UNARY_OPERATORS: dict[str, UnaryOperator] = {
+    "not": UnaryOperator.NOT,
+    "-": UnaryOperator.NEG,
+    "#": UnaryOperator.LENGTH,
+    "~": UnaryOperator.BIT_NOT,
+}
+
+BLOCK_FOLLOW = frozenset({"else", "elseif", "end", "until", EOF})
+
+
+class Parser:
+    """Recursive-descent parser over the tokens of a single source string."""
+
+    def __init__(self, source: str, *, filename: str = "<?>"):
+        self.filename = filename
+        self.tokens = tokenize(source, filename=filename)
+        self.index = 0
+
+    # Token helpers
+
+    def _kind(self) -> str:
+        return self.tokens[self.index][0]
+
+    def _line(self) -> int:
+        return self.tokens[self.index][2]
+
+    def _peek_kind(self) -> str:
+        return self.tokens[self.index + 1][0]
+
+    def _advance(self) -> Token:
+        token = self.tokens[self.index]
+        self.index += 1
+        return token
+
+    def _accept(self, kind: str) -> bool:
+        if self.tokens[self.index][0] == kind:
+            self.index += 1
+            return True
+        return False
+
+    def _error(self, message: str) -> LuaSyntaxError:
+        kind, value, line = self.tokens[self.index]
+        if kind == EOF:
+            near = "<eof>"
+        elif kind == NUMBER:
+            near = value.group()
+        else:
+            near = value
+        return LuaSyntaxError(
+            f"{message} near '{near}'", filename=self.filename, line=line
+        )
+
+    def _expect(self, kind: str, what: str | None = None) -> Token:
+        if self.tokens[self.index][0] != kind:
+            raise self._error(f"'{what or kind}' expected")
+        return self._advance()
+
+    def _expect_match(self, kind: str, opener: str, line: int) -> None:
+        if self.tokens[self.index][0] == kind:
+            self.index += 1
+            return
+        if line == self._line():
+            raise self._error(f"'{kind}' expected")
+        raise self._error(
+            f"'{kind}' expected (to close '{opener}' at line {line})"
+        )
+
+    def _terminal(self, text: str, line: int) -> nodes.Terminal:
+        return nodes.Terminal(text, file=self.filename, line=line)
+
+    def _name(self) -> nodes.Name:
+        kind, value, line = self.tokens[self.index]
+        if kind != NAME:
+            raise self._error("<name> expected")
+        self.index += 1
+        return nodes.Name(
+            name=self._terminal(value, line), file=self.filename, line=line
+        )
+
+    # Entry points
+
+    def parse_chunk(self) -> nodes.Chunk:
+        line = self._line()
+        block = self._block()
+        if self._kind() != EOF:
+            raise self._error("'<eof>' expected")
+        return nodes.Chunk(block=block, file=self.filename, line=line)
+
+    def parse_expression(self) -> nodes.Expression:
+        expression = self._expression()
+        if self._kind() != EOF:
+            raise self._error("'<eof>' expected")
+        return expression
+
+    def parse_numeral(self) -> nodes.Numeral:
+        if self._kind() != NUMBER:
+            raise self._error("malformed number")
+        numeral = self._numeral()
+        if self._kind() != EOF:
+            raise self._error("malformed number")
+        return numeral
+
+    # Blocks and statements
+
+    def _block(self) -> nodes.Block:
+        line = self._line()
+        statements = []
+        tokens = self.tokens
+        while True:
+            kind = tokens[self.index][0]
+            if kind in BLOCK_FOLLOW:
+                return_statement = None
+                break
+            if kind == "return":
+                return_statement = self._return_statement()
+                break
+            statements.append(self._statement())
+        return nodes.Block(
+            statements=statements,
+            return_statement=return_statement,
+            file=self.filename,
+            line=line,
+        )
+
+    def _return_statement(self) -> nodes.ReturnStatement:
+        line = self._line()
+        self._advance()
+        kind = self._kind()
+        if kind in BLOCK_FOLLOW or kind == ";":
+            values = ()
+        else:
+            values = self._expression_list()
+        self._accept(";")
+        if self._kind() not in BLOCK_FOLLOW:
+            raise self._error("'<eof>' expected")
+        return nodes.ReturnStatement(
+            values=values, file=self.filename, line=line
+        )
+
+    def _statement(self) -> nodes.Statement:
+        kind, _, line = self.tokens[self.index]
+        file = self.filename
+        if kind == ";":
+            self.index += 1
+            return nodes.EmptyStatement(file=file, line=line)
+        if kind == "if":
+            return self._if_statement()
+        if kind == "while":
+            self.index += 1
+            condition = self._expression()
+            self._expect("do")
+            block = self._block()
+            self._expect_match("end", "while", line)
+            return nodes.While(
+                condition=condition, block=block, file=file, line=line
+            )
+        if kind == "do":
+            self.index += 1
+            block = self._block()
+            self._expect_match("end", "do", line)
+            return nodes.Do(block=block, file=file, line=line)
+        if kind == "for":
+            return self._for_statement()
+        if kind == "repeat":
+            self.index += 1
+            block = self._block()
+            self._expect_match("until", "repeat", line)
+            condition = self._expression()
+            return nodes.Repeat(
+                block=block, condition=condition, file=file, line=line
+            )
+        if kind == "function":
+            self.index += 1
+            name = self._function_name()
+            body = self._function_body(line)
+            return nodes.FunctionStatement(
+                name=name, body=body, file=file, line=line
+            )
+        if kind == "local":
+            self.index += 1
+            if self._accept("function"):
+                name = self._name()
+                body = self._function_body(line)
+                return nodes.LocalFunctionStatement(
+                    name=name, body=body, file=file, line=line
+                )
+            return self._local_assignment(line)
+        if kind == "::":
+            self.index += 1
+            name = self._name()
+            self._expect("::")
+            return nodes.Label(name=name, file=file, line=line)
+        if kind == "return":
+            raise self._error("'<eof>' expected")
+        if kind == "break":
+            self.index += 1
+            return nodes.Break(file=file, line=line)
+        if kind == "goto":
+            self.index += 1
+            return nodes.Goto(name=self._name(), file=file, line=line)
+        return self._expression_statement()
+
+    def _if_statement(self) -> nodes.If:
+        line = self._line()
+        self._advance()
+        blocks = []
+        condition = self._expression()
+        self._expect("then")
+        blocks.append((condition, self._block()))
+        else_block = None
+        while True:
+            kind = self._kind()
+            if kind == "elseif":
+                self._advance()
+                condition = self._expression()
+                self._expect("then")
+                blocks.append((condition, self._block()))
+            elif kind == "else":
+                self._advance()
+                else_block = self._block()
+                self._expect_match("end", "if", line)
+                break
+            else:
+                self._expect_match("end", "if", line)
+                break
+        return nodes.If(
+            blocks=blocks,
+            else_block=else_block,
+            file=self.filename,
+            line=line,
+        )
+
+    def _for_statement(self) -> nodes.For | nodes.ForIn:
+        line = self._line()
+        self._advance()
+        first_name = self._name()
+        if self._accept("="):
+            start = self._expression()
+            self._expect(",")
+            stop = self._expression()
+            step = self._expression() if self._accept(",") else None
+            self._expect("do")
+            block = self._block()
+            self._expect_match("end", "for", line)
+            return nodes.For(
+                name=first_name,
+                start=start,
+                stop=stop,
+                step=step,
+                block=block,
+                file=self.filename,
+                line=line,
+            )
+        names = [first_name]
+        while self._accept(","):
+            names.append(self._name())
+        if self._kind() != "in":
+            raise self._error("'=' or 'in' expected")
+        self._advance()
+        exprs = self._expression_list()
+        self._expect("do")
+        block = self._block()
+        self._expect_match("end", "for", line)
+        return nodes.ForIn(
+            names=tuple(names),
+            exprs=exprs,
+            block=block,
+            file=self.filename,
+            line=line,
+        )
+
+    def _function_name(self) -> nodes.FuncName:
+        line = self._line()
+        names = [self._name()]
+        while self._accept("."):
+            names.append(self._name())
+        method = self._accept(":")
+        if method:
+            names.append(self._name())
+        return nodes.FuncName(
+            names=tuple(names), method=method, file=self.filename, line=line
+        )
+
+    def _function_body(self, line: int) -> nodes.FuncBody:
+        body_line = self._line()
+        self._expect("(")
+        params = []
+        vararg = False
+        if self._kind() != ")":
+            while True:
+                if self._accept("..."):
+                    vararg = True
+                    break
+                params.append(self._name())
+                if not self._accept(","):
+                    break
+        self._expect(")")
+        block = self._block()
+        self._expect_match("end", "function", line)
+        return nodes.FuncBody(
+            params=tuple(params),
+            body=block,
+            vararg=vararg,
+            file=self.filename,
+            line=body_line,
+        )
+
+    def _local_assignment(self, line: int) -> nodes.LocalAssignment:
+        names = []
+        while True:
+            name_line = self._line()
+            name = self._name()
+            attrib = None
+            if self._accept("<"):
+                attrib = self._name()
+                self._expect(">")
+            names.append(
+                nodes.AttributeName(
+                    name=name,
+                    attrib=attrib,
+                    file=self.filename,
+                    line=name_line,
+                )
+            )
+            if not self._accept(","):
+                break
+        exprs = self._expression_list() if self._accept("=") else None
+        return nodes.LocalAssignment(
+            names=tuple(names), exprs=exprs, file=self.filename, line=line
+        )
+
+    def _expression_statement(self) -> nodes.Statement:
+        line = self._line()
+        expression = self._suffixed_expression()
+        if self._kind() in ("=", ","):
+            targets = [expression]
+            while self._accept(","):
+                targets.append(self._suffixed_expression())
+            self._expect("=")
+            for target in targets:
+                if not isinstance(target, (nodes.VarName, nodes.VarIndex)):
+                    raise LuaSyntaxError(
+                        "syntax error near '='",
+                        filename=self.filename,
+                        line=target.line,
+                    )
+            exprs = self._expression_list()
+            return nodes.Assignment(
+                names=tuple(targets),
+                exprs=exprs,
+                file=self.filename,
+                line=line,
+            )
+        if not isinstance(
+            expression, (nodes.FuncCallRegular, nodes.FuncCallMethod)
+        ):
+            raise self._error("syntax error")
+        return expression
+
+    # Expressions
+
+    def _expression_list(self) -> Sequence[nodes.Expression]:
+        exprs = [self._expression()]
+        while self._accept(","):
+            exprs.append(self._expression())
+        return tuple(exprs)
+
+    def _expression(self, limit: int = 0) -> nodes.Expression:
+        kind, _, line = self.tokens[self.index]
+        unary_operator = UNARY_OPERATORS.get(kind)
+        if unary_operator is not None:
+            self.index += 1
+            operand = self._expression(UNARY_PRIORITY)
+            left = nodes.UnaryOperation(
+                op=unary_operator, exp=operand, file=self.filename, line=line
+            )
+        else:
+            left = self._simple_expression()
+        tokens = self.tokens
+        while True:
+            kind = tokens[self.index][0]
+            priority = BINARY_PRIORITY.get(kind)
+            if priority is None or priority[0] <= limit:
+                return left
+            self.index += 1
+            right = self._expression(priority[1])
+            left = nodes.BinaryOperation(
+                lhs=left,
+                op=priority[2],
+                rhs=right,
+                file=self.filename,
+                line=left.line,
+            )
+
+    def _simple_expression(self) -> nodes.Expression:
+        kind, value, line = self.tokens[self.index]
+        file = self.filename
+        if kind == NUMBER:
+            return self._numeral()
+        if kind == STRING:
+            self.index += 1
+            return nodes.LiteralString(
+                text=self._terminal(value, line), file=file, line=line
+            )
+        if kind == "nil":
+            self.index += 1
+            return nodes.LiteralNil(file=file, line=line)
+        if kind == "true":
+            self.index += 1
+            return nodes.LiteralTrue(file=file, line=line)
+        if kind == "false":
+            self.index += 1
+            return nodes.LiteralFalse(file=file, line=line)
+        if kind == "...":
+            self.index += 1
+            return nodes.VarArgExpr(file=file, line=line)
+        if kind == "{":
+            return self._table_constructor()
+        if kind == "function":
+            self.index += 1
+            body = self._function_body(line)
+            return nodes.FuncDef(body=body, file=file, line=line)
+        return self._suffixed_expression()
+
+    def _primary_expression(self) -> nodes.Expression:
+        kind, _, line = self.tokens[self.index]
+        if kind == NAME:
+            return nodes.VarName(
+                name=self._name(), file=self.filename, line=line
+            )
+        if kind == "(":
+            self.index += 1
+            expression = self._expression()
+            self._expect_match(")", "(", line)
+            return nodes.ParenExpression(
+                expression, file=self.filename, line=line
+            )
+        raise self._error("unexpected symbol")
+
+    def _suffixed_expression(self) -> nodes.Expression:
+        line = self._line()
+        expression = self._primary_expression()
+        file = self.filename
+        while True:
+            kind, _, token_line = self.tokens[self.index]
+            if kind == ".":
+                self.index += 1
+                name_line = self._line()
+                name = self._name()
+                expression = nodes.VarIndex(
+                    base=expression,
+                    index=nodes.ParsedLiteralLuaStringExpr(
+                        name.as_lua_string(), file=file, line=name_line
+                    ),
+                    file=file,
+                    line=line,
+                )
+            elif kind == "[":
+                self.index += 1
+                index = self._expression()
+                self._expect("]")
+                expression = nodes.VarIndex(
+                    base=expression, index=index, file=file, line=line
+                )
+            elif kind == ":":
+                self.index += 1
+                method = self._name()
+                args = self._call_arguments()
+                expression = nodes.FuncCallMethod(
+                    object=expression,
+                    method=method,
+                    args=args,
+                    file=file,
+                    line=line,
+                )
+            elif kind in ("(", STRING, "{"):
+                args = self._call_arguments()
+                expression = nodes.FuncCallRegular(
+                    name=expression, args=args, file=file, line=line
+                )
+            else:
+                return expression
+
+    def _call_arguments(self) -> Sequence[nodes.Expression]:
+        kind, value, line = self.tokens[self.index]
+        if kind == STRING:
+            self.index += 1
+            return (
+                nodes.LiteralString(
+                    text=self._terminal(value, line),
+                    file=self.filename,
+                    line=line,
+                ),
+            )
+        if kind == "{":
+            return (self._table_constructor(),)
+        if kind != "(":
+            raise self._error("function arguments expected")
+        self.index += 1
+        if self._accept(")"):
+            return ()
+        args = self._expression_list()
+        self._expect_match(")", "(", line)
+        return args
+
+    def _table_constructor(self) -> nodes.TableConstructor:
+        line = self._line()
+        self._expect("{")
+        fields = []
+        file = self.filename
+        while self._kind() != "}":
+            field_line = self._line()
+            kind = self._kind()
+            if kind == "[":
+                self._advance()
+                key = self._expression()
+                self._expect("]")
+                self._expect("=")
+                fields.append(
+                    nodes.FieldWithKey(
+                        key=key,
+                        value=self._expression(),
+                        file=file,
+                        line=field_line,
+                    )
+                )
+            elif kind == NAME and self._peek_kind() == "=":
+                key = self._name()
+                self._advance()
+                fields.append(
+                    nodes.FieldWithKey(
+                        key=key,
+                        value=self._expression(),
+                        file=file,
+                        line=field_line,
+                    )
+                )
+            else:
+                fields.append(
+                    nodes.FieldCounterKey(
+                        value=self._expression(), file=file, line=field_line
+                    )
+                )
+            if not (self._accept(",") or self._accept(";")):
+                break
+        self._expect_match("}", "{", line)
+        return nodes.TableConstructor(
+            fields=tuple(fields), file=file, line=line
+        )
+
+    def _numeral(self) -> nodes.Numeral:
+        _, m, line = self._advance()
+        file = self.filename
+
+        def terminal(group: str) -> nodes.Terminal | None:
+            text = m.group(group)
+            if text is None:
+                return None
+            return nodes.Terminal(text, file=file, line=line)
+
+        if m.lastgroup == "hex":
+            p_digits = terminal("hex_exp")
+            return nodes.NumeralHex(
+                digits=terminal("hex_digits"),
+                fract_digits=terminal("hex_fract"),
+                p_sign=terminal("hex_sign") if m.group("hex_sign") else None,
+                p_digits=p_digits,
+                file=file,
+                line=line,
+            )
+        return nodes.NumeralDec(
+            digits=terminal("dec_digits"),
+            fract_digits=terminal("dec_fract"),
+            e_sign=terminal("dec_sign") if m.group("dec_sign") else None,
+            e_digits=terminal("dec_exp"),
+            file=file,
+            line=line,
+        )
+
+
+def parse_chunk(source: str, *, filename: str = "<?>") -> nodes.Chunk:
+    """Parse a chunk of Lua source code.
+
+    :raises LuaSyntaxError: if the source is not a valid chunk.
+    """
+    return Parser(source, filename=filename).parse_chunk()
+
+
+def parse_expression(
+    source: str, *, filename: str = "<?>"
+) -> nodes.Expression:
+    """Parse a single Lua expression.
+
+    :raises LuaSyntaxError: if the source is not a valid expression.
+    """
+    return Parser(source, filename=filename).parse_expression()
+
+
+def parse_numeral(source: str, *, filename: str = "<?>") -> nodes.Numeral:
+    """Parse a single Lua numeral without a sign.
+
+    :raises LuaSyntaxError: if the source is not a valid numeral.
+    """
+    return Parser(source, filename=filename).parse_numeral()
@@ -0,0 +1,162 @@
+"""Selection of the engine that runs parsed Lua code.
+
+:class:`VirtualMachine` runs every chunk through the functions in this module,
+which hand it to the engine selected with
+:attr:`VirtualMachine.engine`.
+"""
+
+from __future__ import annotations
+
+import enum
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from mehtap.ast_nodes import Chunk, Expression
+    from mehtap.scope import Scope
+    from mehtap.values import LuaFunction, LuaValue
+
+
+class ExecutionEngine(enum.Enum):
+    """ExecutionEngine(value)
+    Enumeration of the ways parsed Lua code can be run.
+    """
+
+    TREE_WALKING = "tree-walking"
+    """Every node of the abstract syntax tree evaluates itself."""
+    CLOSURES = "closures"
+    """The abstract syntax tree is compiled to nested Python closures once,
+    which are then called.
+    See :mod:`mehtap.closure_compiler`.
+    """
+    BYTECODE = "bytecode"
+    """The abstract syntax tree is compiled to register-based bytecode,
+    which is run by a dispatch loop.
+    See :mod:`mehtap.bytecode`.
+    """
+    UNBOXED = "unboxed"
+    """Like :attr:`CLOSURES`,
+    but numbers and booleans are represented as Python objects inside the
+    compiled code.
+    See :mod:`mehtap.unboxed_compiler`.
+    """
+
+
+def execute_chunk(chunk: Chunk, scope: Scope) -> list[LuaValue]:
+    """Run a main chunk in a scope.
+
+    Local variables declared in the outermost block of the chunk are put in
+    the scope.
+
+    :return: The values returned by the chunk.
+    """
+    engine = scope.vm.engine
+    if engine is ExecutionEngine.CLOSURES:
+        from mehtap.closure_compiler import compile_chunk
+
+        return compile_chunk(chunk)(scope)
+    if engine is ExecutionEngine.UNBOXED:
+        from mehtap.unboxed_compiler import compile_chunk
+
+        return compile_chunk(chunk)(scope)
+    if engine is ExecutionEngine.BYTECODE:
+        from mehtap.bytecode_compiler import compile_chunk
+        from mehtap.bytecode_interpreter import execute_main
+
+        return execute_main(compile_chunk(chunk), scope)
+    from mehtap.scope import Scope
+    from mehtap.values import LuaNil, finish_tail_calls
+
+    _resolve_names(chunk, exported_locals=True)
+    frame = Scope(
+        scope.vm,
+        scope,
+        varargs=scope.varargs,
+        slots=[LuaNil] * chunk.block.frame_size,
+    )
+    return finish_tail_calls(chunk.block.evaluate_without_inner_scope(frame))
+
+
+def _resolve_names(chunk: Chunk, *, exported_locals: bool) -> None:
+    # The tree-walking interpreter keeps the results of name resolution in the
+    # nodes, so a chunk is only resolved again if it is run the other way.
+    if chunk.exported_locals is exported_locals:
+        return
+    from mehtap.resolver import resolve
+
+    if chunk.exported_locals is not None:
+        from mehtap.quickening import unspecialize
+        from mehtap.source_compiler import discard_compiled
+
+        # Specialized nodes and compiled code read local variables from their
+        # old slots.
+        unspecialize(chunk)
+        discard_compiled(chunk)
+    resolve(chunk, export_chunk_locals=exported_locals, annotate=True)
+    chunk.exported_locals = exported_locals
+
+
+def evaluate_expression(expression: Expression, scope: Scope) \
+        -> list[LuaValue]:
+    """Evaluate an expression in a scope.
+
+    :return: All values of the expression.
+    """
+    from mehtap.ast_nodes import Block, Chunk, ReturnStatement
+
+    return execute_chunk(
+        Chunk(
+            Block(
+                [],
+                ReturnStatement(
+                    [expression],
+                    file=expression.file,
+                    line=expression.line,
+                ),
+            ),
+            file=expression.file,
+            line=expression.line,
+        ),
+        scope,
+    )
+
+
+def chunk_function(chunk: Chunk, scope: Scope) -> LuaFunction:
+    """Create the function of a loaded main chunk.
+
+    The function looks up global variables in a new scope of the virtual
+    machine of *scope*.
+    """
+    from mehtap.scope import Scope
+
+    parent_scope = Scope(scope.vm, None)
+    engine = scope.vm.engine
+    if engine is ExecutionEngine.CLOSURES:
+        from mehtap.closure_compiler import compile_chunk_function
+
+        return compile_chunk_function(chunk, parent_scope)
+    if engine is ExecutionEngine.UNBOXED:
+        from mehtap.unboxed_compiler import compile_chunk_function
+
+        return compile_chunk_function(chunk, parent_scope)
+    if engine is ExecutionEngine.BYTECODE:
+        from mehtap.bytecode_compiler import compile_chunk
+        from mehtap.bytecode_interpreter import BytecodeFunction
+
+        prototype = compile_chunk(chunk, export_chunk_locals=False)
+        return BytecodeFunction(
+            param_names=[],
+            variadic=True,
+            parent_scope=parent_scope,
+            block=prototype,
+            prototype=prototype,
+        )
+    from mehtap.values import LuaFunction
+
+    _resolve_names(chunk, exported_locals=False)
+    return LuaFunction(
+        param_names=[],
+        variadic=True,
+        parent_scope=parent_scope,
+        block=chunk.block,
+        gets_scope=False,
+    )
@@ -0,0 +1,191 @@
+"""Static checks of the ``goto`` and ``break`` statements of a chunk.
+
+Like the reference implementation,
+mehtap finds the target of every jump when a chunk is loaded,
+so that a chunk with an invalid jump is rejected before any of it runs:
+
+* a ``goto`` must refer to a label that is visible at the ``goto``,
+  that is, a label in the same block or an enclosing block of the same
+  function,
+* a ``goto`` may not jump into the scope of a local variable,
+* a label may not have the same name as a visible label,
+* and a ``break`` must be inside a loop.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Iterator
+
+import attrs
+
+import mehtap.ast_nodes as nodes
+from mehtap.descent_parser import LuaSyntaxError
+
+_LOOPS = (nodes.While, nodes.Repeat, nodes.For, nodes.ForIn)
+
+
+@attrs.define(slots=True)
+class _PendingGoto:
+    goto: nodes.Goto
+    """The ``goto`` statement that isn't resolved yet."""
+    index: int
+    """The index of the statement of the block being checked that contains the
+    ``goto``."""
+    active: int
+    """The number of local variables of the block being checked that are in
+    scope at the ``goto``."""
+
+
+def _children(node: nodes.Node) -> Iterator[nodes.Node]:
+    for field in attrs.fields(type(node)):
+        value = getattr(node, field.name)
+        if isinstance(value, nodes.Node):
+            yield value
+        elif isinstance(value, (list, tuple)):
+            for element in value:
+                if isinstance(element, nodes.Node):
+                    yield element
+                elif isinstance(element, tuple):
+                    # The condition and the block of an if statement.
+                    yield from element
+
+
+def _is_void(statement: nodes.Statement) -> bool:
+    return isinstance(statement, (nodes.Label, nodes.EmptyStatement))
+
+
+class _Checker:
+    def __init__(self, filename: str):
+        self.filename = filename
+
+    def error(self, node: nodes.Node, message: str) -> LuaSyntaxError:
+        return LuaSyntaxError(message, filename=self.filename, line=node.line)
+
+    def function(self, body: nodes.Block) -> None:
+        for goto in self.block(body, {}, loop=False):
+            raise self.error(
+                goto,
+                f"no visible label '{goto.name.name.text}' for <goto> "
+                f"at line {goto.line}",
+            )
+
+    def nested(
+        self,
+        node: nodes.Node,
+        visible: dict[str, int],
+        loop: bool,
+    ) -> list[nodes.Goto]:
+        """Check the blocks and functions inside a statement or an expression.
+
+        :return: The ``goto`` statements that aren't resolved in them.
+        """
+        if isinstance(node, nodes.FuncBody):
+            self.function(node.body)
+            return []
+        if isinstance(node, nodes.Block):
+            return self.block(node, visible, loop=loop)
+        unresolved = []
+        for child in _children(node):
+            if isinstance(node, _LOOPS) and child is node.block:
+                unresolved.extend(self.block(
+                    child,
+                    visible,
+                    loop=True,
+                    repeat=isinstance(node, nodes.Repeat),
+                ))
+            else:
+                unresolved.extend(self.nested(child, visible, loop))
+        return unresolved
+
+    def block(
+        self,
+        block: nodes.Block,
+        visible: dict[str, int],
+        *,
+        loop: bool,
+        repeat: bool = False,
+    ) -> list[nodes.Goto]:
+        """Check a block.
+
+        :param visible: The lines of the labels of the enclosing blocks that
+                        are visible at the start of the block, by name.
+        :param loop: Whether the block is inside a loop.
+        :param repeat: Whether the block is the body of a ``repeat`` loop.
+        :return: The ``goto`` statements in the block that refer to no label
+                 of the block.
+        """
+        statements = block.statements
+        # The index, the number of local variables in scope and the line of
+        # each label, by name.
+        labels: dict[str, tuple[int, int, int]] = {}
+        local_names: list[str] = []
+        pending: list[_PendingGoto] = []
+        for index, statement in enumerate(statements):
+            active = len(local_names)
+            if isinstance(statement, nodes.Label):
+                name = statement.name.name.text
+                if name in labels:
+                    previous_line = labels[name][2]
+                else:
+                    previous_line = visible.get(name)
+                if previous_line is not None:
+                    raise self.error(
+                        statement,
+                        f"label '{name}' already defined on line "
+                        f"{previous_line}",
+                    )
+                if (
+                    not repeat
+                    and block.return_statement is None
+                    and all(map(_is_void, statements[index + 1:]))
+                ):
+                    # A label at the end of a block is outside the scope of
+                    # the local variables of the block.
+                    active = 0
+                labels[name] = (index, active, statement.line)
+            elif isinstance(statement, nodes.Goto):
+                pending.append(_PendingGoto(statement, index, active))
+            elif isinstance(statement, nodes.Break):
+                if not loop:
+                    raise self.error(
+                        statement,
+                        f"break outside a loop at line {statement.line}",
+                    )
+            else:
+                inner_visible = visible | {
+                    name: line for name, (_, _, line) in labels.items()
+                }
+                for goto in self.nested(statement, inner_visible, loop):
+                    pending.append(_PendingGoto(goto, index, active))
+                if isinstance(statement, nodes.LocalAssignment):
+                    local_names.extend(
+                        attname.name.name.text for attname in statement.names
+                    )
+                elif isinstance(statement, nodes.LocalFunctionStatement):
+                    local_names.append(statement.name.name.text)
+        if block.return_statement is not None:
+            for value in block.return_statement.values:
+                self.nested(value, visible, loop)
+
+        unresolved = []
+        for p in pending:
+            name = p.goto.name.name.text
+            if name not in labels:
+                unresolved.append(p.goto)
+                continue
+            label_index, label_active, _ = labels[name]
+            if label_index > p.index and label_active > p.active:
+                raise self.error(
+                    p.goto,
+                    f"<goto {name}> at line {p.goto.line} jumps into the "
+                    f"scope of local '{local_names[p.active]}'",
+                )
+        return unresolved
+
+
+def check_jumps(chunk: nodes.Chunk) -> None:
+    """Check the ``goto``, ``break`` and label statements of a chunk.
+
+    :raises LuaSyntaxError: if a jump is not valid.
+    """
+    _Checker(chunk.file).function(chunk.block)
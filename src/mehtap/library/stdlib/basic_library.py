@@ -6,7 +6,8 @@ from os.path import basename
 from typing import TYPE_CHECKING
 
 from mehtap.ast_nodes import UnaryOperation, UnaryOperator, Chunk
-from mehtap.ast_transformer import transformer
+from mehtap.chunk_cache import load_chunk_file
+from mehtap.execution import chunk_function, execute_chunk
 from mehtap.py2lua import PyLuaRet, py2lua
 from mehtap.library.provider_abc import LibraryProvider
 from mehtap.py2lua import lua_function
@@ -20,13 +21,17 @@ from mehtap.values import (
     MAX_INT64,
     LuaFunction,
     LuaIndexableABC, type_of_lv,
+    LuaTrue,
+    LuaFalse,
+    lua_integer,
 )
 from mehtap.control_structures import LuaError
-from mehtap.values import LuaBool
-from mehtap.parser import chunk_parser, numeral_parser
+from mehtap.parser import parse_chunk, parse_numeral
 from mehtap.operations import rel_eq, length, call
 
 if TYPE_CHECKING:
+    from collections.abc import Callable
+
     from mehtap.scope import Scope
     from mehtap.values import LuaNilType
 
@@ -40,7 +45,7 @@ SYMBOL_NAME = LuaString(b"__name")
 FAIL = LuaNil
 
 
-@lua_function(name="assert")
+@lua_function(name="assert", fastcall=True)
 def lf_assert(v: LuaValue, message: LuaValue = LuaNil, /, *a) -> PyLuaRet:
     return basic_assert(v, message, *a)
 
@@ -49,7 +54,7 @@ def basic_assert(v: LuaValue, message: LuaValue = LuaNil, /, *a) -> PyLuaRet:
     """assert (v [, message])"""
     #  Raises an error if the value of its argument v is false
     #  (i.e., nil or false);
-    if v is LuaNil or (isinstance(v, LuaBool) and not v.true):
+    if v is LuaNil or v is LuaFalse:
         #  In case of error, message is the error object;
         if message is not LuaNil:
             raise LuaError(message)
@@ -59,12 +64,13 @@ def basic_assert(v: LuaValue, message: LuaValue = LuaNil, /, *a) -> PyLuaRet:
     return [v, message, *a]
 
 
-@lua_function(name="collectgarbage", gets_scope=True)
-def lf_collectgarbage(scope: Scope, opt=None, arg=None, /) -> PyLuaRet:
+@lua_function(name="collectgarbage", gets_scope=True, fastcall=True)
+def lf_collectgarbage(scope: Scope, opt=LuaNil, arg=LuaNil, /) -> PyLuaRet:
     return basic_collectgarbage(scope, opt, arg)
 
 
-def basic_collectgarbage(scope: Scope, opt=None, arg=None, /) -> PyLuaRet:
+def basic_collectgarbage(scope: Scope, opt=LuaNil, arg=LuaNil, /) \
+        -> PyLuaRet:
     """collectgarbage ([opt [, arg]])"""
     lf_warn.call(
         [py2lua("collectgarbage(): mehtap doesn't have garbage collection")],
@@ -73,47 +79,55 @@ def basic_collectgarbage(scope: Scope, opt=None, arg=None, /) -> PyLuaRet:
     return [LuaNil]
 
 
-@lua_function(name="dofile", gets_scope=True)
-def lf_dofile(scope: Scope, filename: LuaString | None = None, /) -> PyLuaRet:
+@lua_function(name="dofile", gets_scope=True, fastcall=True)
+def lf_dofile(
+    scope: Scope, filename: LuaString | LuaNilType = LuaNil, /
+) -> PyLuaRet:
     return basic_dofile(scope, filename)
 
 
 def basic_dofile(
-    scope: Scope, filename: LuaString | None = None, /
+    scope: Scope, filename: LuaString | LuaNilType = LuaNil, /
 ) -> PyLuaRet:
     """dofile ([filename])"""
     #  Opens the named file and executes its content as a Lua chunk.
     #  When called without arguments, dofile executes the content of the
     #  standard input (stdin).
-    infile = sys.stdin
-    filename_str = "<stdin>"
-    if filename is not None:
-        if isinstance(filename, LuaString):
-            infile = open(filename.content, "r", encoding="utf-8")
-            filename_str = basename(filename.content)
-        else:
-            raise LuaError("bad argument #1 to 'dofile' (string expected)")
+    if filename is LuaNil:
+        chunk_node = parse_chunk(
+            sys.stdin.read(),
+            filename="<stdin>",
+            backend=scope.vm.parser_backend,
+            optimize=scope.vm.optimize,
+        )
+    elif isinstance(filename, LuaString):
+        chunk_node = load_chunk_file(
+            scope.vm,
+            filename.content,
+            filename=basename(filename.content).decode("utf-8"),
+        )
+    else:
+        raise LuaError("bad argument #1 to 'dofile' (string expected)")
     #  Returns all values returned by the chunk. In case of errors,
     #  dofile propagates the error to its caller.
     #  (That is, dofile does not run in protected mode.)
-    parsed_chunk = chunk_parser.parse(infile.read())
-    chunk_node = transformer.transform(parsed_chunk, filename=filename_str)
     from mehtap.scope import Scope
     new_scope = Scope(
         vm=scope.vm,
         parent=None,
     )
-    r = chunk_node.block.evaluate(new_scope)
-    return r
+    return execute_chunk(chunk_node, new_scope)
 
 
-@lua_function(name="error", gets_scope=True)
+@lua_function(name="error", gets_scope=True, fastcall=True)
 def lf_error(
     scope: Scope,
     message: LuaValue = LuaNil,
-    level: LuaNumber = LuaNumber(1, LuaNumberType.INTEGER),
+    level: LuaNumber | LuaNilType = LuaNil,
     /,
 ) -> PyLuaRet:
+    if level is LuaNil:
+        level = LuaNumber(1, LuaNumberType.INTEGER)
     return basic_error(scope, message, level)
 
 
@@ -137,7 +151,7 @@ def basic_error(
     # addition of error position information to the message.
 
 
-@lua_function(name="getmetatable")
+@lua_function(name="getmetatable", fastcall=True)
 def lf_getmetatable(object: LuaValue, /) -> PyLuaRet:
     return basic_getmetatable(object)
 
@@ -154,22 +168,32 @@ def basic_getmetatable(object: LuaValue, /) -> PyLuaRet:
     return [mt.get_with_fallback(SYMBOL_METATABLE, mt)]
 
 
-@lua_function(name="ipairs")
+@lua_function(name="ipairs", fastcall=True)
 def lf_ipairs(t: LuaTable, /) -> PyLuaRet:
     return basic_ipairs(t)
 
 
-@lua_function
-def _ipairs_iterator_function(state, control_variable: LuaNumber, /) \
-        -> PyLuaRet:
+def _ipairs_step(
+    state: LuaTable,
+    control_variable: LuaNumber,
+) -> tuple[LuaNumber, LuaValue] | None:
     index = control_variable.value + 1
     if index > MAX_INT64:
         return None
-    index_val = LuaNumber(index, LuaNumberType.INTEGER)
+    index_val = lua_integer(index)
     value = state.rawget(index_val)
     if value is LuaNil:
         return None
-    return [index_val, value]
+    return index_val, value
+
+
+@lua_function(fastcall=True)
+def _ipairs_iterator_function(state, control_variable: LuaNumber, /) \
+        -> PyLuaRet:
+    pair = _ipairs_step(state, control_variable)
+    if pair is None:
+        return [LuaNil]
+    return list(pair)
 
 
 def basic_ipairs(t: LuaTable, /) -> PyLuaRet:
@@ -181,16 +205,40 @@ def basic_ipairs(t: LuaTable, /) -> PyLuaRet:
     # will iterate over the key–value pairs (1,t[1]), (2,t[2]), ..., up
     # to the first absent index.
 
-    return [_ipairs_iterator_function, t, LuaNumber(0)]
+    return [_ipairs_iterator_function, t, lua_integer(0)]
 
 
-@lua_function(name="load", gets_scope=True)
+def native_table_step(
+    iterator_function: LuaValue,
+    state: LuaValue,
+) -> Callable[[LuaTable, LuaValue], tuple[LuaValue, LuaValue] | None] | None:
+    """Find a native replacement for the iterator of a generic for loop.
+
+    :return: If *iterator_function* is the :func:`next` or the ipairs iterator
+             of the basic library and *state* is a table, a function that
+             takes the state and the control value and returns the next pair
+             of the loop variables, or :data:`None` when the loop ends.
+             Otherwise :data:`None`.
+
+    Generic for loops use this to traverse tables without calling the
+    iterator function through :func:`call`.
+    """
+    if not isinstance(state, LuaTable):
+        return None
+    if iterator_function is lf_next:
+        return LuaTable.next
+    if iterator_function is _ipairs_iterator_function:
+        return _ipairs_step
+    return None
+
+
+@lua_function(name="load", gets_scope=True, fastcall=True)
 def lf_load(
     scope: Scope,
     chunk: LuaString | LuaFunction,
-    chunk_name: LuaString | None = None,
-    mode: LuaString | None = None,
-    env: LuaTable | None = None,
+    chunk_name: LuaString | LuaNilType = LuaNil,
+    mode: LuaString | LuaNilType = LuaNil,
+    env: LuaTable | LuaNilType = LuaNil,
     /,
 ) -> PyLuaRet:
     return basic_load(scope, chunk, chunk_name, mode, env)
@@ -199,9 +247,9 @@ def lf_load(
 def basic_load(
     scope: Scope,
     chunk: LuaString | LuaFunction,
-    chunkname: LuaString | None = None,
-    mode: LuaString | None = None,
-    env: LuaTable | None = None,
+    chunkname: LuaString | LuaNilType = LuaNil,
+    mode: LuaString | LuaNilType = LuaNil,
+    env: LuaTable | LuaNilType = LuaNil,
     /,
 ) -> PyLuaRet:
     """load (chunk [, chunkname [, mode [, env]]])"""
@@ -213,7 +261,7 @@ def basic_load(
         # chunkname is used as the name of the chunk for error messages and
         # debug information (see §4.7). When absent, it defaults to chunk,
         # if chunk is a string, or to "=(load)" otherwise.
-        if chunkname is None:
+        if chunkname is LuaNil:
             chunkname = LuaString(b"chunk")
         chunk_content.write(chunk.content)
         chunk_content.seek(0)
@@ -222,7 +270,7 @@ def basic_load(
         # chunkname is used as the name of the chunk for error messages and
         # debug information (see §4.7). When absent, it defaults to chunk,
         # if chunk is a string, or to "=(load)" otherwise.
-        if chunkname is None:
+        if chunkname is LuaNil:
             chunkname = LuaString(b"=(load)")
         while True:
             # Each call to chunk must return a string that concatenates with
@@ -249,20 +297,14 @@ def basic_load(
     # function; otherwise, it returns fail plus the error message.
     try:
         chunk_name_str = chunkname.content.decode("utf-8")
-        parsed_chunk = chunk_parser.parse(chunk_content.read().decode("utf-8"))
-        chunk_node: Chunk = transformer.transform(
-            parsed_chunk, filename=chunk_name_str
-        )
-        from mehtap.scope import Scope
-
-        return LuaFunction(
-            param_names=[],
-            variadic=True,
-            parent_scope=Scope(scope.vm, None),
-            block=chunk_node.block,
-            gets_scope=False,
+        chunk_node: Chunk = parse_chunk(
+            chunk_content.read().decode("utf-8"),
+            filename=chunk_name_str,
+            backend=scope.vm.parser_backend,
+            optimize=scope.vm.optimize,
         )
-    except Exception as e:
+        return [chunk_function(chunk_node, scope)]
+    except (Exception, LuaError) as e:
         return [FAIL, py2lua(str(e))]
     # TODO: The following is not implemented:
     # When you load a main chunk, the resulting function will always have
@@ -287,12 +329,12 @@ def basic_load(
     # interpreter.
 
 
-@lua_function(name="loadfile", gets_scope=True)
+@lua_function(name="loadfile", gets_scope=True, fastcall=True)
 def lf_loadfile(
     scope: Scope,
-    filename: LuaString | None = None,
-    mode: LuaString | None = None,
-    env: LuaTable | None = None,
+    filename: LuaString | LuaNilType = LuaNil,
+    mode: LuaString | LuaNilType = LuaNil,
+    env: LuaTable | LuaNilType = LuaNil,
     /,
 ) -> PyLuaRet:
     return basic_loadfile(scope, filename, mode, env)
@@ -300,16 +342,16 @@ def lf_loadfile(
 
 def basic_loadfile(
     scope: Scope,
-    filename: LuaString | None = None,
-    mode: LuaString | None = None,
-    env: LuaTable | None = None,
+    filename: LuaString | LuaNilType = LuaNil,
+    mode: LuaString | LuaNilType = LuaNil,
+    env: LuaTable | LuaNilType = LuaNil,
     /,
 ) -> PyLuaRet:
     """loadfile ([filename [, mode [, env]]])"""
     # Similar to load, but gets the chunk from file filename
     # or from the standard input, if no file name is given.
     try:
-        if filename is None:
+        if filename is LuaNil:
             return basic_load(
                 scope,
                 LuaString(input().encode("utf-8")),
@@ -317,18 +359,17 @@ def basic_loadfile(
             )
         if not isinstance(filename, LuaString):
             raise LuaError("bad argument #1 to 'loadfile' (string expected)")
-        with open(filename.content, "rb") as f:
-            return basic_load(
-                scope,
-                LuaString(f.read()),
-                filename,
-                mode, env,
-            )
-    except Exception as e:
+        chunk_node = load_chunk_file(
+            scope.vm,
+            filename.content,
+            filename=basename(filename.content).decode("utf-8"),
+        )
+        return [chunk_function(chunk_node, scope)]
+    except (Exception, LuaError) as e:
         return [FAIL, py2lua(str(e))]
 
 
-@lua_function(name="next")
+@lua_function(name="next", fastcall=True)
 def lf_next(table: LuaTable, index: LuaValue = LuaNil, /) -> PyLuaRet:
     return basic_next(table, index)
 
@@ -361,30 +402,13 @@ def basic_next(table: LuaTable, index: LuaValue = LuaNil, /) -> PyLuaRet:
         raise LuaError(
             f"bad argument #1 to 'next' (table expected, got {table_type})"
         )
-    if index is LuaNil:
-        iterator = iter(table.map.items())
-        try:
-            k, v = next(iterator)
-        except StopIteration:
-            return [LuaNil]
-        return [k, v]
-    iterator = iter(table.map.items())
-    for k, v in iterator:
-        if rel_eq(k, index).true:
-            break
-    else:
+    pair = table.next(index)
+    if pair is None:
         return [LuaNil]
-    # return the next pair for which v isn't nil
-    while True:
-        try:
-            k, v = next(iterator)
-        except StopIteration:
-            return [LuaNil]
-        if v is not LuaNil:
-            return [k, v]
+    return list(pair)
 
 
-@lua_function(name="pairs", gets_scope=True)
+@lua_function(name="pairs", gets_scope=True, fastcall=True)
 def lf_pairs(scope: Scope, t: LuaTable, /) -> list[LuaValue] | None:
     return basic_pairs(scope, t)
 
@@ -403,7 +427,7 @@ def basic_pairs(scope: Scope, t: LuaTable, /) -> list[LuaValue] | None:
     return [lf_next, t, LuaNil]
 
 
-@lua_function(name="pcall", gets_scope=True)
+@lua_function(name="pcall", gets_scope=True, fastcall=True)
 def lf_pcall(
     scope: Scope,
     f: LuaFunction,
@@ -432,12 +456,12 @@ def basic_pcall(
     try:
         return_vals = call(f, list(args), scope)
     except LuaError as lua_error:
-        return [LuaBool(False), lua_error.message]
+        return [LuaFalse, lua_error.message]
     else:
-        return [LuaBool(True), *return_vals]
+        return [LuaTrue, *return_vals]
 
 
-@lua_function(name="print", gets_scope=True)
+@lua_function(name="print", gets_scope=True, fastcall=True)
 def lf_print(scope: Scope, /, *args: LuaValue) -> PyLuaRet:
     return basic_print(scope, *args)
 
@@ -457,10 +481,10 @@ def basic_print(scope: Scope, /, *args: LuaValue) -> PyLuaRet:
         for string_list in string_lists
     )
     print(x)
-    return None
+    return []
 
 
-@lua_function(name="rawequal")
+@lua_function(name="rawequal", fastcall=True)
 def lf_rawequal(v1, v2, /) -> PyLuaRet:
     return basic_rawequal(v1, v2)
 
@@ -473,7 +497,7 @@ def basic_rawequal(v1, v2, /) -> PyLuaRet:
     return [rel_eq(v1, v2, raw=True)]
 
 
-@lua_function(name="rawget")
+@lua_function(name="rawget", fastcall=True)
 def lf_rawget(
     table: LuaTable,
     index: LuaValue,
@@ -496,7 +520,7 @@ def basic_rawget(
     return [table.rawget(index)]
 
 
-@lua_function(name="rawlen")
+@lua_function(name="rawlen", fastcall=True)
 def lf_rawlen(v: LuaTable | LuaString, /) -> PyLuaRet:
     return basic_rawlen(v)
 
@@ -510,7 +534,7 @@ def basic_rawlen(v: LuaTable | LuaString, /) -> PyLuaRet:
     return [length(v, raw=True)]
 
 
-@lua_function(name="rawset")
+@lua_function(name="rawset", fastcall=True)
 def lf_rawset(table: LuaTable, index: LuaValue, value: LuaValue, /) -> PyLuaRet:
     return basic_rawset(table, index, value)
 
@@ -529,7 +553,7 @@ def basic_rawset(
     return [table]
 
 
-@lua_function(name="select")
+@lua_function(name="select", fastcall=True)
 def lf_select(index, /, *a) -> PyLuaRet:
     return basic_select(index, *a)
 
@@ -549,15 +573,15 @@ def basic_select(index, /, *a) -> PyLuaRet:
             raise LuaError("bad argument #1 to 'select' (index out of range)")
         return list(a[index - 1 :])
     # Otherwise, index must be the string "#",
-    if index != LuaString(b"#"):
+    if not isinstance(index, LuaString) or index.content != b"#":
         raise LuaError(
             "bad argument #1 to 'select' " "(must be integer or the string '#')"
         )
     # and select returns the total number of extra arguments it received.
-    return [LuaNumber(len(a), LuaNumberType.INTEGER)]
+    return [lua_integer(len(a))]
 
 
-@lua_function(name="setmetatable")
+@lua_function(name="setmetatable", fastcall=True)
 def lf_setmetatable(
     table: LuaTable,
     metatable: LuaTable | LuaNilType,
@@ -587,12 +611,12 @@ def basic_setmetatable(
     # debug library (§6.10).
 
 
-@lua_function(name="tonumber", gets_scope=True)
-def lf_tonumber(scope: Scope, e, base=None, /) -> PyLuaRet:
+@lua_function(name="tonumber", gets_scope=True, fastcall=True)
+def lf_tonumber(scope: Scope, e, base=LuaNil, /) -> PyLuaRet:
     return basic_tonumber(scope, e, base)
 
 
-def basic_tonumber(scope: Scope, e, base=None, /) -> PyLuaRet:
+def basic_tonumber(scope: Scope, e, base=LuaNil, /) -> PyLuaRet:
     """tonumber (e [, base])"""
     # When called with no base, tonumber tries to convert its argument to a
     # number.
@@ -602,7 +626,7 @@ def basic_tonumber(scope: Scope, e, base=None, /) -> PyLuaRet:
     # The conversion of strings can result in integers or floats, according
     # to the lexical conventions of Lua (see §3.1). The string may have
     # leading and trailing spaces and a sign.
-    if base is None:
+    if base is LuaNil:
         if isinstance(e, LuaNumber):
             return [e]
         if isinstance(e, LuaString):
@@ -612,19 +636,13 @@ def basic_tonumber(scope: Scope, e, base=None, /) -> PyLuaRet:
                     return [
                         UnaryOperation(
                             op=UnaryOperator.NEG,
-                            exp=transformer.transform(
-                                numeral_parser.parse(e_str[1:])
-                            ),
+                            exp=parse_numeral(e_str[1:]),
                         ).evaluate_single(scope)
                     ]
 
                 if e_str[0] == "+":
                     e_str = e_str[1:]
-                return [
-                    transformer.transform(
-                        numeral_parser.parse(e_str)
-                    ).evaluate_single(scope)
-                ]
+                return [parse_numeral(e_str).evaluate_single(scope)]
             except Exception:
                 return [FAIL]
     # When called with base, then e must be a string to be interpreted as an
@@ -657,16 +675,14 @@ def basic_tonumber(scope: Scope, e, base=None, /) -> PyLuaRet:
         if digit >= base.value:
             return [FAIL]
         acc = acc * base.value + digit
-    if acc < MAX_INT64:
-        number = LuaNumber(acc, LuaNumberType.INTEGER)
-    else:
-        number = LuaNumber(-1, LuaNumberType.INTEGER)
+    if acc >= MAX_INT64:
+        acc = -1
     if e_str[0] == "-":
-        number.value = -number.value
-    return [number]
+        acc = -acc
+    return [lua_integer(acc)]
 
 
-@lua_function(name="tostring", gets_scope=True)
+@lua_function(name="tostring", gets_scope=True, fastcall=True)
 def lf_tostring(scope: Scope, v: LuaValue, /) -> PyLuaRet:
     return basic_tostring(scope, v)
 
@@ -693,7 +709,7 @@ def basic_tostring(scope: Scope, v: LuaValue, /) -> PyLuaRet:
     return [LuaString(str(v).encode("utf-8"))]
 
 
-@lua_function(name="type")
+@lua_function(name="type", fastcall=True)
 def lf_type(v: LuaValue, /) -> PyLuaRet:
     return basic_type(v)
 
@@ -708,9 +724,10 @@ def basic_type(v: LuaValue, /) -> PyLuaRet:
     return [LuaString(type_of_lv(v).encode("ascii"))]
 
 
-@lua_function(name="warn", gets_scope=True)
+@lua_function(name="warn", gets_scope=True, fastcall=True)
 def lf_warn(scope: Scope, msg1: LuaString, /, *a: LuaString) -> PyLuaRet:
-    return basic_warn(scope, msg1, *a)
+    basic_warn(scope, msg1, *a)
+    return []
 
 
 def basic_warn(scope: Scope, msg1: LuaString, /, *a: LuaString) -> None:
@@ -743,7 +760,7 @@ def basic_warn(scope: Scope, msg1: LuaString, /, *a: LuaString) -> None:
     return None
 
 
-@lua_function(name="xpcall", gets_scope=True)
+@lua_function(name="xpcall", gets_scope=True, fastcall=True)
 def lf_xpcall(
     scope: Scope,
     f: LuaFunction,
@@ -772,7 +789,7 @@ def basic_xpcall(
         # and returns a status code.
         return [
             # In case of any error, xpcall returns false
-            LuaBool(False),
+            LuaFalse,
             # plus the result from msgh.
             *call(msgh, [lua_error.message], scope),
         ]
@@ -780,7 +797,7 @@ def basic_xpcall(
         return [
             # Its first result is the status code (a boolean),
             # which is true if the call succeeds without errors.
-            LuaBool(True),
+            LuaTrue,
             # In such case, xpcall also returns all results from the call,
             # after this first result.
             *return_vals,
@@ -4,15 +4,13 @@ import subprocess
 from io import SEEK_CUR, SEEK_SET, SEEK_END
 from os import fsync
 from tempfile import TemporaryFile
-from typing import TypeVar, BinaryIO, IO
+from typing import TYPE_CHECKING, TypeVar, BinaryIO, IO
 
 import attrs
 
-from mehtap.ast_nodes import Numeral
-from mehtap.ast_transformer import transformer
 from mehtap.control_structures import LuaError
 from mehtap.library.provider_abc import LibraryProvider
-from mehtap.parser import numeral_parser
+from mehtap.parser import parse_numeral
 from mehtap.py2lua import lua_function, PyLuaRet
 from mehtap.scope import Scope
 from mehtap.values import (
@@ -25,9 +23,12 @@ from mehtap.values import (
     LuaIndexableABC,
     LuaFunction,
     type_of_lv,
-    LuaBool,
+    LuaTrue,
 )
 
+if TYPE_CHECKING:
+    from mehtap.values import LuaNilType
+
 FAIL = LuaNil
 
 
@@ -88,22 +89,23 @@ class LuaFile(LuaUserdata, LuaIndexableABC):
         return f"file: {self._name()} ({hex(id(self))})"
 
 
-@lua_function(name="close")
+@lua_function(name="close", fastcall=True)
 def _lf_file_method_close(self: LuaFile, /) -> PyLuaRet:
     self.io.close()
     if self.popen is None:
-        return None
+        return []
     retcode = self.popen.wait()
     return [
-        LuaBool(True) if retcode == 0 else FAIL,
-        ("exit" if retcode >= 0 else "signal").encode("ascii"),
+        LuaTrue if retcode == 0 else FAIL,
+        LuaString(b"exit" if retcode >= 0 else b"signal"),
         LuaNumber(abs(retcode)),
     ]
 
 
-@lua_function(name="flush")
+@lua_function(name="flush", fastcall=True)
 def _lf_file_method_flush(self: LuaFile, /) -> PyLuaRet:
-    return _fsync_io(self.io)
+    _fsync_io(self.io)
+    return []
 
 
 def _fsync_io(io: IO, /) -> PyLuaRet:
@@ -112,7 +114,7 @@ def _fsync_io(io: IO, /) -> PyLuaRet:
     return None
 
 
-@lua_function(name="lines", gets_scope=True)
+@lua_function(name="lines", gets_scope=True, fastcall=True)
 def _lf_file_method_lines(scope: Scope, self: LuaFile, /, *formats) -> PyLuaRet:
     return _file_method_lines(scope, self, *formats)
 
@@ -123,7 +125,7 @@ def _file_method_lines(scope: Scope, self: LuaFile, /, *formats) -> PyLuaRet:
         formats = (LuaString(b"l"),)
 
     # Returns an iterator function that,
-    @lua_function
+    @lua_function(fastcall=True)
     def iterator_function() -> PyLuaRet:
         # each time it is called, reads the file
         # according to the given formats.
@@ -152,9 +154,7 @@ def _read_format_n(scope: Scope, file: LuaFile) -> LuaNumber | FAIL:
     for length in range(len(part), 0, -1):
         try:
             input = part[:length].decode("ascii")
-            parsed = numeral_parser.parse(input)
-            transformed: Numeral = transformer.transform(parsed)
-            return transformed.evaluate(scope=scope)
+            return parse_numeral(input).evaluate(scope=scope)
         except Exception:
             continue
         finally:
@@ -207,7 +207,7 @@ def _read_format_number(file: LuaFile, number: int) -> LuaString:
     return LuaString(acc)
 
 
-@lua_function(name="read", gets_scope=True)
+@lua_function(name="read", gets_scope=True, fastcall=True)
 def _lf_file_method_read(scope: Scope, self: LuaFile, /, *formats: LuaValue) \
         -> PyLuaRet:
     return _file_method_read(scope, self, *formats)
@@ -240,16 +240,16 @@ def _file_method_read(scope: Scope, self: LuaFile, /, *formats: LuaValue) \
 SYMBOL__FD = LuaString(b"__fd")
 
 
-@lua_function(name="seek")
+@lua_function(name="seek", fastcall=True)
 def _lf_file_method_seek(
     self: LuaFile,
-    whence: LuaString | None = None,
-    offset: LuaNumber | None = None,
+    whence: LuaString | LuaNilType = LuaNil,
+    offset: LuaNumber | LuaNilType = LuaNil,
     /,
 ) -> PyLuaRet:
-    if whence is None:
+    if whence is LuaNil:
         whence = LuaString(b"cur")
-    if offset is None:
+    if offset is LuaNil:
         offset = LuaNumber(0)
     match whence.content:
         case b"set":
@@ -263,15 +263,15 @@ def _lf_file_method_seek(
     return [LuaNumber(new_offset)]
 
 
-@lua_function(name="setvbuf", gets_scope=True)
+@lua_function(name="setvbuf", gets_scope=True, fastcall=True)
 def _lf_file_method_setvbuf(
-    scope: Scope, self: LuaFile, mode, size=None, /
+    scope: Scope, self: LuaFile, mode, size=LuaNil, /
 ) -> PyLuaRet:
     scope.vm.get_warning("file:setvbuf(): ignored call")
-    return None
+    return []
 
 
-@lua_function(name="write")
+@lua_function(name="write", fastcall=True)
 def _lf_file_method_write(
     self: LuaFile,
     /,
@@ -293,75 +293,82 @@ def _file_method_write(
     return [self]
 
 
-@lua_function(name="close", gets_scope=True)
-def lf_io_close(scope: Scope, file: LuaFile | None = None, /) -> PyLuaRet:
+@lua_function(name="close", gets_scope=True, fastcall=True)
+def lf_io_close(
+    scope: Scope, file: LuaFile | LuaNilType = LuaNil, /
+) -> PyLuaRet:
     return io_close(scope, file)
 
 
-def io_close(scope: Scope, file: LuaFile | None = None, /) -> PyLuaRet:
-    if file is None:
+def io_close(
+    scope: Scope, file: LuaFile | LuaNilType = LuaNil, /
+) -> PyLuaRet:
+    if file is LuaNil:
         binary_io = scope.vm.default_output
     else:
         binary_io = file.io
     binary_io.close()
-    return None
+    return []
 
 
-@lua_function(name="flush", gets_scope=True)
+@lua_function(name="flush", gets_scope=True, fastcall=True)
 def lf_io_flush(scope: Scope, /) -> PyLuaRet:
     return io_flush(scope)
 
 
 def io_flush(scope: Scope, /) -> PyLuaRet:
     _fsync_io(scope.vm.default_output)
-    return None
+    return []
 
 
-@lua_function(name="input", gets_scope=True)
+@lua_function(name="input", gets_scope=True, fastcall=True)
 def lf_io_input(
-    scope: Scope, file: LuaFile | LuaString | None = None, /
+    scope: Scope, file: LuaFile | LuaString | LuaNilType = LuaNil, /
 ) -> PyLuaRet:
     return io_input(scope, file)
 
 
-def io_input(scope: Scope, file: LuaFile | LuaString | None = None, /):
+def io_input(
+    scope: Scope, file: LuaFile | LuaString | LuaNilType = LuaNil, /
+) -> PyLuaRet:
     # When called with a file name, it opens the named file (in text mode),
     # and sets its handle as the default input file.
     try:
         if isinstance(file, LuaString):
             file = open(file.content, "rb")
             scope.vm.default_input = file
-            return None
+            return []
         # When called with a file handle, it simply sets this file handle as
         # the default input file.
         if isinstance(file, LuaFile):
             scope.vm.default_input = file.io
-            return None
+            return []
         # When called without arguments, it returns the
         # current default input file.
-        if file is None:
+        if file is LuaNil:
             return [LuaFile(scope.vm.default_input)]
         # In case of errors this function raises the error, instead of
         # returning an error code.
+        return []
     except Exception as e:
         raise LuaError(f"io.input(): {e!s}")
 
 
-@lua_function(name="lines", gets_scope=True)
+@lua_function(name="lines", gets_scope=True, fastcall=True)
 def lf_io_lines(
-    scope: Scope, filename: LuaString | None = None, /, *formats
+    scope: Scope, filename: LuaString | LuaNilType = LuaNil, /, *formats
 ) -> PyLuaRet:
     return io_lines(scope, filename, *formats)
 
 
 def io_lines(
-    scope: Scope, filename: LuaString | None = None, /, *formats
+    scope: Scope, filename: LuaString | LuaNilType = LuaNil, /, *formats
 ) -> PyLuaRet:
     # The call io.lines() (with no file name) is equivalent to
     # io.input():lines("l"); that is, it iterates over the lines of the
     # default input file.
     # In this case, the iterator does not close the file when the loop ends.
-    if filename is None:
+    if filename is LuaNil:
         file_handle = LuaFile(scope.vm.default_input)
         to_close = False
     else:
@@ -372,7 +379,7 @@ def io_lines(
     # function that works like file:lines(···) over the opened file.
     # When the iterator function fails to read any value, it automatically
     # closes the file.
-    @lua_function
+    @lua_function(fastcall=True)
     def iterator_function() -> PyLuaRet:
         f = _file_method_read(scope, file_handle, *formats)
         if to_close and (
@@ -389,14 +396,16 @@ def io_lines(
     return [iterator_function, LuaNil, LuaNil, file_handle]
 
 
-@lua_function(name="open")
+@lua_function(name="open", fastcall=True)
 def lf_io_open(
-    filename: LuaString, mode: LuaString | None = None, /
+    filename: LuaString, mode: LuaString | LuaNilType = LuaNil, /
 ) -> PyLuaRet:
     return io_open(filename, mode)
 
 
-def io_open(filename: LuaString, mode: LuaString | None = None, /) -> PyLuaRet:
+def io_open(
+    filename: LuaString, mode: LuaString | LuaNilType = LuaNil, /
+) -> PyLuaRet:
     # This function opens a file, in the mode specified in the string mode.
     # In case of success, it returns a new file handle.
     #
@@ -412,7 +421,7 @@ def io_open(filename: LuaString, mode: LuaString | None = None, /) -> PyLuaRet:
     #
     # The mode string can also have a 'b' at the end, which is needed in
     # some systems to open the file in binary mode.
-    if mode is None:
+    if mode is LuaNil:
         mode = LuaString(b"r")
     if not isinstance(mode, LuaString):
         raise LuaError("'mode' must be a string")
@@ -434,15 +443,16 @@ def io_open(filename: LuaString, mode: LuaString | None = None, /) -> PyLuaRet:
     return [LuaFile(open(filename.content, mode_str))]
 
 
-@lua_function(name="output", gets_scope=True)
+@lua_function(name="output", gets_scope=True, fastcall=True)
 def lf_io_output(
-    scope: Scope, file: LuaFile | LuaString | None = None, /
+    scope: Scope, file: LuaFile | LuaString | LuaNilType = LuaNil, /
 ) -> PyLuaRet:
     return io_output(scope, file)
 
 
 def io_output(
-    scope: Scope, file: LuaFile | LuaString | None = None, /):
+    scope: Scope, file: LuaFile | LuaString | LuaNilType = LuaNil, /
+) -> PyLuaRet:
     # Similar to io.input, but operates over the default output file.
 
     # When called with a file name, it opens the named file (in text mode),
@@ -450,28 +460,29 @@ def io_output(
     try:
         if isinstance(file, LuaString):
             scope.vm.default_output = open(file.content, "rb")
-            return None
+            return []
         # When called with a file handle, it simply sets this file handle as
         # the default input file.
         if isinstance(file, LuaFile):
             scope.vm.default_output = file.io
-            return None
+            return []
         # When called without arguments, it returns the
         # current default input file.
-        if file is None:
+        if file is LuaNil:
             return [LuaFile(scope.vm.default_output)]
         # In case of errors this function raises the error, instead of
         # returning an error code.
+        return []
     except Exception as e:
         raise LuaError(f"io.output(): {e!s}")
 
 
-@lua_function(name="popen")
-def lf_io_popen(prog, mode=None, /) -> PyLuaRet:
+@lua_function(name="popen", fastcall=True)
+def lf_io_popen(prog, mode=LuaNil, /) -> PyLuaRet:
     return io_popen(prog, mode)
 
 
-def io_popen(prog, mode=None, /):
+def io_popen(prog, mode=LuaNil, /) -> PyLuaRet:
     # io.popen (prog [, mode])
     # This function is system dependent and is not available on all
     # platforms.
@@ -485,7 +496,7 @@ def io_popen(prog, mode=None, /):
             f"bad argument #1 to 'popen' "
             f"(string expected, got {type_of_prog})"
         )
-    if mode is not None:
+    if mode is not LuaNil:
         if not isinstance(mode, LuaString):
             type_of_mode = type_of_lv(mode)
             raise LuaError(
@@ -511,7 +522,7 @@ def io_popen(prog, mode=None, /):
     return [LuaFile(popen.stdin, popen=popen)]
 
 
-@lua_function(name="read", gets_scope=True)
+@lua_function(name="read", gets_scope=True, fastcall=True)
 def lf_io_read(scope: Scope, /, *formats) -> PyLuaRet:
     return io_read(scope, *formats)
 
@@ -523,7 +534,7 @@ def io_read(scope: Scope, /, *formats) -> PyLuaRet:
     return _file_method_read(scope, io_input(scope)[0])
 
 
-@lua_function(name="tmpfile")
+@lua_function(name="tmpfile", fastcall=True)
 def lf_io_tmpfile() -> PyLuaRet:
     return io_tmpfile()
 
@@ -537,7 +548,7 @@ def io_tmpfile() -> PyLuaRet:
     return [LuaFile(TemporaryFile())]
 
 
-@lua_function(name="type")
+@lua_function(name="type", fastcall=True)
 def lf_io_type(obj: LuaValue, /) -> PyLuaRet:
     return io_type(obj)
 
@@ -555,7 +566,7 @@ def io_type(obj: LuaValue, /) -> PyLuaRet:
     return [LuaString(b"file")]
 
 
-@lua_function(name="write", gets_scope=True)
+@lua_function(name="write", gets_scope=True, fastcall=True)
 def lf_io_write(scope: Scope, /, *values: LuaValue) -> PyLuaRet:
     return io_write(scope, *values)
 
@@ -20,6 +20,7 @@ from mehtap.values import (
     LuaNil,
     LuaNumber,
     LuaBool,
+    LuaTrue,
     LuaValue,
     LuaFunction,
     type_of_lv,
@@ -198,7 +199,7 @@ class TimeTuple:
         )
 
 
-@lua_function(name="clock")
+@lua_function(name="clock", fastcall=True)
 def lf_os_clock() -> PyLuaRet:
     return os_clock()
 
@@ -209,7 +210,7 @@ def os_clock() -> PyLuaRet:
     return [LuaNumber(process_time())]
 
 
-@lua_function(name="date")
+@lua_function(name="date", fastcall=True)
 def lf_os_date(format=LuaNil, time=LuaNil, /) -> PyLuaRet:
     return os_date(format, time)
 
@@ -274,7 +275,7 @@ def os_date(format=LuaNil, time=LuaNil, /) -> PyLuaRet:
     # reliance on C function gmtime and C function localtime.
 
 
-@lua_function(name="difftime")
+@lua_function(name="difftime", fastcall=True)
 def lf_os_difftime(t2, t1, /) -> PyLuaRet:
     return os_difftime(t2, t1)
 
@@ -295,16 +296,16 @@ def os_difftime(t2, t1, /) -> PyLuaRet:
     return [LuaNumber(t2.value - t1.value)]
 
 
-@lua_function(name="execute")
-def lf_os_execute(command=None, /) -> PyLuaRet:
+@lua_function(name="execute", fastcall=True)
+def lf_os_execute(command=LuaNil, /) -> PyLuaRet:
     return os_execute(command)
 
 
-def os_execute(command=None, /) -> PyLuaRet:
+def os_execute(command=LuaNil, /) -> PyLuaRet:
     # When called without a command, os.execute returns a boolean that is
     # true if a shell is available.
-    if command is None:
-        return [LuaBool(True)]
+    if command is LuaNil:
+        return [LuaTrue]
 
     # This function is equivalent to the ISO C function system.
     # It passes command to be executed by an operating system shell.
@@ -323,24 +324,24 @@ def os_execute(command=None, /) -> PyLuaRet:
     #     "signal": the command was terminated by a signal; the following
     #               number is the signal that terminated the command.
     return [
-        LuaBool(True) if retcode == 0 else FAIL,
+        LuaTrue if retcode == 0 else FAIL,
         str_to_lua_string("exit" if retcode >= 0 else "signal"),
         LuaNumber(abs(retcode)),
     ]
 
 
-@lua_function(name="exit")
-def lf_os_exit(code=None, close=None, /) -> PyLuaRet:
+@lua_function(name="exit", fastcall=True)
+def lf_os_exit(code=LuaNil, close=LuaNil, /) -> PyLuaRet:
     return os_exit(code, close)
 
 
-def os_exit(code=None, close=None, /) -> PyLuaRet:
+def os_exit(code=LuaNil, close=LuaNil, /) -> PyLuaRet:
     # Calls the ISO C function exit to terminate the host program.
     # If code is true, the returned status is EXIT_SUCCESS;
     # if code is false, the returned status is EXIT_FAILURE;
     # if code is a number, the returned status is this number.
     # The default value for code is true.
-    if code is None:
+    if code is LuaNil:
         code = 0
     elif isinstance(code, LuaNumber):
         code = code.value
@@ -351,14 +352,14 @@ def os_exit(code=None, close=None, /) -> PyLuaRet:
 
     # If the optional second argument close is true, the function closes the
     # Lua state before exiting (see lua_close).
-    if close == LuaBool(True):
+    if close is LuaTrue:
         sys.exit(code)
     else:
         os._exit(code)
     return []
 
 
-@lua_function(name="getenv")
+@lua_function(name="getenv", fastcall=True)
 def lf_os_getenv(varname, /) -> PyLuaRet:
     return os_getenv(varname)
 
@@ -374,7 +375,7 @@ def os_getenv(varname, /) -> PyLuaRet:
     return [str_to_lua_string(value)]
 
 
-@lua_function(name="remove")
+@lua_function(name="remove", fastcall=True)
 def lf_os_remove(filename, /) -> PyLuaRet:
     return os_remove(filename)
 
@@ -399,10 +400,10 @@ def os_remove(filename, /) -> PyLuaRet:
         # the error and the error code.
         return _oserror_to_errtuple(e)
     # Otherwise, it returns true.
-    return [LuaBool(True)]
+    return [LuaTrue]
 
 
-@lua_function(name="rename")
+@lua_function(name="rename", fastcall=True)
 def lf_os_rename(oldname, newname, /) -> PyLuaRet:
     return os_rename(oldname, newname)
 
@@ -420,19 +421,19 @@ def os_rename(oldname, newname, /) -> PyLuaRet:
         # plus a string describing the error and the error code.
         return _oserror_to_errtuple(e)
     # Otherwise, it returns true.
-    return [LuaBool(True)]
+    return [LuaTrue]
 
 
-@lua_function(name="setlocale")
-def lf_os_setlocale(locale, category=None, /) -> PyLuaRet:
+@lua_function(name="setlocale", fastcall=True)
+def lf_os_setlocale(locale=LuaNil, category=LuaNil, /) -> PyLuaRet:
     return os_setlocale(locale, category)
 
 
-def os_setlocale(locale, category=None, /) -> PyLuaRet:
+def os_setlocale(locale=LuaNil, category=LuaNil, /) -> PyLuaRet:
     # category is an optional string describing which category to change:
     # "all", "collate", "ctype", "monetary", "numeric", or "time";
     # the default category is "all".
-    if category is None:
+    if category is LuaNil:
         category = lc.LC_ALL
     else:
         category = _get_category_from_luastr(category)
@@ -467,7 +468,7 @@ def os_setlocale(locale, category=None, /) -> PyLuaRet:
         return [str_to_lua_string(new_locale_name)]
 
 
-@lua_function(name="time")
+@lua_function(name="time", fastcall=True)
 def lf_os_time(table=LuaNil, /) -> PyLuaRet:
     return os_time(table)
 
@@ -496,7 +497,7 @@ def os_time(table=LuaNil, /) -> PyLuaRet:
     return [LuaNumber(TimeTuple.from_table(table).to_datetime().timestamp())]
 
 
-@lua_function(name="tmpname")
+@lua_function(name="tmpname", fastcall=True)
 def lf_os_tmpname() -> PyLuaRet:
     return os_tmpname()
 
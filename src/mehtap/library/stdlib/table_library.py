@@ -3,31 +3,45 @@ from functools import cmp_to_key
 from mehtap.control_structures import LuaError
 from mehtap.library.provider_abc import LibraryProvider
 from mehtap.operations import length, rel_gt, index, concat, new_index, \
-    arith_add, call
+    arith_add, call, str_to_lua_string
 from mehtap.py2lua import PyLuaRet, lua_function
 from mehtap.values import LuaString, LuaFunction, LuaTable, LuaNumber, \
-    type_of_lv, LuaValue, LuaNil, LuaBool, LuaIndexableABC
+    type_of_lv, LuaValue, LuaNil, LuaTrue, LuaIndexableABC, LuaNumberType, \
+    lua_integer
 
 
-@lua_function(name="concat")
-def lf_table_concat(
-    list,
-    sep=LuaString(b""),
-    i=LuaNumber(1),
-    j=None,
-    /
-) -> PyLuaRet:
+def _plain_table(value: LuaValue) -> LuaTable | None:
+    # Tables without metatables can be operated on through their array part,
+    # because no metamethods can be triggered.
+    if isinstance(value, LuaTable) and value.get_metatable() is LuaNil:
+        return value
+    return None
+
+
+def _is_integer(value: LuaValue) -> bool:
+    return (
+        isinstance(value, LuaNumber)
+        and value.type is LuaNumberType.INTEGER
+    )
+
+
+@lua_function(name="concat", fastcall=True)
+def lf_table_concat(list, sep=LuaNil, i=LuaNil, j=LuaNil, /) -> PyLuaRet:
     return table_concat(list, sep, i, j)
 
 
-def table_concat(list, sep, i, j, /) -> PyLuaRet:
+def table_concat(list, sep=LuaNil, i=LuaNil, j=LuaNil, /) -> PyLuaRet:
     # The default value for sep is the empty string,
     # the default for i is 1,
     # and the default for j is #list.
-    if j is None:
+    if sep is LuaNil:
+        sep = LuaString(b"")
+    if i is LuaNil:
+        i = lua_integer(1)
+    if j is LuaNil:
         j = length(list)
     # If i is greater than j, returns the empty string.
-    if rel_gt(i, j).true:
+    if rel_gt(i, j) is LuaTrue:
         return [LuaString(b"")]
     if not isinstance(i, LuaNumber):
         raise LuaError(f"bad argument #3 to 'concat' "
@@ -38,10 +52,31 @@ def table_concat(list, sep, i, j, /) -> PyLuaRet:
     # Given a list where all elements are strings or numbers,
     # returns the string
     # list[i]..sep..list[i+1] ··· sep..list[j].
+    table = _plain_table(list)
+    if (
+        table is not None
+        and _is_integer(i)
+        and _is_integer(j)
+        and 1 <= i.value
+        and j.value <= len(table.array)
+        and isinstance(sep, LuaString)
+    ):
+        parts = []
+        for x, value in enumerate(table.array[i.value - 1:j.value], i.value):
+            if isinstance(value, LuaString):
+                parts.append(value.content)
+            elif isinstance(value, LuaNumber):
+                parts.append(str_to_lua_string(str(value)).content)
+            else:
+                t = type_of_lv(value)
+                raise LuaError(
+                    f"invalid value ({t}) at index {x} in table for 'concat'"
+                )
+        return [LuaString(sep.content.join(parts))]
     cur_str: LuaValue | None = None
     first_trip = True
     for x in range(i.value, j.value + 1):
-        value = index(list, LuaNumber(x))
+        value = index(list, lua_integer(x))
         if not isinstance(value, (LuaString, LuaNumber)):
             t = type_of_lv(value)
             raise LuaError(
@@ -55,7 +90,7 @@ def table_concat(list, sep, i, j, /) -> PyLuaRet:
     return [cur_str]
 
 
-@lua_function(name="insert")
+@lua_function(name="insert", fastcall=True)
 def lf_table_insert(list, /, *args):
     if len(args) < 1 or len(args) > 2:
         raise LuaError(f"wrong number of arguments to 'insert'")
@@ -70,7 +105,7 @@ def table_insert(list, arg1, arg2) -> PyLuaRet:
     if arg2 is None:
         # The default value for pos is #list+1,
         # so that a call table.insert(t,x) # inserts x at the end of the list t.
-        pos = arith_add(len_list, LuaNumber(1))
+        pos = arith_add(len_list, lua_integer(1))
         value = arg1
     else:
         pos = arg1
@@ -82,16 +117,20 @@ def table_insert(list, arg1, arg2) -> PyLuaRet:
         raise LuaError(f"bad argument #2 to 'insert' "
                        f"(position out of bounds, got {pos.value} to a list"
                        f" of length {len_list.value})")
+    table = _plain_table(list)
+    if table is not None and _is_integer(pos) and 1 <= pos.value:
+        table.array_insert(pos.value, value)
+        return []
     for idx in range(len_list.value + 1, pos.value, -1):
         # shifting up the elements
         #   list[pos], list[pos+1], ···, list[#list].
-        new_index(list, LuaNumber(idx), index(list, LuaNumber(idx - 1)))
+        new_index(list, lua_integer(idx), index(list, lua_integer(idx - 1)))
     # Inserts element value at position pos in list,
     new_index(list, pos, value)
     return []
 
 
-@lua_function(name="move")
+@lua_function(name="move", fastcall=True)
 def lf_table_move(a1, f, e, t, a2=LuaNil, /) -> PyLuaRet:
     return table_move(a1, f, e, t, a2)
 
@@ -113,28 +152,45 @@ def table_move(a1, f, e, t, a2=LuaNil) -> PyLuaRet:
     if not isinstance(t, LuaNumber):
         raise LuaError(f"bad argument #4 to 'move' "
                        f"(number expected, got {type_of_lv(t)})")
+    source = _plain_table(a1)
+    destination = _plain_table(a2)
+    count = e.value - f.value + 1
+    if (
+        source is not None
+        and destination is not None
+        and _is_integer(f)
+        and _is_integer(e)
+        and _is_integer(t)
+        and count > 0
+        and 1 <= f.value
+        and e.value <= len(source.array)
+        and 1 <= t.value
+        and t.value + count - 1 <= len(destination.array)
+    ):
+        # The slice is copied before it's assigned, so the ranges can overlap.
+        destination.array[t.value - 1:t.value - 1 + count] = \
+            source.array[f.value - 1:e.value]
+        return [a2]
     for a2_idx, a1_idx in enumerate(range(f.value, e.value + 1), start=t.value):
-        new_index(a2, LuaNumber(a2_idx), index(a1, LuaNumber(a1_idx)))
+        new_index(a2, lua_integer(a2_idx), index(a1, lua_integer(a1_idx)))
     # Returns the destination table a2.
     return [a2]
 
 
-@lua_function(name="pack")
+@lua_function(name="pack", fastcall=True)
 def lf_table_pack(*args) -> PyLuaRet:
     return table_pack(*args)
 
 
 def table_pack(*args) -> PyLuaRet:
     # Returns a new table with all arguments stored into keys 1, 2, etc.
-    new_table = LuaTable()
-    for idx, value in enumerate(args, start=1):
-        new_table.rawput(LuaNumber(idx), value)
+    new_table = LuaTable(array=list(args))
     # and with a field "n" with the total number of arguments.
-    new_table.rawput(LuaString(b"n"), LuaNumber(len(args)))
+    new_table.rawput(LuaString(b"n"), lua_integer(len(args)))
     return [new_table]
 
 
-@lua_function(name="remove")
+@lua_function(name="remove", fastcall=True)
 def lf_table_remove(list, pos=LuaNil, /) -> PyLuaRet:
     return table_remove(list, pos)
 
@@ -144,6 +200,14 @@ def table_remove(list, pos=LuaNil) -> PyLuaRet:
     list_length = length(list)
     if pos is LuaNil:
         pos = list_length
+    table = _plain_table(list)
+    if (
+        table is not None
+        and isinstance(pos, LuaNumber)
+        and _is_integer(pos)
+        and 1 <= pos.value <= list_length.value
+    ):
+        return [table.array_remove(pos.value)]
     # Removes from list the element at position pos,
     old_value = index(list, pos)
     new_index(list, pos, LuaNil)
@@ -158,13 +222,13 @@ def table_remove(list, pos=LuaNil) -> PyLuaRet:
         #   list[pos+1], list[pos+2], ···, list[#list]
         # and erases element list[#list];
         for idx in range(pos.value, list_length.value + 1):
-            new_index(list, LuaNumber(idx), index(list, LuaNumber(idx + 1)))
+            new_index(list, lua_integer(idx), index(list, lua_integer(idx + 1)))
         new_index(list, list_length, LuaNil)
     # The index pos can also be 0 when #list is 0, or #list + 1.
     return [old_value]
 
 
-@lua_function(name="sort")
+@lua_function(name="sort", fastcall=True)
 def lf_table_sort(list, comp=LuaNil, /) -> PyLuaRet:
     return table_sort(list, comp)
 
@@ -183,13 +247,19 @@ def table_sort(list: LuaIndexableABC, comp=LuaNil) -> PyLuaRet:
 
     if comp is LuaNil:
         def comparator(a, b) -> bool:
-            return rel_gt(a, b).true
+            return rel_gt(a, b) is LuaTrue
     else:
         def comparator(a, b) -> bool:
-            return call(comp, [a, b], None) == [LuaBool(True)]
+            return call(comp, [a, b], None) == [LuaTrue]
     list_length = length(list).value
     # Extract elements from list[1] to list[#list]
-    elements = [index(list, LuaNumber(idx)) for idx in range(1, list_length + 1)]
+    table = _plain_table(list)
+    if table is not None and list_length <= len(table.array):
+        elements = table.array[:list_length]
+    else:
+        elements = [
+            index(list, lua_integer(idx)) for idx in range(1, list_length + 1)
+        ]
     # Use a stable sort (Python's sorted is stable)
     def cmp(a, b):
         # comparator(a, b) should return True if a > b (i.e., a should come after b)
@@ -201,13 +271,16 @@ def table_sort(list: LuaIndexableABC, comp=LuaNil) -> PyLuaRet:
         else:
             return 0
     sorted_elements = sorted(elements, key=cmp_to_key(cmp))
+    if table is not None and list_length <= len(table.array):
+        table.array[:list_length] = sorted_elements
+        return []
     # Write back sorted elements to list[1] to list[#list]
     for idx, value in enumerate(sorted_elements, start=1):
-        new_index(list, LuaNumber(idx), value)
+        new_index(list, lua_integer(idx), value)
     return []
 
 
-@lua_function(name="unpack")
+@lua_function(name="unpack", fastcall=True)
 def lf_table_unpack(list, i=LuaNil, j=LuaNil, /) -> PyLuaRet:
     return table_unpack(list, i, j)
 
@@ -215,7 +288,7 @@ def lf_table_unpack(list, i=LuaNil, j=LuaNil, /) -> PyLuaRet:
 def table_unpack(list, i=LuaNil, j=LuaNil) -> PyLuaRet:
     # By default, i is 1 and j is #list.
     if i is LuaNil:
-        i = LuaNumber(1)
+        i = lua_integer(1)
     if not isinstance(i, LuaNumber):
         raise LuaError(f"bad argument #2 to 'unpack' "
                        f"(number expected, got {type_of_lv(i)})")
@@ -226,8 +299,17 @@ def table_unpack(list, i=LuaNil, j=LuaNil) -> PyLuaRet:
                        f"(number expected, got {type_of_lv(j)})")
     # Returns the elements from the given list. This function is equivalent to
     #     return list[i], list[i+1], ···, list[j]
+    table = _plain_table(list)
+    if (
+        table is not None
+        and _is_integer(i)
+        and _is_integer(j)
+        and 1 <= i.value
+        and j.value <= len(table.array)
+    ):
+        return table.array[i.value - 1:j.value]
     return [
-        index(list, LuaNumber(x))
+        index(list, lua_integer(x))
         for x in range(i.value, j.value + 1)
     ]
 
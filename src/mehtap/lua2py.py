@@ -115,9 +115,7 @@ def _lua2py(lua_val, memos):
                 return m
         m = {}
         memos[id(lua_val)] = m
-        for k, v in lua_val.map.items():
-            if v is LuaNil:
-                continue
+        for k, v in lua_val.items():
             py_v = _lua2py(v, memos)
             py_k = _lua2py(k, memos)
             m[py_k] = py_v
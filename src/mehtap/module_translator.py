@@ -0,0 +1,432 @@
+"""Translation of whole Lua chunks to Python modules.
+
+Scripts that are deployed with an application can be translated ahead of
+time, when the application is built,
+so that running them needs neither parsing nor compiling::
+
+    mehtap --translate script.lua -o script.py
+
+The module has a function ``load(vm)`` that returns the main chunk as a
+:class:`~mehtap.values.LuaFunction`, like the ``load`` function of Lua does,
+and a function ``run(vm, *args)`` that calls it::
+
+    import script
+    vm = VirtualMachine()
+    script.run(vm, LuaString(b"argument"))
+
+Every Lua function of the chunk is a Python function of the module,
+written like the ones that :mod:`mehtap.source_compiler` compiles hot
+functions to.
+Local variables that nested functions capture are stored inside a
+:class:`~mehtap.values.Variable`,
+and the functions of the module are
+:class:`~mehtap.closure_compiler.ClosureFunction` objects holding their
+upvalues.
+Global variables are looked up in the virtual machine that the chunk was
+loaded into,
+so translated functions and interpreted ones can call each other through
+them.
+
+A ``goto`` can only be translated if it jumps to a label at the end of the
+body of the loop it is in, which is a Python ``continue`` statement.
+Variables with the ``<close>`` attribute are not closed,
+like in the closure compiler.
+"""
+
+from __future__ import annotations
+
+import math
+import os
+from collections.abc import Sequence
+from typing import TYPE_CHECKING
+
+import mehtap.ast_nodes as nodes
+from mehtap.closure_compiler import ClosureFunction
+from mehtap.control_structures import LuaError
+from mehtap.parser import parse_chunk
+from mehtap.resolver import FunctionInfo, LocalVariable, NameKind, resolve
+from mehtap.source_compiler import (
+    CallSite,
+    _RUNTIME,
+    _Translator,
+    _Unsupported,
+)
+from mehtap.values import (
+    LuaNumber,
+    LuaNumberType,
+    LuaString,
+    Variable,
+    lua_integer,
+)
+
+if TYPE_CHECKING:
+    from mehtap.scope import Scope
+    from mehtap.vm import VirtualMachine
+
+
+def translate(source: str, *, filename: str = "<translated>") -> str:
+    """Translate a chunk of Lua source code to the source code of a Python
+    module.
+
+    :raises LuaError: If the chunk uses a ``goto`` that can't be translated.
+    """
+    return translate_chunk(parse_chunk(source, filename=filename), filename)
+
+
+def translate_chunk(chunk: nodes.Chunk, filename: str) -> str:
+    """Translate a parsed chunk to the source code of a Python module.
+
+    :raises LuaError: If the chunk uses a ``goto`` that can't be translated.
+    """
+    translator = _ModuleTranslator(chunk)
+    try:
+        entry = translator.function(
+            chunk.block,
+            translator.resolution.function(chunk),
+            name="chunk",
+            variadic=True,
+        )
+    except _Unsupported as e:
+        raise LuaError(
+            LuaString(f"{filename}: can't translate {e}".encode("utf-8"))
+        )
+    return translator.module(filename, entry)
+
+
+def translate_file(path: str, output_path: str) -> None:
+    """Translate a file of Lua source code to a Python module file."""
+    with open(path, encoding="utf-8") as file:
+        source = file.read()
+    python = translate(source, filename=os.path.basename(path))
+    with open(output_path, "w", encoding="utf-8") as file:
+        file.write(python)
+
+
+class _ModuleTranslator:
+    def __init__(self, chunk: nodes.Chunk):
+        self.resolution = resolve(chunk, export_chunk_locals=False)
+        # The source code of every constant, to its name.
+        self.constants: dict[str, str] = {}
+        self.functions: list[list[str]] = []
+
+    def constant(self, value: object) -> str:
+        source = _constant_source(value)
+        name = self.constants.get(source)
+        if name is None:
+            name = f"_k{len(self.constants)}"
+            self.constants[source] = name
+        return name
+
+    def function(
+        self,
+        block: nodes.Block,
+        info: FunctionInfo,
+        *,
+        name: str,
+        variadic: bool,
+    ) -> str:
+        """Translate a function body to a Python function of the module.
+
+        :return: The name of the Python function.
+        """
+        # The last part of the name has letters in it,
+        # so it can't be the name of a local variable.
+        python_name = "lua_{}_fn{}".format(
+            "".join(c if c.isalnum() or c == "_" else "_" for c in name),
+            len(self.functions),
+        )
+        lines = [f"def {python_name}(function, args):"]
+        self.functions.append(lines)
+        translator = _FunctionTranslator(self)
+        translator.indent = 1
+        translator.block(block)
+        if block.return_statement is None:
+            translator.emit("return []")
+
+        param_count = len(info.parameters)
+        if variadic:
+            lines.append(f"    varargs = args[{param_count}:]")
+        if param_count:
+            lines.append(f"    if len(args) < {param_count}:")
+            lines.append(f"        args = _fit(args, {param_count})")
+        for i, parameter in enumerate(info.parameters):
+            value = f"args[{i}]"
+            if parameter.captured:
+                value = f"Variable({value})"
+            lines.append(f"    {_python_name(parameter)} = {value}")
+        if info.upvalues:
+            upvalues = ", ".join(f"_u{i}" for i in range(len(info.upvalues)))
+            lines.append(f"    {upvalues}, = function.upvalues")
+        lines.append("    scope = function.parent_scope")
+        lines.extend(translator.lines)
+        return python_name
+
+    def module(self, filename: str, entry: str) -> str:
+        lines = [
+            f"# Translated from the Lua chunk {filename!r} by mehtap.",
+            "import mehtap.module_translator",
+            "",
+            "globals().update(mehtap.module_translator.RUNTIME)",
+            "",
+        ]
+        lines.extend(
+            f"{name} = {source}" for source, name in self.constants.items()
+        )
+        for function in self.functions:
+            lines.extend(["", ""])
+            lines.extend(function)
+        lines.extend([
+            "",
+            "",
+            "def load(vm):",
+            '    """Create the function of the main chunk,',
+            '    which looks up global variables in the virtual machine."""',
+            f"    return _chunk_function({entry}, vm)",
+            "",
+            "",
+            "def run(vm, *args):",
+            '    """Run the main chunk with the arguments as its varargs."""',
+            "    return load(vm).rawcall(list(args), None)",
+        ])
+        return "\n".join(lines) + "\n"
+
+
+class _FunctionTranslator(_Translator):
+    """Translates a function body to the lines of a Python function of a
+    module."""
+
+    attribs = ("const", "close")
+    # Python code calls the functions of modules, and expects their values.
+    tail_calls = False
+
+    def __init__(self, module: _ModuleTranslator):
+        super().__init__()
+        self.module = module
+        self.resolution = module.resolution
+
+    def constant(self, value: object) -> str:
+        return self.module.constant(value)
+
+    def call_site(
+        self,
+        expression: nodes.FuncCallRegular | nodes.FuncCallMethod,
+    ) -> str:
+        return self.constant(
+            CallSite(
+                expression.__class__ is nodes.FuncCallMethod,
+                expression.file,
+                expression.line,
+            )
+        )
+
+    # region Statements
+
+    def stat_LocalFunctionStatement(
+        self,
+        statement: nodes.LocalFunctionStatement,
+    ) -> None:
+        variable = self.resolution.declaration(statement.name)
+        python = _python_name(variable)
+        function = self.function(
+            statement.body, statement.name.as_lua_string()
+        )
+        if variable.captured:
+            # The function can refer to itself.
+            self.emit(f"{python} = Variable(NIL)")
+            self.emit(f"{python}.value = {function}")
+        else:
+            self.emit(f"{python} = {function}")
+
+    def stat_FunctionStatement(self, statement: nodes.FunctionStatement) \
+            -> None:
+        names = statement.name.names
+        function = self.function(
+            statement.body,
+            names[-1].as_lua_string(),
+            method=statement.name.method,
+        )
+        if len(names) == 1:
+            self.store(names[0], function)
+            return
+        table = self.load(names[0])
+        for name in names[1:-1]:
+            table = f"index({table}, {self.constant(name.as_lua_string())})"
+        key = self.constant(names[-1].as_lua_string())
+        self.emit(f"_set_index({table}, {key}, {function})")
+
+    # endregion
+
+    # region Variables
+
+    def is_local(self, name: nodes.Name) -> bool:
+        use = self.resolution.use(name)
+        return (
+            use.kind is NameKind.LOCAL
+            and not use.variable.captured
+            and use.variable.attrib != "const"
+        )
+
+    def local(self, name: nodes.Name) -> str:
+        variable = self.resolution.declarations.get(id(name))
+        if variable is None:
+            variable = self.resolution.use(name).variable
+        return _python_name(variable)
+
+    def declared(self, names: Sequence[nodes.Name]) -> None:
+        for name in names:
+            variable = self.resolution.declaration(name)
+            if variable.captured:
+                python = _python_name(variable)
+                self.emit(f"{python} = Variable({python})")
+
+    def load(self, name: nodes.Name) -> str:
+        use = self.resolution.use(name)
+        if use.kind is NameKind.GLOBAL:
+            return f"scope.get_ls({self.constant(name.as_lua_string())})"
+        if use.kind is NameKind.UPVALUE:
+            return f"_u{use.index}.value"
+        if use.variable.captured:
+            return f"{_python_name(use.variable)}.value"
+        return _python_name(use.variable)
+
+    def store(self, name: nodes.Name, value: str) -> None:
+        use = self.resolution.use(name)
+        if use.kind is NameKind.GLOBAL:
+            key = self.constant(name.as_lua_string())
+            self.emit(f"scope.put_nonlocal_ls({key}, {value})")
+        elif use.variable.attrib == "const":
+            self.emit("_store_constant()")
+        elif use.kind is NameKind.UPVALUE:
+            self.emit(f"_u{use.index}.value = {value}")
+        elif use.variable.captured:
+            self.emit(f"{_python_name(use.variable)}.value = {value}")
+        else:
+            self.emit(f"{_python_name(use.variable)} = {value}")
+
+    # endregion
+
+    # region Expressions
+
+    def multires(self, expression: nodes.Expression) -> str:
+        if expression.__class__ is nodes.VarArgExpr:
+            return "varargs"
+        return super().multires(expression)
+
+    def exp_VarArgExpr(self, expression: nodes.VarArgExpr) -> str:
+        return "_first(varargs)"
+
+    def exp_FuncDef(self, expression: nodes.FuncDef) -> str:
+        return self.function(expression.body)
+
+    def exp_FuncBody(self, expression: nodes.FuncBody) -> str:
+        return self.function(expression)
+
+    def function(
+        self,
+        body: nodes.FuncBody,
+        name: LuaString | None = None,
+        *,
+        method: bool = False,
+    ) -> str:
+        """
+        :return: A Python expression that creates a closure of the function
+                 body.
+        """
+        info = self.resolution.function(body)
+        entry = self.module.function(
+            body.body,
+            info,
+            name=str(name) if name is not None else "anonymous",
+            variadic=body.vararg,
+        )
+        param_names = [p.as_lua_string() for p in body.params]
+        if method:
+            param_names.insert(0, LuaString(b"self"))
+        upvalues = [
+            _python_name(upvalue.variable)
+            if upvalue.in_parent_frame
+            else f"_u{upvalue.index}"
+            for upvalue in info.upvalues
+        ]
+        upvalues = f"({', '.join(upvalues)},)" if upvalues else "()"
+        return (
+            f"_closure({entry}, {self.constant(param_names)}, {body.vararg}, "
+            f"{self.constant(name)}, scope, {upvalues})"
+        )
+
+    # endregion
+
+
+def _python_name(variable: LocalVariable) -> str:
+    return f"{variable.name}_{variable.slot}"
+
+
+def _constant_source(value: object) -> str:
+    # The source code of a constant that translated code refers to.
+    if isinstance(value, list):
+        return f"[{', '.join(_constant_source(v) for v in value)}]"
+    if isinstance(value, dict):
+        return "{" + ", ".join(
+            f"{_constant_source(k)}: {_constant_source(v)}"
+            for k, v in value.items()
+        ) + "}"
+    if isinstance(value, LuaString):
+        return f"LuaString({value.content!r})"
+    if isinstance(value, LuaNumber):
+        if value.type is LuaNumberType.INTEGER:
+            return f"lua_integer({value.value!r})"
+        if math.isfinite(value.value):
+            return f"LuaNumber({value.value!r}, LuaNumberType.FLOAT)"
+        return f"LuaNumber(float({str(value.value)!r}), LuaNumberType.FLOAT)"
+    if isinstance(value, CallSite):
+        return f"CallSite({value.method!r}, {value.file!r}, {value.line!r})"
+    if value is None or isinstance(value, (bytes, int)):
+        return repr(value)
+    raise TypeError(f"unexpected constant {value!r}")
+
+
+# region Run-time support of translated modules
+
+def _closure(
+    entry,
+    param_names: list[LuaString],
+    variadic: bool,
+    name: LuaString | None,
+    scope: Scope,
+    upvalues: tuple[Variable, ...],
+) -> ClosureFunction:
+    # The source code of the function isn't there to be a block.
+    return ClosureFunction(
+        param_names=param_names,
+        variadic=variadic,
+        parent_scope=scope,
+        block=None,
+        gets_scope=False,
+        name=name,
+        min_req=0,
+        upvalues=upvalues,
+        entry=entry,
+    )
+
+
+def _chunk_function(entry, vm: VirtualMachine) -> ClosureFunction:
+    from mehtap.scope import Scope
+
+    return _closure(entry, [], True, None, Scope(vm, None), ())
+
+
+RUNTIME: dict[str, object] = {
+    **_RUNTIME,
+    "CallSite": CallSite,
+    "LuaNumber": LuaNumber,
+    "LuaNumberType": LuaNumberType,
+    "LuaString": LuaString,
+    "Variable": Variable,
+    "lua_integer": lua_integer,
+    "_closure": _closure,
+    "_chunk_function": _chunk_function,
+}
+"""The names that translated modules refer to, other than their constants
+and functions."""
+
+# endregion
@@ -1,11 +1,15 @@
 from __future__ import annotations
 
 from locale import strcoll
+from math import copysign, floor, fmod
 from typing import TypeAlias, TYPE_CHECKING
 
 from mehtap.control_structures import LuaError
 from mehtap.values import (
     LuaBool,
+    LuaTrue,
+    LuaFalse,
+    lua_integer,
     LuaValue,
     LuaString,
     LuaNumber,
@@ -19,6 +23,7 @@ from mehtap.values import (
     LuaFunction,
     LuaThread,
     LuaUserdata, LuaIndexableABC, LuaCallableABC, type_of_lv,
+    MAX_NATIVE_CALL_DEPTH, native_calls,
 )
 
 
@@ -30,6 +35,22 @@ SYMBOL__EQ = LuaString(b"__eq")
 SYMBOL__LEN = LuaString(b"__len")
 
 
+def call_metamethod(mm: LuaValue, args: list[LuaValue]) -> list[LuaValue]:
+    """Call a metamethod.
+
+    Like calls of native functions, calls of metamethods nest on the C stack,
+    so they count against :data:`~mehtap.values.MAX_NATIVE_CALL_DEPTH`.
+    """
+    depth = native_calls.depth
+    if depth >= MAX_NATIVE_CALL_DEPTH:
+        raise LuaError("C stack overflow")
+    native_calls.depth = depth + 1
+    try:
+        return call(mm, args=args, scope=None)
+    finally:
+        native_calls.depth = depth
+
+
 def check_metamethod_binary(a: LuaValue, b: LuaValue, mm_name: LuaString) \
         -> LuaValue | None:
     mm = a.get_metavalue(mm_name)
@@ -38,7 +59,7 @@ def check_metamethod_binary(a: LuaValue, b: LuaValue, mm_name: LuaString) \
         if mm is None:
             return None
     # mm is not None
-    return adjust_to_one(call(mm, args=[a, b], scope=None))
+    return adjust_to_one(call_metamethod(mm, [a, b]))
 
 
 def check_metamethod_unary(a: LuaValue, mm_name: LuaString) \
@@ -46,7 +67,7 @@ def check_metamethod_unary(a: LuaValue, mm_name: LuaString) \
     mm = a.get_metavalue(mm_name)
     if mm is None:
         return None
-    return adjust_to_one(call(mm, args=[a], scope=None))
+    return adjust_to_one(call_metamethod(mm, [a]))
 
 
 def rel_eq(a: LuaValue, b: LuaValue, *, raw: bool = False) -> LuaBool:
@@ -56,21 +77,22 @@ def rel_eq(a: LuaValue, b: LuaValue, *, raw: bool = False) -> LuaBool:
     """
     # Equality (==) first compares the type of its operands.
     # If the types are different, then the result is false.
-    if type(a) is not type(b):
-        return LuaBool(False)
+    cls = a.__class__
+    if cls is not b.__class__:
+        return LuaFalse
     # Otherwise, the values of the operands are compared.
-    # Strings are equal if they have the same byte content.
-    if isinstance(a, LuaString):
-        return LuaBool(a.content == b.content)
     # Numbers are equal if they denote the same mathematical value.
-    if isinstance(a, LuaNumber):
-        return LuaBool(a.value == b.value)
-    # mehtap extension: All LuaBool(False) _and true_ objects are currently not
-    #                   all the same object :(
-    if isinstance(a, LuaBool):
-        return LuaBool(a.true == b.true)
+    if cls is LuaNumber:
+        return LuaTrue if a.value == b.value else LuaFalse
+    # Strings are equal if they have the same byte content.
+    if cls is LuaString:
+        return LuaTrue if a.content == b.content else LuaFalse
+    # mehtap extension: There is only one true and one false object,
+    #                   so booleans are compared by reference too.
     # Tables, userdata, and threads are compared by reference:
     # two objects are considered equal only if they are the same object.
+    if a is b:
+        return LuaTrue
     # You can change the way that Lua compares tables and userdata by using the
     # __eq metamethod (see §2.4).
     mt_types = (LuaTable, LuaUserdata)
@@ -78,7 +100,7 @@ def rel_eq(a: LuaValue, b: LuaValue, *, raw: bool = False) -> LuaBool:
         mm_res = check_metamethod_binary(a, b, SYMBOL__EQ)
         if mm_res is not None:
             return coerce_to_bool(mm_res)
-    return LuaBool(a is b)
+    return LuaFalse
 
 
 def rel_ne(a: LuaValue, b: LuaValue, *, raw: bool = False) -> LuaBool:
@@ -87,7 +109,7 @@ def rel_ne(a: LuaValue, b: LuaValue, *, raw: bool = False) -> LuaBool:
     :return: The result of ``a ~= b`` in Lua.
     """
     # The operator ~= is exactly the negation of equality (==).
-    return LuaBool(not rel_eq(a, b, raw=raw).true)
+    return LuaFalse if rel_eq(a, b, raw=raw) is LuaTrue else LuaTrue
 
 
 SYMBOL__LT = LuaString(b"__lt")
@@ -99,16 +121,16 @@ def rel_lt(a: LuaValue, b: LuaValue) -> LuaBool:
     """
     # The order operators work as follows.
     # If both arguments are numbers,
-    if isinstance(a, LuaNumber) and isinstance(b, LuaNumber):
+    if a.__class__ is LuaNumber and b.__class__ is LuaNumber:
         # then they are compared according to their mathematical values,
         # regardless of their subtypes.
-        return LuaBool(a.value < b.value)
+        return LuaTrue if a.value < b.value else LuaFalse
     # Otherwise, if both arguments are strings,
     # then their values are compared according to the current locale.
     if isinstance(a, LuaString) and isinstance(b, LuaString):
-        return LuaBool(strcoll(
-            a.content.decode("utf-8"),
-            b.content.decode("utf-8")) < 0)
+        if strcoll(a.content.decode("utf-8"), b.content.decode("utf-8")) < 0:
+            return LuaTrue
+        return LuaFalse
     # Otherwise, Lua tries to call the __lt or the __le metamethod (see §2.4).
     mm_res = check_metamethod_binary(a, b, SYMBOL__LT)
     if mm_res is not None:
@@ -135,14 +157,14 @@ def rel_le(a: LuaValue, b: LuaValue) -> LuaBool:
     """
     # The order operators work as follows.
     # If both arguments are numbers,
-    if isinstance(a, LuaNumber) and isinstance(b, LuaNumber):
+    if a.__class__ is LuaNumber and b.__class__ is LuaNumber:
         # then they are compared according to their mathematical values,
         # regardless of their subtypes.
-        return LuaBool(a.value <= b.value)
+        return LuaTrue if a.value <= b.value else LuaFalse
     # Otherwise, if both arguments are strings,
     # then their values are compared according to the current locale.
     if isinstance(a, LuaString) and isinstance(b, LuaString):
-        return LuaBool(strcoll(a.content, b.content) <= 0)
+        return LuaTrue if strcoll(a.content, b.content) <= 0 else LuaFalse
     # Otherwise, Lua tries to call the __lt or the __le metamethod (see §2.4).
     mm_res = check_metamethod_binary(a, b, SYMBOL__LE)
     if mm_res is not None:
@@ -164,13 +186,12 @@ def int_wrap_overflow(value: int) -> LuaNumber:
     """Wrap around an integer value to the range of a signed 64-bit integer.
 
     The value is used as-is if it can already fit in a signed 64-bit integer.
+    Otherwise, it is wrapped around according to the usual rules of
+    two-complement arithmetic.
     """
-    if MIN_INT64 < value < MAX_INT64:
-        return LuaNumber(value, LuaNumberType.INTEGER)
-    whole_val, sign = divmod(value, MAX_INT64)
-    if sign & 1:
-        return LuaNumber(-whole_val, LuaNumberType.INTEGER)
-    return LuaNumber(whole_val, LuaNumberType.INTEGER)
+    if MIN_INT64 <= value <= MAX_INT64:
+        return lua_integer(value)
+    return lua_integer(((value - MIN_INT64) & ALL_SET) + MIN_INT64)
 
 
 def coerce_float_to_int(value: LuaNumber) -> LuaNumber:
@@ -190,7 +211,7 @@ def coerce_float_to_int(value: LuaNumber) -> LuaNumber:
     v = value.value
     if v.is_integer() and MIN_INT64 <= v <= MAX_INT64:
         # If it does, that representation is the result.
-        return LuaNumber(int(v), LuaNumberType.INTEGER)
+        return lua_integer(int(v))
     # Otherwise, the conversion fails.
     raise LuaError("number has no integer representation")
 
@@ -218,26 +239,29 @@ def arith_add(a: LuaValue, b: LuaValue) -> LuaValue:
     """
     :return: The result of ``a + b`` in Lua.
     """
-    if not isinstance(a, LuaNumber) or not isinstance(b, LuaNumber):
-        mm_res = check_metamethod_binary(a, b, SYMBOL__ADD)
-        if mm_res is not None:
-            return mm_res
-        a_type = type_of_lv(a)
-        b_type = type_of_lv(b)
-        raise LuaError(f"attempt to add {a_type} and {b_type} values")
-    # If both operands are integers,
-    if a.type == LuaNumberType.INTEGER and b.type == LuaNumberType.INTEGER:
-        # the operation is performed over integers and the result is an integer.
-        return int_wrap_overflow(a.value + b.value)
-    # Otherwise, if both operands are numbers,
-    # then they are converted to floats,
-    # the operation is performed following the machine's rules for
-    # floating-point arithmetic (usually the IEEE 754 standard),
-    # and the result is a float.
-    return LuaNumber(
-        coerce_int_to_float(a).value + coerce_int_to_float(b).value,
-        LuaNumberType.FLOAT,
-    )
+    if a.__class__ is LuaNumber and b.__class__ is LuaNumber:
+        x = a.value
+        y = b.value
+        # If both operands are integers,
+        if x.__class__ is int and y.__class__ is int:
+            # the operation is performed over integers and the result is an
+            # integer.
+            r = x + y
+            if MIN_INT64 <= r <= MAX_INT64:
+                return lua_integer(r)
+            return int_wrap_overflow(r)
+        # Otherwise, if both operands are numbers,
+        # then they are converted to floats,
+        # the operation is performed following the machine's rules for
+        # floating-point arithmetic (usually the IEEE 754 standard),
+        # and the result is a float.
+        return LuaNumber(float(x) + float(y), LuaNumberType.FLOAT)
+    mm_res = check_metamethod_binary(a, b, SYMBOL__ADD)
+    if mm_res is not None:
+        return mm_res
+    a_type = type_of_lv(a)
+    b_type = type_of_lv(b)
+    raise LuaError(f"attempt to add {a_type} and {b_type} values")
 
 
 def overflow_arith_add(a: LuaValue, b: LuaValue) -> tuple[bool, LuaNumber]:
@@ -266,19 +290,21 @@ def arith_sub(a: LuaValue, b: LuaValue) -> LuaValue:
     """
     :return: The result of ``a - b`` in Lua.
     """
-    if not isinstance(a, LuaNumber) or not isinstance(b, LuaNumber):
-        mm_res = check_metamethod_binary(a, b, SYMBOL__SUB)
-        if mm_res is not None:
-            return mm_res
-        a_type = type_of_lv(a)
-        b_type = type_of_lv(b)
-        raise LuaError(f"attempt to subtract {a_type} and {b_type} values")
-    if a.type == LuaNumberType.INTEGER and b.type == LuaNumberType.INTEGER:
-        return int_wrap_overflow(a.value - b.value)
-    return LuaNumber(
-        coerce_int_to_float(a).value - coerce_int_to_float(b).value,
-        LuaNumberType.FLOAT,
-    )
+    if a.__class__ is LuaNumber and b.__class__ is LuaNumber:
+        x = a.value
+        y = b.value
+        if x.__class__ is int and y.__class__ is int:
+            r = x - y
+            if MIN_INT64 <= r <= MAX_INT64:
+                return lua_integer(r)
+            return int_wrap_overflow(r)
+        return LuaNumber(float(x) - float(y), LuaNumberType.FLOAT)
+    mm_res = check_metamethod_binary(a, b, SYMBOL__SUB)
+    if mm_res is not None:
+        return mm_res
+    a_type = type_of_lv(a)
+    b_type = type_of_lv(b)
+    raise LuaError(f"attempt to subtract {a_type} and {b_type} values")
 
 
 SYMBOL__MUL = LuaString(b"__mul")
@@ -288,46 +314,53 @@ def arith_mul(a: LuaValue, b: LuaValue) -> LuaValue:
     """
     :return: The result of ``a * b`` in Lua.
     """
-    if not isinstance(a, LuaNumber) or not isinstance(b, LuaNumber):
-        mm_res = check_metamethod_binary(a, b, SYMBOL__MUL)
-        if mm_res is not None:
-            return mm_res
-        a_type = type_of_lv(a)
-        b_type = type_of_lv(b)
-        raise LuaError(f"attempt to multiply {a_type} and {b_type} values")
-    if a.type == LuaNumberType.INTEGER and b.type == LuaNumberType.INTEGER:
-        return int_wrap_overflow(a.value * b.value)
-    return LuaNumber(
-        coerce_int_to_float(a).value * coerce_int_to_float(b).value,
-        LuaNumberType.FLOAT,
-    )
+    if a.__class__ is LuaNumber and b.__class__ is LuaNumber:
+        x = a.value
+        y = b.value
+        if x.__class__ is int and y.__class__ is int:
+            r = x * y
+            if MIN_INT64 <= r <= MAX_INT64:
+                return lua_integer(r)
+            return int_wrap_overflow(r)
+        return LuaNumber(float(x) * float(y), LuaNumberType.FLOAT)
+    mm_res = check_metamethod_binary(a, b, SYMBOL__MUL)
+    if mm_res is not None:
+        return mm_res
+    a_type = type_of_lv(a)
+    b_type = type_of_lv(b)
+    raise LuaError(f"attempt to multiply {a_type} and {b_type} values")
 
 
 SYMBOL__DIV = LuaString(b"__div")
 
 
+def _float_div(x: float, y: float) -> float:
+    if y:
+        return x / y
+    # Division by zero follows IEEE 754 instead of raising an error.
+    if x != x or x == 0:
+        return float("nan")
+    if (x < 0) != (copysign(1.0, y) < 0):
+        return float("-inf")
+    return float("inf")
+
+
 def arith_float_div(a: LuaValue, b: LuaValue) -> LuaValue:
     """
     :return: The result of ``a / b`` in Lua, which is always a float.
     """
-    if not isinstance(a, LuaNumber) or not isinstance(b, LuaNumber):
-        mm_res = check_metamethod_binary(a, b, SYMBOL__DIV)
-        if mm_res is not None:
-            return mm_res
-        a_type = type_of_lv(a)
-        b_type = type_of_lv(b)
-        raise LuaError(f"attempt to divide {a_type} and {b_type} values")
-    # Exponentiation and float division (/) always convert their operands to
-    # floats and the result is always a float.
-    a_float = coerce_int_to_float(a).value
-    b_float = coerce_int_to_float(b).value
-    if b_float == 0:
-        if a_float == 0:
-            return LuaNumber(float("nan"), LuaNumberType.FLOAT)
-        if a_float < 0:
-            return LuaNumber(float("-inf"), LuaNumberType.FLOAT)
-        return LuaNumber(float("inf"), LuaNumberType.FLOAT)
-    return LuaNumber(a_float / b_float, LuaNumberType.FLOAT)
+    if a.__class__ is LuaNumber and b.__class__ is LuaNumber:
+        # Exponentiation and float division (/) always convert their operands
+        # to floats and the result is always a float.
+        return LuaNumber(
+            _float_div(float(a.value), float(b.value)), LuaNumberType.FLOAT
+        )
+    mm_res = check_metamethod_binary(a, b, SYMBOL__DIV)
+    if mm_res is not None:
+        return mm_res
+    a_type = type_of_lv(a)
+    b_type = type_of_lv(b)
+    raise LuaError(f"attempt to divide {a_type} and {b_type} values")
 
 
 SYMBOL__IDIV = LuaString(b"__idiv")
@@ -341,21 +374,30 @@ def arith_floor_div(a: LuaValue, b: LuaValue) -> LuaValue:
              of the division of *a* by *b*
              rounded towards minus infinity.
     """
-    if not isinstance(a, LuaNumber) or not isinstance(b, LuaNumber):
-        mm_res = check_metamethod_binary(a, b, SYMBOL__IDIV)
-        if mm_res is not None:
-            return mm_res
-        a_type = type_of_lv(a)
-        b_type = type_of_lv(b)
-        raise LuaError(f"attempt to floor divide {a_type} and {b_type} values")
-    # Floor division (//) is a division that rounds the quotient towards minus
-    # infinity, resulting in the floor of the division of its operands.
-    if a.type == LuaNumberType.INTEGER and b.type == LuaNumberType.INTEGER:
-        return int_wrap_overflow(a.value // b.value)
-    return LuaNumber(
-        coerce_int_to_float(a).value // coerce_int_to_float(b).value,
-        LuaNumberType.INTEGER,
-    )
+    if a.__class__ is LuaNumber and b.__class__ is LuaNumber:
+        x = a.value
+        y = b.value
+        # Floor division (//) is a division that rounds the quotient towards
+        # minus infinity, resulting in the floor of the division of its
+        # operands.
+        if x.__class__ is int and y.__class__ is int:
+            if not y:
+                raise LuaError("attempt to perform 'n//0'")
+            r = x // y
+            if r <= MAX_INT64:
+                return lua_integer(r)
+            return int_wrap_overflow(r)
+        q = _float_div(float(x), float(y))
+        # Infinities, NaN and zeros are already their own floor.
+        if q and q - q == 0:
+            q = float(floor(q))
+        return LuaNumber(q, LuaNumberType.FLOAT)
+    mm_res = check_metamethod_binary(a, b, SYMBOL__IDIV)
+    if mm_res is not None:
+        return mm_res
+    a_type = type_of_lv(a)
+    b_type = type_of_lv(b)
+    raise LuaError(f"attempt to floor divide {a_type} and {b_type} values")
 
 
 SYMBOL__MOD = LuaString(b"__mod")
@@ -368,21 +410,33 @@ def arith_mod(a: LuaValue, b: LuaValue) -> LuaValue:
              The result of modulo is defined as the remainder of a division that
              rounds the quotient towards minus infinity (floor division).
     """
-    if not isinstance(a, LuaNumber) or not isinstance(b, LuaNumber):
-        mm_res = check_metamethod_binary(a, b, SYMBOL__MOD)
-        if mm_res is not None:
-            return mm_res
-        a_type = type_of_lv(a)
-        b_type = type_of_lv(b)
-        raise LuaError(f"attempt to modulo {a_type} and {b_type} values")
-    # Modulo is defined as the remainder of a division that rounds the quotient
-    # towards minus infinity (floor division).
-    if a.type == LuaNumberType.INTEGER and b.type == LuaNumberType.INTEGER:
-        return int_wrap_overflow(a.value % b.value)
-    return LuaNumber(
-        coerce_int_to_float(a).value % coerce_int_to_float(b).value,
-        LuaNumberType.INTEGER,
-    )
+    if a.__class__ is LuaNumber and b.__class__ is LuaNumber:
+        x = a.value
+        y = b.value
+        # Modulo is defined as the remainder of a division that rounds the
+        # quotient towards minus infinity (floor division).
+        if x.__class__ is int and y.__class__ is int:
+            if not y:
+                raise LuaError("attempt to perform 'n%%0'")
+            # The remainder is always smaller than the divisor,
+            # so it can't overflow.
+            return lua_integer(x % y)
+        x = float(x)
+        y = float(y)
+        if not y or x - x != 0:
+            return LuaNumber(float("nan"), LuaNumberType.FLOAT)
+        m = fmod(x, y)
+        # The remainder of fmod has the sign of x,
+        # so it is moved towards y if their signs differ.
+        if (y < 0) if m > 0 else (m < 0 and y != m):
+            m += y
+        return LuaNumber(m, LuaNumberType.FLOAT)
+    mm_res = check_metamethod_binary(a, b, SYMBOL__MOD)
+    if mm_res is not None:
+        return mm_res
+    a_type = type_of_lv(a)
+    b_type = type_of_lv(b)
+    raise LuaError(f"attempt to modulo {a_type} and {b_type} values")
 
 
 SYMBOL__POW = LuaString(b"__pow")
@@ -416,13 +470,20 @@ def arith_unary_minus(a: LuaValue) -> LuaValue:
     """
     :return: The result of ``-a`` in Lua.
     """
-    if not isinstance(a, LuaNumber):
-        mm_res = check_metamethod_unary(a, SYMBOL__UNM)
-        if mm_res is not None:
-            return mm_res
-        a_type = type_of_lv(a)
-        raise LuaError(f"attempt to negate a {a_type} value")
-    return LuaNumber(-a.value, a.type)
+    if a.__class__ is LuaNumber:
+        x = a.value
+        if x.__class__ is int:
+            # The only integer whose negation overflows is the minimum
+            # integer, which wraps around to itself.
+            if x == MIN_INT64:
+                return a
+            return lua_integer(-x)
+        return LuaNumber(-x, LuaNumberType.FLOAT)
+    mm_res = check_metamethod_unary(a, SYMBOL__UNM)
+    if mm_res is not None:
+        return mm_res
+    a_type = type_of_lv(a)
+    raise LuaError(f"attempt to negate a {a_type} value")
 
 
 def _python_int_to_int64_luanumber(x: int) -> LuaNumber:
@@ -435,8 +496,8 @@ def _python_int_to_int64_luanumber(x: int) -> LuaNumber:
     """
     x = x & ALL_SET
     if x & SIGN_BIT:
-        return LuaNumber(-x + MAX_INT64, LuaNumberType.INTEGER)
-    return LuaNumber(x, LuaNumberType.INTEGER)
+        return lua_integer(-x + MAX_INT64)
+    return lua_integer(x)
 
 
 SYMBOL__BOR = LuaString(b"__bor")
@@ -522,7 +583,7 @@ def bitwise_shift_left(a: LuaValue, b: LuaValue) -> LuaValue:
     # displacements with absolute values equal to or higher than the number of
     # bits in an integer result in zero (as all bits are shifted out).
     if b.value >= 64:
-        return LuaNumber(0, LuaNumberType.INTEGER)
+        return lua_integer(0)
     return _python_int_to_int64_luanumber(a.value << b.value)
 
 
@@ -545,7 +606,7 @@ def bitwise_shift_right(a: LuaValue, b: LuaValue) -> LuaValue:
     if b.value < 0:
         return bitwise_shift_left(a, arith_unary_minus(b))
     if b.value >= 64:
-        return LuaNumber(0, LuaNumberType.INTEGER)
+        return lua_integer(0)
     return _python_int_to_int64_luanumber(a.value >> b.value)
 
 
@@ -574,11 +635,9 @@ def coerce_to_bool(a: LuaValue) -> LuaBool:
     # Like the control structures (see §3.3.4),
     # all logical operators consider both false and nil as false
     # and anything else as true.
-    if a is LuaNil:
-        return LuaBool(False)
-    if isinstance(a, LuaBool):
-        return a
-    return LuaBool(True)
+    if a is LuaNil or a is LuaFalse:
+        return LuaFalse
+    return LuaTrue
 
 
 def logical_unary_not(a: LuaValue) -> LuaBool:
@@ -586,7 +645,7 @@ def logical_unary_not(a: LuaValue) -> LuaBool:
     :return: The result of ``not a`` in Lua.
     """
     # The negation operator not always returns false or true.
-    return LuaBool(not coerce_to_bool(a).true)
+    return LuaTrue if a is LuaNil or a is LuaFalse else LuaFalse
 
 
 def is_false_or_nil(a: LuaValue) -> bool:
@@ -594,11 +653,7 @@ def is_false_or_nil(a: LuaValue) -> bool:
     :return: :data:`True` if ``a`` is ``false`` or ``nil``, :data:`False`
              otherwise.
     """
-    if a is LuaNil:
-        return True
-    if isinstance(a, LuaBool):
-        return not a.true
-    return False
+    return a is LuaNil or a is LuaFalse
 
 
 def str_to_lua_string(s: str) -> LuaString:
@@ -616,6 +671,8 @@ def concat(a: LuaValue, b: LuaValue) -> LuaValue:
     """
     :return: The result of ``a .. b`` in Lua.
     """
+    if a.__class__ is LuaString and b.__class__ is LuaString:
+        return LuaString(a.content + b.content)
     # If both operands are strings or numbers,
     types = (LuaString, LuaNumber)
     if isinstance(a, types) and isinstance(b, types):
@@ -641,20 +698,23 @@ def length(a: LuaValue, *, raw: bool = False) -> LuaValue:
     """
     # The length of a string is its number of bytes.
     if isinstance(a, LuaString):
-        return LuaNumber(len(a.content), LuaNumberType.INTEGER)
+        return lua_integer(len(a.content))
 
     if a.has_metavalue(SYMBOL__LEN) and not raw:
         mm_result = check_metamethod_unary(a, SYMBOL__LEN)
         if mm_result is not None:
             return mm_result
 
+    if isinstance(a, LuaTable):
+        return lua_integer(a.border())
+
     if isinstance(a, LuaIndexableABC):
         border = 0
-        while a.has(LuaNumber(border + 1, LuaNumberType.INTEGER)):
+        while a.has(lua_integer(border + 1)):
             border += 1
             if border == MAX_INT64:
                 break
-        return LuaNumber(border, LuaNumberType.INTEGER)
+        return lua_integer(border)
 
     type_string = type_of_lv(a)
     raise LuaError(f"attempt to get length of a {type_string} value")
@@ -678,7 +738,7 @@ def index(a: LuaValue, b: LuaValue) -> LuaValue:
             f"with an '__index' metavalue"
         )
     if isinstance(mv, LuaFunction):
-        return adjust_to_one(call(mv, args=[a, b], scope=None))
+        return adjust_to_one(call_metamethod(mv, [a, b]))
     return index(mv, b)
 
 
@@ -702,7 +762,7 @@ def new_index(a: LuaValue, b: LuaValue, c: LuaValue):
             f"with a '__newindex' metavalue"
         )
     if isinstance(mv, LuaFunction):
-        call(mv, args=[a, b, c], scope=None)
+        call_metamethod(mv, [a, b, c])
         return
     new_index(mv, b, c)
 
@@ -744,31 +804,39 @@ def adjust(multires: Multires, needed: int) -> list[LuaValue]:
     .. _the rules on adjustment of Lua:
        https://lua.org/manual/5.4/manual.html#3.4.12
     """
+    if needed == 1:
+        return [adjust_to_one(multires[0]) if multires else LuaNil]
+    values = []
+    if not needed:
+        return values
     # When the list of expressions ends with a multires expression,
     # all results from that expression
     # enter the list of values before the adjustment.
-    multires = [x for x in multires]  # Create a shallow copy of multires.
-    if multires and isinstance(multires[-1], list):
-        multires.extend(multires.pop())
-
+    count = len(multires)
+    tail = ()
+    if count and multires[-1].__class__ is list:
+        count -= 1
+        tail = multires[count]
     # The adjustment follows these rules:
     # If there are more values than needed,
-    if len(multires) > needed:
-        # the extra values are thrown away;
-        multires = multires[:needed]
+    # the extra values are thrown away;
+    for i in range(count if count < needed else needed):
+        value = multires[i]
+        # When a multires expression is used in a list of expressions without
+        # being the last element, ..., Lua adjusts the result list of that
+        # expression to one element.
+        if value.__class__ is list:
+            value = adjust_to_one(value)
+        values.append(value)
+    missing = needed - len(values)
+    if missing > 0 and tail:
+        values.extend(tail[:missing])
+        missing = needed - len(values)
     # if there are fewer values than needed,
-    if len(multires) < needed:
+    if missing > 0:
         # the list is extended with nil's.
-        multires.extend([LuaNil] * (needed - len(multires)))
-
-    # When a multires expression is used in a list of expressions without being
-    # the last element, ..., Lua adjusts the result list of that expression
-    # to one element.
-    for i, value in enumerate(multires):
-        if isinstance(value, list):
-            multires[i] = adjust(value, 1)[0]
-
-    return multires
+        values.extend([LuaNil] * missing)
+    return values
 
 
 def adjust_flatten(multires: Multires) -> list[LuaValue]:
@@ -776,14 +844,22 @@ def adjust_flatten(multires: Multires) -> list[LuaValue]:
     :return: The input multires where each element is adjusted to one value
              except for the last, which is extended to the list of previous
              values.
+
+    The result is a new list, even if the input needs no adjustment.
     """
-    multires = [x for x in multires]
-    if multires and isinstance(multires[-1], list):
-        multires.extend(multires.pop())
-    for i, value in enumerate(multires):
-        if isinstance(value, list):
-            multires[i] = adjust(value, 1)[0]
-    return multires
+    count = len(multires)
+    tail = ()
+    if count and multires[-1].__class__ is list:
+        count -= 1
+        tail = multires[count]
+    values = []
+    for i in range(count):
+        value = multires[i]
+        if value.__class__ is list:
+            value = adjust_to_one(value)
+        values.append(value)
+    values.extend(tail)
+    return values
 
 
 def adjust_to_one(multires_or_value: Multires | LuaValue) -> LuaValue:
@@ -795,6 +871,10 @@ def adjust_to_one(multires_or_value: Multires | LuaValue) -> LuaValue:
     :param multires_or_value: The multires or single Lua value to adjust.
     :return: A single Lua value.
     """
-    if isinstance(multires_or_value, list):
-        return adjust(multires_or_value, 1)[0]
+    # The first value of a multires is its first element,
+    # or the first value of its first element if that is a multires too.
+    while multires_or_value.__class__ is list:
+        if not multires_or_value:
+            return LuaNil
+        multires_or_value = multires_or_value[0]
     return multires_or_value
@@ -0,0 +1,639 @@
+"""Constant folding and constant propagation.
+
+When a chunk is parsed,
+after the parse tree is transformed into an abstract syntax tree,
+this pass replaces the parts of the tree whose values are known before the
+chunk runs:
+
+* numerals become :class:`~mehtap.ast_nodes.NumeralConstant` nodes,
+  and string literals become
+  :class:`~mehtap.ast_nodes.ParsedLiteralLuaStringExpr` nodes,
+  so that their text is converted to a value once,
+* operators whose operands are constants are evaluated,
+  with the functions of :mod:`mehtap.operations` that evaluate them at run
+  time,
+  unless that raises an error, which is left to happen at run time,
+* ``and`` and ``or`` whose left operand is a constant are replaced by the
+  operand that they evaluate to,
+* local variables with the ``<const>`` attribute that are initialized
+  with a constant are replaced by their value wherever they are read,
+* ``if`` statements with at least :data:`MIN_DISPATCH_ARMS` arms that
+  compare the same local variable with number or string constants get a
+  :class:`~mehtap.ast_nodes.Dispatch` jump table,
+  which finds the arm to run with one lookup,
+* and calls of small local functions are replaced by the expressions that
+  the functions return
+  (see :func:`optimize_chunk`).
+
+Like the reference implementation,
+only operators whose operands are numbers or strings are evaluated,
+so no metamethod can be skipped.
+
+The pass can be disabled,
+for example to see the tree that the parser produced,
+with the ``optimize`` argument of :func:`mehtap.parser.parse_chunk`
+and :class:`~mehtap.vm.VirtualMachine`.
+"""
+
+from __future__ import annotations
+
+import copy
+from collections.abc import Iterator
+from typing import Any
+
+import attrs
+
+import mehtap.ast_nodes as nodes
+from mehtap.ast_nodes import (
+    BinaryOperator,
+    UnaryOperator,
+    binary_operator_functions,
+    unary_operator_functions,
+)
+from mehtap.control_structures import LuaError
+from mehtap.resolver import LocalVariable, NameKind, Resolution, resolve
+from mehtap.values import (
+    LuaFalse,
+    LuaNil,
+    LuaNumber,
+    LuaString,
+    LuaTrue,
+    LuaValue,
+)
+
+
+MIN_DISPATCH_ARMS = 3
+"""The smallest number of arms that an ``if`` statement needs to get a jump
+table."""
+MAX_INLINE_SIZE = 30
+"""The largest number of expression nodes that a function can return for its
+calls to be inlined."""
+
+
+@attrs.define(slots=True, frozen=True)
+class InlinedCall:
+    """A call that was replaced by the expression that the function returns."""
+
+    function: str
+    """The name of the function."""
+    file: str
+    line: int
+    """Where the call was."""
+    definition_line: int
+    """Where the function was defined."""
+
+    def __str__(self) -> str:
+        return (
+            f"{self.file}:{self.line}: inlined call of {self.function} "
+            f"(defined on line {self.definition_line})"
+        )
+
+
+def optimize_chunk(
+    chunk: nodes.Chunk,
+    *,
+    inline: bool = True,
+) -> list[InlinedCall]:
+    """Fold the constants of a chunk, in place.
+
+    If *inline* is true,
+    calls of a function are also replaced by the expression that it returns
+    if all of these hold:
+
+    * it is declared with ``local function f`` or ``local f = function``,
+      and ``f`` is never assigned to,
+    * it isn't variadic,
+    * its body is a single ``return`` statement with one expression,
+      which has at most :data:`MAX_INLINE_SIZE` expression nodes,
+      and defines no functions,
+    * it doesn't call itself,
+    * each argument of the call is a constant or a local variable that no
+      function captures,
+      so evaluating it once or many times, early or late, is the same,
+    * the names that the expression uses refer to the same variables where
+      the call is,
+    * and the call isn't a statement, which discards the values.
+
+    :return: The calls that were inlined.
+    """
+    _Optimizer(resolve(chunk)).node(chunk)
+    if not inline:
+        return []
+    return _Inliner(chunk).run()
+
+
+def optimize_expression(expression: nodes.Expression) -> nodes.Expression:
+    """Fold the constants of an expression.
+
+    :return: The expression, or the node that replaces it.
+    """
+    return _Optimizer(None).expression(expression)
+
+
+_LITERAL_NODES = (nodes.NumeralDec, nodes.NumeralHex, nodes.LiteralString)
+_MULTIRES_NODES = (
+    nodes.FuncCallRegular,
+    nodes.FuncCallMethod,
+    nodes.VarArgExpr,
+)
+_NUMBER_OPERATORS = {
+    BinaryOperator.ADD,
+    BinaryOperator.SUBTRACT,
+    BinaryOperator.MULTIPLY,
+    BinaryOperator.FLOAT_DIV,
+    BinaryOperator.FLOOR_DIV,
+    BinaryOperator.MODULO,
+    BinaryOperator.EXP,
+    BinaryOperator.BIT_OR,
+    BinaryOperator.BIT_XOR,
+    BinaryOperator.BIT_AND,
+    BinaryOperator.SHIFT_LEFT,
+    BinaryOperator.SHIFT_RIGHT,
+}
+"""The operators that are only folded for numbers."""
+_ORDER_OPERATORS = {
+    BinaryOperator.LT,
+    BinaryOperator.LE,
+    BinaryOperator.GT,
+    BinaryOperator.GE,
+}
+"""The operators that are only folded for two numbers or two strings."""
+
+
+class _Optimizer:
+    def __init__(self, resolution: Resolution | None):
+        self.resolution = resolution
+        # The values of the <const> variables that were initialized with
+        # constants.
+        self.constants: dict[int, LuaValue] = {}
+
+    def node(self, node: nodes.Node) -> None:
+        if node.__class__ is nodes.Assignment:
+            node.exprs = self.value(node.exprs)
+            for target in node.names:
+                # Assigning to a <const> variable stays an error.
+                if target.__class__ is not nodes.VarName:
+                    self.children(target)
+            return
+        self.children(node)
+        if node.__class__ is nodes.LocalAssignment:
+            self.declare_constants(node)
+        elif node.__class__ is nodes.If:
+            self.dispatch(node)
+
+    def children(self, node: nodes.Node) -> None:
+        for field in attrs.fields(node.__class__):
+            value = getattr(node, field.name)
+            new_value = self.value(value)
+            if new_value is not value:
+                setattr(node, field.name, new_value)
+
+    def value(self, value: Any) -> Any:
+        if isinstance(value, (list, tuple)):
+            new_value = [self.value(item) for item in value]
+            if all(new is old for new, old in zip(new_value, value)):
+                return value
+            return new_value if isinstance(value, list) else tuple(new_value)
+        if isinstance(value, nodes.Expression) \
+                and value.__class__ is not nodes.Block:
+            return self.expression(value)
+        if isinstance(value, nodes.Node):
+            self.node(value)
+        return value
+
+    def declare_constants(self, statement: nodes.LocalAssignment) -> None:
+        if self.resolution is None:
+            return
+        exprs = list(statement.exprs or ())
+        for i, attname in enumerate(statement.names):
+            if attname.attrib is None or attname.attrib.name.text != "const":
+                continue
+            if i < len(exprs):
+                if i == len(exprs) - 1 and len(statement.names) > len(exprs) \
+                        and isinstance(exprs[i], _MULTIRES_NODES):
+                    continue
+                value = _constant_value(exprs[i])
+            elif exprs and isinstance(exprs[-1], _MULTIRES_NODES):
+                continue
+            else:
+                value = LuaNil
+            if value is not None:
+                variable = self.resolution.declaration(attname.name)
+                self.constants[id(variable)] = value
+
+    def dispatch(self, statement: nodes.If) -> None:
+        if self.resolution is None \
+                or len(statement.blocks) < MIN_DISPATCH_ARMS:
+            return
+        subject = None
+        variable = None
+        arms = {}
+        for i, (condition, _) in enumerate(statement.blocks):
+            if condition.__class__ is not nodes.BinaryOperation \
+                    or condition.op is not BinaryOperator.EQ:
+                return
+            if condition.lhs.__class__ is nodes.VarName:
+                name, value = condition.lhs, _constant_value(condition.rhs)
+            elif condition.rhs.__class__ is nodes.VarName:
+                name, value = condition.rhs, _constant_value(condition.lhs)
+            else:
+                return
+            if not isinstance(value, (LuaNumber, LuaString)) \
+                    or value != value:
+                # NaN is not equal to itself.
+                return
+            use = self.resolution.use(name.name)
+            if use.kind is NameKind.GLOBAL:
+                # Each condition looks the global variable up again.
+                return
+            if variable is None:
+                subject, variable = name, use.variable
+            elif use.variable is not variable:
+                return
+            arms.setdefault(value, i)
+        statement.dispatch = nodes.Dispatch(subject, arms)
+
+    def constant_variable(self, name: nodes.Name) -> LuaValue | None:
+        if self.resolution is None or not self.constants:
+            return None
+        use = self.resolution.use(name)
+        if use.kind is NameKind.GLOBAL:
+            return None
+        variable: LocalVariable = use.variable
+        return self.constants.get(id(variable))
+
+    def expression(self, expression: nodes.Expression) -> nodes.Expression:
+        """:return: The expression, or the node that replaces it."""
+        cls = expression.__class__
+        if cls is nodes.VarName:
+            value = self.constant_variable(expression.name)
+            if value is None:
+                return expression
+            return _constant_node(value, expression)
+        self.children(expression)
+        if cls in _LITERAL_NODES:
+            return _constant_node(expression._evaluate(None), expression)
+        if cls is nodes.ParenExpression:
+            if _constant_value(expression.exp) is not None:
+                return expression.exp
+            return expression
+        if cls is nodes.UnaryOperation:
+            return self.unary_operation(expression)
+        if cls is nodes.BinaryOperation:
+            return self.binary_operation(expression)
+        return expression
+
+    @staticmethod
+    def unary_operation(expression: nodes.UnaryOperation) -> nodes.Expression:
+        operand = _constant_value(expression.exp)
+        if operand is None:
+            return expression
+        op = expression.op
+        if op is UnaryOperator.LENGTH:
+            if not isinstance(operand, LuaString):
+                return expression
+        elif op is not UnaryOperator.NOT:
+            if not isinstance(operand, LuaNumber):
+                return expression
+        try:
+            value = unary_operator_functions[op](operand)
+        except (LuaError, Exception):
+            # Leave the error to be raised at run time.
+            return expression
+        return _constant_node(value, expression)
+
+    @staticmethod
+    def binary_operation(expression: nodes.BinaryOperation) \
+            -> nodes.Expression:
+        lhs = _constant_value(expression.lhs)
+        if lhs is None:
+            return expression
+        op = expression.op
+        if op is BinaryOperator.AND or op is BinaryOperator.OR:
+            truthy = lhs is not LuaNil and lhs is not LuaFalse
+            if truthy is (op is BinaryOperator.OR):
+                return expression.lhs
+            if isinstance(expression.rhs, _MULTIRES_NODES):
+                # The operand is adjusted to one value.
+                return nodes.ParenExpression(
+                    expression.rhs,
+                    file=expression.file,
+                    line=expression.line,
+                )
+            return expression.rhs
+        rhs = _constant_value(expression.rhs)
+        if rhs is None:
+            return expression
+        if op in _NUMBER_OPERATORS:
+            if not (isinstance(lhs, LuaNumber) and isinstance(rhs, LuaNumber)):
+                return expression
+        elif op in _ORDER_OPERATORS:
+            if not (
+                isinstance(lhs, LuaNumber) and isinstance(rhs, LuaNumber)
+                or isinstance(lhs, LuaString) and isinstance(rhs, LuaString)
+            ):
+                return expression
+        elif op is BinaryOperator.CONCAT:
+            if not (
+                isinstance(lhs, (LuaNumber, LuaString))
+                and isinstance(rhs, (LuaNumber, LuaString))
+            ):
+                return expression
+        try:
+            value = binary_operator_functions[op](lhs, rhs)
+        except (LuaError, Exception):
+            # Leave the error to be raised at run time.
+            return expression
+        return _constant_node(value, expression)
+
+
+def _constant_value(expression: nodes.Expression) -> LuaValue | None:
+    # The value of a node that was folded to a constant, if it was.
+    cls = expression.__class__
+    if cls is nodes.NumeralConstant or cls is nodes.ParsedLiteralLuaStringExpr:
+        return expression.value
+    if cls is nodes.LiteralNil:
+        return LuaNil
+    if cls is nodes.LiteralTrue:
+        return LuaTrue
+    if cls is nodes.LiteralFalse:
+        return LuaFalse
+    return None
+
+
+def _constant_node(value: LuaValue, like: nodes.Node) -> nodes.Expression:
+    position = {"file": like.file, "line": like.line}
+    if value is LuaNil:
+        return nodes.LiteralNil(**position)
+    if value is LuaTrue:
+        return nodes.LiteralTrue(**position)
+    if value is LuaFalse:
+        return nodes.LiteralFalse(**position)
+    if isinstance(value, LuaNumber):
+        return nodes.NumeralConstant(value, **position)
+    return nodes.ParsedLiteralLuaStringExpr(value, **position)
+
+
+class _CantInline(Exception):
+    pass
+
+
+_GLOBAL = -1
+"""The binding of names that refer to global variables."""
+
+
+@attrs.define(slots=True, eq=False)
+class _Site:
+    call: nodes.FuncCallRegular
+    replacement: nodes.Expression
+    bindings: list[tuple[nodes.Name, int]]
+    """The names in the replacement,
+    with the declarations that they must refer to."""
+    report: InlinedCall
+
+
+class _Inliner:
+    def __init__(self, chunk: nodes.Chunk):
+        self.chunk = chunk
+        # Chunk locals are only exported to the scope for later chunks,
+        # which can't run while this chunk evaluates an expression.
+        self.resolution = resolve(chunk, export_chunk_locals=False)
+        # The Name nodes that declare each variable, by id.
+        self.declared_by = _declarations_by_variable(self.resolution)
+        # The functions that can be inlined, by the id of their variables.
+        self.functions: dict[int, tuple[nodes.Name, nodes.FuncBody]] = {}
+        # The bindings of the names that were copied into the tree,
+        # which the resolution doesn't know.
+        self.copied: dict[int, tuple[nodes.Name, int]] = {}
+        self.sites: list[_Site] = []
+
+    def run(self) -> list[InlinedCall]:
+        self.find_functions()
+        if not self.functions:
+            return []
+        self.rewrite(self.chunk)
+        if not self.sites:
+            return []
+        self.check_sites()
+        return [site.report for site in self.sites]
+
+    def find_functions(self) -> None:
+        assigned = set()
+        candidates = []
+        for node in _walk(self.chunk):
+            cls = node.__class__
+            if cls is nodes.Assignment:
+                for target in node.names:
+                    if target.__class__ is nodes.VarName:
+                        use = self.resolution.use(target.name)
+                        if use.kind is not NameKind.GLOBAL:
+                            assigned.add(id(use.variable))
+            elif cls is nodes.FunctionStatement:
+                # function f() ... end assigns to f if it is a local.
+                if len(node.name.names) == 1:
+                    use = self.resolution.use(node.name.names[0])
+                    if use.kind is not NameKind.GLOBAL:
+                        assigned.add(id(use.variable))
+            elif cls is nodes.LocalFunctionStatement:
+                candidates.append((node.name, node.body))
+            elif cls is nodes.LocalAssignment:
+                if len(node.names) != 1 or len(node.exprs or ()) != 1:
+                    continue
+                attname, = node.names
+                if attname.attrib is not None \
+                        and attname.attrib.name.text != "const":
+                    continue
+                expression, = node.exprs
+                if expression.__class__ is nodes.FuncDef:
+                    expression = expression.body
+                if expression.__class__ is nodes.FuncBody:
+                    candidates.append((attname.name, expression))
+        for name, body in candidates:
+            variable = self.resolution.declaration(name)
+            if id(variable) not in assigned and not body.vararg:
+                self.functions[id(variable)] = name, body
+
+    def binding(self, name: nodes.Name) -> int:
+        if id(name) in self.copied:
+            return self.copied[id(name)][1]
+        use = self.resolution.use(name)
+        if use.kind is NameKind.GLOBAL:
+            return _GLOBAL
+        try:
+            return self.declared_by[id(use.variable)]
+        except KeyError:
+            # The implicit self parameter of methods has no declaration.
+            raise _CantInline() from None
+
+    def rewrite(self, node: nodes.Node) -> None:
+        for field in attrs.fields(node.__class__):
+            value = getattr(node, field.name)
+            new_value = self.value(
+                value,
+                statement=node.__class__ is nodes.Block
+                and field.name == "statements",
+            )
+            if new_value is not value:
+                setattr(node, field.name, new_value)
+
+    def value(self, value: Any, *, statement: bool = False) -> Any:
+        if isinstance(value, (list, tuple)):
+            new_value = [self.value(item, statement=statement)
+                         for item in value]
+            if all(new is old for new, old in zip(new_value, value)):
+                return value
+            return new_value if isinstance(value, list) else tuple(new_value)
+        if isinstance(value, nodes.Node):
+            self.rewrite(value)
+            if value.__class__ is nodes.FuncCallRegular and not statement:
+                try:
+                    return self.call(value)
+                except _CantInline:
+                    pass
+        return value
+
+    def call(self, call: nodes.FuncCallRegular) -> nodes.Expression:
+        if call.name.__class__ is not nodes.VarName \
+                or id(call.name.name) in self.copied:
+            raise _CantInline()
+        use = self.resolution.use(call.name.name)
+        if use.kind is NameKind.GLOBAL \
+                or id(use.variable) not in self.functions:
+            raise _CantInline()
+        name, body = self.functions[id(use.variable)]
+        expression = _returned_expression(body)
+        function_binding = self.declared_by[id(use.variable)]
+        parameters = {id(param): i for i, param in enumerate(body.params)}
+        # The names of the expression, and what they must refer to.
+        names = [
+            (node.name, self.binding(node.name))
+            for node in _walk(expression)
+            if node.__class__ is nodes.VarName
+        ]
+        if any(binding == function_binding for _, binding in names):
+            # The function calls itself.
+            raise _CantInline()
+        arguments = [self.argument(arg) for arg in call.args]
+        copied = copy.deepcopy(expression)
+        replacements = {}
+        bindings = []
+        copied_names = (
+            node for node in _walk(copied) if node.__class__ is nodes.VarName
+        )
+        for node, (_, binding) in zip(copied_names, names):
+            if binding not in parameters:
+                bindings.append((node.name, binding))
+                continue
+            i = parameters[binding]
+            if i < len(arguments):
+                argument, argument_binding = arguments[i]
+                argument = copy.deepcopy(argument)
+                if argument.__class__ is nodes.VarName:
+                    bindings.append((argument.name, argument_binding))
+            else:
+                argument = nodes.LiteralNil(file=call.file, line=call.line)
+            replacements[id(node)] = argument
+        replacement = _replace(copied, replacements)
+        replacement = _Optimizer(None).expression(replacement)
+        for name_node, binding in bindings:
+            self.copied[id(name_node)] = name_node, binding
+        self.sites.append(_Site(
+            call,
+            replacement,
+            bindings,
+            InlinedCall(name.name.text, call.file, call.line, name.line),
+        ))
+        return replacement
+
+    def argument(self, argument: nodes.Expression) \
+            -> tuple[nodes.Expression, int]:
+        if _constant_value(argument) is not None:
+            return argument, _GLOBAL
+        if argument.__class__ is nodes.VarName \
+                and id(argument.name) not in self.copied:
+            use = self.resolution.use(argument.name)
+            if use.kind is not NameKind.GLOBAL and (
+                not use.variable.captured or use.variable.attrib == "const"
+            ):
+                return argument, self.binding(argument.name)
+        raise _CantInline()
+
+    def check_sites(self) -> None:
+        # A name of the function can refer to another variable where the call
+        # is, if a local variable with the same name is declared in between.
+        resolution = resolve(self.chunk, export_chunk_locals=False)
+        declared_by = _declarations_by_variable(resolution)
+        undone = {}
+        for site in self.sites:
+            for name, binding in site.bindings:
+                use = resolution.names.get(id(name))
+                if use is None:
+                    # The name was folded away,
+                    # or the replacement was copied into another one.
+                    continue
+                if use.kind is NameKind.GLOBAL:
+                    actual = _GLOBAL
+                else:
+                    actual = declared_by.get(id(use.variable))
+                if actual != binding:
+                    undone[id(site.replacement)] = site.call
+                    break
+        if undone:
+            _replace(self.chunk, undone)
+            self.sites = [
+                site for site in self.sites
+                if id(site.replacement) not in undone
+            ]
+
+
+def _returned_expression(body: nodes.FuncBody) -> nodes.Expression:
+    block = body.body
+    if block.statements or block.return_statement is None \
+            or len(block.return_statement.values) != 1:
+        raise _CantInline()
+    expression, = block.return_statement.values
+    size = 0
+    for node in _walk(expression):
+        if node.__class__ is nodes.FuncBody:
+            raise _CantInline()
+        if isinstance(node, nodes.Expression):
+            size += 1
+    if size > MAX_INLINE_SIZE:
+        raise _CantInline()
+    return expression
+
+
+def _declarations_by_variable(resolution: Resolution) -> dict[int, int]:
+    return {
+        id(variable): name_id
+        for name_id, variable in resolution.declarations.items()
+    }
+
+
+def _walk(value: Any) -> Iterator[nodes.Node]:
+    if isinstance(value, (list, tuple)):
+        for item in value:
+            yield from _walk(item)
+    elif isinstance(value, nodes.Node):
+        yield value
+        for field in attrs.fields(value.__class__):
+            yield from _walk(getattr(value, field.name))
+
+
+def _replace(value: Any, replacements: dict[int, nodes.Node]) -> Any:
+    # Replace the nodes in the tree of value whose ids are in replacements,
+    # in place where possible.
+    if id(value) in replacements:
+        return replacements[id(value)]
+    if isinstance(value, (list, tuple)):
+        new_value = [_replace(item, replacements) for item in value]
+        if all(new is old for new, old in zip(new_value, value)):
+            return value
+        return new_value if isinstance(value, list) else tuple(new_value)
+    if isinstance(value, nodes.Node):
+        for field in attrs.fields(value.__class__):
+            item = getattr(value, field.name)
+            new_item = _replace(item, replacements)
+            if new_item is not item:
+                setattr(value, field.name, new_item)
+    return value
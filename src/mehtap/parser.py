@@ -1,40 +1,250 @@
+from __future__ import annotations
+
+import enum
+import hashlib
+import os
+import pickle
+import sys
 from pathlib import Path
+from typing import TYPE_CHECKING
+
+from mehtap.control_structures import LuaError
+from mehtap.values import LuaString
+
+if TYPE_CHECKING:
+    import lark
 
-import lark
+    from mehtap.ast_nodes import Chunk, Expression, Numeral
 
 
 with open(Path(__file__).parent / "lua.lark", "r", encoding="utf-8") as f:
     lua_grammar = f.read()
 
-chunk_parser = lark.Lark(
-    lua_grammar,
-    start="chunk",
-    parser="earley",
-    propagate_positions=True,
-    debug=True,
-)
-
-expr_parser = lark.Lark(
-    lua_grammar,
-    start="exp",
-    parser="earley",
-    propagate_positions=True,
-    debug=True,
-)
-
-numeral_parser = lark.Lark(
-    lua_grammar,
-    start="numeral",
-    parser="earley",
-    propagate_positions=True,
-    debug=True,
-)
-
-repl_parser = lark.Lark(
-    lua_grammar,
-    start="repl_input",
-    parser="earley",
-    propagate_positions=True,
-    debug=True,
-)
+GRAMMAR_VERSION = hashlib.sha256(lua_grammar.encode("utf-8")).hexdigest()[:16]
+"""Digest of the grammar that identifies the trees that parsers produce."""
+
+
+
+def _user_cache_directory() -> Path | None:
+    directory = os.environ.get("MEHTAP_CACHE_DIR")
+    if directory:
+        return Path(directory)
+    try:
+        home = Path.home()
+    except (RuntimeError, KeyError):
+        return None
+    if sys.platform == "win32":
+        local_app_data = os.environ.get("LOCALAPPDATA")
+        base = (
+            Path(local_app_data) if local_app_data
+            else home / "AppData" / "Local"
+        )
+    elif sys.platform == "darwin":
+        base = home / "Library" / "Caches"
+    else:
+        xdg_cache_home = os.environ.get("XDG_CACHE_HOME")
+        base = Path(xdg_cache_home) if xdg_cache_home else home / ".cache"
+    return base / "mehtap"
+
+
+GRAMMAR_CACHE_DIRECTORY: Path | None = _user_cache_directory()
+"""Directory that the analyzed grammar is cached in.
+
+This is the directory in the ``MEHTAP_CACHE_DIR`` environment variable if it
+is set,
+and a ``mehtap`` directory in the cache directory of the user otherwise
+(``$XDG_CACHE_HOME`` or ``~/.cache`` on Linux,
+``~/Library/Caches`` on macOS and ``%LOCALAPPDATA%`` on Windows).
+If it is :data:`None` or can't be written to,
+the grammar is analyzed again in every process that builds a parser.
+"""
+
+_PARSER_START_RULES = {
+    "chunk_parser": "chunk",
+    "expr_parser": "exp",
+    "numeral_parser": "numeral",
+    "repl_parser": "repl_input",
+}
+_parsers: dict[str, lark.Lark] = {}
+_pickled_grammar: bytes | None = None
+
+
+def _get_pickled_grammar() -> bytes:
+    global _pickled_grammar
+    if _pickled_grammar is not None:
+        return _pickled_grammar
+
+    import lark
+    from lark.load_grammar import load_grammar
+
+    key = hashlib.sha256(
+        "\0".join(
+            (lua_grammar, lark.__version__, str(sys.version_info[:2]))
+        ).encode("utf-8")
+    ).hexdigest()[:16]
+    directory = GRAMMAR_CACHE_DIRECTORY
+    if directory is not None:
+        cache_path = directory / f"lua.lark.{key}.pickle"
+        try:
+            with open(cache_path, "rb") as f:
+                pickled_grammar = f.read()
+            pickle.loads(pickled_grammar)
+        except Exception:
+            pass
+        else:
+            _pickled_grammar = pickled_grammar
+            return _pickled_grammar
+    grammar, _ = load_grammar(lua_grammar, "lua.lark", None, False)
+    _pickled_grammar = pickle.dumps(grammar, protocol=pickle.HIGHEST_PROTOCOL)
+    if directory is not None:
+        temporary_path = cache_path.with_name(
+            f"{cache_path.name}.{os.getpid()}.tmp"
+        )
+        try:
+            directory.mkdir(parents=True, exist_ok=True)
+            with open(temporary_path, "wb") as f:
+                f.write(_pickled_grammar)
+            os.replace(temporary_path, cache_path)
+        except OSError:
+            try:
+                os.remove(temporary_path)
+            except OSError:
+                pass
+    return _pickled_grammar
+
+
+def get_parser(start: str) -> lark.Lark:
+    """Get the Earley parser of a start rule of the grammar.
+
+    Parsers are built on first use.
+    The analyzed grammar they are built from is cached on disk,
+    so that building them doesn't need to parse ``lua.lark``.
+
+    :param start: The name of the start rule, such as ``"chunk"``.
+    """
+    try:
+        return _parsers[start]
+    except KeyError:
+        pass
+    import lark
+
+    parser = lark.Lark(
+        pickle.loads(_get_pickled_grammar()),
+        start=start,
+        parser="earley",
+        propagate_positions=True,
+        debug=True,
+    )
+    _parsers[start] = parser
+    return parser
+
+
+def __getattr__(name: str):
+    # chunk_parser, expr_parser, numeral_parser and repl_parser used to be
+    # built when this module was imported.
+    if name in _PARSER_START_RULES:
+        return get_parser(_PARSER_START_RULES[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class ParserBackend(enum.Enum):
+    """ParserBackend(value)
+    Enumeration of the parsers that can turn Lua source code into an
+    abstract syntax tree.
+    """
+
+    EARLEY = "earley"
+    """Lark's Earley parser built from ``lua.lark``."""
+    RECURSIVE_DESCENT = "recursive-descent"
+    """The hand-written parser in :mod:`mehtap.descent_parser`.
+
+    Runs in time linear in the size of the input.
+    """
+
+
+def _transform(tree: lark.Tree, filename: str | None):
+    from lark.exceptions import VisitError
+
+    from mehtap.ast_transformer import transformer
+
+    try:
+        return transformer.transform(tree, filename=filename)
+    except VisitError as e:
+        le = LuaError(
+            LuaString(str(e.orig_exc).encode("utf-8")),
+            caused_by=e,
+        )
+        raise le from e
+
+
+def parse_chunk(
+    source: str,
+    *,
+    filename: str,
+    backend: ParserBackend = ParserBackend.EARLEY,
+    optimize: bool = True,
+) -> Chunk:
+    """Parse a chunk of Lua source code into its abstract syntax tree.
+
+    The ``goto`` and ``break`` statements of the chunk are checked with
+    :func:`mehtap.jump_checker.check_jumps`.
+
+    :param optimize: Whether to fold the constants of the chunk,
+                     and inline calls of small local functions, with
+                     :func:`mehtap.optimizer.optimize_chunk`.
+    """
+    from mehtap.jump_checker import check_jumps
+    from mehtap.vm import host_recursion_limit
+
+    with host_recursion_limit():
+        if backend is ParserBackend.RECURSIVE_DESCENT:
+            from mehtap.descent_parser import (
+                parse_chunk as descent_parse_chunk,
+            )
+
+            chunk = descent_parse_chunk(source, filename=filename)
+        else:
+            chunk = _transform(get_parser("chunk").parse(source), filename)
+        check_jumps(chunk)
+        if optimize:
+            from mehtap.optimizer import optimize_chunk
+
+            optimize_chunk(chunk)
+    return chunk
+
+
+def parse_expression(
+    source: str,
+    *,
+    filename: str,
+    backend: ParserBackend = ParserBackend.EARLEY,
+    optimize: bool = True,
+) -> Expression:
+    """Parse a Lua expression into its abstract syntax tree.
+
+    :param optimize: Whether to fold the constants of the expression with
+                     :func:`mehtap.optimizer.optimize_expression`.
+    """
+    from mehtap.vm import host_recursion_limit
+
+    with host_recursion_limit():
+        if backend is ParserBackend.RECURSIVE_DESCENT:
+            from mehtap.descent_parser import (
+                parse_expression as descent_parse_expression,
+            )
+
+            expression = descent_parse_expression(source, filename=filename)
+        else:
+            expression = _transform(get_parser("exp").parse(source), filename)
+        if optimize:
+            from mehtap.optimizer import optimize_expression
+
+            expression = optimize_expression(expression)
+    return expression
+
+
+def parse_numeral(source: str) -> Numeral:
+    """Parse a Lua numeral into its abstract syntax tree."""
+    from mehtap.ast_transformer import transformer
 
+    return transformer.transform(get_parser("numeral").parse(source))
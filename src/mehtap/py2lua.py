@@ -21,6 +21,7 @@ from mehtap.values import (
     LuaNil,
     LuaBool,
     LuaNumber,
+    lua_integer,
 )
 
 
@@ -61,13 +62,11 @@ def table_function(
     *,
     name: str | None = None,
 ) -> LuaFunction:
-    from mehtap.control_structures import ReturnException
-
     used_name = name if name is not None else func.__name__
     if not used_name:
         used_name = "<native function>"
 
-    def new_function(arguments: LuaTable) -> None:
+    def new_function(arguments: LuaTable) -> list[LuaValue]:
         if not isinstance(arguments, LuaTable):
             raise TypeError("function must be called with a table")
 
@@ -76,18 +75,16 @@ def table_function(
         memos = {}
         args = []
         kwargs = {}
-        for k,v in arguments.map.items():
+        for k,v in arguments.items():
             if not isinstance(k, LuaString):
                 continue
             kwargs[_lua2py(k, memos)] = _lua2py(v, memos)
-        i = 1
-        while True:
-            if i not in arguments.map:
+        for v in arguments.array:
+            if v is LuaNil:
                 break
-            args.append(_lua2py(arguments.map[i], memos))
-            i += 1
+            args.append(_lua2py(v, memos))
 
-        raise ReturnException([py2lua(func(*args, **kwargs))])
+        return [py2lua(func(*args, **kwargs))]
 
     return LuaFunction(
         param_names=[LuaString(b"arguments")],
@@ -178,7 +175,7 @@ def _py2lua(py_val, memos):
         m = LuaTable()
         memos[id(py_val)] = m
         for i, v in enumerate(py_val, start=1):
-            m.rawput(LuaNumber(i), _py2lua(v, memos))
+            m.rawput(lua_integer(i), _py2lua(v, memos))
         return m
     if callable(py_val):
         return table_function(py_val)
@@ -214,6 +211,7 @@ def lua_function(
     gets_scope: Literal[False] = False,
     wrap_values: Literal[False] = False,
     rename_args: list[str] | None = None,
+    fastcall: bool = False,
 ) -> Callable[[LuaCallback], LuaFunction]: ...
 
 
@@ -224,6 +222,7 @@ def lua_function(
     gets_scope: Literal[False] = False,
     wrap_values: Literal[True] = True,
     rename_args: list[str] | None = None,
+    fastcall: bool = False,
 ) -> Callable[[PyCallback], LuaFunction]: ...
 
 
@@ -235,6 +234,7 @@ def lua_function(
     gets_scope: Literal[True] = True,
     wrap_values: Literal[False] = False,
     rename_args: list[str] | None = None,
+    fastcall: bool = False,
 ) -> Callable[[LuaScopeCallback], LuaFunction]: ...
 
 
@@ -245,6 +245,7 @@ def lua_function(
     gets_scope: Literal[True] = True,
     wrap_values: Literal[True] = True,
     rename_args: list[str] | None = None,
+    fastcall: bool = False,
 ) -> Callable[[PyScopeCallback], LuaFunction]: ...
 
 
@@ -260,6 +261,7 @@ def lua_function(
     gets_scope: bool = False,
     wrap_values: bool = False,
     rename_args: list[str] | None = None,
+    fastcall: bool = False,
 ) -> Callable[Callable, LuaFunction]:
     """Convert a Python callable to a :class:`LuaFunction` instance.
 
@@ -272,6 +274,8 @@ def lua_function(
                         Lua/Python
                         when passing them to/from the function.
     :param rename_args: Allows to rename the arguments of the function.
+    :param fastcall: Whether the function is called with the fastcall
+                     convention.
     :return: A decorator that turns Python functions to :class:`LuaFunction`
              instances.
 
@@ -306,6 +310,18 @@ def lua_function(
     arguments to the function.
 
     If *preserve* is set to True, *table* must not be left empty.
+
+    If *fastcall* is set to True, the function receives a value for each of
+    its parameters, and :data:`LuaNil` for the optional ones that aren't
+    given, so the default values of its parameters must be :data:`LuaNil`.
+    A call without one of the required arguments raises an error before
+    the function is called.
+    The extra arguments are dropped unless the function is variadic.
+    The function must return a list of :class:`LuaValue` instances,
+    which is returned as is.
+    The arguments and the return values are never converted, so
+    *wrap_values* can't be set to True.
+    See :meth:`LuaFunction.fastcall_with`.
     """
     if function is not None:
         return _lua_function(
@@ -313,26 +329,23 @@ def lua_function(
             rename_args=rename_args,
             gets_scope=gets_scope,
             wrap_values=wrap_values,
+            fastcall=fastcall,
         )(function)
     return _lua_function(
         name=name,
         rename_args=rename_args,
         gets_scope=gets_scope,
         wrap_values=wrap_values,
+        fastcall=fastcall,
     )
 
 
 def _wrap_values(func: Callable, wrap_values: bool) -> Callable:
     """Wraps the function to convert its arguments and return values."""
-    from mehtap.control_structures import ReturnException
-
     if not wrap_values:
-        def new_function(*args: LuaValue, **kwargs: LuaValue) -> None:
-            raise ReturnException(func(*args, **kwargs))
-
-        return new_function
+        return func
 
-    def new_function(*args: LuaValue, **kwargs: LuaValue) -> None:
+    def new_function(*args: LuaValue, **kwargs: LuaValue) -> list[LuaValue]:
         from mehtap.lua2py import lua2py
 
         return_values = func(
@@ -340,8 +353,8 @@ def _wrap_values(func: Callable, wrap_values: bool) -> Callable:
             **{k: lua2py(v) for k, v in kwargs.items()}
         )
         if isinstance(return_values, (list, tuple)):
-            raise ReturnException([py2lua(v) for v in return_values])
-        raise ReturnException([py2lua(return_values)])
+            return [py2lua(v) for v in return_values]
+        return [py2lua(return_values)]
 
     return new_function
 
@@ -352,8 +365,10 @@ def _lua_function(
     rename_args: list[str] | None = None,
     gets_scope: bool = False,
     wrap_values: bool = False,
+    fastcall: bool = False,
 ):
-    from mehtap.control_structures import ReturnException
+    if fastcall and wrap_values:
+        raise ValueError("Fastcall functions can't wrap values")
 
     def decorator(func: Callable):
         f_signature = signature(func)
@@ -373,6 +388,12 @@ def _lua_function(
             if param.kind == param.POSITIONAL_ONLY:
                 if param.default is param.empty:
                     minimum_required += 1
+                elif fastcall and param.default is not LuaNil:
+                    raise ValueError(
+                        f"Fastcall function {func.__qualname__} has a "
+                        f"parameter {param.name} whose default value "
+                        f"isn't nil"
+                    )
             elif param.kind == param.VAR_POSITIONAL:
                 f_variadic = True
                 continue
@@ -413,6 +434,7 @@ def _lua_function(
             gets_scope=gets_scope,
             name=used_name,
             min_req=minimum_required,
+            fastcall=fastcall,
         )
 
     return decorator
@@ -0,0 +1,656 @@
+"""Specialization of the nodes of the tree-walking interpreter by the types
+of the values they see.
+
+The nodes that run most often,
+:class:`~mehtap.ast_nodes.BinaryOperation`,
+:class:`~mehtap.ast_nodes.VarIndex`,
+:class:`~mehtap.ast_nodes.FuncCallRegular` and
+:class:`~mehtap.ast_nodes.FuncCallMethod`,
+evaluate themselves by calling their :attr:`handler`.
+A node starts with an *adaptive* handler,
+which evaluates it like the generic code and records the kind of the values
+it saw in the :class:`TypeFeedback` of the node.
+Once a node has seen values of the same kind :data:`THRESHOLD` times in a
+row, the adaptive handler replaces itself with a handler that is specialized
+for them, for example one that adds two integers, or one that reads a field
+of a table.
+Specialized handlers also read the operands that are constants or local
+variables directly, instead of asking their nodes to evaluate themselves.
+
+Specialized handlers check that their values are still of the kind they
+expect before taking their fast path.
+If they aren't, the node is *deoptimized*:
+the values are handled by the generic code and the node goes back to the
+adaptive handler,
+which waits twice as long as the last time before specializing again.
+After :data:`MAX_DEOPTIMIZATIONS` deoptimizations,
+the node keeps using the generic code.
+
+:func:`dump_specializations` lists the nodes that were specialized.
+"""
+
+from __future__ import annotations
+
+import operator
+from collections.abc import Callable, Iterator
+from typing import Any, TYPE_CHECKING
+
+import attrs
+
+import mehtap.ast_nodes as nodes
+from mehtap.control_structures import LuaError, TailCall
+from mehtap.operations import index, int_wrap_overflow
+from mehtap.values import (
+    LuaFalse,
+    LuaFunction,
+    LuaNil,
+    LuaNumber,
+    LuaNumberType,
+    LuaString,
+    LuaTable,
+    LuaTrue,
+    LuaValue,
+    MAX_INT64,
+    MIN_INT64,
+    finish_tail_calls,
+    lua_integer,
+)
+
+if TYPE_CHECKING:
+    from mehtap.scope import Scope
+
+
+Handler = Callable[[Any, "Scope"], Any]
+Specializer = Callable[[Any], Handler]
+Reader = Callable[["Scope"], LuaValue]
+
+THRESHOLD = 8
+"""How many times in a row a node has to see values of the same kind before
+it is specialized for them."""
+MAX_DEOPTIMIZATIONS = 4
+"""How many times a node can be deoptimized before it stops being
+specialized."""
+
+
+@attrs.define(slots=True, eq=False)
+class TypeFeedback:
+    """The values an adaptive node has seen."""
+
+    countdown: int = THRESHOLD
+    """How many more times the node has to see values of the kind of
+    :attr:`candidate` before it is specialized."""
+    candidate: Specializer | None = None
+    """The function that makes the specialized handler for the values the
+    node saw last,
+    or :data:`None` if they can't be specialized for."""
+    key: Any = None
+    """Data the candidate handler depends on,
+    like the block of the function a call calls."""
+    deoptimizations: int = 0
+    """How many times the node was deoptimized."""
+
+
+def _observe(node, candidate: Specializer | None, key: Any = None) -> None:
+    feedback = node.feedback
+    if feedback is None:
+        feedback = node.feedback = TypeFeedback()
+    if candidate is not feedback.candidate or key is not feedback.key:
+        feedback.candidate = candidate
+        feedback.key = key
+        feedback.countdown = THRESHOLD << feedback.deoptimizations
+        return
+    feedback.countdown -= 1
+    if feedback.countdown > 0:
+        return
+    if candidate is None:
+        # The node sees values that no handler is specialized for.
+        node.handler = _GENERIC_HANDLERS[node.__class__]
+    else:
+        node.handler = candidate(node)
+
+
+def _deoptimize(node) -> None:
+    feedback = node.feedback
+    feedback.deoptimizations += 1
+    feedback.candidate = None
+    feedback.key = None
+    if feedback.deoptimizations >= MAX_DEOPTIMIZATIONS:
+        node.handler = _GENERIC_HANDLERS[node.__class__]
+    else:
+        node.handler = _ADAPTIVE_HANDLERS[node.__class__]
+
+
+_CONSTANT_NODES = (
+    nodes.NumeralDec,
+    nodes.NumeralHex,
+    nodes.NumeralConstant,
+    nodes.LiteralString,
+    nodes.LiteralTrue,
+    nodes.LiteralFalse,
+    nodes.LiteralNil,
+    nodes.ParsedLiteralLuaStringExpr,
+)
+
+
+def _reader(expression: nodes.Expression) -> Reader:
+    # Make a function that evaluates an expression to a single value,
+    # which reads constants and local variables without evaluating their
+    # nodes.
+    if isinstance(expression, _CONSTANT_NODES):
+        # These nodes don't use the scope.
+        value = expression._evaluate(None)
+
+        def read_constant(scope: Scope) -> LuaValue:
+            return value
+
+        return read_constant
+    if expression.__class__ is nodes.VarName:
+        name = expression.name
+        slot = name.slot
+        if name.depth == 0 and not name.exported:
+            def read_local(scope: Scope) -> LuaValue:
+                return scope.slots[slot]
+
+            return read_local
+        if name.depth == 1 and not name.exported:
+            def read_upvalue(scope: Scope) -> LuaValue:
+                return scope.parent.slots[slot]
+
+            return read_upvalue
+    return expression.evaluate_single
+
+
+# Binary operations
+
+def _int_arithmetic(name: str, operation) -> Specializer:
+    def specialize(node: nodes.BinaryOperation) -> Handler:
+        lhs = _reader(node.lhs)
+        rhs = _reader(node.rhs)
+
+        def handler(node: nodes.BinaryOperation, scope: Scope) -> LuaValue:
+            a = lhs(scope)
+            b = rhs(scope)
+            if a.__class__ is LuaNumber and b.__class__ is LuaNumber:
+                x = a.value
+                y = b.value
+                if x.__class__ is int and y.__class__ is int:
+                    r = operation(x, y)
+                    if MIN_INT64 <= r <= MAX_INT64:
+                        return lua_integer(r)
+                    return int_wrap_overflow(r)
+            _deoptimize(node)
+            return node.function(a, b)
+
+        handler.__name__ = name
+        return handler
+
+    return specialize
+
+
+def _int_division(name: str, operation) -> Specializer:
+    def specialize(node: nodes.BinaryOperation) -> Handler:
+        lhs = _reader(node.lhs)
+        rhs = _reader(node.rhs)
+
+        def handler(node: nodes.BinaryOperation, scope: Scope) -> LuaValue:
+            a = lhs(scope)
+            b = rhs(scope)
+            if a.__class__ is LuaNumber and b.__class__ is LuaNumber:
+                x = a.value
+                y = b.value
+                # Division by zero is left to the generic code.
+                if x.__class__ is int and y.__class__ is int and y:
+                    r = operation(x, y)
+                    if r <= MAX_INT64:
+                        return lua_integer(r)
+                    return int_wrap_overflow(r)
+            _deoptimize(node)
+            return node.function(a, b)
+
+        handler.__name__ = name
+        return handler
+
+    return specialize
+
+
+def _float_arithmetic(name: str, operation) -> Specializer:
+    def specialize(node: nodes.BinaryOperation) -> Handler:
+        lhs = _reader(node.lhs)
+        rhs = _reader(node.rhs)
+
+        def handler(node: nodes.BinaryOperation, scope: Scope) -> LuaValue:
+            a = lhs(scope)
+            b = rhs(scope)
+            if a.__class__ is LuaNumber and b.__class__ is LuaNumber:
+                x = a.value
+                y = b.value
+                # Division by zero is left to the generic code.
+                if x.__class__ is float and y.__class__ is float and y:
+                    return LuaNumber(operation(x, y), LuaNumberType.FLOAT)
+            _deoptimize(node)
+            return node.function(a, b)
+
+        handler.__name__ = name
+        return handler
+
+    return specialize
+
+
+def _number_comparison(name: str, operation) -> Specializer:
+    def specialize(node: nodes.BinaryOperation) -> Handler:
+        lhs = _reader(node.lhs)
+        rhs = _reader(node.rhs)
+
+        def handler(node: nodes.BinaryOperation, scope: Scope) -> LuaValue:
+            a = lhs(scope)
+            b = rhs(scope)
+            if a.__class__ is LuaNumber and b.__class__ is LuaNumber:
+                return LuaTrue if operation(a.value, b.value) else LuaFalse
+            _deoptimize(node)
+            return node.function(a, b)
+
+        handler.__name__ = name
+        return handler
+
+    return specialize
+
+
+def _string_operation(name: str, operation) -> Specializer:
+    def specialize(node: nodes.BinaryOperation) -> Handler:
+        lhs = _reader(node.lhs)
+        rhs = _reader(node.rhs)
+
+        def handler(node: nodes.BinaryOperation, scope: Scope) -> LuaValue:
+            a = lhs(scope)
+            b = rhs(scope)
+            if a.__class__ is LuaString and b.__class__ is LuaString:
+                return operation(a.content, b.content)
+            _deoptimize(node)
+            return node.function(a, b)
+
+        handler.__name__ = name
+        return handler
+
+    return specialize
+
+
+_B = nodes.BinaryOperator
+_INT_SPECIALIZERS = {
+    _B.ADD: _int_arithmetic("int_add", operator.add),
+    _B.SUBTRACT: _int_arithmetic("int_sub", operator.sub),
+    _B.MULTIPLY: _int_arithmetic("int_mul", operator.mul),
+    _B.FLOOR_DIV: _int_division("int_floor_div", operator.floordiv),
+    _B.MODULO: _int_division("int_mod", operator.mod),
+}
+_FLOAT_SPECIALIZERS = {
+    _B.ADD: _float_arithmetic("float_add", operator.add),
+    _B.SUBTRACT: _float_arithmetic("float_sub", operator.sub),
+    _B.MULTIPLY: _float_arithmetic("float_mul", operator.mul),
+    _B.FLOAT_DIV: _float_arithmetic("float_div", operator.truediv),
+}
+_NUMBER_SPECIALIZERS = {
+    _B.LT: _number_comparison("number_lt", operator.lt),
+    _B.LE: _number_comparison("number_le", operator.le),
+    _B.GT: _number_comparison("number_gt", operator.gt),
+    _B.GE: _number_comparison("number_ge", operator.ge),
+    _B.EQ: _number_comparison("number_eq", operator.eq),
+    _B.NE: _number_comparison("number_ne", operator.ne),
+}
+_STRING_SPECIALIZERS = {
+    _B.EQ: _string_operation(
+        "string_eq", lambda a, b: LuaTrue if a == b else LuaFalse
+    ),
+    _B.NE: _string_operation(
+        "string_ne", lambda a, b: LuaTrue if a != b else LuaFalse
+    ),
+    _B.CONCAT: _string_operation(
+        "string_concat", lambda a, b: LuaString(a + b)
+    ),
+}
+del _B
+
+
+def adaptive_binary_operation(
+    node: nodes.BinaryOperation,
+    scope: Scope,
+) -> LuaValue:
+    a = node.lhs.evaluate_single(scope)
+    b = node.rhs.evaluate_single(scope)
+    candidate = None
+    if a.__class__ is LuaNumber and b.__class__ is LuaNumber:
+        x = a.value.__class__
+        y = b.value.__class__
+        if x is int and y is int:
+            candidate = _INT_SPECIALIZERS.get(node.op)
+        elif x is float and y is float:
+            candidate = _FLOAT_SPECIALIZERS.get(node.op)
+        if candidate is None:
+            candidate = _NUMBER_SPECIALIZERS.get(node.op)
+    elif a.__class__ is LuaString and b.__class__ is LuaString:
+        candidate = _STRING_SPECIALIZERS.get(node.op)
+    _observe(node, candidate)
+    return node.function(a, b)
+
+
+# Indexing
+
+def _table_field(node: nodes.VarIndex) -> Handler:
+    base = _reader(node.base)
+    key = node.index.value
+    content = key.content
+    # The position of the field in the values of tables with the shape that
+    # the last table with the field had.
+    cached_shape = None
+    cached_slot = 0
+
+    def table_field(node: nodes.VarIndex, scope: Scope) -> LuaValue:
+        nonlocal cached_shape, cached_slot
+        table = base(scope)
+        if table.__class__ is LuaTable:
+            shape = table._shape
+            if shape is None:
+                value = table._map.get(content)
+            elif shape is cached_shape:
+                value = table._values[cached_slot]
+            else:
+                slot = shape.slots.get(content)
+                if slot is None:
+                    value = None
+                else:
+                    cached_shape = shape
+                    cached_slot = slot
+                    value = table._values[slot]
+            if value is not None and value is not LuaNil:
+                return value
+            if table._metatable is None:
+                return LuaNil
+            return index(table, key)
+        _deoptimize(node)
+        return index(table, key)
+
+    return table_field
+
+
+def _table_array_index(node: nodes.VarIndex) -> Handler:
+    base = _reader(node.base)
+    key_reader = _reader(node.index)
+
+    def table_array_index(node: nodes.VarIndex, scope: Scope) -> LuaValue:
+        table = base(scope)
+        key = key_reader(scope)
+        if table.__class__ is LuaTable and key.__class__ is LuaNumber:
+            i = key.value
+            if i.__class__ is int and 0 < i <= len(table.array):
+                value = table.array[i - 1]
+                if value is not LuaNil:
+                    return value
+            if table._metatable is None:
+                return table.rawget(key)
+            return index(table, key)
+        _deoptimize(node)
+        return index(table, key)
+
+    return table_array_index
+
+
+def _table_index(node: nodes.VarIndex) -> Handler:
+    base = _reader(node.base)
+    key_reader = _reader(node.index)
+
+    def table_index(node: nodes.VarIndex, scope: Scope) -> LuaValue:
+        table = base(scope)
+        key = key_reader(scope)
+        if table.__class__ is LuaTable:
+            if table._metatable is None:
+                return table.rawget(key)
+            return index(table, key)
+        _deoptimize(node)
+        return index(table, key)
+
+    return table_index
+
+
+def adaptive_var_index(node: nodes.VarIndex, scope: Scope) -> LuaValue:
+    table = node.base.evaluate_single(scope)
+    key = node.index.evaluate_single(scope)
+    candidate = None
+    if table.__class__ is LuaTable:
+        if node.index.__class__ is nodes.ParsedLiteralLuaStringExpr:
+            candidate = _table_field
+        elif (
+            key.__class__ is LuaNumber
+            and key.type is LuaNumberType.INTEGER
+        ):
+            candidate = _table_array_index
+        else:
+            candidate = _table_index
+    _observe(node, candidate)
+    return index(table, key)
+
+
+# Calls
+
+def _has_fixed_arity(args) -> bool:
+    # Whether the argument list of a call always has the same length,
+    # which it does unless its last expression is multires.
+    return not args or not isinstance(
+        args[-1],
+        (nodes.FuncCallRegular, nodes.FuncCallMethod, nodes.VarArgExpr),
+    )
+
+
+def _observe_callee(node, function: LuaValue) -> None:
+    # A call is specialized for the functions created from the same function
+    # body, which is a Lua function with a fixed number of parameters.
+    if (
+        function.__class__ is LuaFunction
+        and function.block.__class__ is nodes.Block
+        and function.block.frame_size is not None
+        and not function.variadic
+        and _has_fixed_arity(node.args)
+    ):
+        _observe(node, _CALL_SPECIALIZERS[node.__class__], function.block)
+    else:
+        _observe(node, None)
+
+
+def _call_lua_function(
+    node,
+    function: LuaFunction,
+    args: list[LuaValue],
+) -> list[LuaValue]:
+    # Call a Lua function the way LuaFunction.rawcall() does, without
+    # adjusting an argument list that has no multires expressions.
+    param_count = len(function.param_names)
+    if len(args) > param_count:
+        del args[param_count:]
+    else:
+        args.extend([LuaNil] * (param_count - len(args)))
+    try:
+        r = function._enter(args, None)
+        if r.__class__ is TailCall:
+            r = finish_tail_calls(r)
+        return r
+    except LuaError as le:
+        node._push_tb(le, function)
+        raise le
+    except Exception as e:
+        le = LuaError(
+            LuaString(f"{function!s}: {e!s}".encode("utf-8")),
+            caused_by=e,
+        )
+        node._push_tb(le, function)
+        raise le from e
+
+
+def _call_lua_function_specializer(node: nodes.FuncCallRegular) -> Handler:
+    callee = _reader(node.name)
+    readers = [_reader(arg) for arg in node.args]
+    block = node.feedback.key
+
+    def call_lua_function(
+        node: nodes.FuncCallRegular,
+        scope: Scope,
+    ) -> list[LuaValue]:
+        function = callee(scope)
+        if (
+            function.__class__ is not LuaFunction
+            or function.block is not block
+        ):
+            _deoptimize(node)
+            return node._call(
+                function, [arg.evaluate(scope) for arg in node.args], scope
+            )
+        return _call_lua_function(
+            node, function, [read(scope) for read in readers]
+        )
+
+    return call_lua_function
+
+
+def adaptive_func_call(
+    node: nodes.FuncCallRegular,
+    scope: Scope,
+) -> list[LuaValue]:
+    function = node.name.evaluate_single(scope)
+    _observe_callee(node, function)
+    return node._call(
+        function, [arg.evaluate(scope) for arg in node.args], scope
+    )
+
+
+def _call_lua_method_specializer(node: nodes.FuncCallMethod) -> Handler:
+    receiver = _reader(node.object)
+    name = node.method.as_lua_string()
+    readers = [_reader(arg) for arg in node.args]
+    block = node.feedback.key
+
+    def call_lua_method(
+        node: nodes.FuncCallMethod,
+        scope: Scope,
+    ) -> list[LuaValue]:
+        v = receiver(scope)
+        function = index(v, name)
+        if (
+            function.__class__ is not LuaFunction
+            or function.block is not block
+        ):
+            _deoptimize(node)
+            return node._call(
+                function,
+                [v, *(arg.evaluate(scope) for arg in node.args)],
+                scope,
+            )
+        return _call_lua_function(
+            node, function, [v, *[read(scope) for read in readers]]
+        )
+
+    return call_lua_method
+
+
+def adaptive_method_call(
+    node: nodes.FuncCallMethod,
+    scope: Scope,
+) -> list[LuaValue]:
+    v = node.object.evaluate_single(scope)
+    function = index(v, node.method.as_lua_string())
+    _observe_callee(node, function)
+    return node._call(
+        function, [v, *(arg.evaluate(scope) for arg in node.args)], scope
+    )
+
+
+_CALL_SPECIALIZERS = {
+    nodes.FuncCallRegular: _call_lua_function_specializer,
+    nodes.FuncCallMethod: _call_lua_method_specializer,
+}
+_ADAPTIVE_HANDLERS = {
+    nodes.BinaryOperation: adaptive_binary_operation,
+    nodes.VarIndex: adaptive_var_index,
+    nodes.FuncCallRegular: adaptive_func_call,
+    nodes.FuncCallMethod: adaptive_method_call,
+}
+_GENERIC_HANDLERS = {
+    nodes.BinaryOperation: nodes.BinaryOperation._evaluate_generic,
+    nodes.VarIndex: nodes.VarIndex._evaluate_generic,
+    nodes.FuncCallRegular: nodes.FuncCallRegular._evaluate_generic,
+    nodes.FuncCallMethod: nodes.FuncCallMethod._evaluate_generic,
+}
+nodes.adaptive_handlers.update(_ADAPTIVE_HANDLERS)
+
+
+def unspecialize(root: nodes.Node) -> None:
+    """Put every node in the tree of *root* back to its adaptive handler and
+    forget the values it has seen.
+
+    Used when the names of a chunk are resolved again,
+    since specialized handlers read local variables from the slots they were
+    in.
+    """
+    for node in _walk(root):
+        if getattr(node, "feedback", None) is not None:
+            node.__attrs_post_init__()
+            node.feedback = None
+
+
+# Debugging
+
+def _walk(value: Any) -> Iterator[nodes.Node]:
+    if isinstance(value, (list, tuple)):
+        for item in value:
+            yield from _walk(item)
+    elif isinstance(value, nodes.Node):
+        yield value
+        for field in attrs.fields(value.__class__):
+            yield from _walk(getattr(value, field.name))
+
+
+def specialized_nodes(
+    root: nodes.Node | LuaFunction,
+) -> list[tuple[nodes.Node, str, int]]:
+    """
+    :param root: A node, or a function implemented in Lua.
+    :return: A tuple *(node, handler, deoptimizations)* for each node in the
+             tree of *root* that was specialized or deoptimized,
+             where *handler* is the name of the handler the node uses now:
+             the name of a specialized handler, ``"adaptive"`` or
+             ``"generic"``.
+    """
+    if isinstance(root, LuaFunction):
+        root = root.block
+    result = []
+    for node in _walk(root):
+        feedback = getattr(node, "feedback", None)
+        if feedback is None:
+            continue
+        handler = node.handler
+        if handler is _ADAPTIVE_HANDLERS[node.__class__]:
+            name = "adaptive"
+        elif handler is _GENERIC_HANDLERS[node.__class__]:
+            name = "generic"
+        else:
+            name = handler.__name__
+        if name == "adaptive" and not feedback.deoptimizations:
+            continue
+        result.append((node, name, feedback.deoptimizations))
+    return result
+
+
+def dump_specializations(root: nodes.Node | LuaFunction) -> str:
+    """
+    :param root: A node, or a function implemented in Lua.
+    :return: A human-readable list of the nodes in the tree of *root* that
+             were specialized or deoptimized, one per line.
+    """
+    lines = []
+    for node, handler, deoptimizations in specialized_nodes(root):
+        description = node.__class__.__name__
+        if isinstance(node, nodes.BinaryOperation):
+            description += f" {node.op.value!r}"
+        elif isinstance(node, nodes.FuncCallMethod):
+            description += f" :{node.method.name.text}"
+        line = f"{node.file}:{node.line}: {description} -> {handler}"
+        if deoptimizations:
+            line += f" (deoptimized {deoptimizations} times)"
+        lines.append(line)
+    return "\n".join(lines)
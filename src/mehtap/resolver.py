@@ -0,0 +1,411 @@
+"""Resolution of the names in an abstract syntax tree.
+
+The resolver walks a :class:`~mehtap.ast_nodes.Chunk` once and decides,
+for every name that is declared or used in it,
+where the variable lives at run time:
+
+* in a *local* slot of the frame of the function that is running,
+* in an *upvalue* of the function that is running,
+  that is, in a slot of the frame of an enclosing function,
+* or nowhere that is known statically,
+  in which case the name is looked up in the scope chain and the globals.
+
+The tree-walking interpreter asks the resolver to write the results into the
+:class:`~mehtap.ast_nodes.Name` nodes themselves
+(see :meth:`~mehtap.ast_nodes.Name.set_address`),
+so that variables are found by their index instead of their name.
+"""
+
+from __future__ import annotations
+
+import enum
+
+import attrs
+
+import mehtap.ast_nodes as nodes
+
+
+class NameKind(enum.Enum):
+    """NameKind(value)
+    Enumeration of the places that a variable can be found in.
+    """
+
+    LOCAL = "local"
+    """A slot in the frame of the running function."""
+    UPVALUE = "upvalue"
+    """A slot in the frame of an enclosing function."""
+    GLOBAL = "global"
+    """A name that is looked up in the scope chain and the global table."""
+
+
+@attrs.define(slots=True, eq=False)
+class LocalVariable:
+    """A local variable declaration."""
+
+    name: str
+    """The name of the variable."""
+    slot: int
+    """The index of the variable in the frame of its function."""
+    attrib: str | None = None
+    """The attribute of the variable, ``"const"`` or ``"close"``."""
+    captured: bool = False
+    """Whether a nested function refers to the variable."""
+    exported: bool = False
+    """Whether the variable is also put in the scope that the chunk runs in,
+    by name."""
+
+
+@attrs.define(slots=True, eq=False)
+class Upvalue:
+    """Describes how a function captures a variable when it is created."""
+
+    variable: LocalVariable
+    """The captured variable."""
+    in_parent_frame: bool
+    """Whether the variable is a local of the immediately enclosing function.
+
+    If not, the variable is an upvalue of the enclosing function.
+    """
+    index: int
+    """The slot of the variable in the frame of the enclosing function if
+    :attr:`in_parent_frame` is :data:`True`, otherwise the index of the
+    upvalue in the enclosing function's upvalues."""
+
+
+@attrs.define(slots=True, eq=False)
+class FunctionInfo:
+    """The result of resolving a function body or a chunk."""
+
+    parent: FunctionInfo | None
+    """The function that the function is defined in."""
+    parameters: list[LocalVariable] = attrs.field(factory=list)
+    """The parameters of the function, in order."""
+    slot_count: int = 0
+    """The number of slots the frame of the function needs."""
+    upvalues: list[Upvalue] = attrs.field(factory=list)
+    """The variables of enclosing functions that the function refers to."""
+    _upvalue_indices: dict[int, int] = attrs.field(factory=dict, repr=False)
+
+    @property
+    def depth(self) -> int:
+        """The number of functions that the function is nested in."""
+        depth = 0
+        function = self.parent
+        while function is not None:
+            depth += 1
+            function = function.parent
+        return depth
+
+    def new_slot(self) -> int:
+        slot = self.slot_count
+        self.slot_count += 1
+        return slot
+
+    def upvalue_index(self, variable: LocalVariable, owner: FunctionInfo) \
+            -> int:
+        """
+        :return: The index of the upvalue of this function that refers to
+                 *variable*, which is a local of *owner*.
+        """
+        key = id(variable)
+        if key in self._upvalue_indices:
+            return self._upvalue_indices[key]
+        if self.parent is owner:
+            upvalue = Upvalue(variable, True, variable.slot)
+        else:
+            upvalue = Upvalue(
+                variable, False, self.parent.upvalue_index(variable, owner)
+            )
+        index = len(self.upvalues)
+        self.upvalues.append(upvalue)
+        self._upvalue_indices[key] = index
+        return index
+
+
+@attrs.define(slots=True, eq=False)
+class NameResolution:
+    """Where a use of a name refers to."""
+
+    kind: NameKind
+    """Where the variable is found."""
+    name: str
+    """The name of the variable."""
+    variable: LocalVariable | None = None
+    """The variable, if it is not a global."""
+    index: int = -1
+    """The slot of the variable for :attr:`NameKind.LOCAL`,
+    the index of the upvalue for :attr:`NameKind.UPVALUE`."""
+    depth: int = 0
+    """The number of functions between the use and the declaration of the
+    variable."""
+
+
+@attrs.define(slots=True, eq=False)
+class Resolution:
+    """The result of resolving a chunk.
+
+    Nodes are identified by their :func:`id`,
+    so the chunk must be kept alive while the resolution is used.
+    """
+
+    chunk: nodes.Chunk
+    """The chunk that was resolved."""
+    declarations: dict[int, LocalVariable] = attrs.field(factory=dict)
+    """Variables keyed by the :class:`~mehtap.ast_nodes.Name` nodes that
+    declare them."""
+    names: dict[int, NameResolution] = attrs.field(factory=dict)
+    """Resolutions keyed by the :class:`~mehtap.ast_nodes.Name` nodes that
+    use them."""
+    functions: dict[int, FunctionInfo] = attrs.field(factory=dict)
+    """Functions keyed by :class:`~mehtap.ast_nodes.FuncBody` and
+    :class:`~mehtap.ast_nodes.Chunk` nodes."""
+
+    def declaration(self, name: nodes.Name) -> LocalVariable:
+        return self.declarations[id(name)]
+
+    def use(self, name: nodes.Name) -> NameResolution:
+        return self.names[id(name)]
+
+    def function(self, node: nodes.FuncBody | nodes.Chunk) -> FunctionInfo:
+        return self.functions[id(node)]
+
+
+class _Resolver:
+    def __init__(
+        self,
+        resolution: Resolution,
+        export_chunk_locals: bool,
+        annotate: bool,
+    ):
+        self.resolution = resolution
+        self.export_chunk_locals = export_chunk_locals
+        self.annotate = annotate
+        # Each block scope is a dictionary of names to variables,
+        # paired with the function that it belongs to.
+        self.scopes: list[tuple[dict[str, LocalVariable], FunctionInfo]] = []
+        self.function: FunctionInfo | None = None
+
+    def declare(
+        self,
+        name: nodes.Name,
+        attrib: str | None = None,
+    ) -> LocalVariable:
+        scope, function = self.scopes[-1]
+        variable = LocalVariable(name.name.text, function.new_slot(), attrib)
+        if (
+            self.export_chunk_locals
+            and function.parent is None
+            and len(self.scopes) == 1
+        ):
+            # The variable is shared with the scope, so it needs a cell.
+            variable.exported = True
+            variable.captured = True
+        scope[variable.name] = variable
+        self.resolution.declarations[id(name)] = variable
+        if self.annotate:
+            name.set_address(0, variable.slot, variable.exported, False)
+        return variable
+
+    def use(self, name: nodes.Name) -> None:
+        text = name.name.text
+        for scope, owner in reversed(self.scopes):
+            variable = scope.get(text)
+            if variable is None:
+                continue
+            if owner is self.function:
+                resolution = NameResolution(
+                    NameKind.LOCAL, text, variable, variable.slot
+                )
+            else:
+                variable.captured = True
+                resolution = NameResolution(
+                    NameKind.UPVALUE,
+                    text,
+                    variable,
+                    self.function.upvalue_index(variable, owner),
+                    self.function.depth - owner.depth,
+                )
+            self.resolution.names[id(name)] = resolution
+            if self.annotate:
+                name.set_address(
+                    resolution.depth,
+                    variable.slot,
+                    variable.exported,
+                    variable.attrib == "const",
+                )
+            return
+        self.resolution.names[id(name)] = NameResolution(NameKind.GLOBAL, text)
+        if self.annotate:
+            name.set_address(-1, -1, False, False)
+
+    def chunk(self, chunk: nodes.Chunk) -> None:
+        self.function = FunctionInfo(None)
+        self.resolution.functions[id(chunk)] = self.function
+        self.block(chunk.block)
+        if self.annotate:
+            chunk.block.frame_size = self.function.slot_count
+
+    def block(self, block: nodes.Block, *, new_scope: bool = True) -> None:
+        if new_scope:
+            self.scopes.append(({}, self.function))
+        for statement in block.statements:
+            self.statement(statement)
+        if block.return_statement is not None:
+            for expression in block.return_statement.values:
+                self.expression(expression)
+        if new_scope:
+            self.scopes.pop()
+
+    def function_body(
+        self,
+        body: nodes.FuncBody,
+        *,
+        method: bool = False,
+    ) -> None:
+        parent = self.function
+        self.function = FunctionInfo(parent)
+        self.resolution.functions[id(body)] = self.function
+        self.scopes.append(({}, self.function))
+        if method:
+            self_variable = LocalVariable("self", self.function.new_slot())
+            self.scopes[-1][0]["self"] = self_variable
+            self.function.parameters.append(self_variable)
+        for param in body.params:
+            self.function.parameters.append(self.declare(param))
+        self.block(body.body)
+        self.scopes.pop()
+        if self.annotate:
+            body.body.frame_size = self.function.slot_count
+        self.function = parent
+
+    def statement(self, statement: nodes.Statement) -> None:
+        if isinstance(statement, nodes.LocalAssignment):
+            # The expressions are None if no values are assigned.
+            for expression in statement.exprs or ():
+                self.expression(expression)
+            for attname in statement.names:
+                attrib = attname.attrib
+                self.declare(
+                    attname.name,
+                    attrib.name.text if attrib is not None else None,
+                )
+        elif isinstance(statement, nodes.LocalFunctionStatement):
+            self.declare(statement.name)
+            self.function_body(statement.body)
+        elif isinstance(statement, nodes.FunctionStatement):
+            self.use(statement.name.names[0])
+            self.function_body(statement.body, method=statement.name.method)
+        elif isinstance(statement, nodes.Assignment):
+            for expression in statement.exprs:
+                self.expression(expression)
+            for variable in statement.names:
+                self.expression(variable)
+        elif isinstance(statement, (nodes.FuncCallRegular,
+                                    nodes.FuncCallMethod)):
+            self.expression(statement)
+        elif isinstance(statement, nodes.Do):
+            self.block(statement.block)
+        elif isinstance(statement, nodes.While):
+            self.expression(statement.condition)
+            self.block(statement.block)
+        elif isinstance(statement, nodes.Repeat):
+            # The condition can refer to local variables declared inside the
+            # loop block.
+            self.scopes.append(({}, self.function))
+            self.block(statement.block, new_scope=False)
+            self.expression(statement.condition)
+            self.scopes.pop()
+        elif isinstance(statement, nodes.If):
+            for condition, block in statement.blocks:
+                self.expression(condition)
+                self.block(block)
+            if statement.else_block is not None:
+                self.block(statement.else_block)
+        elif isinstance(statement, nodes.For):
+            self.expression(statement.start)
+            self.expression(statement.stop)
+            if statement.step is not None:
+                self.expression(statement.step)
+            self.scopes.append(({}, self.function))
+            self.declare(statement.name)
+            self.block(statement.block, new_scope=False)
+            self.scopes.pop()
+        elif isinstance(statement, nodes.ForIn):
+            for expression in statement.exprs:
+                self.expression(expression)
+            self.scopes.append(({}, self.function))
+            for name in statement.names:
+                self.declare(name)
+            self.block(statement.block, new_scope=False)
+            self.scopes.pop()
+        elif isinstance(statement, nodes.Block):
+            self.block(statement)
+        elif isinstance(statement, (nodes.EmptyStatement, nodes.Label,
+                                    nodes.Break, nodes.Goto)):
+            pass
+        else:
+            raise TypeError(f"unexpected statement {statement!r}")
+
+    def expression(self, expression: nodes.Expression) -> None:
+        if isinstance(expression, nodes.VarName):
+            self.use(expression.name)
+        elif isinstance(expression, nodes.VarIndex):
+            self.expression(expression.base)
+            self.expression(expression.index)
+        elif isinstance(expression, nodes.FuncCallRegular):
+            self.expression(expression.name)
+            for arg in expression.args:
+                self.expression(arg)
+        elif isinstance(expression, nodes.FuncCallMethod):
+            self.expression(expression.object)
+            for arg in expression.args:
+                self.expression(arg)
+        elif isinstance(expression, nodes.BinaryOperation):
+            self.expression(expression.lhs)
+            self.expression(expression.rhs)
+        elif isinstance(expression, nodes.UnaryOperation):
+            self.expression(expression.exp)
+        elif isinstance(expression, nodes.ParenExpression):
+            self.expression(expression.exp)
+        elif isinstance(expression, nodes.FuncDef):
+            self.function_body(expression.body)
+        elif isinstance(expression, nodes.FuncBody):
+            self.function_body(expression)
+        elif isinstance(expression, nodes.TableConstructor):
+            for field in expression.fields:
+                if (
+                    isinstance(field, nodes.FieldWithKey)
+                    and isinstance(field.key, nodes.Expression)
+                ):
+                    self.expression(field.key)
+                self.expression(field.value)
+        else:
+            # Literals and the vararg expression refer to no names.
+            pass
+
+
+def resolve(
+    chunk: nodes.Chunk,
+    *,
+    export_chunk_locals: bool = True,
+    annotate: bool = False,
+) -> Resolution:
+    """Resolve the names in a chunk.
+
+    :param chunk: The chunk to resolve.
+    :param export_chunk_locals: Whether the local variables declared in the
+                                outermost block of the chunk are also put in
+                                the scope that the chunk runs in,
+                                by name.
+                                This keeps them visible to later chunks that
+                                run in the same scope,
+                                like in :meth:`VirtualMachine.exec`.
+    :param annotate: Whether to also store where each variable lives in the
+                     :class:`~mehtap.ast_nodes.Name` nodes of the chunk,
+                     and the number of slots each function needs in
+                     :attr:`Block.frame_size <mehtap.ast_nodes.Block.frame_size>`
+                     of its body.
+    """
+    resolution = Resolution(chunk)
+    _Resolver(resolution, export_chunk_locals, annotate).chunk(chunk)
+    return resolution
@@ -1,20 +1,22 @@
 from __future__ import annotations
 
 from abc import ABC, abstractmethod
-from io import SEEK_SET
-from os import PathLike
+from collections.abc import Mapping
+from os import PathLike, fsdecode
+from types import MappingProxyType
 from os.path import basename
 from typing import TypeVar, TYPE_CHECKING
 
 import attrs
-from lark.exceptions import VisitError
 
-from mehtap.ast_transformer import transformer
+from mehtap.chunk_cache import load_chunk_file
 from mehtap.control_structures import LuaError
-from mehtap.parser import expr_parser, chunk_parser
+from mehtap.execution import evaluate_expression, execute_chunk
+from mehtap.parser import parse_chunk, parse_expression
 from mehtap.values import LuaString, Variable, LuaValue
 
 if TYPE_CHECKING:
+    from mehtap.ast_nodes import Chunk
     from mehtap.vm import VirtualMachine
     from mehtap.py2lua import Py2LuaAccepts
 
@@ -84,6 +86,9 @@ class Scope(ExecutionContext):
     varargs: list[LuaValue] | None = None
     file: str | None = None
     line: int | None = None
+    # The local variables of the running function, indexed by the slots that
+    # mehtap.resolver assigned to them.
+    slots: list[LuaValue | Variable] | None = None
 
     def push(
         self,
@@ -93,44 +98,50 @@ class Scope(ExecutionContext):
     ) -> Scope:
         return Scope(self.vm, self, file=file, line=line)
 
+    def frame(
+        self,
+        slots: list[LuaValue | Variable],
+        varargs: list[LuaValue] | None = None,
+    ) -> Frame:
+        """Make the scope of a call of a function defined in this scope.
+
+        :param slots: The local variables of the function,
+                      beginning with its parameters.
+        :param varargs: The extra arguments of a variadic function.
+        """
+        return Frame(self, slots, varargs)
+
     def eval(self, expr: str):
-        parsed_lua = expr_parser.parse(expr)
-        try:
-            ast = transformer.transform(parsed_lua, filename="<eval>")
-        except VisitError as e:
-            le = LuaError(
-                LuaString(str(e.orig_exc).encode("utf-8")),
-                caused_by=e,
-            )
-            raise le from e
+        ast = parse_expression(
+            expr,
+            filename="<eval>",
+            backend=self.vm.parser_backend,
+            optimize=self.vm.optimize,
+        )
         try:
-            r = ast.evaluate(self)
+            with self.vm.running_lua():
+                return evaluate_expression(ast, self)
         except Exception as e:
             le = LuaError(
                 LuaString(str(e).encode("utf-8")),
                 caused_by=e,
             )
             raise le from e
-        if isinstance(r, LuaValue):
-            return [r]
-        return r
 
     def exec(self, chunk: str, *, filename: str | None = None) \
             -> list[LuaValue]:
-        parsed_lua = chunk_parser.parse(chunk)
-        try:
-            ast = transformer.transform(
-                parsed_lua,
-                filename=filename or "<exec>"
-            )
-        except VisitError as e:
-            le = LuaError(
-                LuaString(str(e.orig_exc).encode("utf-8")),
-                caused_by=e,
-            )
-            raise le from e
+        ast = parse_chunk(
+            chunk,
+            filename=filename or "<exec>",
+            backend=self.vm.parser_backend,
+            optimize=self.vm.optimize,
+        )
+        return self._exec_chunk(ast)
+
+    def _exec_chunk(self, ast: Chunk) -> list[LuaValue]:
         try:
-            r = ast.block.evaluate_without_inner_scope(self)
+            with self.vm.running_lua():
+                r = execute_chunk(ast, self)
         except Exception as e:
             le = LuaError(
                 LuaString(str(e).encode("utf-8")),
@@ -140,25 +151,23 @@ class Scope(ExecutionContext):
         return r
 
     def exec_file(self, file_path: AnyPath) -> list[LuaValue]:
+        if isinstance(file_path, int):
+            filename_str = f"<fd {file_path}>"
+        else:
+            filename_str = basename(fsdecode(file_path))
         try:
-            f = open(file_path, "r", encoding="utf-8")
+            ast = load_chunk_file(self.vm, file_path, filename=filename_str)
+            return self._exec_chunk(ast)
         except FileNotFoundError as e:
             raise LuaError(str(e))
-        with f:
-            if f.read(1) == "#":
-                f.readline()
-            f.seek(0, SEEK_SET)
-            filename_str = basename(file_path)
-            try:
-                return self.exec(f.read(), filename=filename_str)
-            except LuaError as le:
-                le.push_tb("main chunk", file=filename_str, line=0)
-                raise le
-            except Exception as e:
-                raise LuaError(
-                    LuaString(str(e).encode("utf-8")),
-                    caused_by=e,
-                )
+        except LuaError as le:
+            le.push_tb("main chunk", file=filename_str, line=0)
+            raise le
+        except Exception as e:
+            raise LuaError(
+                LuaString(str(e).encode("utf-8")),
+                caused_by=e,
+            )
 
     def __repr__(self):
         cls_name = self.__class__.__name__
@@ -200,9 +209,43 @@ class Scope(ExecutionContext):
         if key in self.locals:
             if self.locals[key].constant:
                 raise LuaError("attempt to change constant variable")
-            self.locals[key] = Variable(value)
+            # Compiled code may share the variable, so it is changed in place.
+            self.locals[key].value = value
             return
         if self.parent is None:
             self.vm.globals.rawput(key, value)
             return
         return self.parent.put_nonlocal_ls(key, value)
+
+
+_NO_LOCALS: Mapping[LuaString, Variable] = MappingProxyType({})
+
+
+@attrs.define(slots=True, repr=False, init=False)
+class Frame(Scope):
+    """The scope of a call of a Lua function whose names are resolved.
+
+    The local variables of the function are in :attr:`slots`,
+    so a frame has no dictionary of local variables until one is put in it,
+    and a frame is made for every call without the initializer of
+    :class:`Scope`.
+    """
+
+    def __init__(
+        self,
+        parent: Scope,
+        slots: list[LuaValue | Variable],
+        varargs: list[LuaValue] | None = None,
+    ):
+        self.vm = parent.vm
+        self.parent = parent
+        self.locals = _NO_LOCALS
+        self.varargs = varargs
+        self.file = None
+        self.line = None
+        self.slots = slots
+
+    def put_local_ls(self, key: LuaString, variable: Variable):
+        if self.locals is _NO_LOCALS:
+            self.locals = {}
+        super().put_local_ls(key, variable)
@@ -0,0 +1,947 @@
+"""Compilation of hot Lua functions to Python code.
+
+The tree-walking interpreter counts the calls of every
+:class:`~mehtap.values.LuaFunction` in
+:attr:`~mehtap.values.LuaFunction.call_count`.
+Once a function has been called :data:`HOT_CALL_COUNT` times,
+the body of the function is translated to the source code of a Python
+function, which is compiled with :func:`compile` and kept in
+:attr:`Block.compiled <mehtap.ast_nodes.Block.compiled>`,
+so that later calls of every function with that body run the Python function
+instead of interpreting the block.
+
+In the Python function,
+the local variables of the Lua function are Python local variables,
+operators are direct calls to the functions of :mod:`mehtap.operations`,
+and the control structures of Lua are the ones of Python.
+Upvalues are read from the frames of the enclosing functions,
+and global variables are looked up in the scope that the function was
+created in, like the interpreter does.
+
+A ``goto`` to a label at the end of the body of the loop it is in is a
+``continue`` statement.
+Function bodies that use something else that doesn't map to Python local
+variables and control flow,
+like other ``goto`` statements, ``...``, nested functions or ``<close>``
+variables,
+are not compiled and stay interpreted.
+:func:`python_source` returns the code a function is compiled to.
+"""
+
+from __future__ import annotations
+
+import linecache
+from collections.abc import Callable, Sequence
+from typing import TYPE_CHECKING
+
+import attrs
+
+import mehtap.ast_nodes as nodes
+from mehtap.ast_nodes import (
+    BinaryOperator,
+    UnaryOperator,
+    binary_operator_functions,
+    unary_operator_functions,
+)
+from mehtap.closure_compiler import (
+    _COMPARISON_OPERATORS,
+    ClosureFunction,
+    _call_other,
+    _finish_tail_calls,
+)
+from mehtap.control_structures import LuaError, TailCall
+from mehtap.library.stdlib.basic_library import native_table_step
+from mehtap.operations import (
+    call,
+    coerce_int_to_float,
+    index,
+    new_index,
+)
+from mehtap.quickening import _walk
+from mehtap.values import (
+    LuaFalse,
+    LuaFunction,
+    LuaIndexableABC,
+    LuaNil,
+    LuaNumber,
+    LuaNumberType,
+    LuaString,
+    LuaTable,
+    LuaTrue,
+    LuaValue,
+    MAX_INT64,
+    MIN_INT64,
+    finish_tail_calls,
+    lua_integer,
+    type_of_lv,
+)
+
+if TYPE_CHECKING:
+    from mehtap.scope import Scope
+
+
+CompiledFunction = Callable[
+    [LuaFunction, list[LuaValue]], "list[LuaValue] | TailCall"
+]
+"""A compiled function body.
+
+It takes the function that is called and its arguments,
+of which there are at least as many as the function has parameters,
+and returns the values the function returns,
+or the tail call that it ends with.
+"""
+
+HOT_CALL_COUNT = 100
+"""How many times a function has to be called before its body is
+compiled."""
+
+
+def count_call(function: LuaFunction) -> CompiledFunction | None:
+    """Count a call of a function whose body is interpreted,
+    and compile the body once the function is hot.
+
+    :return: The compiled body, if the function should be run compiled from
+             now on.
+    """
+    function.call_count += 1
+    if function.call_count < HOT_CALL_COUNT:
+        return None
+    if function.parent_scope.vm.verbose_tb:
+        # Compiled code doesn't add its statements and expressions to
+        # tracebacks.
+        return None
+    return compile_function(function) or None
+
+
+def compile_function(function: LuaFunction) -> CompiledFunction | bool:
+    """Compile the body of a Lua function and keep the result in
+    :attr:`Block.compiled <mehtap.ast_nodes.Block.compiled>`.
+
+    :return: The compiled body,
+             or :data:`False` if it can't be compiled.
+    """
+    block = function.block
+    if block.compiled is not None:
+        return block.compiled
+    try:
+        source, namespace, name = _translate(function)
+        filename = f"<compiled {name}>"
+        code = compile(source, filename, "exec")
+    except (_Unsupported, SyntaxError, RecursionError):
+        # SyntaxError is raised for code that Python can't nest deep enough.
+        block.compiled = False
+        return False
+    # Let tracebacks of Python exceptions show the compiled code.
+    linecache.cache[filename] = (
+        len(source), None, source.splitlines(True), filename
+    )
+    exec(code, namespace)
+    block.compiled = namespace[name]
+    return block.compiled
+
+
+def python_source(function: LuaFunction) -> str | None:
+    """
+    :return: The source code of the Python function that the body of
+             *function* is compiled to,
+             or :data:`None` if it can't be compiled.
+    """
+    try:
+        return _translate(function)[0]
+    except _Unsupported:
+        return None
+
+
+def discard_compiled(root: nodes.Node) -> None:
+    """Forget the compiled code of every function body in the tree of
+    *root*.
+
+    Used when the names of a chunk are resolved again,
+    since compiled code refers to variables by the slots they were in.
+    """
+    for node in _walk(root):
+        if node.__class__ is nodes.Block:
+            node.compiled = None
+
+
+class _Unsupported(Exception):
+    """Raised for code that can't be compiled."""
+
+
+def _translate(function: LuaFunction) -> tuple[str, dict, str]:
+    block = function.block
+    if function.variadic:
+        raise _Unsupported("variadic function")
+    if block.frame_size is None:
+        raise _Unsupported("names are not resolved")
+    name = "lua_" + "".join(
+        c if c.isalnum() or c == "_" else "_"
+        for c in str(function.name or "function")
+    )
+    translator = _Translator()
+    params = [
+        f"{param.content.decode('ascii')}_{slot}"
+        for slot, param in enumerate(function.param_names)
+    ]
+    translator.indent = 1
+    translator.block(block)
+    translator.emit("return []")
+    body = translator.lines
+    prologue = [f"def {name}(function, args):"]
+    for param_slot, param in enumerate(params):
+        prologue.append(f"    {param} = args[{param_slot}]")
+    prologue.append("    scope = function.parent_scope")
+    for depth in range(2, translator.max_depth + 1):
+        prologue.append(f"    {_frame(depth)} = {_frame(depth - 1)}.parent")
+    source = "\n".join(prologue + body) + "\n"
+    return source, {**_RUNTIME, **translator.namespace}, name
+
+
+def _frame(depth: int) -> str:
+    # The name of the scope of the function that is depth functions outside
+    # the compiled one.
+    return "scope" if depth == 1 else f"_up{depth}"
+
+
+_MULTIRES_NODES = (
+    nodes.FuncCallRegular,
+    nodes.FuncCallMethod,
+    nodes.VarArgExpr,
+)
+
+
+class _Translator:
+    """Translates a function body to the lines of a Python function."""
+
+    tail_calls = True
+    """Whether a ``return`` statement with a single call returns a
+    :class:`~mehtap.control_structures.TailCall` instead of making the call.
+    """
+
+    def __init__(self):
+        self.lines: list[str] = []
+        self.indent = 0
+        self.namespace: dict[str, object] = {}
+        self._names: dict[int, str] = {}
+        self._temporaries = 0
+        self.max_depth = 1
+        # The blocks that the statement being translated is in,
+        # and the bodies of the loops that it is in,
+        # with None for repeat loops, whose condition a continue would skip.
+        self.blocks: list[nodes.Block] = []
+        self.loops: list[nodes.Block | None] = []
+
+    def emit(self, line: str) -> None:
+        self.lines.append("    " * self.indent + line)
+
+    def constant(self, value: object) -> str:
+        """
+        :return: The name that *value* has in the namespace of the compiled
+                 code.
+        """
+        name = self._names.get(id(value))
+        if name is None:
+            name = f"_k{len(self._names)}"
+            self._names[id(value)] = name
+            self.namespace[name] = value
+        return name
+
+    def temporary(self) -> str:
+        self._temporaries += 1
+        return f"_t{self._temporaries}"
+
+    def call_site(
+        self,
+        expression: nodes.FuncCallRegular | nodes.FuncCallMethod,
+    ) -> str:
+        """
+        :return: The name of what a call adds to the tracebacks of errors that
+                 pass through it.
+        """
+        return self.constant(expression)
+
+    # region Blocks and statements
+
+    def block(self, block: nodes.Block) -> None:
+        start = len(self.lines)
+        self.blocks.append(block)
+        for statement in block.statements:
+            method = getattr(self, f"stat_{type(statement).__name__}", None)
+            if method is None:
+                raise _Unsupported(type(statement).__name__)
+            method(statement)
+        if block.return_statement is not None:
+            self.stat_ReturnStatement(block.return_statement)
+        self.blocks.pop()
+        if len(self.lines) == start:
+            self.emit("pass")
+
+    def indented_block(
+        self,
+        block: nodes.Block,
+        declared: Sequence[nodes.Name] = (),
+    ) -> None:
+        self.indent += 1
+        self.declared(declared)
+        self.block(block)
+        self.indent -= 1
+
+    def loop_body(
+        self,
+        block: nodes.Block,
+        declared: Sequence[nodes.Name] = (),
+        *,
+        can_continue: bool = True,
+    ) -> None:
+        self.loops.append(block if can_continue else None)
+        self.indented_block(block, declared)
+        self.loops.pop()
+
+    def stat_Block(self, block: nodes.Block) -> None:
+        self.block(block)
+
+    def stat_Do(self, statement: nodes.Do) -> None:
+        self.block(statement.block)
+
+    def stat_EmptyStatement(self, statement: nodes.EmptyStatement) -> None:
+        pass
+
+    def stat_Break(self, statement: nodes.Break) -> None:
+        self.emit("break")
+
+    def stat_Label(self, statement: nodes.Label) -> None:
+        pass
+
+    def stat_Goto(self, statement: nodes.Goto) -> None:
+        label = statement.name.name.text
+        for block in reversed(self.blocks):
+            if label in block.labels:
+                break
+        else:
+            raise _Unsupported(f"goto {label} on line {statement.line}")
+        if not self.loops or block is not self.loops[-1]:
+            raise _Unsupported(f"goto {label} on line {statement.line}")
+        following = block.statements[block.labels[label] + 1:]
+        if block.return_statement is not None or any(
+            s.__class__ not in (nodes.Label, nodes.EmptyStatement)
+            for s in following
+        ):
+            raise _Unsupported(f"goto {label} on line {statement.line}")
+        self.emit("continue")
+
+    def stat_ReturnStatement(self, statement: nodes.ReturnStatement) -> None:
+        values = statement.values
+        if self.tail_calls and len(values) == 1 and isinstance(
+            values[0], (nodes.FuncCallRegular, nodes.FuncCallMethod)
+        ):
+            function, args = self.call(values[0])
+            site = self.call_site(values[0])
+            self.emit(f"return TailCall({function}, {args}, {site}, scope)")
+        elif len(values) == 1 and isinstance(values[0], _MULTIRES_NODES):
+            self.emit(f"return {self.multires(values[0])}")
+        else:
+            self.emit(f"return {self.value_list(values)}")
+
+    def stat_FuncCallRegular(self, statement: nodes.FuncCallRegular) -> None:
+        self.emit(self.multires(statement))
+
+    stat_FuncCallMethod = stat_FuncCallRegular
+
+    def stat_While(self, statement: nodes.While) -> None:
+        self.emit(f"while {self.condition(statement.condition)}:")
+        self.loop_body(statement.block)
+
+    def stat_Repeat(self, statement: nodes.Repeat) -> None:
+        self.emit("while True:")
+        self.loop_body(statement.block, can_continue=False)
+        # The condition can refer to the local variables of the block.
+        self.indent += 1
+        self.emit(f"if {self.condition(statement.condition)}:")
+        self.emit("    break")
+        self.indent -= 1
+
+    def stat_If(self, statement: nodes.If) -> None:
+        dispatch = statement.dispatch
+        if dispatch is not None:
+            self.emit(
+                f"_arm = _dispatch({self.expression(dispatch.subject)}, "
+                f"{self.constant(dispatch.arms)})"
+            )
+        keyword = "if"
+        for i, (condition, block) in enumerate(statement.blocks):
+            if dispatch is not None:
+                self.emit(f"{keyword} _arm == {i}:")
+            else:
+                self.emit(f"{keyword} {self.condition(condition)}:")
+            self.indented_block(block)
+            keyword = "elif"
+        if statement.else_block is not None:
+            self.emit("else:")
+            self.indented_block(statement.else_block)
+
+    def stat_For(self, statement: nodes.For) -> None:
+        start = self.expression(statement.start)
+        stop = self.expression(statement.stop)
+        step = (
+            self.expression(statement.step)
+            if statement.step is not None
+            else "None"
+        )
+        variable = self.local(statement.name)
+        self.emit(f"for {variable} in _numeric_for({start}, {stop}, {step}):")
+        self.loop_body(statement.block, [statement.name])
+
+    def stat_ForIn(self, statement: nodes.ForIn) -> None:
+        variables = [self.local(name) for name in statement.names]
+        values = self.value_list(statement.exprs)
+        self.emit(
+            f"for {', '.join(variables)}, in "
+            f"_generic_for({values}, scope, {len(variables)}):"
+        )
+        self.loop_body(statement.block, statement.names)
+
+    def stat_LocalAssignment(self, statement: nodes.LocalAssignment) -> None:
+        for attname in statement.names:
+            if (
+                attname.attrib is not None
+                and attname.attrib.name.text not in self.attribs
+            ):
+                raise _Unsupported(f"<{attname.attrib.name.text}> variables")
+        self.assign(
+            [self.local(attname.name) for attname in statement.names],
+            statement.exprs or (),
+        )
+        self.declared([attname.name for attname in statement.names])
+
+    def stat_Assignment(self, statement: nodes.Assignment) -> None:
+        targets = statement.names
+        if all(
+            target.__class__ is nodes.VarName and self.is_local(target.name)
+            for target in targets
+        ):
+            self.assign(
+                [self.local(target.name) for target in targets],
+                statement.exprs,
+            )
+            return
+        # The values are assigned after all of them are evaluated.
+        temporaries = [self.temporary() for _ in targets]
+        self.assign(temporaries, statement.exprs)
+        for target, value in zip(targets, temporaries):
+            if target.__class__ is nodes.VarName:
+                self.store(target.name, value)
+            else:
+                self.emit(
+                    f"_set_index({self.expression(target.base)}, "
+                    f"{self.expression(target.index)}, {value})"
+                )
+
+    def assign(
+        self,
+        targets: list[str],
+        expressions: Sequence[nodes.Expression],
+    ) -> None:
+        """Emit the assignment of a list of expressions to Python variables,
+        adjusting the values to the number of variables.
+        """
+        count = len(targets)
+        expressions = list(expressions)
+        if (
+            expressions
+            and isinstance(expressions[-1], _MULTIRES_NODES)
+            and len(expressions) <= count
+        ):
+            last = self.multires(expressions.pop())
+            values = [self.expression(e) for e in expressions]
+            if not values:
+                if count == 1:
+                    self.emit(f"{targets[0]} = _first({last})")
+                else:
+                    self.emit(f"{', '.join(targets)} = _fit({last}, {count})")
+                return
+            values.append(f"*_fit({last}, {count - len(values)})")
+        else:
+            values = [self.expression(e) for e in expressions]
+            values.extend(["NIL"] * (count - len(values)))
+            # Extra values are evaluated and thrown away.
+            targets = targets + ["_"] * (len(values) - count)
+        self.emit(f"{', '.join(targets)} = {', '.join(values)}")
+
+    # endregion
+
+    # region Variables
+
+    attribs = ("const",)
+    """The attributes that local variables can have."""
+
+    @staticmethod
+    def is_local(name: nodes.Name) -> bool:
+        """
+        :return: Whether a variable is a Python variable that can be assigned
+                 to.
+        """
+        return (
+            name.depth == 0
+            and name.slot >= 0
+            and not name.exported
+            and not name.constant
+        )
+
+    def declared(self, names: Sequence[nodes.Name]) -> None:
+        """Emit what has to be done after local variables get their first
+        values."""
+
+    def local(self, name: nodes.Name) -> str:
+        """:return: The Python variable of a local variable."""
+        if name.depth != 0 or name.slot < 0 or name.exported:
+            raise _Unsupported(f"variable {name.name.text}")
+        return f"{name.name.text}_{name.slot}"
+
+    def upvalue(self, name: nodes.Name) -> str:
+        """:return: The Python expression of an upvalue."""
+        self.max_depth = max(self.max_depth, name.depth)
+        slot = f"{_frame(name.depth)}.slots[{name.slot}]"
+        if name.exported:
+            return f"{slot}.value"
+        return slot
+
+    def load(self, name: nodes.Name) -> str:
+        if name.depth < 0:
+            return f"scope.get_ls({self.constant(name.as_lua_string())})"
+        if name.depth == 0:
+            return self.local(name)
+        return self.upvalue(name)
+
+    def store(self, name: nodes.Name, value: str) -> None:
+        if name.depth < 0:
+            key = self.constant(name.as_lua_string())
+            self.emit(f"scope.put_nonlocal_ls({key}, {value})")
+        elif name.constant:
+            self.emit("_store_constant()")
+        elif name.depth == 0:
+            self.emit(f"{self.local(name)} = {value}")
+        else:
+            self.emit(f"{self.upvalue(name)} = {value}")
+
+    # endregion
+
+    # region Expressions
+
+    def expression(self, expression: nodes.Expression) -> str:
+        """
+        :return: A Python expression that evaluates the expression adjusted to
+                 one value.
+        """
+        method = getattr(self, f"exp_{type(expression).__name__}", None)
+        if method is None:
+            raise _Unsupported(type(expression).__name__)
+        return method(expression)
+
+    def multires(self, expression: nodes.Expression) -> str:
+        """
+        :return: A Python expression that evaluates the expression to a list
+                 of all of its values.
+        """
+        if expression.__class__ not in (
+            nodes.FuncCallRegular, nodes.FuncCallMethod
+        ):
+            return f"[{self.expression(expression)}]"
+        function, args = self.call(expression)
+        return f"_call({function}, {args}, scope, {self.call_site(expression)})"
+
+    def call(
+        self,
+        expression: nodes.FuncCallRegular | nodes.FuncCallMethod,
+    ) -> tuple[str, str]:
+        """
+        :return: Python expressions that evaluate the function and the list of
+                 arguments of a call.
+        """
+        if expression.__class__ is nodes.FuncCallRegular:
+            return (
+                self.expression(expression.name),
+                self.value_list(expression.args),
+            )
+        value = self.temporary()
+        method = self.constant(expression.method.as_lua_string())
+        function = (
+            f"index(({value} := {self.expression(expression.object)}), "
+            f"{method})"
+        )
+        return function, self.value_list(expression.args, first=value)
+
+    def value_list(
+        self,
+        expressions: Sequence[nodes.Expression],
+        *,
+        first: str | None = None,
+    ) -> str:
+        """
+        :return: A Python expression that evaluates a list of expressions to a
+                 list of values.
+        """
+        values = [first] if first is not None else []
+        for i, expression in enumerate(expressions):
+            if (
+                i == len(expressions) - 1
+                and isinstance(expression, _MULTIRES_NODES)
+            ):
+                values.append(f"*{self.multires(expression)}")
+            else:
+                values.append(self.expression(expression))
+        return f"[{', '.join(values)}]"
+
+    def condition(self, expression: nodes.Expression) -> str:
+        """
+        :return: A Python expression that evaluates whether the expression is
+                 neither ``false`` nor ``nil``.
+        """
+        while expression.__class__ is nodes.ParenExpression:
+            expression = expression.exp
+        if expression.__class__ is nodes.BinaryOperation:
+            if expression.op in _COMPARISON_OPERATORS:
+                return f"{self.expression(expression)} is TRUE"
+            if expression.op is BinaryOperator.AND:
+                return (
+                    f"({self.condition(expression.lhs)} "
+                    f"and {self.condition(expression.rhs)})"
+                )
+            if expression.op is BinaryOperator.OR:
+                return (
+                    f"({self.condition(expression.lhs)} "
+                    f"or {self.condition(expression.rhs)})"
+                )
+        if (
+            expression.__class__ is nodes.UnaryOperation
+            and expression.op is UnaryOperator.NOT
+        ):
+            return f"(not {self.condition(expression.exp)})"
+        value = self.temporary()
+        return (
+            f"(({value} := {self.expression(expression)}) is not NIL "
+            f"and {value} is not FALSE)"
+        )
+
+    def exp_constant(self, expression: nodes.Expression) -> str:
+        return self.constant(expression._evaluate(None))
+
+    exp_NumeralDec = exp_constant
+    exp_NumeralHex = exp_constant
+    exp_NumeralConstant = exp_constant
+    exp_LiteralString = exp_constant
+    exp_ParsedLiteralLuaStringExpr = exp_constant
+
+    def exp_LiteralNil(self, expression: nodes.LiteralNil) -> str:
+        return "NIL"
+
+    def exp_LiteralTrue(self, expression: nodes.LiteralTrue) -> str:
+        return "TRUE"
+
+    def exp_LiteralFalse(self, expression: nodes.LiteralFalse) -> str:
+        return "FALSE"
+
+    def exp_ParenExpression(self, expression: nodes.ParenExpression) -> str:
+        return self.expression(expression.exp)
+
+    def exp_VarName(self, expression: nodes.VarName) -> str:
+        return self.load(expression.name)
+
+    def exp_VarIndex(self, expression: nodes.VarIndex) -> str:
+        base = self.expression(expression.base)
+        if expression.index.__class__ is nodes.ParsedLiteralLuaStringExpr:
+            key = expression.index.value
+            return (
+                f"_get_field({base}, {self.constant(key)}, "
+                f"{self.constant(key.content)})"
+            )
+        return f"_get_index({base}, {self.expression(expression.index)})"
+
+    def exp_UnaryOperation(self, expression: nodes.UnaryOperation) -> str:
+        if expression.op is UnaryOperator.NOT:
+            return f"(FALSE if {self.condition(expression.exp)} else TRUE)"
+        function = unary_operator_functions[expression.op]
+        return f"{function.__name__}({self.expression(expression.exp)})"
+
+    def exp_BinaryOperation(self, expression: nodes.BinaryOperation) -> str:
+        lhs = self.expression(expression.lhs)
+        rhs = self.expression(expression.rhs)
+        if expression.op is BinaryOperator.AND:
+            value = self.temporary()
+            return (
+                f"({rhs} if ({value} := {lhs}) is not NIL "
+                f"and {value} is not FALSE else {value})"
+            )
+        if expression.op is BinaryOperator.OR:
+            value = self.temporary()
+            return (
+                f"({value} if ({value} := {lhs}) is not NIL "
+                f"and {value} is not FALSE else {rhs})"
+            )
+        function = binary_operator_functions[expression.op]
+        return f"{function.__name__}({lhs}, {rhs})"
+
+    def exp_TableConstructor(
+        self,
+        expression: nodes.TableConstructor,
+    ) -> str:
+        fields = list(expression.fields)
+        if not fields:
+            return "LuaTable()"
+        last = None
+        if (
+            fields[-1].__class__ is nodes.FieldCounterKey
+            and isinstance(fields[-1].value, _MULTIRES_NODES)
+        ):
+            last = fields.pop()
+        items = []
+        counter = 1
+        for field in fields:
+            if field.__class__ is nodes.FieldWithKey:
+                if field.key.__class__ is nodes.Name:
+                    items.append(self.constant(field.key.as_lua_string()))
+                else:
+                    items.append(self.expression(field.key))
+            else:
+                items.append(self.constant(lua_integer(counter)))
+                counter += 1
+            items.append(self.expression(field.value))
+        items = f"({', '.join(items)},)" if items else "()"
+        if last is None:
+            return f"_new_table({items})"
+        return (
+            f"_new_table({items}, {self.multires(last.value)}, {counter})"
+        )
+
+    def _first_value(self, expression: nodes.Expression) -> str:
+        return f"_first({self.multires(expression)})"
+
+    exp_FuncCallRegular = _first_value
+    exp_FuncCallMethod = _first_value
+
+    # endregion
+
+
+# region Run-time support of compiled code
+
+def _first(values: list[LuaValue]) -> LuaValue:
+    return values[0] if values else LuaNil
+
+
+def _fit(values: list[LuaValue], count: int) -> list[LuaValue]:
+    # Adjust a list of values to a number of values.
+    given = len(values)
+    if given == count:
+        return values
+    if given > count:
+        return values[:count]
+    return [*values, *[LuaNil] * (count - given)]
+
+
+@attrs.define(slots=True, frozen=True)
+class CallSite:
+    """Where a call is in the Lua source code of translated code,
+    which has no nodes to add to tracebacks.
+    See :mod:`mehtap.module_translator`.
+    """
+
+    method: bool
+    file: str | None = None
+    line: int | None = None
+
+    def _push_tb(self, le: LuaError, function: LuaValue) -> None:
+        call = "method call" if self.method else "call"
+        le.push_tb(f"{call} of {function}", file=self.file, line=self.line)
+
+
+def _call(
+    function: LuaValue,
+    args: list[LuaValue],
+    scope: Scope,
+    node: nodes.FuncCallRegular | nodes.FuncCallMethod | CallSite,
+) -> list[LuaValue]:
+    if function.__class__ is ClosureFunction:
+        # Functions of translated modules pad their arguments themselves.
+        try:
+            r = function.entry(function, args)
+            if r.__class__ is TailCall:
+                r = _finish_tail_calls(r)
+            return r
+        except LuaError as le:
+            node._push_tb(le, function)
+            raise le
+    if function.__class__ is LuaFunction:
+        block = function.block
+        if block.__class__ is nodes.Block and block.compiled:
+            missing = len(function.param_names) - len(args)
+            if missing > 0:
+                args.extend([LuaNil] * missing)
+            try:
+                r = function._enter(args, None)
+                if r.__class__ is TailCall:
+                    r = finish_tail_calls(r)
+                return r
+            except LuaError as le:
+                node._push_tb(le, function)
+                raise le
+            except Exception as e:
+                le = LuaError(
+                    LuaString(f"{function!s}: {e!s}".encode("utf-8")),
+                    caused_by=e,
+                )
+                node._push_tb(le, function)
+                raise le from e
+    try:
+        return _call_other(function, args, scope)
+    except LuaError as le:
+        node._push_tb(le, function)
+        raise le
+
+
+def _get_field(table: LuaValue, key: LuaString, content: bytes) -> LuaValue:
+    if table.__class__ is LuaTable:
+        shape = table._shape
+        if shape is None:
+            value = table._map.get(content)
+        else:
+            slot = shape.slots.get(content)
+            value = None if slot is None else table._values[slot]
+        if value is not None and value is not LuaNil:
+            return value
+        if table._metatable is None:
+            return LuaNil
+    return index(table, key)
+
+
+def _get_index(table: LuaValue, key: LuaValue) -> LuaValue:
+    if table.__class__ is LuaTable and table._metatable is None:
+        return table.rawget(key)
+    return index(table, key)
+
+
+def _set_index(table: LuaValue, key: LuaValue, value: LuaValue) -> None:
+    if table.__class__ is LuaTable and table._metatable is None:
+        table.rawput(key, value)
+        return
+    if not isinstance(table, LuaIndexableABC):
+        raise LuaError(f"attempt to index {type_of_lv(table)} value")
+    new_index(table, key, value)
+
+
+def _dispatch(value: LuaValue, arms: dict[LuaValue, int]) -> int:
+    # The arm of an if statement with a jump table to run,
+    # or -1 for the else block.
+    cls = value.__class__
+    if cls is LuaNumber or cls is LuaString:
+        return arms.get(value, -1)
+    return -1
+
+
+def _store_constant() -> None:
+    raise LuaError("attempt to change constant variable")
+
+
+def _new_table(
+    items: tuple[LuaValue, ...],
+    values: list[LuaValue] = (),
+    counter: int = 1,
+) -> LuaTable:
+    # Create a table from its keys and values, in turn,
+    # and the values of its last positional field.
+    table = LuaTable()
+    for i in range(0, len(items), 2):
+        table.rawput(items[i], items[i + 1])
+    for counter, value in enumerate(values, start=counter):
+        table.rawput(lua_integer(counter), value)
+    return table
+
+
+def _numeric_for(start: LuaValue, stop: LuaValue, step: LuaValue | None):
+    # The values of the control variable of a numeric for loop.
+    if not isinstance(start, LuaNumber):
+        raise LuaError("the initial value must be a number")
+    if not isinstance(stop, LuaNumber):
+        raise LuaError("the limit value must be a number")
+    if step is None:
+        step = _ONE
+    elif not isinstance(step, LuaNumber):
+        raise LuaError("the step value must be a number")
+    if step.value == 0:
+        raise LuaError("step must not be zero")
+    if (
+        start.type is LuaNumberType.INTEGER
+        and step.type is LuaNumberType.INTEGER
+    ):
+        # The loop is done with integers and never wraps around.
+        last = stop.value
+        if last != last:
+            return ()
+        if step.value > 0:
+            if last.__class__ is float:
+                last = min(last, MAX_INT64) // 1
+            return map(
+                lua_integer, range(start.value, int(last) + 1, step.value)
+            )
+        if last.__class__ is float:
+            last = -(-max(last, MIN_INT64) // 1)
+        return map(lua_integer, range(start.value, int(last) - 1, step.value))
+    return _float_for(
+        coerce_int_to_float(start).value,
+        coerce_int_to_float(stop).value,
+        coerce_int_to_float(step).value,
+    )
+
+
+def _float_for(value: float, last: float, increment: float):
+    while value <= last if increment > 0 else value >= last:
+        yield LuaNumber(value, LuaNumberType.FLOAT)
+        value += increment
+
+
+def _generic_for(values: list[LuaValue], scope: Scope, count: int):
+    # The values of the variables of a generic for loop, on each iteration.
+    function, state, control, closing = _fit(values, 4)
+    step = native_table_step(function, state)
+    while True:
+        if step is not None:
+            results = _fit(step(state, control) or [], count)
+        else:
+            results = _fit(call(function, [state, control], scope), count)
+        control = results[0]
+        if control is LuaNil:
+            break
+        yield results
+    if closing is not LuaNil:
+        raise NotImplementedError()
+
+
+_ONE = lua_integer(1)
+
+_RUNTIME = {
+    "NIL": LuaNil,
+    "TRUE": LuaTrue,
+    "FALSE": LuaFalse,
+    "LuaTable": LuaTable,
+    "index": index,
+    "_first": _first,
+    "_fit": _fit,
+    "_call": _call,
+    "TailCall": TailCall,
+    "_get_field": _get_field,
+    "_get_index": _get_index,
+    "_set_index": _set_index,
+    "_dispatch": _dispatch,
+    "_store_constant": _store_constant,
+    "_new_table": _new_table,
+    "_numeric_for": _numeric_for,
+    "_generic_for": _generic_for,
+    **{
+        function.__name__: function
+        for function in (
+            *binary_operator_functions.values(),
+            *unary_operator_functions.values(),
+        )
+    },
+}
+"""The names that compiled code refers to, other than its constants."""
+
+# endregion
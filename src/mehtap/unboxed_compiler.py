@@ -0,0 +1,696 @@
+"""Compilation of abstract syntax trees to closures over unboxed values.
+
+This engine is a variant of :mod:`mehtap.closure_compiler`
+in which the compiled code represents
+integers as Python :class:`int` objects,
+floats as Python :class:`float` objects
+and booleans as Python :class:`bool` objects
+instead of :class:`LuaNumber` and :class:`LuaBool` objects.
+Arithmetic and comparisons of these values are done with Python operators
+directly,
+and only fall back to the functions of :mod:`mehtap.operations` for the
+cases those operators don't cover,
+such as integer overflow, division by zero or metamethods.
+Every other value is represented as usual.
+
+Values are converted back to :class:`LuaValue` objects with :func:`box`
+whenever they leave the compiled code,
+that is, when they are stored in a table, passed to a function that wasn't
+compiled by this module, put in a :class:`Scope` or returned from a chunk,
+and converted with :func:`unbox` whenever they come into it.
+So native functions, including the ones of :class:`LibraryProvider`
+implementations, and :func:`~mehtap.py2lua.py2lua` and
+:func:`~mehtap.lua2py.lua2py`,
+only ever see :class:`LuaValue` objects and work unchanged.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Callable
+from typing import TYPE_CHECKING, Union
+
+import attrs
+
+import mehtap.ast_nodes as nodes
+from mehtap.ast_nodes import (
+    BinaryOperator,
+    UnaryOperator,
+    binary_operator_functions,
+    unary_operator_functions,
+)
+from mehtap.closure_compiler import (
+    ClosureFunction,
+    Evaluator,
+    Executor,
+    Frame,
+    _BREAK,
+    _COMPARISON_OPERATORS,
+    _Compiler,
+    _FIRST_SLOT,
+    _Jump,
+    _SCOPE,
+    _UPVALUES,
+    _call_other,
+    _function_entry,
+    _tail_call_finisher,
+    _unfinished_jump,
+)
+from mehtap.control_structures import LuaError, TailCall
+from mehtap.library.stdlib.basic_library import native_table_step
+from mehtap.operations import (
+    concat,
+    index,
+    length,
+    new_index,
+    rel_eq,
+    str_to_lua_string,
+)
+from mehtap.resolver import NameKind, resolve
+from mehtap.values import (
+    LuaBool,
+    LuaFalse,
+    LuaIndexableABC,
+    LuaNil,
+    LuaNumber,
+    LuaNumberType,
+    LuaString,
+    LuaTable,
+    LuaTrue,
+    LuaValue,
+    MAX_INT64,
+    MIN_INT64,
+    Variable,
+    lua_integer,
+    type_of_lv,
+)
+
+if TYPE_CHECKING:
+    from mehtap.scope import Scope
+
+
+UnboxedValue = Union[LuaValue, int, float, bool]
+"""The type of the values that code compiled by this module works with."""
+
+_NUMBERS = frozenset((int, float))
+_FLOAT = LuaNumberType.FLOAT
+
+
+def box(value: UnboxedValue) -> LuaValue:
+    """Convert an unboxed value to a :class:`LuaValue`."""
+    cls = value.__class__
+    if cls is int:
+        return lua_integer(value)
+    if cls is float:
+        return LuaNumber(value, _FLOAT)
+    if cls is bool:
+        return LuaTrue if value else LuaFalse
+    return value
+
+
+def unbox(value: LuaValue) -> UnboxedValue:
+    """Convert a :class:`LuaValue` to the value that represents it in
+    compiled code."""
+    cls = value.__class__
+    if cls is LuaNumber:
+        return value.value
+    if cls is LuaBool:
+        return value.true
+    return value
+
+
+def _is_true(value: UnboxedValue) -> bool:
+    return value is not LuaNil and value is not False
+
+
+# region Operators
+
+
+def _boxed_binary(operator: BinaryOperator):
+    operation = binary_operator_functions[operator]
+
+    def evaluate_boxed(a, b):
+        return unbox(operation(box(a), box(b)))
+
+    return evaluate_boxed
+
+
+def _boxed_comparison(operator: BinaryOperator):
+    operation = binary_operator_functions[operator]
+
+    def compare_boxed(a, b):
+        return operation(box(a), box(b)) is LuaTrue
+
+    return compare_boxed
+
+
+def _boxed_unary(operator: UnaryOperator):
+    operation = unary_operator_functions[operator]
+
+    def evaluate_boxed(a):
+        return unbox(operation(box(a)))
+
+    return evaluate_boxed
+
+
+_add_boxed = _boxed_binary(BinaryOperator.ADD)
+_sub_boxed = _boxed_binary(BinaryOperator.SUBTRACT)
+_mul_boxed = _boxed_binary(BinaryOperator.MULTIPLY)
+_div_boxed = _boxed_binary(BinaryOperator.FLOAT_DIV)
+_floor_div_boxed = _boxed_binary(BinaryOperator.FLOOR_DIV)
+_mod_boxed = _boxed_binary(BinaryOperator.MODULO)
+_lt_boxed = _boxed_comparison(BinaryOperator.LT)
+_le_boxed = _boxed_comparison(BinaryOperator.LE)
+_neg_boxed = _boxed_unary(UnaryOperator.NEG)
+
+
+# The integer operations only take the fast path if the result fits in a
+# signed 64-bit integer, so that overflow wraps around like in
+# mehtap.operations.
+
+
+def _add(a, b):
+    if a.__class__ is int and b.__class__ is int:
+        r = a + b
+        if MIN_INT64 <= r <= MAX_INT64:
+            return r
+    elif a.__class__ in _NUMBERS and b.__class__ in _NUMBERS:
+        return float(a) + float(b)
+    return _add_boxed(a, b)
+
+
+def _sub(a, b):
+    if a.__class__ is int and b.__class__ is int:
+        r = a - b
+        if MIN_INT64 <= r <= MAX_INT64:
+            return r
+    elif a.__class__ in _NUMBERS and b.__class__ in _NUMBERS:
+        return float(a) - float(b)
+    return _sub_boxed(a, b)
+
+
+def _mul(a, b):
+    if a.__class__ is int and b.__class__ is int:
+        r = a * b
+        if MIN_INT64 <= r <= MAX_INT64:
+            return r
+    elif a.__class__ in _NUMBERS and b.__class__ in _NUMBERS:
+        return float(a) * float(b)
+    return _mul_boxed(a, b)
+
+
+def _div(a, b):
+    if a.__class__ in _NUMBERS and b.__class__ in _NUMBERS and b:
+        return float(a) / float(b)
+    return _div_boxed(a, b)
+
+
+def _floor_div(a, b):
+    if a.__class__ is int and b.__class__ is int and b:
+        r = a // b
+        if MIN_INT64 <= r <= MAX_INT64:
+            return r
+    return _floor_div_boxed(a, b)
+
+
+def _mod(a, b):
+    if a.__class__ is int and b.__class__ is int and b:
+        return a % b
+    return _mod_boxed(a, b)
+
+
+def _eq(a, b):
+    if a.__class__ in _NUMBERS and b.__class__ in _NUMBERS:
+        return a == b
+    if a.__class__ is bool or b.__class__ is bool:
+        return a is b
+    return a is b or rel_eq(a, b).true
+
+
+def _ne(a, b):
+    return not _eq(a, b)
+
+
+def _lt(a, b):
+    if a.__class__ in _NUMBERS and b.__class__ in _NUMBERS:
+        return a < b
+    return _lt_boxed(a, b)
+
+
+def _le(a, b):
+    if a.__class__ in _NUMBERS and b.__class__ in _NUMBERS:
+        return a <= b
+    return _le_boxed(a, b)
+
+
+def _gt(a, b):
+    return _lt(b, a)
+
+
+def _ge(a, b):
+    return _le(b, a)
+
+
+def _concat(a, b):
+    if a.__class__ is LuaString and b.__class__ is LuaString:
+        return LuaString(a.content + b.content)
+    return unbox(concat(box(a), box(b)))
+
+
+def _neg(a):
+    if a.__class__ in _NUMBERS and a != MIN_INT64:
+        return -a
+    return _neg_boxed(a)
+
+
+def _not(a):
+    return a is LuaNil or a is False
+
+
+def _length(a):
+    if a.__class__ is LuaString:
+        return len(a.content)
+    return unbox(length(box(a)))
+
+
+_binary_operations: dict[BinaryOperator, Callable] = {
+    BinaryOperator.ADD: _add,
+    BinaryOperator.SUBTRACT: _sub,
+    BinaryOperator.MULTIPLY: _mul,
+    BinaryOperator.FLOAT_DIV: _div,
+    BinaryOperator.FLOOR_DIV: _floor_div,
+    BinaryOperator.MODULO: _mod,
+    BinaryOperator.EQ: _eq,
+    BinaryOperator.NE: _ne,
+    BinaryOperator.LT: _lt,
+    BinaryOperator.LE: _le,
+    BinaryOperator.GT: _gt,
+    BinaryOperator.GE: _ge,
+    BinaryOperator.CONCAT: _concat,
+}
+"""The operations on unboxed values, by operator.
+Operators that aren't in this dictionary always work on boxed values."""
+_binary_operations.update(
+    (operator, _boxed_binary(operator))
+    for operator in binary_operator_functions
+    if operator not in _binary_operations
+)
+_unary_operations: dict[UnaryOperator, Callable] = {
+    UnaryOperator.NEG: _neg,
+    UnaryOperator.NOT: _not,
+    UnaryOperator.LENGTH: _length,
+    UnaryOperator.BIT_NOT: _boxed_unary(UnaryOperator.BIT_NOT),
+}
+
+# endregion
+
+# region Boundaries
+
+
+def _get_index(table, key):
+    if table.__class__ is LuaTable:
+        cls = key.__class__
+        if cls is LuaString:
+            value = table.rawget(key)
+        elif cls is int:
+            array = table.array
+            if 0 < key <= len(array):
+                value = array[key - 1]
+            else:
+                value = table._map.get(key, LuaNil)
+        else:
+            value = table.rawget(box(key))
+        if value is not LuaNil:
+            return unbox(value)
+    return unbox(index(box(table), box(key)))
+
+
+def _set_index(table, key, value):
+    if table.__class__ is LuaTable and table._metatable is None:
+        # Without a metatable there is no __newindex metamethod to call.
+        table.rawput(box(key), box(value))
+    else:
+        new_index(box(table), box(key), box(value))
+
+
+def _call_boxed(function, args, scope):
+    """Call a value that is not an :class:`UnboxedFunction`."""
+    return [
+        unbox(value)
+        for value in _call_other(box(function), [box(a) for a in args], scope)
+    ]
+
+
+def _table_step(function, state):
+    step = native_table_step(function, state)
+    if step is None:
+        return None
+
+    def unboxed_step(state, control):
+        pair = step(state, box(control))
+        if pair is None:
+            return None
+        return unbox(pair[0]), unbox(pair[1])
+
+    return unboxed_step
+
+
+@attrs.define(slots=True, eq=False, repr=False)
+class UnboxedFunction(ClosureFunction):
+    """A Lua function that was compiled by :mod:`mehtap.unboxed_compiler`.
+
+    When it is called through :meth:`rawcall`,
+    its arguments are unboxed and its return values are boxed.
+    """
+
+    def _run(self, args: list[LuaValue]) -> list[LuaValue]:
+        r = self.entry(self, [unbox(a) for a in args])
+        if r.__class__ is TailCall:
+            r = _finish_tail_calls(r)
+        return [box(v) for v in r]
+
+
+_finish_tail_calls = _tail_call_finisher(UnboxedFunction, _call_boxed)
+
+
+# endregion
+
+
+class _UnboxedCompiler(_Compiler):
+    function_class = UnboxedFunction
+    call_other = staticmethod(_call_boxed)
+    get_index = staticmethod(_get_index)
+    set_index = staticmethod(_set_index)
+    table_step = staticmethod(_table_step)
+    finish_tail_calls = staticmethod(_finish_tail_calls)
+    # Booleans are excluded, since True == 1 in Python.
+    dispatch_classes = frozenset({int, float, LuaString})
+
+    @staticmethod
+    def jump_table(arms: dict[LuaValue, int]) -> dict:
+        return {unbox(value): i for value, i in arms.items()}
+
+    # region Statements
+
+    def stat_For(self, statement: nodes.For) -> Executor:
+        start = self.expression(statement.start)
+        stop = self.expression(statement.stop)
+        step = (
+            self.expression(statement.step)
+            if statement.step is not None
+            else None
+        )
+        variable = self.resolution.declaration(statement.name)
+        slot = _FIRST_SLOT + variable.slot
+        captured = variable.captured
+        body = self.block(statement.block)
+
+        def execute_for(frame: Frame):
+            initial_value = start(frame)
+            if initial_value.__class__ not in _NUMBERS:
+                raise LuaError("the initial value must be a number")
+            limit = stop(frame)
+            if limit.__class__ not in _NUMBERS:
+                raise LuaError("the limit value must be a number")
+            if step is not None:
+                step_value = step(frame)
+                if step_value.__class__ not in _NUMBERS:
+                    raise LuaError("the step value must be a number")
+            else:
+                step_value = 1
+            if step_value == 0:
+                raise LuaError("step must not be zero")
+            if initial_value.__class__ is int and step_value.__class__ is int:
+                # The loop is done with integers and never wraps around.
+                last = limit
+                if step_value > 0:
+                    if last.__class__ is float:
+                        last = min(last, MAX_INT64) // 1
+                    values = range(initial_value, int(last) + 1, step_value)
+                else:
+                    if last.__class__ is float:
+                        last = -(-max(last, MIN_INT64) // 1)
+                    values = range(initial_value, int(last) - 1, step_value)
+                for value in values:
+                    if captured:
+                        frame[slot] = Variable(value)
+                    else:
+                        frame[slot] = value
+                    r = body(frame)
+                    if r is not None:
+                        if r is _BREAK:
+                            break
+                        return r
+                return None
+            value = float(initial_value)
+            last = float(limit)
+            increment = float(step_value)
+            while value <= last if increment > 0 else value >= last:
+                if captured:
+                    frame[slot] = Variable(value)
+                else:
+                    frame[slot] = value
+                r = body(frame)
+                if r is not None:
+                    if r is _BREAK:
+                        break
+                    return r
+                value += increment
+            return None
+
+        return execute_for
+
+    # endregion
+
+    # region Variables
+
+    # Exported local variables are also visible to other chunks through the
+    # scope, so their values are kept boxed.
+
+    def declaration(self, variable) -> Callable[[Frame, UnboxedValue], None]:
+        if not variable.exported:
+            return super().declaration(variable)
+        declare = super().declaration(variable)
+        return lambda frame, value: declare(frame, box(value))
+
+    def name_load(self, name: nodes.Name) -> Evaluator:
+        resolution = self.resolution.use(name)
+        if resolution.kind is NameKind.LOCAL:
+            if resolution.variable.exported:
+                slot = _FIRST_SLOT + resolution.index
+                return lambda frame: unbox(frame[slot].value)
+            return super().name_load(name)
+        if resolution.kind is NameKind.UPVALUE:
+            if resolution.variable.exported:
+                upvalue = resolution.index
+                return lambda frame: unbox(frame[_UPVALUES][upvalue].value)
+            return super().name_load(name)
+        key = str_to_lua_string(resolution.name)
+        return lambda frame: unbox(frame[_SCOPE].get_ls(key))
+
+    def store(self, variable) -> Callable[[Frame, UnboxedValue], None]:
+        store = super().store(variable)
+        if not variable.exported or variable.attrib == "const":
+            return store
+        return lambda frame, value: store(frame, box(value))
+
+    def name_store(self, name: nodes.Name) \
+            -> Callable[[Frame, UnboxedValue], None]:
+        resolution = self.resolution.use(name)
+        store = super().name_store(name)
+        if resolution.kind is NameKind.LOCAL:
+            return store
+        if resolution.kind is NameKind.UPVALUE and (
+            not resolution.variable.exported
+            or resolution.variable.attrib == "const"
+        ):
+            return store
+        return lambda frame, value: store(frame, box(value))
+
+    def assignment(self, target: nodes.Variable) \
+            -> Callable[[Frame, UnboxedValue], None]:
+        if not isinstance(target, nodes.VarIndex):
+            return super().assignment(target)
+        base = self.expression(target.base)
+        key = self.expression(target.index)
+
+        def store_index(frame: Frame, value: UnboxedValue):
+            table = base(frame)
+            if not isinstance(table, LuaIndexableABC):
+                raise LuaError(
+                    f"attempt to index {type_of_lv(box(table))} value"
+                )
+            _set_index(table, key(frame), value)
+
+        return store_index
+
+    # endregion
+
+    # region Expressions
+
+    def constant(self, expression: nodes.Expression) -> Evaluator:
+        value = unbox(expression._evaluate(None))
+        return lambda frame: value
+
+    exp_NumeralDec = constant
+    exp_NumeralHex = constant
+    exp_NumeralConstant = constant
+    exp_LiteralString = constant
+    exp_LiteralTrue = constant
+    exp_LiteralFalse = constant
+    exp_LiteralNil = constant
+    exp_ParsedLiteralLuaStringExpr = constant
+
+    def exp_UnaryOperation(self, expression: nodes.UnaryOperation) \
+            -> Evaluator:
+        operation = _unary_operations[expression.op]
+        operand = self.expression(expression.exp)
+        return lambda frame: operation(operand(frame))
+
+    def exp_BinaryOperation(self, expression: nodes.BinaryOperation) \
+            -> Evaluator:
+        lhs = self.expression(expression.lhs)
+        rhs = self.expression(expression.rhs)
+        if expression.op is BinaryOperator.AND:
+            def evaluate_and(frame: Frame):
+                value = lhs(frame)
+                if value is LuaNil or value is False:
+                    return value
+                return rhs(frame)
+
+            return evaluate_and
+        if expression.op is BinaryOperator.OR:
+            def evaluate_or(frame: Frame):
+                value = lhs(frame)
+                if value is LuaNil or value is False:
+                    return rhs(frame)
+                return value
+
+            return evaluate_or
+        operation = _binary_operations[expression.op]
+        return lambda frame: operation(lhs(frame), rhs(frame))
+
+    def condition(self, expression: nodes.Expression) \
+            -> Callable[[Frame], bool]:
+        while isinstance(expression, nodes.ParenExpression):
+            expression = expression.exp
+        if isinstance(expression, nodes.BinaryOperation):
+            if expression.op in _COMPARISON_OPERATORS:
+                # The comparisons already evaluate to Python booleans.
+                return self.expression(expression)
+            if expression.op is BinaryOperator.AND:
+                lhs = self.condition(expression.lhs)
+                rhs = self.condition(expression.rhs)
+                return lambda frame: lhs(frame) and rhs(frame)
+            if expression.op is BinaryOperator.OR:
+                lhs = self.condition(expression.lhs)
+                rhs = self.condition(expression.rhs)
+                return lambda frame: lhs(frame) or rhs(frame)
+        if (
+            isinstance(expression, nodes.UnaryOperation)
+            and expression.op is nodes.UnaryOperator.NOT
+        ):
+            operand = self.condition(expression.exp)
+            return lambda frame: not operand(frame)
+        evaluate = self.expression(expression)
+        return lambda frame: _is_true(evaluate(frame))
+
+    def exp_TableConstructor(self, expression: nodes.TableConstructor) \
+            -> Evaluator:
+        fields = list(expression.fields)
+        last = None
+        if fields and isinstance(fields[-1], nodes.FieldCounterKey):
+            last = fields.pop()
+        items = []
+        counter = 1
+        for field in fields:
+            if isinstance(field, nodes.FieldWithKey):
+                if isinstance(field.key, nodes.Name):
+                    items.append((
+                        field.key.as_lua_string(),
+                        None,
+                        self.expression(field.value),
+                    ))
+                else:
+                    items.append((
+                        None,
+                        self.expression(field.key),
+                        self.expression(field.value),
+                    ))
+            else:
+                items.append((
+                    lua_integer(counter),
+                    None,
+                    self.expression(field.value),
+                ))
+                counter += 1
+        items = tuple(items)
+        last_values = self.multires(last.value) if last is not None else None
+
+        def evaluate_table(frame: Frame):
+            table = LuaTable()
+            for key, evaluate_key, evaluate_value in items:
+                if evaluate_key is not None:
+                    key = box(evaluate_key(frame))
+                table.rawput(key, box(evaluate_value(frame)))
+            if last_values is not None:
+                for i, value in enumerate(last_values(frame), start=counter):
+                    table.rawput(lua_integer(i), box(value))
+            return table
+
+        return evaluate_table
+
+    # endregion
+
+
+def compile_chunk(chunk: nodes.Chunk) -> Callable[[Scope], list[LuaValue]]:
+    """Compile a chunk to be run in a scope.
+
+    Like :func:`mehtap.closure_compiler.compile_chunk`,
+    but the compiled code works with unboxed values.
+
+    :return: A function that runs the chunk in the given scope.
+    """
+    resolution = resolve(chunk, export_chunk_locals=True)
+    body = _UnboxedCompiler(resolution).block(chunk.block, echo=True)
+    filler = [None] * resolution.function(chunk).slot_count
+
+    def execute_chunk(scope: Scope) -> list[LuaValue]:
+        varargs = scope.varargs
+        if varargs is not None:
+            varargs = [unbox(v) for v in varargs]
+        r = body([scope, varargs, (), *filler])
+        if r is None:
+            return []
+        if r.__class__ is _Jump:
+            raise _unfinished_jump(r)
+        if r.__class__ is TailCall:
+            r = _finish_tail_calls(r)
+        return [box(v) for v in r]
+
+    return execute_chunk
+
+
+def compile_chunk_function(chunk: nodes.Chunk, scope: Scope) \
+        -> UnboxedFunction:
+    """Compile a chunk into a variadic function, like :func:`load` does.
+
+    :param scope: The scope that names which are not local variables are
+                  looked up in.
+    """
+    resolution = resolve(chunk, export_chunk_locals=False)
+    info = resolution.function(chunk)
+    entry = _function_entry(
+        _UnboxedCompiler(resolution).block(chunk.block),
+        param_count=0,
+        captured_params=(),
+        slot_count=info.slot_count,
+        variadic=True,
+    )
+    return UnboxedFunction(
+        param_names=[],
+        variadic=True,
+        parent_scope=scope,
+        block=chunk.block,
+        gets_scope=False,
+        entry=entry,
+    )
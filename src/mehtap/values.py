@@ -1,13 +1,21 @@
 from __future__ import annotations
 
+import threading
 from abc import ABC, abstractmethod
-from collections.abc import Callable
+from collections.abc import (
+    Callable,
+    Iterator,
+    Mapping,
+    MutableMapping,
+    Sequence,
+)
 from enum import Enum
-from typing import TYPE_CHECKING, TypeVar
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Any, TypeVar
 
 import attrs
 
-from mehtap.control_structures import LuaError
+from mehtap.control_structures import LuaError, TailCall
 
 if TYPE_CHECKING:
     from mehtap.ast_nodes import Block
@@ -120,13 +128,28 @@ Sole object of the ``LuaNilType`` class.
 del LuaNilType
 
 
-@attrs.define(slots=True, eq=False, repr=False)
+@attrs.define(slots=True, init=False, eq=False, repr=False)
 class LuaBool(LuaValue):
-    """Class representing values of the *boolean* basic type in Lua."""
+    """Class representing values of the *boolean* basic type in Lua.
+
+    The class has only two objects, :data:`LuaTrue` and :data:`LuaFalse`,
+    which ``LuaBool(True)`` and ``LuaBool(False)`` return,
+    so booleans can be compared by identity.
+    """
 
     true: bool
     """Whether this value is ``true`` or ``false``."""
 
+    def __new__(cls, true: bool) -> LuaBool:
+        return LuaTrue if true else LuaFalse
+
+    def __init__(self, true: bool) -> None:
+        # The objects are initialized once, by _make_bool.
+        pass
+
+    def __reduce__(self):
+        return LuaBool, (self.true,)
+
     def __str__(self) -> str:
         return "true" if self.true else "false"
 
@@ -137,6 +160,19 @@ class LuaBool(LuaValue):
         return hash(self.true)
 
 
+def _make_bool(true: bool) -> LuaBool:
+    value = object.__new__(LuaBool)
+    value.true = true
+    return value
+
+
+LuaTrue = _make_bool(True)
+"""The value ``true``. Sole true object of the :class:`LuaBool` class."""
+LuaFalse = _make_bool(False)
+"""The value ``false``. Sole false object of the :class:`LuaBool` class."""
+del _make_bool
+
+
 class LuaNumberType(Enum):
     """LuaNumberType(value)
     Enumeration of the types of numbers in Lua.
@@ -204,6 +240,29 @@ class LuaNumber(LuaValue):
         return NotImplemented
 
 
+SMALL_INTEGERS = range(-256, 65536)
+"""The integers that :func:`lua_integer` returns shared objects for."""
+_small_integers: list[LuaNumber | None] = [None] * len(SMALL_INTEGERS)
+
+
+def lua_integer(value: int) -> LuaNumber:
+    """
+    :return: An integer :class:`LuaNumber` with the given value.
+
+    The numbers in :data:`SMALL_INTEGERS` are cached,
+    so calling this function with one of them returns the same object every
+    time instead of allocating a new one.
+    Numbers must therefore not be modified.
+    """
+    if -256 <= value < 65536:
+        number = _small_integers[value + 256]
+        if number is None:
+            number = LuaNumber(value, LuaNumberType.INTEGER)
+            _small_integers[value + 256] = number
+        return number
+    return LuaNumber(value, LuaNumberType.INTEGER)
+
+
 @attrs.define(slots=True, eq=False, frozen=True, repr=False)
 class LuaString(LuaValue):
     """Class representing values of the *string* basic type in Lua."""
@@ -262,6 +321,43 @@ class LuaCallableABC(ABC):
         ...
 
 
+MAX_NATIVE_CALL_DEPTH = 200
+"""How deep calls of native functions and of metamethods can nest,
+like ``LUAI_MAXCCALLS`` in the reference implementation.
+A call that would nest deeper raises a ``C stack overflow`` error.
+
+Unlike calls of Lua functions,
+these nest on the C stack of the thread that they run in,
+which would overflow and crash the process long before
+:attr:`VirtualMachine.max_call_depth
+<mehtap.vm.VirtualMachine.max_call_depth>` is reached.
+"""
+
+
+class _NativeCalls(threading.local):
+    depth = 0
+    """How many calls of native functions and of metamethods are running
+    in this thread."""
+
+
+native_calls = _NativeCalls()
+"""The calls counted against :data:`MAX_NATIVE_CALL_DEPTH`."""
+
+
+_count_call: Callable[[LuaFunction], Any] | None = None
+
+
+def _get_count_call() -> Callable[[LuaFunction], Any]:
+    # mehtap.source_compiler imports this module,
+    # so its count_call is bound on the first call instead.
+    global _count_call
+    if _count_call is None:
+        from mehtap.source_compiler import count_call
+
+        _count_call = count_call
+    return _count_call
+
+
 @attrs.define(slots=True, eq=False, repr=False)
 class LuaFunction(LuaObject, LuaCallableABC):
     """Class representing values of the *function* basic type in Lua."""
@@ -288,7 +384,8 @@ class LuaFunction(LuaObject, LuaCallableABC):
     """The code that the function executes.
 
     If of type :class:`Block`, the function is implemented in Lua.
-    If of type :class:`Callable`, the function is implemented in Python.
+    If of type :class:`Callable`, the function is implemented in Python,
+    and what it returns is returned from the function.
 
     The :meth:`call` method should be used to call the function.
     """
@@ -310,6 +407,22 @@ class LuaFunction(LuaObject, LuaCallableABC):
 
     Only used for pretty-displaying the function.
     """
+    fastcall: bool = False
+    """Whether the function is called with the fastcall convention.
+
+    Only applicable for functions implemented in Python.
+    Such a function receives a value for each of its parameters,
+    nil for the ones that aren't required and aren't given,
+    followed by the extra arguments if it is variadic,
+    and returns a list of values.
+    See :meth:`fastcall_with`.
+    """
+    call_count: int = attrs.field(default=0, init=False, repr=False)
+    """How many times the function was called while its body was interpreted.
+
+    Only applicable for functions implemented in Lua.
+    See :mod:`mehtap.source_compiler`.
+    """
 
     def _py_param_str(self, index):
         if not self.param_names or index == len(self.param_names):
@@ -377,22 +490,19 @@ class LuaFunction(LuaObject, LuaCallableABC):
         .. _the rules on adjustment of Lua:
            https://lua.org/manual/5.4/manual.html#3.4.12
         """
-        from mehtap.control_structures import ReturnException
-        from mehtap.vm import VirtualMachine
-        from mehtap.control_structures import LuaError
+        if scope is None:
+            scope = self.parent_scope
+            if scope is None:
+                from mehtap.vm import VirtualMachine
+
+                scope = VirtualMachine().root_scope
         try:
-            self._call(
-                args,
-                scope or self.parent_scope or VirtualMachine().root_scope,
-            )
+            return self._call(args, scope)
         except LuaError as le:
             if modify_tb:
                 le.push_tb(str(self))
             raise le
-        except ReturnException as e:
-            return e.values if e.values is not None else []
         except Exception as e:
-            from mehtap.control_structures import LuaError
             s_e = str(e)
             assert s_e
             le = LuaError(
@@ -402,44 +512,37 @@ class LuaFunction(LuaObject, LuaCallableABC):
             if modify_tb:
                 le.push_tb(str(self))
             raise le from e
-        return []
 
     def _call(
         self,
         args: Multires,
         scope: Scope,
-    ):
+    ) -> list[LuaValue]:
         if not callable(self.block):
             # Function is implemented in Lua
-            new_scope = self.parent_scope.push()
-            param_count = len(self.param_names)
-
-            if self.variadic:
-                from mehtap.operations import adjust_flatten
-
-                args = adjust_flatten(args)
-                new_scope.varargs = args[param_count:]
-                args = args[:param_count]
-            from mehtap.operations import adjust
-
-            args = adjust(args, param_count)
-            for param_name, arg in zip(self.param_names, args):
-                new_scope.put_local_ls(param_name, Variable(arg))
-            retvals = self.block.evaluate_without_inner_scope(new_scope)
-            if retvals is not None:
-                from mehtap.control_structures import ReturnException
-
-                raise ReturnException(retvals)
+            r = self._start(args)
+            if r.__class__ is TailCall:
+                r = finish_tail_calls(r)
+            return r
         else:
             # Function is implemented in Python
-            from mehtap.operations import adjust_flatten
-
-            args = adjust_flatten(args)
+            for arg in args:
+                if arg.__class__ is list:
+                    from mehtap.operations import adjust_flatten
+
+                    args = adjust_flatten(args)
+                    break
+            if self.fastcall:
+                return self.fastcall_with(args, scope)
+            depth = native_calls.depth
             try:
+                if depth >= MAX_NATIVE_CALL_DEPTH:
+                    raise LuaError("C stack overflow")
+                native_calls.depth = depth + 1
                 if not self.gets_scope:
-                    self.block(*args)
+                    r = self.block(*args)
                 else:
-                    self.block(scope, *args)
+                    r = self.block(scope, *args)
             # Always add Python functions to tracebacks.
             # (Ignore the modify_tb parameter of cls.call().)
             except LuaError as le:
@@ -452,6 +555,170 @@ class LuaFunction(LuaObject, LuaCallableABC):
                 )
                 le.push_tb(str(self), file="<Python>", line=None)
                 raise le from e
+            finally:
+                native_calls.depth = depth
+            if r is None:
+                return []
+            return r
+
+    def fastcall_with(
+        self,
+        args: list[LuaValue],
+        scope: Scope,
+    ) -> list[LuaValue]:
+        """Call a function that uses the fastcall convention.
+
+        :param args: The arguments, none of which is a multires.
+        :param scope: The scope of the caller.
+        :return: The values returned by the function.
+        :raises LuaError: If a required argument is missing,
+                          if the call would nest deeper than
+                          :data:`MAX_NATIVE_CALL_DEPTH`,
+                          or if the function raises an error.
+
+        Unlike :meth:`rawcall`,
+        this doesn't adjust multires arguments or the returned values.
+        """
+        param_count = len(self.param_names)
+        given = len(args)
+        depth = native_calls.depth
+        try:
+            if depth >= MAX_NATIVE_CALL_DEPTH:
+                raise LuaError("C stack overflow")
+            native_calls.depth = depth + 1
+            if given < param_count:
+                if given < self.min_req:
+                    raise LuaError(
+                        f"bad argument #{given + 1} to '{self.name}' "
+                        f"(value expected)"
+                    )
+                args = [*args, *[LuaNil] * (param_count - given)]
+            elif given > param_count and not self.variadic:
+                args = args[:param_count]
+            if self.gets_scope:
+                return self.block(scope, *args)
+            return self.block(*args)
+        except LuaError as le:
+            le.push_tb(str(self), file="<Python>", line=None)
+            raise le
+        except Exception as e:
+            le = LuaError(
+                LuaString(str(e).encode("utf-8")),
+                caused_by=e,
+            )
+            le.push_tb(str(self), file="<Python>", line=None)
+            raise le from e
+        finally:
+            native_calls.depth = depth
+
+    def _start(self, args: Multires) -> list[LuaValue] | TailCall:
+        # Adjust the arguments of a call of a Lua function to its parameters
+        # and run its body.
+        for arg in args:
+            if arg.__class__ is list:
+                from mehtap.operations import adjust_flatten
+
+                args = adjust_flatten(args)
+                break
+        # The arguments are bound to the parameters positionally.
+        param_count = len(self.param_names)
+        varargs = args[param_count:] if self.variadic else None
+        given = len(args)
+        if given >= param_count:
+            return self._enter(args[:param_count], varargs)
+        return self._enter([*args, *[LuaNil] * (param_count - given)], varargs)
+
+    def _enter(
+        self,
+        args: list[LuaValue],
+        varargs: list[LuaValue] | None,
+    ) -> list[LuaValue] | TailCall:
+        """Run the body of a Lua function.
+
+        :param args: A value for each parameter of the function.
+                     The list becomes the frame of the call.
+        :param varargs: The extra arguments of a variadic function.
+        :return: The values returned by the function,
+                 or the tail call that it ends with,
+                 which the caller makes with
+                 :func:`finish_tail_calls`.
+        :raises LuaError: If the call would nest deeper than
+                          :attr:`VirtualMachine.max_call_depth
+                          <mehtap.vm.VirtualMachine.max_call_depth>`.
+        """
+        block = self.block
+        compiled = block.compiled
+        if compiled is None:
+            count_call = _count_call
+            if count_call is None:
+                count_call = _get_count_call()
+            compiled = count_call(self)
+        vm = self.parent_scope.vm
+        depth = vm.call_depth
+        if depth >= vm.max_call_depth:
+            raise LuaError("stack overflow")
+        vm.call_depth = depth + 1
+        try:
+            if compiled:
+                return compiled(self, args)
+            frame_size = block.frame_size
+            if frame_size is None:
+                new_scope = self.parent_scope.push()
+                new_scope.varargs = varargs
+                for param_name, arg in zip(self.param_names, args):
+                    new_scope.put_local_ls(param_name, Variable(arg))
+            else:
+                # The parameters are the first local variables of the
+                # function, and the frame has a slot for each of them.
+                args.extend([LuaNil] * (frame_size - len(args)))
+                new_scope = self.parent_scope.frame(args, varargs)
+            return block.evaluate_without_inner_scope(new_scope, echo=False)
+        finally:
+            vm.call_depth = depth
+
+
+def finish_tail_calls(r: list[LuaValue] | TailCall) -> list[LuaValue]:
+    """Make the tail call that the body of a function returned,
+    and the ones that the bodies of the functions it calls return,
+    until a function returns values.
+
+    The bodies are run one after another,
+    so that the stack doesn't grow with the number of tail calls.
+
+    :return: The values returned by the last function.
+    """
+    while r.__class__ is TailCall:
+        function = r.function
+        try:
+            if (
+                function.__class__ is LuaFunction
+                and not callable(function.block)
+            ):
+                r = function._start(r.args)
+            else:
+                from mehtap.operations import call
+
+                r = call(function, r.args, r.scope, modify_tb=False)
+        except LuaError as le:
+            r.site._push_tb(le, function)
+            raise le
+        except Exception as e:
+            le = LuaError(
+                LuaString(f"{function!s}: {e!s}".encode("utf-8")),
+                caused_by=e,
+            )
+            r.site._push_tb(le, function)
+            raise le from e
+    if r.__class__ is list:
+        return r
+    # Native functions may return a single value or nothing.
+    if r is None:
+        return []
+    if isinstance(r, LuaValue):
+        return [r]
+    from mehtap.operations import adjust_flatten
+
+    return adjust_flatten(r)
 
 
 @attrs.define(slots=True, eq=False)
@@ -505,14 +772,168 @@ class LuaIndexableABC(LuaValue, ABC):
         ...
 
 
+MAX_SHAPE_FIELDS = 32
+"""How many string keys a table can have before it stops using a
+:class:`TableShape` and keeps its hash part in a dictionary."""
+MAX_SHAPE_TRANSITIONS = 64
+"""How many different keys can be added to tables with the same shape
+before tables with it that get yet another key keep their hash part in a
+dictionary.
+
+This bounds the number of shapes that tables used as dictionaries of strings
+make."""
+MAX_SHAPES = 10_000
+"""How many shapes can be made in total.
+Shapes are shared by all virtual machines and never freed,
+so once this many were made, tables that would need a new shape keep their
+hash part in a dictionary."""
+_shape_count = 1
+"""How many shapes were made, including :data:`EMPTY_SHAPE`."""
+
+
+@attrs.define(slots=True, eq=False, repr=False)
+class TableShape:
+    """The layout of the hash part of tables whose keys are strings.
+
+    Tables that got the same keys in the same order share a shape,
+    which gives the position of the value of each key in the list
+    :attr:`LuaTable._values` of the tables,
+    so that each table only stores the values.
+    Adding a key to a table replaces its shape with the shape that has the
+    key as well, which is made the first time the key is added to a table
+    with the shape and reused after that.
+    """
+
+    keys: tuple[bytes, ...] = ()
+    """The keys, in the order they were added."""
+    slots: dict[bytes, int] = attrs.field(factory=dict)
+    """The position of each key in :attr:`keys`."""
+    _transitions: dict[bytes, TableShape] = attrs.field(factory=dict)
+    """The shapes that have one more key, by that key."""
+
+    def __repr__(self):
+        return f"<TableShape {list(self.keys)}>"
+
+    def add(self, key: bytes) -> TableShape | None:
+        """
+        :return: The shape with the keys of this shape and *key*,
+                 or :data:`None` if there would be too many shapes.
+        """
+        global _shape_count
+        shape = self._transitions.get(key)
+        if shape is not None:
+            return shape
+        size = len(self.keys)
+        if (
+            size >= MAX_SHAPE_FIELDS
+            or len(self._transitions) >= MAX_SHAPE_TRANSITIONS
+            or _shape_count >= MAX_SHAPES
+        ):
+            return None
+        _shape_count += 1
+        shape = TableShape((*self.keys, key), {**self.slots, key: size})
+        self._transitions[key] = shape
+        return shape
+
+
+EMPTY_SHAPE = TableShape()
+"""The shape of tables that don't have keys in their hash part."""
+_NO_FIELDS: Mapping[Any, LuaValue] = MappingProxyType({})
+
+
 @attrs.define(slots=True, eq=False, repr=False)
 class LuaTable(LuaObject, LuaIndexableABC):
-    """Class representing values of the *table* basic type in Lua."""
+    """Class representing values of the *table* basic type in Lua.
+
+    Like in the reference implementation, a table has two parts:
+    the values of the keys ``1`` to ``n`` are stored in the list
+    :attr:`array`, and every other key-value pair is stored in the dictionary
+    :attr:`_map`.
+    A key is moved from the hash part to the array part when the array part
+    grows to reach it, so the hash part never contains the key ``n + 1``.
+
+    The keys of the hash part are also kept in a list in the order they were
+    added, with the position of each key in that list,
+    so that :meth:`next` finds the key after a given key in constant time.
+    Keys whose values are set to :data:`LuaNil` are kept until a new key is
+    added, which is when the list is compacted,
+    because Lua allows clearing fields during a traversal but not adding
+    them.
+
+    Strings and numbers are stored in the hash part unboxed,
+    as their :class:`bytes`, :class:`int` or :class:`float` values,
+    so that looking them up uses the hashing and equality of Python types.
+    See :func:`unboxed_key` and :func:`boxed_key`.
+
+    While all the keys of the hash part are strings,
+    the table has a :class:`TableShape` that it shares with the tables that
+    got the same keys in the same order,
+    and only stores the values of the keys, in the list :attr:`_values`.
+    The hash part is moved to :attr:`_map` when a key of another type is put in
+    it, or when the shape would have too many keys or transitions.
+
+    :attr:`map` is a view of all the key-value pairs of the table,
+    whichever part they are stored in.
+    """
 
-    map: dict[LuaValue, LuaValue] = attrs.field(factory=dict)
-    """The key-value pairs of the table."""
+    _map: dict[Any, LuaValue] = attrs.field(default=_NO_FIELDS)
+    """The key-value pairs of the hash part of the table,
+    by :func:`unboxed key <unboxed_key>`,
+    or an empty read-only mapping while the table has a shape.
+
+    The constructor accepts a dictionary with :class:`LuaValue` keys as
+    ``map``, whose pairs are put in the table.
+    """
     _metatable: LuaTable | None = None
     """The metatable of the table."""
+    array: list[LuaValue] = attrs.field(factory=list, kw_only=True)
+    """The values of the keys ``1`` to ``len(array)`` of the table.
+
+    The array part can contain :data:`LuaNil`,
+    for example after a value in the middle of a sequence is removed.
+    """
+    _shape: TableShape | None = attrs.field(init=False, default=EMPTY_SHAPE)
+    """The shape of the hash part,
+    or :data:`None` if the hash part is stored in :attr:`_map`."""
+    _values: list[LuaValue] = attrs.field(init=False, default=())
+    """The values of the keys of :attr:`_shape`, in the same order.
+
+    This is an empty tuple until the table has a key in its shape.
+    """
+    _keys: list[Any] | None = attrs.field(init=False, default=None)
+    """The keys of :attr:`_map` in traversal order.
+
+    Keys that were moved to the array part are replaced by :data:`LuaNil`.
+    """
+    _slots: dict[Any, int] | None = attrs.field(init=False, default=None)
+    """The index of each key of :attr:`_map` in :attr:`_keys`."""
+    _compact_at: int = attrs.field(init=False, default=8)
+    """The length of :attr:`_keys` at which it is compacted when a new key is
+    added."""
+
+    def __attrs_post_init__(self):
+        fields = self._map
+        if fields:
+            self._map = _NO_FIELDS
+            for key, value in fields.items():
+                self.rawput(key, value)
+
+    @property
+    def shape(self) -> TableShape | None:
+        """The shape of the hash part of the table,
+        or :data:`None` if the table stores it in :attr:`_map`."""
+        return self._shape
+
+    @property
+    def map(self) -> TableMap:
+        """A mutable mapping of the keys of the table to their values,
+        as :class:`LuaValue` objects.
+
+        Keys whose values are :data:`LuaNil` aren't in the mapping.
+        Assigning to or deleting a key of the mapping is the same as
+        :meth:`rawput`.
+        """
+        return TableMap(self)
 
     def __repr__(self):
         if not self._metatable:
@@ -531,7 +952,7 @@ class LuaTable(LuaObject, LuaIndexableABC):
             return "{<...>}"
         seen_objects.add(i)
         pair_list = []
-        for key, value in self.map.items():
+        for key, value in self.items():
             if not isinstance(key, LuaTable):
                 key_str = str(key)
             else:
@@ -543,36 +964,364 @@ class LuaTable(LuaObject, LuaIndexableABC):
             pair_list.append((key_str, value_str))
         return "{" + ", ".join(f"({k})=({v})" for k, v in pair_list) + "}"
 
+    def _migrate(self) -> None:
+        # Move the keys that follow the array part from the hash part to the
+        # array part.
+        array = self.array
+        map = self._map
+        while True:
+            key = len(array) + 1
+            value = map.get(key)
+            if value is None or value is LuaNil:
+                return
+            self._remove_key(key)
+            array.append(value)
+
+    def _use_map(self) -> dict[Any, LuaValue]:
+        # Move the hash part from the shape to a dictionary.
+        shape = self._shape
+        keys = list(shape.keys)
+        self._map = map = dict(zip(keys, self._values))
+        self._keys = keys
+        self._slots = shape.slots.copy()
+        self._compact_at = max(8, 2 * len(keys))
+        self._shape = None
+        self._values = ()
+        return map
+
+    def _add_key(self, key: Any) -> None:
+        # Add a key that was just put in the hash part to the key index.
+        keys = self._keys
+        if len(keys) >= self._compact_at:
+            self._compact()
+            keys = self._keys
+        self._slots[key] = len(keys)
+        keys.append(key)
+
+    def _remove_key(self, key: Any) -> None:
+        slot = self._slots.pop(key, None)
+        if slot is not None:
+            del self._map[key]
+            self._keys[slot] = LuaNil
+
+    def _compact(self) -> None:
+        # Drop the keys with nil values and the keys that were moved to the
+        # array part from the hash part and the key index.
+        map = self._map
+        keys = []
+        for key in self._keys:
+            if key is LuaNil:
+                continue
+            if map[key] is LuaNil:
+                del map[key]
+                continue
+            keys.append(key)
+        self._keys = keys
+        self._slots = {key: slot for slot, key in enumerate(keys)}
+        self._compact_at = max(8, 2 * len(keys))
+
+    def items(self) -> Iterator[tuple[LuaValue, LuaValue]]:
+        """
+        :return: An iterator over the key-value pairs of the table whose
+                 values aren't :data:`LuaNil`, in the order of :func:`next`.
+        """
+        for index, value in enumerate(self.array, start=1):
+            if value is not LuaNil:
+                yield LuaNumber(index, LuaNumberType.INTEGER), value
+        shape = self._shape
+        if shape is not None:
+            for key, value in zip(shape.keys, self._values):
+                if value is not LuaNil:
+                    yield LuaString(key), value
+            return
+        for key, value in self._map.items():
+            if value is not LuaNil:
+                yield boxed_key(key), value
+
+    def next(
+        self,
+        key: LuaValue,
+    ) -> tuple[LuaValue, LuaValue] | None:
+        """
+        :param key: :data:`LuaNil` or a key of the table.
+        :return: The key-value pair that follows *key* in a traversal of the
+                 table, or :data:`None` if *key* is the last key or isn't a key
+                 of the table.
+        """
+        array = self.array
+        shape = self._shape
+        start = None
+        if key is LuaNil:
+            start = 0
+        elif isinstance(key, LuaNumber) and 0 < key.value <= len(array):
+            if key.value.__class__ is int:
+                start = key.value
+            elif key.value.is_integer():
+                start = int(key.value)
+        if start is not None:
+            for position in range(start, len(array)):
+                value = array[position]
+                if value is not LuaNil:
+                    return (
+                        LuaNumber(position + 1, LuaNumberType.INTEGER),
+                        value,
+                    )
+            slot = 0
+        else:
+            slots = self._slots if shape is None else shape.slots
+            slot = slots.get(unboxed_key(key))
+            if slot is None:
+                return None
+            slot += 1
+        if shape is not None:
+            keys = shape.keys
+            values = self._values
+            for slot in range(slot, len(keys)):
+                value = values[slot]
+                if value is not LuaNil:
+                    return LuaString(keys[slot]), value
+            return None
+        keys = self._keys
+        map = self._map
+        for slot in range(slot, len(keys)):
+            key = keys[slot]
+            if key is not LuaNil:
+                value = map[key]
+                if value is not LuaNil:
+                    return boxed_key(key), value
+        return None
+
+    def border(self) -> int:
+        """
+        :return: A border of the table, the raw result of ``#t`` in Lua.
+
+        This takes constant time if the last value of the array part isn't
+        :data:`LuaNil`, and logarithmic time otherwise.
+        """
+        array = self.array
+        high = len(array)
+        if not high or array[high - 1] is not LuaNil:
+            # The hash part never contains the key len(array) + 1.
+            return high
+        # Binary search for a border in the array part, keeping
+        # array[low - 1] not nil (or low == 0) and array[high - 1] nil.
+        low = 0
+        while high - low > 1:
+            middle = (low + high) // 2
+            if array[middle - 1] is LuaNil:
+                high = middle
+            else:
+                low = middle
+        return low
+
     def rawput(self, key: LuaValue, value: LuaValue):
         # Warning: Do not optimize by deleting keys that are assigned LuaNil,
         # as Lua allows you to set existing fields in a table to nil while
         # traversing it by using next().
 
-        if isinstance(key, LuaNumber):
-            if key.type == LuaNumberType.FLOAT:
-                if key.value == float("nan"):
+        key_class = key.__class__
+        if key_class is LuaString:
+            key = key.content
+            shape = self._shape
+            if shape is not None:
+                slot = shape.slots.get(key)
+                if slot is not None:
+                    self._values[slot] = value
+                    return
+                if value is LuaNil:
+                    return
+                shape = shape.add(key)
+                if shape is not None:
+                    self._shape = shape
+                    if self._values:
+                        self._values.append(value)
+                    else:
+                        self._values = [value]
+                    return
+        elif key_class is LuaNumber:
+            key = key.value
+            if key.__class__ is float:
+                if key != key:
                     raise LuaError("table index is NaN")
-                if key.value.is_integer():
-                    key = LuaNumber(int(key.value), LuaNumberType.INTEGER)
-        if value is LuaNil and key not in self.map:
+                if key.is_integer():
+                    key = int(key)
+            if key.__class__ is int:
+                array = self.array
+                length = len(array)
+                if 0 < key <= length:
+                    array[key - 1] = value
+                    return
+                if key == length + 1 and value is not LuaNil:
+                    array.append(value)
+                    if self._map:
+                        self._remove_key(key)
+                        self._migrate()
+                    return
+        map = self._map
+        if self._shape is not None:
+            if value is LuaNil:
+                return
+            map = self._use_map()
+        if value is LuaNil:
+            if key in map:
+                map[key] = LuaNil
             return
-        self.map[key] = value
+        size = len(map)
+        map[key] = value
+        if len(map) != size:
+            self._add_key(key)
 
     def rawget(self, key: LuaValue):
-        if key in self.map:
-            return self.map[key]
-        return LuaNil
+        key_class = key.__class__
+        if key_class is LuaString:
+            shape = self._shape
+            if shape is not None:
+                slot = shape.slots.get(key.content)
+                if slot is None:
+                    return LuaNil
+                return self._values[slot]
+            return self._map.get(key.content, LuaNil)
+        if key_class is LuaNumber:
+            key = key.value
+            if 0 < key <= len(self.array):
+                if key.__class__ is int:
+                    return self.array[key - 1]
+                if key.is_integer():
+                    return self.array[int(key) - 1]
+        return self._map.get(key, LuaNil)
 
     T = TypeVar("T")
 
     def get_with_fallback(self, key: LuaValue, fallback: T) -> LuaValue | T:
-        f = self.map.get(key, None)
-        if f is LuaNil or f is None:
+        f = self.rawget(key)
+        if f is LuaNil:
             return fallback
         return f
 
     def has(self, key: LuaValue) -> bool:
-        return key in self.map and self.map[key] is not LuaNil
+        return self.rawget(key) is not LuaNil
+
+    def put_sequence(self, start: int, values: Sequence[LuaValue]) -> None:
+        """Put values at consecutive integer keys,
+        like the last field of a table constructor does.
+
+        :param start: The key of the first value.
+        :param values: The values to put.
+        """
+        array = self.array
+        if start == len(array) + 1 and not self._map:
+            # The array part can contain nil.
+            array.extend(values)
+            return
+        for key, value in enumerate(values, start):
+            self.rawput(lua_integer(key), value)
+
+    def array_insert(self, position: int, value: LuaValue) -> None:
+        """Insert a value into the sequence of the table,
+        shifting up the values from ``position`` to the border.
+
+        :param position: The key to insert the value at,
+                         between ``1`` and the border plus one.
+        """
+        array = self.array
+        border = self.border()
+        if border < len(array):
+            # The value after the border is nil, overwrite it.
+            array[position - 1:border + 1] = [
+                value, *array[position - 1:border]
+            ]
+            return
+        array.insert(position - 1, value)
+        if self._map:
+            self._remove_key(len(array))
+            self._migrate()
+
+    def array_remove(self, position: int) -> LuaValue:
+        """Remove a value from the sequence of the table,
+        shifting down the values from ``position + 1`` to the border.
+
+        :param position: The key to remove, between ``1`` and the border.
+        :return: The removed value.
+        """
+        array = self.array
+        border = self.border()
+        value = array[position - 1]
+        array[position - 1:border] = array[position:border]
+        # Keep the keys that follow the border in the array part.
+        array.insert(border - 1, LuaNil)
+        return value
+
+
+class TableMap(MutableMapping):
+    """A view of the key-value pairs of a :class:`LuaTable`,
+    which is what :attr:`LuaTable.map` returns.
+
+    The pairs are those of :meth:`LuaTable.items`, in the same order.
+    """
+
+    __slots__ = ("table",)
+
+    def __init__(self, table: LuaTable):
+        self.table = table
+
+    def __repr__(self):
+        return f"<TableMap of {self.table!r}>"
+
+    def __getitem__(self, key: LuaValue) -> LuaValue:
+        value = self.table.rawget(key)
+        if value is LuaNil:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: LuaValue, value: LuaValue) -> None:
+        self.table.rawput(key, value)
+
+    def __delitem__(self, key: LuaValue) -> None:
+        if self.table.rawget(key) is LuaNil:
+            raise KeyError(key)
+        self.table.rawput(key, LuaNil)
+
+    def __iter__(self) -> Iterator[LuaValue]:
+        for key, _ in self.table.items():
+            yield key
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self.table.items())
+
+
+def unboxed_key(key: LuaValue) -> Any:
+    """
+    :return: The key of the hash part of a table that stores the value of
+             *key*: the content of a string, the value of a number,
+             or *key* itself for other values.
+
+    Booleans stay boxed, since ``True`` and ``False`` are equal to ``1`` and
+    ``0`` in Python.
+    """
+    key_class = key.__class__
+    if key_class is LuaString:
+        return key.content
+    if key_class is LuaNumber:
+        value = key.value
+        if value.__class__ is float and value.is_integer():
+            return int(value)
+        return value
+    return key
+
+
+def boxed_key(key: Any) -> LuaValue:
+    """
+    :return: The Lua value of a key of the hash part of a table,
+             the inverse of :func:`unboxed_key`.
+    """
+    key_class = key.__class__
+    if key_class is bytes:
+        return LuaString(key)
+    if key_class is int:
+        return LuaNumber(key, LuaNumberType.INTEGER)
+    if key_class is float:
+        return LuaNumber(key, LuaNumberType.FLOAT)
+    return key
 
 
 def type_of_lv(a: LuaValue) -> str:
@@ -1,11 +1,17 @@
 from __future__ import annotations
 
 import sys
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
 from typing import BinaryIO
 
 import attrs
 
+from mehtap.chunk_cache import ChunkCache
+from mehtap.execution import ExecutionEngine
 from mehtap.global_table import create_global_table
+from mehtap.parser import ParserBackend
 from mehtap.scope import Scope, AnyPath, ExecutionContext
 from mehtap.values import (
     LuaTable,
@@ -14,6 +20,69 @@ from mehtap.values import (
     LuaValue,
 )
 
+DEFAULT_MAX_CALL_DEPTH = 30_000
+"""How deep calls of Lua functions can nest by default."""
+PYTHON_FRAMES_PER_CALL = 30
+"""An upper bound of how many Python stack frames the engines nest for a
+call of a Lua function,
+including the frames of the expressions the call is in.
+"""
+MAX_RECURSION_LIMIT = 1_000_000
+"""The highest value that the recursion limit of Python is raised to while
+Lua code runs.
+
+The Python frames of calls of Lua functions aren't on the C stack,
+so the recursion limit can be much higher than the C stack could hold,
+but it also lets recursive Python code go that deep.
+What can nest on the C stack while Lua code runs is bounded separately,
+by :data:`~mehtap.values.MAX_NATIVE_CALL_DEPTH` for calls of native
+functions and metamethods,
+and by :func:`host_recursion_limit` for the parser.
+"""
+
+_recursion_limit_lock = threading.Lock()
+_running_lua = 0
+"""How many times Lua code was entered from Python and is still running,
+in all virtual machines and threads.
+"""
+_saved_recursion_limit = 0
+"""The recursion limit of Python before Lua code was entered."""
+
+
+@contextmanager
+def host_recursion_limit() -> Iterator[None]:
+    """Let Python code that runs inside Lua code recurse only as deep as it
+    could before Lua code was entered, counting from where it runs.
+
+    Recursive Python code may nest on the C stack, like the parser does,
+    and the C stack can't hold as many frames as the recursion limit allows
+    while Lua code runs (see :data:`MAX_RECURSION_LIMIT`).
+    Outside of Lua code, this does nothing.
+    """
+    with _recursion_limit_lock:
+        raised_limit = sys.getrecursionlimit()
+        if not _running_lua:
+            lowered = False
+        else:
+            depth = 0
+            frame = sys._getframe()
+            while frame is not None:
+                depth += 1
+                frame = frame.f_back
+            try:
+                sys.setrecursionlimit(
+                    min(raised_limit, depth + _saved_recursion_limit)
+                )
+                lowered = True
+            except RecursionError:
+                lowered = False
+    try:
+        yield
+    finally:
+        if lowered:
+            with _recursion_limit_lock:
+                sys.setrecursionlimit(raised_limit)
+
 
 @attrs.define(slots=True, repr=False, init=False)
 class VirtualMachine(ExecutionContext):
@@ -23,8 +92,39 @@ class VirtualMachine(ExecutionContext):
     verbose_tb: bool
     default_input: BinaryIO
     default_output: BinaryIO
+    parser_backend: ParserBackend
+    chunk_cache: ChunkCache | None
+    engine: ExecutionEngine
+    optimize: bool
+    max_call_depth: int
+    """How deep calls of Lua functions can nest.
+    A call that would nest deeper raises a ``stack overflow`` error.
+    Tail calls don't nest.
+
+    While Lua code is running, the recursion limit of Python
+    (:func:`sys.setrecursionlimit`) is raised to
+    ``max_call_depth * PYTHON_FRAMES_PER_CALL`` if it is lower,
+    but not above :data:`MAX_RECURSION_LIMIT`,
+    and it is restored when the outermost Lua code returns.
+    Calls that nest too deep for the recursion limit before they reach
+    ``max_call_depth`` raise the :exc:`RecursionError` of Python as a Lua
+    error instead.
+
+    Calls of native functions and of metamethods are limited separately by
+    :data:`~mehtap.values.MAX_NATIVE_CALL_DEPTH`.
+    """
+    call_depth: int
+    """How many calls of Lua functions are running."""
 
-    def __init__(self):
+    def __init__(
+        self,
+        *,
+        parser_backend: ParserBackend = ParserBackend.EARLEY,
+        chunk_cache: ChunkCache | None = None,
+        engine: ExecutionEngine = ExecutionEngine.TREE_WALKING,
+        optimize: bool = True,
+        max_call_depth: int = DEFAULT_MAX_CALL_DEPTH,
+    ):
         self.globals = create_global_table()
         self.root_scope = Scope(self, None, varargs=[])
         self.emitting_warnings = False
@@ -37,6 +137,40 @@ class VirtualMachine(ExecutionContext):
         else:
             self.default_output = sys.stdout
         self.verbose_tb = False
+        self.parser_backend = parser_backend
+        self.chunk_cache = chunk_cache
+        self.engine = engine
+        self.optimize = optimize
+        self.max_call_depth = max_call_depth
+        self.call_depth = 0
+
+    @contextmanager
+    def running_lua(self) -> Iterator[None]:
+        """Let Python calls nest deep enough to reach :attr:`max_call_depth`
+        while Lua code runs in this context.
+
+        Most engines nest Python calls for Lua calls.
+        The recursion limit of Python is restored when the outermost context
+        exits, so it isn't raised for the rest of the program.
+        """
+        global _running_lua, _saved_recursion_limit
+        recursion_limit = min(
+            self.max_call_depth * PYTHON_FRAMES_PER_CALL,
+            MAX_RECURSION_LIMIT,
+        )
+        with _recursion_limit_lock:
+            if not _running_lua:
+                _saved_recursion_limit = sys.getrecursionlimit()
+            _running_lua += 1
+            if sys.getrecursionlimit() < recursion_limit:
+                sys.setrecursionlimit(recursion_limit)
+        try:
+            yield
+        finally:
+            with _recursion_limit_lock:
+                _running_lua -= 1
+                if not _running_lua:
+                    sys.setrecursionlimit(_saved_recursion_limit)
 
     def eval(self, expr: str):
         return self.root_scope.eval(expr)
@@ -0,0 +1,40 @@
+import pytest
+
+from mehtap.execution import ExecutionEngine
+from mehtap.vm import VirtualMachine
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--engine",
+        action="append",
+        choices=[engine.value for engine in ExecutionEngine],
+        help="run the tests with this execution engine "
+             "(can be given more than once, defaults to all engines)",
+    )
+
+
+def pytest_generate_tests(metafunc):
+    if "execution_engine" not in metafunc.fixturenames:
+        return
+    values = (
+        metafunc.config.getoption("engine")
+        or [engine.value for engine in ExecutionEngine]
+    )
+    metafunc.parametrize(
+        "execution_engine",
+        [ExecutionEngine(value) for value in values],
+        ids=values,
+    )
+
+
+@pytest.fixture(autouse=True)
+def default_engine(request, monkeypatch, execution_engine):
+    """Make every virtual machine of the test use the execution engine."""
+    monkeypatch.setitem(
+        VirtualMachine.__init__.__kwdefaults__, "engine", execution_engine
+    )
+    for value in vars(request.module).values():
+        if isinstance(value, VirtualMachine):
+            monkeypatch.setattr(value, "engine", execution_engine)
+    return execution_engine
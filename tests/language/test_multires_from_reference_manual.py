@@ -167,3 +167,30 @@ def test_tableconstructor_culling():
     # {f(), 5}           -- creates a list with the first result from f() and 5.
     t, = run_chunk("return {f(), 5}", new_vm())
     assert t.map.items() == py2lua([100, 5]).map.items()
+
+
+def test_return_culling():
+    # Only the last expression of a return statement is expanded.
+    r_val = run_chunk("return f(), g()", new_vm())
+    assert r_val == [
+        LuaNumber(100), LuaNumber(1000), LuaNumber(2000), LuaNumber(3000)
+    ]
+    r_val = run_chunk("return ..., x", new_vm())
+    assert r_val == [LuaNumber(-100), LuaString(b"marks the spot")]
+
+
+def test_tableconstructor_vararg_with_nils():
+    vm = new_vm()
+    r_val = run_chunk(
+        """
+        local function pack(...) return {...}, select("#", ...) end
+        local t, n = pack(nil, 2, nil)
+        local u = {1, 2, select(2, 3, nil, 5)}
+        return n, t[2], t[3], u[3], u[4]
+        """,
+        vm,
+    )
+    assert r_val == [LuaNumber(3), LuaNumber(2), LuaNil, LuaNil, LuaNumber(5)]
+    assert run_chunk("local t = {...} t[1] = 0 return ...", vm) == [
+        LuaNumber(-100), LuaNumber(-200), LuaNumber(-300)
+    ]
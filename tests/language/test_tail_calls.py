@@ -0,0 +1,171 @@
+import sys
+
+import pytest
+
+from mehtap.control_structures import LuaError
+from mehtap.values import LuaFalse, LuaNil, LuaNumber, LuaString, LuaTrue
+from mehtap.vm import MAX_RECURSION_LIMIT, VirtualMachine
+
+
+def test_tail_calls_dont_nest():
+    vm = VirtualMachine(max_call_depth=100)
+    assert vm.exec(
+        """
+        local function loop(n, acc)
+            if n == 0 then return acc end
+            return loop(n - 1, acc + n)
+        end
+        local is_even, is_odd
+        function is_even(n)
+            if n == 0 then return true end
+            return is_odd(n - 1)
+        end
+        function is_odd(n)
+            if n == 0 then return false end
+            return is_even(n - 1)
+        end
+        local counter = {n = 0}
+        function counter:count(n)
+            if n == 0 then return self.n end
+            self.n = self.n + 1
+            return self:count(n - 1)
+        end
+        local r = loop(20000, 0)
+        return r, is_even(10001), counter:count(20000)
+        """
+    ) == [LuaNumber(200010000), LuaFalse, LuaNumber(20000)]
+
+
+def test_tail_calls_return_all_values():
+    vm = VirtualMachine()
+    assert vm.exec(
+        """
+        local function pair(a, b) return a, b end
+        local function first(a, b) return (pair(a, b)) end
+        local function both(a, b) return pair(a, b) end
+        local function native(...) return select("#", ...) end
+        local callable = setmetatable({}, {
+            __call = function(self, x) return x, x end
+        })
+        local function call(x) return callable(x) end
+        local function nothing() return select(2, "x") end
+        local t = {both(1, 2)}
+        local a, b = first(3, 4)
+        local c = select("#", call(5))
+        local d = select("#", nothing())
+        return #t, a, b, native(1, nil, nil), c, d
+        """
+    ) == [
+        LuaNumber(2), LuaNumber(3), LuaNil, LuaNumber(3), LuaNumber(2),
+        LuaNumber(0),
+    ]
+
+
+def test_deep_recursion():
+    vm = VirtualMachine()
+    assert vm.exec(
+        """
+        local function sum(n)
+            if n == 0 then return 0 end
+            return n + sum(n - 1)
+        end
+        local r = sum(20000)
+        return r
+        """
+    ) == [LuaNumber(200010000)]
+
+
+def test_recursion_limit_is_raised_only_while_lua_runs():
+    recursion_limit = sys.getrecursionlimit()
+    vm = VirtualMachine()
+    assert sys.getrecursionlimit() == recursion_limit
+    with vm.running_lua():
+        assert sys.getrecursionlimit() > recursion_limit
+        # Lua code entered again from Python doesn't restore it early.
+        vm.exec("return 1")
+        assert sys.getrecursionlimit() > recursion_limit
+    assert sys.getrecursionlimit() == recursion_limit
+    with pytest.raises(LuaError):
+        vm.exec("error('x')")
+    assert sys.getrecursionlimit() == recursion_limit
+    with VirtualMachine(max_call_depth=10**9).running_lua():
+        assert sys.getrecursionlimit() == MAX_RECURSION_LIMIT
+
+
+@pytest.mark.parametrize("call", [
+    "pcall(f, n - 1)",
+    "xpcall(f, function(m) return m end, n - 1)",
+])
+def test_recursion_through_native_functions_overflows_the_stack(call):
+    vm = VirtualMachine()
+    with pytest.raises(LuaError, match="stack overflow"):
+        vm.exec(
+            f"""
+            local function f(n)
+                if n == 0 then return 0 end
+                local ok, v = {call}
+                if not ok then error(v, 0) end
+                return v + 1
+            end
+            return f(20000)
+            """
+        )
+    assert vm.exec(
+        f"""
+        local function f(n)
+            if n == 0 then return 0 end
+            return select(2, {call})
+        end
+        local r = f(20000)
+        return r
+        """
+    ) == [LuaString(b"C stack overflow")]
+    # Less deep recursion works, and the calls that failed aren't counted.
+    assert vm.exec(
+        f"""
+        local function f(n)
+            if n == 0 then return 0 end
+            local ok, v = {call}
+            return v + 1
+        end
+        local r = f(150)
+        return r
+        """
+    ) == [LuaNumber(150)]
+
+
+def test_recursion_through_metamethods_overflows_the_stack():
+    vm = VirtualMachine()
+    ok, message = vm.exec(
+        """
+        local t = setmetatable({}, {
+            __index = function(t, k) return t[k + 1] end,
+        })
+        return pcall(function() return t[1] end)
+        """
+    )
+    assert ok is LuaFalse
+    assert "stack overflow" in str(message)
+    ok, message = vm.exec(
+        """
+        local s = setmetatable({}, {
+            __tostring = function(s) return tostring(s) end,
+        })
+        return pcall(tostring, s)
+        """
+    )
+    assert ok is LuaFalse
+    assert "stack overflow" in str(message)
+
+
+def test_code_is_parsed_with_the_recursion_limit_of_the_host():
+    # The parser recurses on the C stack,
+    # so it can't use the recursion limit that Lua code runs with.
+    vm = VirtualMachine()
+    source = "return " + "(" * 400 + "1" + ")" * 400
+    with pytest.raises(RecursionError):
+        vm.exec(source)
+    vm.globals.rawput(LuaString(b"source"), LuaString(source.encode()))
+    f, message = vm.exec("return load(source)")
+    assert f is LuaNil
+    assert "recursion" in str(message)
@@ -2,6 +2,7 @@ from pathlib import Path
 
 import pytest
 
+from mehtap.parser import ParserBackend
 from mehtap.vm import VirtualMachine
 
 
@@ -21,9 +22,10 @@ paths = [
 ]
 
 
+@pytest.mark.parametrize("parser_backend", list(ParserBackend))
 @pytest.mark.parametrize("path", paths)
-def test_program(path: Path, capsys):
-    vm = VirtualMachine()
+def test_program(path: Path, parser_backend: ParserBackend, capsys):
+    vm = VirtualMachine(parser_backend=parser_backend)
 
     stdin_path = path.with_suffix(".stdin")
     if stdin_path.exists():
@@ -0,0 +1,85 @@
+import pytest
+
+from mehtap.control_structures import LuaError
+from mehtap.values import LuaBool, LuaNumber, LuaString
+from mehtap.vm import VirtualMachine
+
+MAX = 9223372036854775807
+MIN = -9223372036854775808
+
+
+def test_integer_overflow_wraps_around():
+    vm = VirtualMachine()
+    assert vm.exec(
+        f"""
+        local max, min = {MAX}, -{MAX} - 1
+        return max + 1, min - 1, max * 2, min * -1, -min, max + max
+        """
+    ) == [
+        LuaNumber(MIN), LuaNumber(MAX), LuaNumber(-2), LuaNumber(MIN),
+        LuaNumber(MIN), LuaNumber(-2),
+    ]
+    assert vm.exec(f"return {MAX} + 0, 0xffffffffffffffff") == [
+        LuaNumber(MAX), LuaNumber(-1)
+    ]
+
+
+def test_integer_and_float_subtypes():
+    vm = VirtualMachine()
+    results = vm.exec("return 3 + 4, 3 + 4.0, 2 * 2.5, 7 - 0.5, 6 / 3")
+    assert results == [
+        LuaNumber(7), LuaNumber(7.0), LuaNumber(5.0), LuaNumber(6.5),
+        LuaNumber(2.0),
+    ]
+    assert [type(n.value) for n in results] == [int, float, float, float, float]
+
+
+def test_floor_division_and_modulo():
+    vm = VirtualMachine()
+    assert vm.exec("return -7 // 2, 7 // -2, -7 % 3, 7 % -3") == [
+        LuaNumber(-4), LuaNumber(-4), LuaNumber(2), LuaNumber(-2)
+    ]
+    results = vm.exec("return 7.5 // 2, -7.5 // 2, 5.5 % 2, -5.5 % 2, 1 // 0.0")
+    assert results == [
+        LuaNumber(3.0), LuaNumber(-4.0), LuaNumber(1.5), LuaNumber(0.5),
+        LuaNumber(float("inf")),
+    ]
+    assert all(type(n.value) is float for n in results)
+    assert vm.exec("return 5 % (1/0), -5 % (1/0), 1 % 0.0 ~= 1 % 0.0") == [
+        LuaNumber(5.0), LuaNumber(float("inf")), LuaBool(True)
+    ]
+    assert vm.exec(f"return (-{MAX} - 1) // -1, (-{MAX} - 1) % -1") == [
+        LuaNumber(MIN), LuaNumber(0)
+    ]
+
+
+@pytest.mark.parametrize("source, message", [
+    ("return 1 // 0", "attempt to perform 'n//0'"),
+    ("return 1 % 0", "attempt to perform 'n%%0'"),
+    ("return 1 + {}", "attempt to add number and table values"),
+    ("return 1 < 'x'", "attempt to compare number with string"),
+])
+def test_errors(source, message):
+    vm = VirtualMachine()
+    with pytest.raises(LuaError) as excinfo:
+        vm.exec(source)
+    assert message in str(excinfo.value)
+
+
+def test_metamethods_are_used_when_operands_are_not_numbers():
+    vm = VirtualMachine()
+    assert vm.exec(
+        """
+        local calls = 0
+        local mt = {
+            __add = function(a, b) return "add" end,
+            __lt = function(a, b) return true end,
+            __eq = function(a, b) calls = calls + 1 return true end,
+        }
+        local a, b = setmetatable({}, mt), setmetatable({}, mt)
+        return a + 1, 1 + a, a < b, a == b, a == a, calls
+        """
+    ) == [
+        LuaString(b"add"), LuaString(b"add"), LuaBool(True), LuaBool(True),
+        LuaBool(True), LuaNumber(1),
+    ]
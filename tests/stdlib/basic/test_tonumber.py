@@ -43,3 +43,7 @@ def test_fail():
     assert execute(
         'return tonumber("5", 3)',
     ) == [LuaNil]
+
+
+def test_nil_base():
+    assert execute('return tonumber("10", nil)') == [LuaNumber(10)]
@@ -1,3 +1,6 @@
+import pytest
+
+from mehtap.control_structures import LuaError
 from mehtap.values import LuaString, LuaThread, Variable, LuaUserdata
 from mehtap.vm import VirtualMachine
 
@@ -45,3 +48,9 @@ def test_type_userdata():
     vm = VirtualMachine()
     vm.put_nonlocal_ls(LuaString(b"ud"), Variable(LuaUserdata()))
     assert vm.exec("return type(ud)") == [LuaString(b"userdata")]
+
+
+def test_type_without_argument():
+    with pytest.raises(LuaError) as excinfo:
+        execute("return type()")
+    assert "bad argument #1 to 'type' (value expected)" in str(excinfo.value)
@@ -41,3 +41,9 @@ def test_table_concat_with_empty_table():
     vm = VirtualMachine()
     result, = vm.eval("table.concat({})")
     assert result == py2lua("")
+
+
+def test_table_concat_with_nil_arguments():
+    vm = VirtualMachine()
+    result, = vm.eval("table.concat({1,2,3}, nil, nil, 2)")
+    assert result == py2lua("12")
@@ -0,0 +1,121 @@
+import pytest
+
+from mehtap.bytecode import Opcode, disassemble
+from mehtap.bytecode_compiler import compile_chunk
+from mehtap.bytecode_interpreter import BytecodeFunction
+from mehtap.control_structures import LuaError
+from mehtap.execution import ExecutionEngine
+from mehtap.parser import parse_chunk
+from mehtap.values import LuaNumber, LuaString
+from mehtap.vm import VirtualMachine
+
+
+def test_bytecode_engine_creates_bytecode_functions():
+    vm = VirtualMachine(engine=ExecutionEngine.BYTECODE)
+    function, = vm.exec("return function(a, b) return a + b end")
+    assert isinstance(function, BytecodeFunction)
+    assert function.rawcall([LuaNumber(1), LuaNumber(2)], None) == [
+        LuaNumber(3)
+    ]
+
+
+def test_constants_are_pooled():
+    prototype = compile_chunk(
+        parse_chunk(
+            'local a = "x" .. "x" return 10, 10, a',
+            filename="t",
+            optimize=False,
+        )
+    )
+    strings = [c for c in prototype.constants if isinstance(c, LuaString)]
+    numbers = [c for c in prototype.constants if isinstance(c, LuaNumber)]
+    assert strings.count(LuaString(b"x")) == 1
+    assert numbers.count(LuaNumber(10)) == 1
+
+
+def test_disassemble():
+    prototype = compile_chunk(
+        parse_chunk(
+            "local function f(n) return n + 1 end return f(2)",
+            filename="t",
+        )
+    )
+    listing = disassemble(prototype)
+    assert listing.startswith("main <")
+    assert "CLOSURE" in listing
+    assert "function <" in listing
+    assert "ADD" in listing
+    assert "; 1" in listing
+    assert Opcode.RETURN.name in disassemble(prototype, nested=False)
+    assert "function <" not in disassemble(prototype, nested=False)
+
+
+def test_deep_lua_recursion_does_not_recurse_in_python():
+    vm = VirtualMachine(engine=ExecutionEngine.BYTECODE)
+    assert vm.exec(
+        """
+        local function depth(n)
+            if n == 0 then return 0 end
+            return 1 + depth(n - 1)
+        end
+        return depth(5000)
+        """
+    ) == [LuaNumber(5000)]
+
+
+def test_tail_calls_reuse_the_frame():
+    prototype = compile_chunk(
+        parse_chunk(
+            "local function f(n) if n > 0 then return f(n - 1) end end "
+            "return (f(1))",
+            filename="t",
+        )
+    )
+    (function,) = prototype.prototypes
+    ops = [op for op, _, _, _ in function.code]
+    assert ops.count(Opcode.TAILCALL) == 1
+    assert ops[ops.index(Opcode.TAILCALL) + 1] == Opcode.RETURN
+    assert Opcode.TAILCALL not in [op for op, _, _, _ in prototype.code]
+    vm = VirtualMachine(engine=ExecutionEngine.BYTECODE, max_call_depth=10)
+    assert vm.exec(
+        """
+        local function count(n, acc)
+            if n == 0 then return acc end
+            return count(n - 1, acc + 1)
+        end
+        local r = count(10000, 0)
+        return r
+        """
+    ) == [LuaNumber(10000)]
+
+
+def test_error_traceback_names_call_site():
+    vm = VirtualMachine(engine=ExecutionEngine.BYTECODE)
+    with pytest.raises(LuaError) as excinfo:
+        vm.exec("local function f() error('boom') end\nf()")
+    assert str(excinfo.value).endswith("boom")
+    assert any(
+        "call of function" in message and ":2" in message
+        for message in excinfo.value.traceback_messages
+    )
+
+
+def test_if_chains_jump_through_tables():
+    source = """
+        local function classify(op)
+            if op == "a" then return 1
+            elseif op == "b" then return 2
+            elseif op == 3 then return 3
+            end
+            return 0
+        end
+        return classify("b"), classify(3.0), classify("c"), classify({})
+    """
+    prototype = compile_chunk(parse_chunk(source, filename="t"))
+    function, = prototype.prototypes
+    assert [op for op, *_ in function.code].count(Opcode.JMPTABLE) == 1
+    assert "jump tables (1):" in disassemble(prototype)
+    vm = VirtualMachine(engine=ExecutionEngine.BYTECODE)
+    assert vm.exec(source) == [
+        LuaNumber(2), LuaNumber(3), LuaNumber(0), LuaNumber(0)
+    ]
@@ -0,0 +1,115 @@
+import os
+
+import pytest
+
+from mehtap.chunk_cache import ChunkCache, CACHE_DIRECTORY_NAME
+from mehtap.values import LuaNumber, LuaString
+from mehtap.vm import VirtualMachine
+
+
+@pytest.fixture
+def script(tmp_path):
+    path = tmp_path / "script.lua"
+    path.write_text("local a = 20\nreturn a + 22\n", encoding="utf-8")
+    return path
+
+
+def test_miss_then_hit(script):
+    cache = ChunkCache()
+    vm = VirtualMachine(chunk_cache=cache)
+    assert vm.exec_file(script) == [LuaNumber(42)]
+    assert (cache.hits, cache.misses) == (0, 1)
+    assert cache.cache_path(script).parent.name == CACHE_DIRECTORY_NAME
+    assert cache.cache_path(script).exists()
+    assert vm.exec_file(script) == [LuaNumber(42)]
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_hit_skips_parser(script, monkeypatch):
+    cache = ChunkCache()
+    VirtualMachine(chunk_cache=cache).exec_file(script)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("the parser was used")
+
+    monkeypatch.setattr("mehtap.chunk_cache.parse_chunk", fail)
+    vm = VirtualMachine(chunk_cache=cache)
+    assert vm.exec_file(script) == [LuaNumber(42)]
+    assert cache.hits == 1
+
+
+def test_changed_source_is_a_miss(script):
+    cache = ChunkCache()
+    vm = VirtualMachine(chunk_cache=cache)
+    vm.exec_file(script)
+    script.write_text("return 'changed'\n", encoding="utf-8")
+    assert vm.exec_file(script) == [LuaString(b"changed")]
+    assert (cache.hits, cache.misses) == (0, 2)
+
+
+def test_touched_source_is_a_hit(script):
+    cache = ChunkCache()
+    vm = VirtualMachine(chunk_cache=cache)
+    vm.exec_file(script)
+    stat = script.stat()
+    os.utime(script, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert vm.exec_file(script) == [LuaNumber(42)]
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_corrupt_cache_file_is_a_miss(script):
+    cache = ChunkCache()
+    vm = VirtualMachine(chunk_cache=cache)
+    vm.exec_file(script)
+    cache.cache_path(script).write_bytes(b"garbage")
+    assert vm.exec_file(script) == [LuaNumber(42)]
+    assert (cache.hits, cache.misses) == (0, 2)
+
+
+def test_custom_directory(script, tmp_path):
+    directory = tmp_path / "cache"
+    cache = ChunkCache(directory)
+    vm = VirtualMachine(chunk_cache=cache)
+    vm.exec_file(script)
+    assert cache.cache_path(script).parent == directory
+    assert len(list(directory.iterdir())) == 1
+    assert not (script.parent / CACHE_DIRECTORY_NAME).exists()
+
+
+def test_chunk_names_have_their_own_cache_files(script):
+    cache = ChunkCache()
+    for _ in range(2):
+        for filename in ("script.lua", "other"):
+            chunk = cache.load(script, filename=filename)
+            assert chunk.file == filename
+    assert (cache.hits, cache.misses) == (2, 2)
+    assert cache.cache_path(script) == cache.cache_path(
+        script, filename="script.lua"
+    )
+    assert cache.cache_path(script) != cache.cache_path(
+        script, filename="other"
+    )
+
+
+def test_dofile_and_loadfile(script):
+    cache = ChunkCache()
+    vm = VirtualMachine(chunk_cache=cache)
+    path = str(script).replace("\\", "\\\\")
+    assert vm.exec(f'return dofile("{path}")') == [LuaNumber(42)]
+    assert vm.exec(f'return loadfile("{path}")()') == [LuaNumber(42)]
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_shebang_line_is_skipped(tmp_path):
+    path = tmp_path / "shebang.lua"
+    path.write_text("#!/usr/bin/env mehtap\nreturn 1\n", encoding="utf-8")
+    assert VirtualMachine().exec_file(path) == [LuaNumber(1)]
+
+
+def test_changed_tree_modules_are_a_miss(script, monkeypatch):
+    cache = ChunkCache()
+    vm = VirtualMachine(chunk_cache=cache)
+    vm.exec_file(script)
+    monkeypatch.setattr("mehtap.chunk_cache._tree_version", "other")
+    assert vm.exec_file(script) == [LuaNumber(42)]
+    assert (cache.hits, cache.misses) == (0, 2)
@@ -0,0 +1,139 @@
+import attrs
+import pytest
+
+from mehtap.descent_parser import LuaSyntaxError, tokenize
+from mehtap.parser import ParserBackend, parse_chunk
+from mehtap.values import LuaNumber, LuaString, LuaNil, LuaBool
+from mehtap.vm import VirtualMachine
+
+
+def normalized(node):
+    def convert(value):
+        if isinstance(value, dict):
+            return {k: convert(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return tuple(convert(v) for v in value)
+        return value
+
+    return convert(
+        attrs.asdict(node, filter=lambda a, v: a.name not in ("file", "line"))
+    )
+
+
+@pytest.mark.parametrize(
+    "source",
+    [
+        "local a <const>, b = 1, 2.5e3",
+        "x, y.z, w[1] = f(1), g:h 'str', {1, 2; k = 3, [4] = 5,}",
+        "function a.b.c:d(x, y, ...) return x + y * 2 - -x end",
+        "local function f() return end",
+        "while x < 10 do x = x + 1 end",
+        "repeat local y = 1 until y == 1",
+        "for i = 1, 10, 2 do print(i) end",
+        "for k, v in pairs(t) do print(k, v) end",
+        "if a then b() elseif c then d() else e() end",
+        "do goto done ::done:: end",
+        "return not a == b, #t, ~x, 0x1F, 0xA.8p1, [[long\nstring]]",
+        "f(function(...) return ... end)",
+        "a = (b or c) and d",
+    ],
+)
+def test_same_tree_as_earley(source):
+    earley = parse_chunk(source, filename="test")
+    descent = parse_chunk(
+        source,
+        filename="test",
+        backend=ParserBackend.RECURSIVE_DESCENT,
+    )
+    assert normalized(earley) == normalized(descent)
+
+
+def execute(program):
+    vm = VirtualMachine(parser_backend=ParserBackend.RECURSIVE_DESCENT)
+    return vm.exec(program)
+
+
+def test_exponentiation_is_right_associative():
+    assert execute("return 2^3^2") == [LuaNumber(512.0)]
+
+
+def test_unary_minus_binds_looser_than_exponentiation():
+    assert execute("return -2^2") == [LuaNumber(-4.0)]
+
+
+def test_concatenation_is_right_associative():
+    assert execute("return 1 .. 2 .. 3") == [LuaString(b"123")]
+
+
+def test_arithmetic_precedence():
+    assert execute("return 1 + 2 * 3 - 8 // 3, 2 * (3 + 1)") == [
+        LuaNumber(5),
+        LuaNumber(8),
+    ]
+
+
+def test_comparison_and_logic_precedence():
+    assert execute("return 1 < 2 and 3 or 4, nil or false == false") == [
+        LuaNumber(3),
+        LuaBool(True),
+    ]
+
+
+def test_numerals_without_leading_or_trailing_digits():
+    assert execute("return .5, 5., 3e2") == [
+        LuaNumber(0.5),
+        LuaNumber(5.0),
+        LuaNumber(300.0),
+    ]
+
+
+def test_comments():
+    assert execute(
+        "--[==[ long\ncomment ]==] return 1 -- short comment"
+    ) == [LuaNumber(1)]
+
+
+def test_line_numbers():
+    chunk = parse_chunk(
+        "local a = 1\n\nlocal b = [[\n\n]]\nreturn a",
+        filename="lines",
+        backend=ParserBackend.RECURSIVE_DESCENT,
+    )
+    assert [s.line for s in chunk.block.statements] == [1, 3]
+    assert chunk.block.return_statement.line == 6
+    assert chunk.file == "lines"
+
+
+def test_tokenize_keywords_and_names():
+    kinds = [kind for kind, _, _ in tokenize("local x = y")]
+    assert kinds == ["local", "<name>", "=", "<name>", "<eof>"]
+
+
+@pytest.mark.parametrize(
+    "source",
+    [
+        "x = ",
+        "local = 1",
+        "f() = 1",
+        "if x then",
+        "return 1 print(2)",
+        "x = 'unfinished",
+        "x = 1 $ 2",
+    ],
+)
+def test_syntax_errors(source):
+    with pytest.raises(LuaSyntaxError):
+        execute(source)
+
+
+def test_syntax_error_message_has_line():
+    with pytest.raises(LuaSyntaxError) as excinfo:
+        execute("x = 1\ny = = 2")
+    assert excinfo.value.line == 2
+    assert "<exec>:2:" in str(excinfo.value)
+
+
+def test_load_returns_fail_on_syntax_error():
+    result = execute("return load('x = = 1')")
+    assert result[0] is LuaNil
+    assert isinstance(result[1], LuaString)
@@ -0,0 +1,215 @@
+import pytest
+
+from mehtap.closure_compiler import ClosureFunction
+from mehtap.control_structures import LuaError
+from mehtap.execution import ExecutionEngine
+from mehtap.values import (
+    LuaFalse,
+    LuaFunction,
+    LuaNil,
+    LuaNumber,
+    LuaString,
+)
+from mehtap.vm import VirtualMachine
+
+
+def test_default_engine_is_used(execution_engine):
+    assert VirtualMachine().engine is execution_engine
+
+
+def test_closure_engine_creates_closure_functions():
+    vm = VirtualMachine(engine=ExecutionEngine.CLOSURES)
+    function, = vm.exec("return function(a, b) return a + b end")
+    assert isinstance(function, ClosureFunction)
+    assert str(function).startswith("function([a[, b]])")
+    assert function.rawcall([LuaNumber(1), LuaNumber(2)], None) == [
+        LuaNumber(3)
+    ]
+
+
+def test_chunk_locals_persist_between_chunks():
+    vm = VirtualMachine()
+    vm.exec("local x = 1; function get() return x end")
+    assert vm.root_scope.get_ls(LuaString(b"x")) == LuaNumber(1)
+    assert vm.exec("x = 5; return get()") == [LuaNumber(5)]
+
+
+def test_loop_variables_are_fresh_in_each_iteration():
+    vm = VirtualMachine(engine=ExecutionEngine.CLOSURES)
+    assert vm.exec(
+        """
+        local fs = {}
+        for i = 1, 3 do fs[i] = function() return i end end
+        return fs[1](), fs[2](), fs[3]()
+        """
+    ) == [LuaNumber(1), LuaNumber(2), LuaNumber(3)]
+
+
+def test_shared_upvalue():
+    vm = VirtualMachine()
+    assert vm.exec(
+        """
+        local function counter()
+            local n = 0
+            return function() n = n + 1 return n end,
+                   function() return n end
+        end
+        local inc, get = counter()
+        inc() inc()
+        return get()
+        """
+    ) == [LuaNumber(2)]
+
+
+def test_goto_continue():
+    vm = VirtualMachine()
+    assert vm.exec(
+        """
+        local sum = 0
+        for i = 1, 10 do
+            if i % 2 == 0 then goto continue end
+            sum = sum + i
+            ::continue::
+        end
+        return sum
+        """
+    ) == [LuaNumber(25)]
+
+
+def test_break_out_of_nested_block():
+    vm = VirtualMachine()
+    assert vm.exec(
+        """
+        local i = 0
+        while true do
+            do
+                i = i + 1
+                if i == 4 then break end
+            end
+        end
+        return i
+        """
+    ) == [LuaNumber(4)]
+
+
+def test_repeat_condition_sees_block_locals():
+    vm = VirtualMachine()
+    assert vm.exec(
+        "local n = 0 repeat local done = n >= 3; n = n + 1 until done "
+        "return n"
+    ) == [LuaNumber(4)]
+
+
+def test_assignment_to_constant():
+    vm = VirtualMachine()
+    with pytest.raises(LuaError) as excinfo:
+        vm.exec("do local x <const> = 1; x = 2 end")
+    assert "attempt to change constant variable" in str(excinfo.value)
+
+
+def test_assignment_to_constant_fails_when_it_runs():
+    vm = VirtualMachine()
+    f, message, count, ok_local, local_message, ok_upvalue, upvalue_message = (
+        vm.exec(
+            """
+            local f, message = load(
+                "local x <const> = 1; " ..
+                "local function g() x = 2 end; " ..
+                "if ... then count = count + 1; x = count end; " ..
+                "g()"
+            )
+            count = 0
+            local ok_local, local_message = pcall(f, true)
+            local ok_upvalue, upvalue_message = pcall(f, false)
+            return f, message, count, ok_local, local_message,
+                ok_upvalue, upvalue_message
+            """
+        )
+    )
+    assert isinstance(f, LuaFunction)
+    assert message is LuaNil
+    # The value is evaluated before the assignment fails.
+    assert count == LuaNumber(1)
+    assert ok_local is LuaFalse and ok_upvalue is LuaFalse
+    assert "attempt to change constant variable" in str(local_message)
+    assert "attempt to change constant variable" in str(upvalue_message)
+
+
+def test_varargs_outside_vararg_function():
+    vm = VirtualMachine()
+    with pytest.raises(LuaError) as excinfo:
+        vm.exec("function f() return ... end")
+        vm.exec("return f()")
+    assert "cannot use '...' outside a vararg function" in str(excinfo.value)
+
+
+def test_last_statement_is_echoed():
+    vm = VirtualMachine()
+    assert vm.exec("x = 1, 2") == [LuaNumber(1)]
+    assert vm.exec("local a, b = 3") == [LuaNumber(3), LuaNil]
+
+
+def test_load_runs_in_new_scope():
+    vm = VirtualMachine()
+    assert vm.exec(
+        """
+        local f = load("local n = (n or 0) + 1; return n, ...")
+        return f("x")
+        """
+    ) == [LuaNumber(1), LuaString(b"x")]
+
+
+def test_local_declaration_without_values():
+    vm = VirtualMachine()
+    assert vm.exec(
+        """
+        local a, b
+        do local c; a = c end
+        return a, b
+        """
+    ) == [LuaNil, LuaNil]
+
+
+def test_backward_goto():
+    vm = VirtualMachine()
+    assert vm.exec(
+        "local i = 0 ::top:: i = i + 1 if i < 5 then goto top end return i"
+    ) == [LuaNumber(5)]
+
+
+def test_return_from_nested_loops():
+    vm = VirtualMachine()
+    assert vm.exec(
+        """
+        local function find(n)
+            for i = 1, 10 do
+                local j = 0
+                while true do
+                    j = j + 1
+                    if i * j == n then return i, j end
+                    if j > 10 then break end
+                end
+            end
+        end
+        return find(12)
+        """
+    ) == [LuaNumber(2), LuaNumber(6)]
+
+
+def test_function_without_return_returns_nothing():
+    vm = VirtualMachine()
+    assert vm.exec("local function f() local a = 5 end return f()") == []
+
+
+@pytest.mark.parametrize(
+    "source,message",
+    [
+        ("break", "break outside a loop"),
+        ("goto nowhere", "no visible label 'nowhere' for <goto>"),
+    ],
+)
+def test_unfinished_jump(source, message):
+    vm = VirtualMachine()
+    with pytest.raises(LuaError) as excinfo:
+        vm.exec(source)
+    assert message in str(excinfo.value)
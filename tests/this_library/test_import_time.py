@@ -0,0 +1,61 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import mehtap
+
+SRC_DIRECTORY = Path(mehtap.__file__).parent.parent
+
+CHECK_IMPORT = """
+import sys
+import mehtap
+import mehtap.parser
+print("lark" in sys.modules)
+print(bool(mehtap.parser._parsers))
+print(mehtap.parser._pickled_grammar is not None)
+"""
+
+BUILD_PARSER = """
+import mehtap.parser
+mehtap.parser.get_parser("numeral")
+print(mehtap.parser.GRAMMAR_CACHE_DIRECTORY)
+"""
+
+
+def run_python(code: str, **environment: str) -> list[str]:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        p for p in (str(SRC_DIRECTORY), env.get("PYTHONPATH")) if p
+    )
+    env.update(environment)
+    return subprocess.run(
+        [sys.executable, "-c", code],
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout.splitlines()
+
+
+def test_import_does_not_build_parsers():
+    imported_lark, built_parsers, loaded_grammar = run_python(CHECK_IMPORT)
+    assert imported_lark == "False"
+    assert built_parsers == "False"
+    assert loaded_grammar == "False"
+
+
+def test_grammar_is_cached_in_cache_directory(tmp_path):
+    directory, = run_python(BUILD_PARSER, MEHTAP_CACHE_DIR=str(tmp_path))
+    assert Path(directory) == tmp_path
+    assert list(tmp_path.glob("lua.lark.*.pickle"))
+    # The cached grammar is used by the next process.
+    run_python(BUILD_PARSER, MEHTAP_CACHE_DIR=str(tmp_path))
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_unwritable_cache_directory(tmp_path):
+    not_a_directory = tmp_path / "file"
+    not_a_directory.write_bytes(b"")
+    run_python(BUILD_PARSER, MEHTAP_CACHE_DIR=str(not_a_directory / "cache"))
+    assert list(tmp_path.iterdir()) == [not_a_directory]
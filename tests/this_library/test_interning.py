@@ -0,0 +1,49 @@
+import copy
+import pickle
+
+from mehtap.py2lua import py2lua
+from mehtap.values import (
+    LuaBool,
+    LuaFalse,
+    LuaNumber,
+    LuaNumberType,
+    LuaTrue,
+    SMALL_INTEGERS,
+    lua_integer,
+)
+from mehtap.vm import VirtualMachine
+
+
+def test_booleans_are_singletons():
+    assert LuaBool(True) is LuaTrue
+    assert LuaBool(False) is LuaFalse
+    assert LuaBool(1) is LuaTrue and LuaTrue.true is True
+    assert py2lua(False) is LuaFalse
+    assert copy.deepcopy(LuaTrue) is LuaTrue
+    assert pickle.loads(pickle.dumps(LuaFalse)) is LuaFalse
+
+
+def test_small_integers_are_shared():
+    assert lua_integer(5) is lua_integer(5)
+    assert lua_integer(SMALL_INTEGERS[0]) is lua_integer(SMALL_INTEGERS[0])
+    assert lua_integer(SMALL_INTEGERS[-1]) is lua_integer(SMALL_INTEGERS[-1])
+    big = SMALL_INTEGERS[-1] + 1
+    assert lua_integer(big) is not lua_integer(big)
+    assert lua_integer(big) == LuaNumber(big)
+    assert lua_integer(-3).type is LuaNumberType.INTEGER
+
+
+def test_engines_return_shared_values():
+    vm = VirtualMachine()
+    a, b, c, d = vm.exec("local x = 20 return x + 1, 21, 1 < 2, not 1")
+    assert a is b is lua_integer(21)
+    assert c is LuaTrue
+    assert d is LuaFalse
+
+
+def test_tonumber_does_not_modify_shared_numbers():
+    vm = VirtualMachine()
+    assert vm.exec('return tonumber("-7", 10), 7') == [
+        LuaNumber(-7), LuaNumber(7)
+    ]
+    assert lua_integer(7).value == 7
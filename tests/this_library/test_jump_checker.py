@@ -0,0 +1,99 @@
+import pytest
+
+from mehtap.descent_parser import LuaSyntaxError
+from mehtap.parser import ParserBackend, parse_chunk
+from mehtap.values import LuaNumber, LuaNil
+from mehtap.vm import VirtualMachine
+
+
+@pytest.fixture(params=list(ParserBackend), ids=lambda b: b.value)
+def backend(request):
+    return request.param
+
+
+@pytest.mark.parametrize(
+    "source,message",
+    [
+        (
+            "goto nowhere",
+            "t:1: no visible label 'nowhere' for <goto> at line 1",
+        ),
+        (
+            "::a::\ndo ::a:: end",
+            "t:2: label 'a' already defined on line 1",
+        ),
+        (
+            "goto skip\nlocal x = 1\n::skip:: print(x)",
+            "t:1: <goto skip> at line 1 jumps into the scope of local 'x'",
+        ),
+        (
+            "do goto l end\nlocal x\n::l:: return",
+            "jumps into the scope of local 'x'",
+        ),
+        (
+            "::l:: local function f() goto l end",
+            "no visible label 'l' for <goto>",
+        ),
+        (
+            "repeat goto l; local x ::l:: until x",
+            "jumps into the scope of local 'x'",
+        ),
+        ("if true then break end", "t:1: break outside a loop at line 1"),
+        ("while true do local f = function() break end end", "break"),
+    ],
+)
+def test_invalid_jumps(backend, source, message):
+    with pytest.raises(LuaSyntaxError) as excinfo:
+        parse_chunk(source, filename="t", backend=backend)
+    assert message in str(excinfo.value)
+
+
+@pytest.mark.parametrize(
+    "source",
+    [
+        "do goto l end ::l::",
+        "goto done local x = 1 ::done:: ;",
+        "for i = 1, 3 do if i == 2 then goto continue end ::continue:: end",
+        "do ::a:: end ::a::",
+        "::top:: do local x goto top end",
+        "while true do do break end end",
+    ],
+)
+def test_valid_jumps(backend, source):
+    parse_chunk(source, filename="t", backend=backend)
+
+
+def test_invalid_chunk_does_not_run():
+    vm = VirtualMachine()
+    with pytest.raises(LuaSyntaxError):
+        vm.exec("ran = true goto nowhere")
+    assert vm.exec("return ran") == [LuaNil]
+
+
+def test_label_table(backend):
+    chunk = parse_chunk(
+        "local i = 0 ::a:: i = i + 1 ::b:: if i < 3 then goto a end",
+        filename="t",
+        backend=backend,
+    )
+    assert chunk.block.labels == {"a": 1, "b": 3}
+
+
+def test_state_machine():
+    vm = VirtualMachine()
+    assert vm.exec(
+        """
+        local n, steps = 7, 0
+        ::check::
+        if n == 1 then goto done end
+        steps = steps + 1
+        if n % 2 == 0 then goto even end
+        n = 3 * n + 1
+        goto check
+        ::even::
+        n = n // 2
+        goto check
+        ::done::
+        return steps
+        """
+    ) == [LuaNumber(16)]
@@ -0,0 +1,150 @@
+import sys
+import types
+
+import pytest
+
+from mehtap.__main__ import main
+from mehtap.control_structures import LuaError
+from mehtap.module_translator import translate, translate_file
+from mehtap.values import LuaFunction, LuaNil, LuaNumber, LuaString
+from mehtap.vm import VirtualMachine
+
+
+def load_module(source, name="translated"):
+    module = types.ModuleType(name)
+    exec(compile(translate(source, filename="test.lua"), name, "exec"),
+         module.__dict__)
+    return module
+
+
+def test_translated_chunks_run():
+    source = """
+        local Point = {}
+        Point.__index = Point
+        function Point.new(x, y) return setmetatable({x = x, y = y}, Point) end
+        function Point:length2() return self.x * self.x + self.y * self.y end
+
+        local function counter()
+            local n = 0
+            return function() n = n + 1; return n end
+        end
+        local next_number = counter()
+        next_number()
+
+        local getters = {}
+        for i = 1, 3 do getters[i] = function() return i end end
+
+        local odd = 0
+        for i = 1, 10 do
+            if i % 2 == 0 then goto continue end
+            odd = odd + i
+            ::continue::
+        end
+
+        local function count(...)
+            local sum = 0
+            for _, v in ipairs({...}) do sum = sum + v end
+            return sum, select("#", ...)
+        end
+
+        local limit <const> = 2.5
+        local a, b = count(1, 2, 3)
+        return Point.new(3, 4):length2(), next_number(),
+            getters[1]() + getters[3](), odd, a, b, limit, ...
+    """
+    module = load_module(source)
+    assert module.run(VirtualMachine(), LuaString(b"extra")) == [
+        LuaNumber(25), LuaNumber(2), LuaNumber(4), LuaNumber(25),
+        LuaNumber(6), LuaNumber(3), LuaNumber(2.5), LuaString(b"extra"),
+    ]
+
+
+def test_translated_modules_share_globals_with_interpreted_code():
+    module = load_module(
+        """
+        counter = 0
+        function bump(n) counter = counter + n; return counter end
+        return greet("module")
+        """
+    )
+    vm = VirtualMachine()
+    vm.exec('function greet(name) return "hello " .. name end')
+    assert module.run(vm) == [LuaString(b"hello module")]
+    # Functions of the module can be called from interpreted code,
+    # and they see the globals that it changes.
+    assert vm.exec("bump(2); counter = counter + 10; return bump(1)") == [
+        LuaNumber(13)
+    ]
+    bump = vm.exec("return bump")[0]
+    assert isinstance(bump, LuaFunction)
+    assert str(bump).startswith("function bump(")
+
+
+def test_loaded_chunks_are_functions():
+    module = load_module("local a, b = ... return b, a")
+    chunk = module.load(VirtualMachine())
+    assert chunk.variadic
+    assert chunk.rawcall([LuaNumber(1)], None) == [LuaNil, LuaNumber(1)]
+
+
+def test_functions_that_return_have_no_fallback_return():
+    source = translate(
+        "local function f(x) return x end return f(1), f(2)",
+        filename="test.lua",
+    )
+    assert "return []" not in source
+    module = load_module("local function f() local x = 1 end return f()")
+    assert module.run(VirtualMachine()) == []
+
+
+def test_errors_have_tracebacks():
+    module = load_module(
+        """
+        local function fail(t) return t.x.y end
+        return fail({})
+        """
+    )
+    with pytest.raises(LuaError) as excinfo:
+        module.run(VirtualMachine())
+    assert "attempt to index a nil value" in str(excinfo.value)
+    assert any(
+        entry.startswith("test.lua:3: call of function fail")
+        for entry in excinfo.value.traceback_messages
+    )
+    module = load_module("local x <const> = 1; x = 2")
+    with pytest.raises(LuaError, match="constant"):
+        module.run(VirtualMachine())
+
+
+@pytest.mark.parametrize("source", [
+    "::top:: goto top",
+    "for i = 1, 2 do goto skip; print(i) ::skip:: print(2) end",
+    "repeat goto continue; ::continue:: until true",
+])
+def test_other_gotos_cant_be_translated(source):
+    with pytest.raises(LuaError, match="can't translate goto"):
+        translate(source, filename="test.lua")
+
+
+def test_command_line_translates_files(tmp_path, monkeypatch):
+    (tmp_path / "script.lua").write_text("return 1 + 2, ...")
+    monkeypatch.setattr(sys, "argv", [
+        "mehtap",
+        "--translate", str(tmp_path / "script.lua"),
+        "-o", str(tmp_path / "script.py"),
+    ])
+    main()
+    sys.path.insert(0, str(tmp_path))
+    try:
+        import script
+    finally:
+        sys.path.remove(str(tmp_path))
+        sys.modules.pop("script", None)
+    assert script.run(VirtualMachine(), LuaNumber(4)) == [
+        LuaNumber(3), LuaNumber(4)
+    ]
+
+    translate_file(tmp_path / "script.lua", tmp_path / "other.py")
+    assert (tmp_path / "other.py").read_text() == (
+        tmp_path / "script.py"
+    ).read_text()
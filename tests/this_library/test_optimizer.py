@@ -0,0 +1,255 @@
+import pytest
+
+import mehtap.ast_nodes as nodes
+from mehtap.control_structures import LuaError
+from mehtap.optimizer import optimize_chunk
+from mehtap.parser import parse_chunk, parse_expression
+from mehtap.values import LuaFalse, LuaNil, LuaNumber, LuaString, LuaTrue
+from mehtap.vm import VirtualMachine
+
+
+def returned(source, **kwargs):
+    chunk = parse_chunk(source, filename="<test>", **kwargs)
+    return list(chunk.block.return_statement.values)
+
+
+def constant(node):
+    assert isinstance(
+        node,
+        (
+            nodes.NumeralConstant,
+            nodes.ParsedLiteralLuaStringExpr,
+            nodes.LiteralTrue,
+            nodes.LiteralFalse,
+            nodes.LiteralNil,
+        ),
+    ), node
+    return node._evaluate(None)
+
+
+def test_literals_are_folded():
+    values = returned(r"return 1, 0x10, 1.5e1, 'a\n', [[long]]")
+    assert [constant(value) for value in values] == [
+        LuaNumber(1), LuaNumber(16), LuaNumber(15.0),
+        LuaString(b"a\n"), LuaString(b"long"),
+    ]
+    assert [type(value) for value in returned("return 1, 'a'",
+                                              optimize=False)] == [
+        nodes.NumeralDec, nodes.LiteralString
+    ]
+
+
+def test_operators_of_constants_are_folded():
+    source = """
+        return 2 * 3 + 1, 7 // 2, 7 % -3, 2 ^ 10, -(-9223372036854775807 - 1),
+            1 / 0, 3 & 5 | 8, "a" .. 1 .. 2.5, 1 == 1.0, "a" < "b", 2 <= 1,
+            not nil, #"abc", ("x")
+    """
+    values = [constant(value) for value in returned(source)]
+    assert values == VirtualMachine().exec(source, filename="<test>")
+    assert values == VirtualMachine(optimize=False).exec(source)
+    assert values[:8] == [
+        LuaNumber(7), LuaNumber(3), LuaNumber(-2), LuaNumber(1024.0),
+        LuaNumber(-9223372036854775807 - 1), LuaNumber(float("inf")),
+        LuaNumber(9), LuaString(b"a12.5"),
+    ]
+    assert values[8:] == [
+        LuaTrue, LuaTrue, LuaFalse, LuaTrue, LuaNumber(3), LuaString(b"x"),
+    ]
+    assert constant(parse_expression("1 + 2", filename="<test>")) == (
+        LuaNumber(3)
+    )
+
+
+@pytest.mark.parametrize("expression", [
+    "1 // 0", "1.5 | 0", "'10' + 1", "'a' < 1", "{} == {}", "#{}",
+])
+def test_operators_that_can_fail_or_call_metamethods_are_not_folded(
+    expression,
+):
+    value, = returned(f"return {expression}")
+    assert isinstance(value, nodes.BinaryOperation | nodes.UnaryOperation)
+
+
+def test_and_and_or_with_constant_left_operands_are_folded():
+    values = returned("return nil and f(), 1 or f(), false or g(), 1 and h()")
+    assert constant(values[0]) is LuaNil
+    assert constant(values[1]) == LuaNumber(1)
+    assert isinstance(values[2], nodes.ParenExpression)
+    assert isinstance(values[3], nodes.ParenExpression)
+    vm = VirtualMachine()
+    vm.exec("function h() return 1, 2 end")
+    assert vm.exec("return 1 and h()") == [LuaNumber(1)]
+
+
+def test_const_locals_are_propagated():
+    source = """
+        local a <const> = 10
+        local b <const>, c <const> = a * 2
+        local function f() return a + b end
+        do local a = 1; return f(), a, c end
+    """
+    chunk = parse_chunk(source, filename="<test>")
+    function = chunk.block.statements[2]
+    value, = function.body.body.return_statement.values
+    assert constant(value) == LuaNumber(30)
+    values = chunk.block.statements[3].block.return_statement.values
+    assert isinstance(values[1], nodes.VarName)
+    assert constant(values[2]) is LuaNil
+    assert VirtualMachine().exec(source) == VirtualMachine(
+        optimize=False
+    ).exec(source)
+
+
+def test_assigning_to_const_locals_is_still_an_error():
+    with pytest.raises(LuaError, match="constant"):
+        VirtualMachine().exec("local x <const> = 1; x = 2")
+
+
+def test_if_chains_over_constants_get_jump_tables():
+    source = """
+        local op = ...
+        if op == "add" then return 1
+        elseif "sub" == op then return 2
+        elseif op == 3 then return 3
+        elseif op == "add" then return 4
+        else return 0 end
+    """
+    statement = parse_chunk(source, filename="<test>").block.statements[1]
+    assert statement.dispatch.arms == {
+        LuaString(b"add"): 0, LuaString(b"sub"): 1, LuaNumber(3): 2,
+    }
+    assert parse_chunk(
+        source, filename="<test>", optimize=False
+    ).block.statements[1].dispatch is None
+
+
+@pytest.mark.parametrize("chain", [
+    # Too few arms.
+    'if x == 1 then elseif x == 2 then end',
+    # Not the same variable.
+    'if x == 1 then elseif y == 2 then elseif x == 3 then end',
+    # Not a constant, or not compared for equality.
+    'if x == 1 then elseif x == y then elseif x == 3 then end',
+    'if x == 1 then elseif x ~= 2 then elseif x == 3 then end',
+    'if x == 1 then elseif x == true then elseif x == 3 then end',
+    'if x == 1 then elseif x == 0/0 then elseif x == 3 then end',
+])
+def test_other_if_chains_dont_get_jump_tables(chain):
+    chunk = parse_chunk(f"local x, y = ...\n{chain}", filename="<test>")
+    assert chunk.block.statements[1].dispatch is None
+    chunk = parse_chunk(
+        "if g == 1 then elseif g == 2 then elseif g == 3 then end",
+        filename="<test>",
+    )
+    assert chunk.block.statements[0].dispatch is None
+
+
+def test_jump_tables_behave_like_comparisons():
+    source = """
+        local function classify(op)
+            if op == "add" then return "a"
+            elseif op == "sub" then return "s"
+            elseif op == 3 then return "3"
+            elseif op == 4.5 then return "4.5"
+            end
+            return "-"
+        end
+        local eq = setmetatable({}, {__eq = function() return true end})
+        local result = ""
+        for _, v in ipairs({"add", "sub", 3, 3.0, 4.5, "3", true, eq}) do
+            result = result .. classify(v)
+        end
+        return result
+    """
+    expected = [LuaString(b"as334.5---")]
+    assert VirtualMachine().exec(source) == expected
+    assert VirtualMachine(optimize=False).exec(source) == expected
+
+
+def inlined(source):
+    chunk = parse_chunk(source, filename="<test>", optimize=False)
+    return [str(call) for call in optimize_chunk(chunk)]
+
+
+def test_calls_of_small_local_functions_are_inlined():
+    source = """
+        local function clamp(x, a, b)
+            return x < a and a or x > b and b or x
+        end
+        local square = function(x) return x * x end
+        local function norm(x) return square(x) + 1 end
+        local function pair(a, b) return a, b end
+        local function first(a) return pair(a, 2) end
+        local sum = 0
+        for i = 1, 10 do sum = sum + clamp(i, 3, 8) + norm(i) end
+        return sum, clamp(20, 0, 10), first(7)
+    """
+    assert inlined(source) == [
+        "<test>:6: inlined call of square (defined on line 5)",
+        "<test>:10: inlined call of clamp (defined on line 2)",
+        "<test>:10: inlined call of norm (defined on line 6)",
+        "<test>:11: inlined call of clamp (defined on line 2)",
+        "<test>:11: inlined call of first (defined on line 8)",
+    ]
+    expected = [LuaNumber(450), LuaNumber(10), LuaNumber(7), LuaNumber(2)]
+    assert VirtualMachine().exec(source) == expected
+    assert VirtualMachine(optimize=False).exec(source) == expected
+    values = returned(source)
+    assert constant(values[1]) == LuaNumber(10)
+
+
+@pytest.mark.parametrize("source", [
+    # Reassigned.
+    "local function f(x) return x end; f = print; local y = f(1)",
+    "local function f(x) return x end; function f(x) return 1 end; "
+    "local y = f(1)",
+    # Recursive.
+    "local function f(x) return x > 0 and f(x - 1) end; local y = f(1)",
+    # Variadic.
+    "local function f(...) return ... end; local y = f(1)",
+    # Not a single return.
+    "local function f(x) x = x + 1; return x end; local y = f(1)",
+    "local function f(x) return x, x end; local y = f(1)",
+    "local function f(x) return function() return x end end; local y = f(1)",
+    # Arguments that could be changed or have side effects.
+    "local function f(x) return x end; local y = f(g())",
+    "local function f(x) return x end; local y = f(z)",
+    "local function f(x) return x end; local a = 1; "
+    "local g = function() a = 2 end; local y = f(a)",
+    # Names that refer to other variables where the call is.
+    "local function f(x) return x + k end; local k = 1; local y = f(1)",
+    # Statements.
+    "local function f(x) return x end; f(1)",
+])
+def test_other_calls_are_not_inlined(source):
+    assert inlined(source) == []
+
+
+def test_functions_redefined_by_function_statements_are_not_inlined():
+    source = """
+        local function f(x) return x + 1 end
+        function f(x) return x * 100 end
+        local a = 3
+        return f(a)
+    """
+    assert inlined(source) == []
+    assert VirtualMachine().exec(source) == [LuaNumber(300)]
+    assert VirtualMachine(optimize=False).exec(source) == [LuaNumber(300)]
+
+
+def test_inlined_calls_call_metamethods_and_raise_errors():
+    source = """
+        local function div(a, b) return a // b end
+        local log = {}
+        local function get(t, k) return t[k] end
+        setmetatable(log, {__index = function(t, k) return k .. "!" end})
+        return get(log, "a"), pcall(function()
+            local zero = 0
+            return div(1, zero)
+        end)
+    """
+    assert len(inlined(source)) == 2
+    result = VirtualMachine().exec(source)
+    assert result[:2] == [LuaString(b"a!"), LuaFalse]
+    assert "'n//0'" in str(result[2])
@@ -1,7 +1,9 @@
 import pytest
 
+from mehtap.control_structures import LuaError
 from mehtap.py2lua import lua_function
-from mehtap.values import LuaString, LuaTable, LuaFunction
+from mehtap.values import LuaString, LuaTable, LuaFunction, LuaNil, LuaNumber
+from mehtap.vm import VirtualMachine
 
 
 def test_invalid_arg_after_variadic():
@@ -66,3 +68,41 @@ def test_unknown_name():
     assert f.name
     assert "native" in f.name
     assert "function" in f.name
+
+
+def test_fastcall_arguments():
+    received = []
+
+    @lua_function(name="f", gets_scope=True, fastcall=True)
+    def f(scope, a, b=LuaNil, /):
+        received.append((a, b))
+        return [a]
+
+    @lua_function(name="g", fastcall=True)
+    def g(a, /, *rest):
+        return [LuaNumber(len(rest))]
+
+    assert f.fastcall and f.min_req == 1
+    vm = VirtualMachine()
+    vm.globals.rawput(LuaString(b"f"), f)
+    vm.globals.rawput(LuaString(b"g"), g)
+    assert vm.exec("return f(1), f(2, 3, 4), g(1, 2, 3), g(1)") == [
+        LuaNumber(1), LuaNumber(2), LuaNumber(2), LuaNumber(0),
+    ]
+    assert received == [(LuaNumber(1), LuaNil), (LuaNumber(2), LuaNumber(3))]
+    with pytest.raises(LuaError) as excinfo:
+        vm.exec("f()")
+    assert "bad argument #1 to 'f' (value expected)" in str(excinfo.value)
+
+
+def test_fastcall_default_must_be_nil():
+    with pytest.raises(ValueError) as excinfo:
+        @lua_function(fastcall=True)
+        def f(a, b=LuaNumber(1), /):
+            return [a]
+
+    assert "isn't nil" in str(excinfo.value)
+    with pytest.raises(ValueError):
+        @lua_function(fastcall=True, wrap_values=True)
+        def g(a, /):
+            return a
@@ -0,0 +1,165 @@
+import pytest
+
+import mehtap.source_compiler
+from mehtap.control_structures import LuaError
+from mehtap.execution import ExecutionEngine
+from mehtap.parser import parse_chunk
+from mehtap.quickening import (
+    MAX_DEOPTIMIZATIONS,
+    THRESHOLD,
+    dump_specializations,
+    specialized_nodes,
+)
+from mehtap.values import LuaNil, LuaNumber, LuaString
+from mehtap.vm import VirtualMachine
+
+
+@pytest.fixture(autouse=True)
+def interpret_functions(monkeypatch):
+    # Keep the bodies of hot functions interpreted, so that their nodes are
+    # evaluated.
+    monkeypatch.setattr(mehtap.source_compiler, "HOT_CALL_COUNT", float("inf"))
+
+
+def run(source):
+    # Keep the calls of small functions, which would be inlined.
+    chunk = parse_chunk(source, filename="<test>", optimize=False)
+    vm = VirtualMachine(engine=ExecutionEngine.TREE_WALKING)
+    return chunk, vm.root_scope._exec_chunk(chunk)
+
+
+def handlers(chunk):
+    return {
+        (node.line, handler): deoptimizations
+        for node, handler, deoptimizations in specialized_nodes(chunk)
+    }
+
+
+def test_nodes_are_specialized_after_the_threshold():
+    chunk, result = run(
+        f"""
+        local t = {{x = 1.5, 10}}
+        local function add(a, b) return a + b end
+        local sum, s = 0, ""
+        for i = 1, {THRESHOLD * 2} do
+            sum = add(sum, i) + t[1] * 0
+            s = t.x < i and s .. "a" or s
+        end
+        return sum, #s
+        """
+    )
+    assert result == [
+        LuaNumber(THRESHOLD * (THRESHOLD * 2 + 1)),
+        LuaNumber(THRESHOLD * 2 - 1),
+    ]
+    assert {handler for _, handler in handlers(chunk)} >= {
+        "int_add",
+        "call_lua_function",
+        "table_array_index",
+        "table_field",
+        "number_lt",
+        "string_concat",
+    }
+    assert "<test>:3: BinaryOperation '+' -> int_add" in (
+        dump_specializations(chunk)
+    )
+
+
+def test_nodes_are_not_specialized_before_the_threshold():
+    chunk, _ = run(f"for i = 1, {THRESHOLD - 1} do local x = i + 1 end")
+    assert specialized_nodes(chunk) == []
+
+
+def test_failed_guards_deoptimize():
+    chunk, result = run(
+        f"""
+        local function add(a, b) return a + b end
+        local results = {{}}
+        for i = 1, {THRESHOLD * 2} do add(i, i) end
+        results[1] = add(1.5, 1)
+        for i = 1, {THRESHOLD * 4} do add(i, i) end
+        local mt = {{__add = function(a, b) return "added" end}}
+        results[2] = add(setmetatable({{}}, mt), 1)
+        return results[1], results[2], add(2, 3)
+        """
+    )
+    assert result == [LuaNumber(2.5), LuaString(b"added"), LuaNumber(5)]
+    assert handlers(chunk)[(2, "adaptive")] == 2
+
+
+def test_nodes_stop_specializing_after_too_many_deoptimizations():
+    loops = "\n".join(
+        f"""
+        for i = 0, {THRESHOLD << n} do add(i, i) end
+        add(0.5, 0.5)
+        """
+        for n in range(MAX_DEOPTIMIZATIONS)
+    )
+    chunk, _ = run(
+        f"""
+        local function add(a, b) return a + b end
+        {loops}
+        """
+    )
+    assert handlers(chunk)[(2, "generic")] == MAX_DEOPTIMIZATIONS
+
+
+def test_specialized_index_respects_metatables():
+    chunk, result = run(
+        f"""
+        local base = {{greeting = "hi"}}
+        local objects = {{}}
+        for i = 1, {THRESHOLD * 2} do
+            objects[i] = setmetatable({{name = i}}, {{__index = base}})
+        end
+        local names, greeting = 0, nil
+        for i = 1, #objects do
+            names = names + objects[i].name
+            greeting = objects[i].greeting
+        end
+        return names, greeting, objects[1].missing, ({{}}).missing
+        """
+    )
+    assert result == [
+        LuaNumber(THRESHOLD * (THRESHOLD * 2 + 1)),
+        LuaString(b"hi"),
+        LuaNil,
+        LuaNil,
+    ]
+    assert (10, "table_field") in handlers(chunk)
+
+
+def test_specialized_calls_adjust_arguments_and_report_errors():
+    chunk, result = run(
+        f"""
+        local Point = {{}}
+        Point.__index = Point
+        function Point:add(dx, dy) return self.x + dx, dy end
+        local p = setmetatable({{x = 0}}, Point)
+        local function first(a) return a end
+        local a, b, c
+        for i = 1, {THRESHOLD * 2} do
+            a = first(i, i + 1)
+            b, c = p:add(i)
+        end
+        return a, b, c
+        """
+    )
+    assert result == [
+        LuaNumber(THRESHOLD * 2), LuaNumber(THRESHOLD * 2), LuaNil
+    ]
+    assert {handler for _, handler in handlers(chunk)} >= {
+        "call_lua_function", "call_lua_method"
+    }
+
+    with pytest.raises(LuaError) as excinfo:
+        run(
+            f"""
+            local function fail(n) if n > {THRESHOLD} then error("x") end end
+            for i = 1, {THRESHOLD * 2} do fail(i) end
+            """
+        )
+    assert any(
+        "call of function fail" in entry
+        for entry in excinfo.value.traceback_messages
+    )
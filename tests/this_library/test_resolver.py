@@ -0,0 +1,154 @@
+import pytest
+
+from mehtap.ast_nodes import FunctionStatement, LocalAssignment
+from mehtap.control_structures import LuaError
+from mehtap.execution import ExecutionEngine
+from mehtap.parser import parse_chunk
+from mehtap.resolver import NameKind, resolve
+from mehtap.scope import Frame, Scope
+from mehtap.values import LuaNil, LuaNumber, LuaString
+from mehtap.vm import VirtualMachine
+
+
+def test_resolve_kinds():
+    chunk = parse_chunk(
+        "local a = 1 "
+        "function f(b) return a, b, c end",
+        filename="t",
+    )
+    resolution = resolve(chunk, export_chunk_locals=False)
+    function = chunk.block.statements[1]
+    assert isinstance(function, FunctionStatement)
+    a, b, c = (
+        resolution.use(value.name)
+        for value in function.body.body.return_statement.values
+    )
+    assert (a.kind, a.depth) == (NameKind.UPVALUE, 1)
+    assert (b.kind, b.index) == (NameKind.LOCAL, 0)
+    assert c.kind is NameKind.GLOBAL
+
+
+def test_annotate():
+    chunk = parse_chunk(
+        "local a = 1 do local b = 2 end "
+        "local function f(x) return a, x, y end",
+        filename="t",
+    )
+    resolve(chunk, export_chunk_locals=False, annotate=True)
+    assert chunk.block.frame_size == 3
+    declaration = chunk.block.statements[0]
+    assert isinstance(declaration, LocalAssignment)
+    assert declaration.names[0].name.slot == 0
+    body = chunk.block.statements[2].body
+    assert body.body.frame_size == 1
+    a, x, y = (value.name for value in body.body.return_statement.values)
+    assert (a.depth, a.slot) == (1, 0)
+    assert (x.depth, x.slot) == (0, 0)
+    assert y.depth == -1
+
+
+def test_blocks_allocate_no_scope(monkeypatch):
+    pushes = []
+    original_push = Scope.push
+
+    def push(self, **kwargs):
+        pushes.append(self)
+        return original_push(self, **kwargs)
+
+    monkeypatch.setattr(Scope, "push", push)
+    vm = VirtualMachine(engine=ExecutionEngine.TREE_WALKING)
+    assert vm.exec(
+        """
+        local n = 0
+        for i = 1, 3 do
+            local j = i * 2
+            while j > 0 do local k = 1; j = j - k; n = n + 1 end
+        end
+        return n
+        """
+    ) == [LuaNumber(12)]
+    assert pushes == []
+
+
+def test_calls_bind_arguments_to_frame_slots(monkeypatch):
+    frames = []
+    original_frame = Scope.frame
+
+    def frame(self, slots, varargs=None):
+        frames.append((list(slots), varargs))
+        return original_frame(self, slots, varargs)
+
+    monkeypatch.setattr(Scope, "frame", frame)
+    vm = VirtualMachine(engine=ExecutionEngine.TREE_WALKING, optimize=False)
+    assert vm.exec(
+        """
+        local function f(a, b) local c = a return c, b end
+        local function g(a, ...) return a, select("#", ...) end
+        local x, y = f(1)
+        local z = f(2, 3, 4)
+        return x, y, z, g(5, 6, 7)
+        """
+    ) == [LuaNumber(1), LuaNil, LuaNumber(2), LuaNumber(5), LuaNumber(2)]
+    assert frames == [
+        ([LuaNumber(1), LuaNil, LuaNil], None),
+        ([LuaNumber(2), LuaNumber(3), LuaNil], None),
+        ([LuaNumber(5)], [LuaNumber(6), LuaNumber(7)]),
+    ]
+    frame = Frame(vm.root_scope, [LuaNumber(1)])
+    assert frame.get_ls(LuaString(b"print")) is vm.globals.rawget(
+        LuaString(b"print")
+    )
+
+
+def test_shadowing():
+    vm = VirtualMachine()
+    assert vm.exec(
+        """
+        local x = 1
+        do local x = 2; x = x + 1 end
+        local y = x
+        local x = 10
+        return y, x
+        """
+    ) == [LuaNumber(1), LuaNumber(10)]
+    assert vm.exec("return z") == [LuaNil]
+
+
+def test_block_locals_do_not_leak():
+    vm = VirtualMachine()
+    vm.exec("do local hidden = 1 end")
+    assert vm.exec("return hidden") == [LuaNil]
+
+
+def test_function_statement_assigns_local():
+    vm = VirtualMachine()
+    assert vm.exec(
+        """
+        do
+            local function f() return 1 end
+            function f() return 2 end
+            g = f
+        end
+        return g(), f
+        """
+    ) == [LuaNumber(2), LuaNil]
+
+
+def test_upvalue_assignment_to_constant():
+    vm = VirtualMachine()
+    with pytest.raises(LuaError) as excinfo:
+        vm.exec(
+            "do local x <const> = 1; local function f() x = 2 end; f() end"
+        )
+    assert "attempt to change constant variable" in str(excinfo.value)
+
+
+def test_generic_for_control_variable():
+    vm = VirtualMachine()
+    assert vm.exec(
+        """
+        local n = 0
+        for i, v in ipairs({1, 2, 3}) do i = 10; n = n + v end
+        return n
+        """
+    ) == [LuaNumber(6)]
@@ -0,0 +1,159 @@
+import pytest
+
+import mehtap.source_compiler
+import mehtap.values
+from mehtap.control_structures import LuaError
+from mehtap.execution import ExecutionEngine
+from mehtap.source_compiler import HOT_CALL_COUNT, python_source
+from mehtap.values import LuaFalse, LuaNil, LuaNumber, LuaString
+from mehtap.vm import VirtualMachine
+
+
+def run(source):
+    # Keep the calls of small functions, which would be inlined.
+    vm = VirtualMachine(engine=ExecutionEngine.TREE_WALKING, optimize=False)
+    return vm.exec(source)
+
+
+@pytest.fixture
+def compile_at_once(monkeypatch):
+    monkeypatch.setattr(mehtap.source_compiler, "HOT_CALL_COUNT", 1)
+
+
+def test_hot_functions_are_compiled():
+    f, before, after = run(
+        f"""
+        local function add(a, b) return a + b end
+        local before, after = 0, 0
+        for i = 1, {HOT_CALL_COUNT - 1} do before = add(before, i) end
+        for i = 1, 10 do after = add(after, i) end
+        return add, before, after
+        """
+    )
+    assert f.block.compiled
+    assert f.call_count == HOT_CALL_COUNT
+    assert before == LuaNumber(HOT_CALL_COUNT * (HOT_CALL_COUNT - 1) // 2)
+    assert after == LuaNumber(55)
+    source = python_source(f)
+    assert "def lua_add(function, args):" in source
+    assert "a_0 = args[0]" in source
+    assert "return [arith_add(a_0, b_1)]" in source
+
+
+def test_calls_are_counted_without_importing():
+    run("local function f() end f()")
+    # The first interpreted call binds count_call for the later ones.
+    assert mehtap.values._count_call is mehtap.source_compiler.count_call
+
+
+@pytest.mark.parametrize("function", [
+    "function(n) goto skip; n = 0; ::skip:: return n end",
+    "function(...) return ... end",
+    "function(n) return (function() return n end)() end",
+    "function(n) local x <close> = nil return n end",
+])
+def test_unsupported_functions_stay_interpreted(compile_at_once, function):
+    f, result = run(
+        f"""
+        local f = {function}
+        return f, f(7)
+        """
+    )
+    assert f.block.compiled is False
+    assert python_source(f) is None
+    assert result == LuaNumber(7)
+
+
+def test_compiled_code_behaves_like_interpreted_code(compile_at_once):
+    assert run(
+        """
+        local log = {}
+        local count = 0
+        local mt = {__index = function(t, k) return k .. "!" end}
+        local function f(a, b, c)
+            local x, y, z = a, b
+            x, y = y, x
+            count = count + 1
+            total = (total or 0) + 1
+            local t = setmetatable({a, b, n = 3, c}, mt)
+            for k, v in pairs({10, 20, 30}) do log[#log + 1] = k * v end
+            for i = 1.5, 3 do log[#log + 1] = i end
+            for i = 3, 1, -1 do log[#log + 1] = i end
+            local n = 0
+            repeat local m = n; n = n + 1 until m >= 2
+            while n > 0 do n = n - 1; if n == 1 then break end end
+            return x, y, z, #t, t.missing, n, not a, a and b or c
+        end
+        local r = {f(1, 2)}
+        return r[1], r[2], r[3], r[4], r[5], r[6], r[7], r[8],
+            count, total, #log, log[4], log[6]
+        """
+    ) == [
+        LuaNumber(2), LuaNumber(1), LuaNil, LuaNumber(2),
+        LuaString(b"missing!"), LuaNumber(1), LuaFalse,
+        LuaNumber(2), LuaNumber(1), LuaNumber(1), LuaNumber(8),
+        LuaNumber(1.5), LuaNumber(3),
+    ]
+
+
+def test_compiled_calls_adjust_values_and_report_errors(compile_at_once):
+    assert run(
+        """
+        local function pair(a, b) return a, b end
+        local function first(a) return a end
+        local x, y, z = pair(pair(1, 2))
+        return first(pair(3, 4)), x, y, z, select("#", pair())
+        """
+    ) == [
+        LuaNumber(3), LuaNumber(1), LuaNumber(2), LuaNil, LuaNumber(2)
+    ]
+    with pytest.raises(LuaError) as excinfo:
+        run(
+            """
+            local function fail(n) error("failed " .. n) end
+            local function outer(n) return fail(n) end
+            outer(1)
+            """
+        )
+    assert "failed 1" in str(excinfo.value)
+    assert any(
+        "call of function fail" in entry
+        for entry in excinfo.value.traceback_messages
+    )
+
+
+def test_gotos_to_the_end_of_loops_are_compiled(compile_at_once):
+    f, result = run(
+        """
+        local function odd_sum(n)
+            local sum = 0
+            for i = 1, n do
+                if i % 2 == 0 then goto continue end
+                sum = sum + i
+                ::continue::
+            end
+            return sum
+        end
+        return odd_sum, odd_sum(10)
+        """
+    )
+    assert f.block.compiled
+    assert "continue" in python_source(f)
+    assert result == LuaNumber(25)
+
+
+def test_jump_tables_are_compiled(compile_at_once):
+    vm = VirtualMachine(engine=ExecutionEngine.TREE_WALKING)
+    f, a, b = vm.exec(
+        """
+        local function classify(op)
+            if op == "a" then return 1
+            elseif op == "b" then return 2
+            elseif op == "c" then return 3
+            else return 0 end
+        end
+        return classify, classify("c"), classify(false)
+        """
+    )
+    assert "_arm = _dispatch(op_0, " in python_source(f)
+    assert (a, b) == (LuaNumber(3), LuaNumber(0))
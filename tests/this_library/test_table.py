@@ -0,0 +1,356 @@
+import pytest
+
+import mehtap.values
+from mehtap.control_structures import LuaError
+from mehtap.values import (
+    LuaTable, LuaNumber, LuaString, LuaNil, LuaBool, TableShape,
+)
+from mehtap.vm import VirtualMachine
+
+
+def n(x):
+    return LuaNumber(x)
+
+
+def test_sequence_uses_array_part():
+    table = LuaTable()
+    for i in range(1, 6):
+        table.rawput(n(i), n(i * 10))
+    assert table.array == [n(10), n(20), n(30), n(40), n(50)]
+    assert table._map == {}
+    assert table.rawget(n(3)) == n(30)
+    assert table.rawget(LuaNumber(3.0)) == n(30)
+    assert table.border() == 5
+
+
+def test_keys_migrate_to_array_part():
+    table = LuaTable()
+    table.rawput(n(3), n(30))
+    table.rawput(n(2), n(20))
+    assert table.array == []
+    table.rawput(n(1), n(10))
+    assert table.array == [n(10), n(20), n(30)]
+    assert table._map == {}
+
+
+def test_constructor_map_migrates():
+    table = LuaTable({n(2): n(20), LuaString(b"x"): n(0), n(1): n(10)})
+    assert table.array == [n(10), n(20)]
+    assert list(table._map) == [b"x"]
+
+
+def test_float_keys_are_normalized():
+    table = LuaTable()
+    table.rawput(LuaNumber(1.0), n(10))
+    assert table.array == [n(10)]
+    table.rawput(LuaNumber(1.5), n(15))
+    assert table.rawget(LuaNumber(1.5)) == n(15)
+    with pytest.raises(LuaError) as excinfo:
+        table.rawput(LuaNumber(float("nan")), n(0))
+    assert "table index is NaN" in str(excinfo.value)
+
+
+def test_border_with_holes():
+    table = LuaTable()
+    for i in range(1, 9):
+        table.rawput(n(i), n(i))
+    table.rawput(n(8), LuaNil)
+    table.rawput(n(7), LuaNil)
+    border = table.border()
+    assert table.has(n(border))
+    assert not table.has(n(border + 1))
+    for i in range(1, 9):
+        table.rawput(n(i), LuaNil)
+    assert table.border() == 0
+
+
+def test_items_skip_nil_values():
+    table = LuaTable()
+    table.rawput(n(1), n(10))
+    table.rawput(n(2), n(20))
+    table.rawput(LuaString(b"a"), n(0))
+    table.rawput(n(1), LuaNil)
+    assert list(table.items()) == [(n(2), n(20)), (LuaString(b"a"), n(0))]
+
+
+def test_array_insert_and_remove():
+    table = LuaTable(array=[n(1), n(3), n(4)])
+    table.array_insert(2, n(2))
+    assert table.array == [n(1), n(2), n(3), n(4)]
+    assert table.array_remove(1) == n(1)
+    assert table.array[:table.border()] == [n(2), n(3), n(4)]
+
+
+def test_next_traverses_array_then_hash():
+    vm = VirtualMachine()
+    assert vm.exec(
+        """
+        local t = {10, 20, 30, x = 1}
+        t[2] = nil
+        local keys = {}
+        for k in pairs(t) do keys[#keys + 1] = tostring(k) end
+        return table.concat(keys, ",")
+        """
+    ) == [LuaString(b"1,3,x")]
+
+
+def test_clear_during_traversal():
+    vm = VirtualMachine()
+    assert vm.exec(
+        """
+        local t = {1, 2, 3, a = 4, b = 5}
+        local n = 0
+        for k, v in pairs(t) do t[k] = nil; n = n + v end
+        return n, next(t)
+        """
+    ) == [n(15), LuaNil]
+
+
+def test_table_library_on_array_part():
+    vm = VirtualMachine()
+    assert vm.exec(
+        """
+        local t = {5, 3, 1}
+        table.insert(t, 4)
+        table.insert(t, 1, 2)
+        table.sort(t)
+        local removed = table.remove(t, 1)
+        table.move(t, 1, 2, 3)
+        return removed, table.concat(t, " "), #t, table.unpack(t, 2, 3)
+        """
+    ) == [n(1), LuaString(b"2 3 2 3"), n(4), n(3), n(2)]
+
+
+def test_table_library_respects_metamethods():
+    vm = VirtualMachine()
+    assert vm.exec(
+        """
+        local log = {}
+        local t = setmetatable({}, {
+            __index = function(_, k) return k * 10 end,
+            __newindex = function(t, k, v) log[#log + 1] = k; rawset(t, k, v) end,
+        })
+        table.insert(t, 1)
+        return t[1], t[2], table.concat(log, ","), table.unpack(t, 2, 3)
+        """
+    ) == [n(1), n(20), LuaString(b"1"), n(20), n(30)]
+
+
+def test_next_follows_insertion_order():
+    table = LuaTable()
+    keys = [LuaString(x.encode()) for x in "qwertyuiopasdfghjkl"]
+    for i, key in enumerate(keys):
+        table.rawput(key, n(i))
+    table.rawput(n(1), n(100))
+    traversed = []
+    pair = table.next(LuaNil)
+    while pair is not None:
+        traversed.append(pair[0])
+        pair = table.next(pair[0])
+    assert traversed == [n(1), *keys]
+    assert table.next(LuaString(b"missing")) is None
+
+
+def test_key_index_is_compacted_when_adding_keys():
+    table = LuaTable()
+    for i in range(100):
+        table.rawput(LuaString(b"k%d" % i), n(i))
+        table.rawput(LuaString(b"k%d" % i), LuaNil)
+    assert len(table._map) < 20
+    table.rawput(LuaString(b"last"), n(1))
+    assert list(table.items()) == [(LuaString(b"last"), n(1))]
+
+
+def test_generic_for_uses_native_iterators(monkeypatch):
+    from mehtap.library.stdlib import basic_library
+
+    monkeypatch.setattr(
+        basic_library.lf_next, "block",
+        lambda *args: pytest.fail("next was called"),
+    )
+    vm = VirtualMachine()
+    assert vm.exec(
+        """
+        local t = {10, 20, 30, x = 40}
+        local sum = 0
+        for k, v in pairs(t) do sum = sum + v end
+        for i, v in ipairs(t) do sum = sum + i end
+        for k, v in next, t do t[k] = nil end
+        return sum, t[1], t.x
+        """
+    ) == [n(106), LuaNil, LuaNil]
+
+
+def test_generic_for_calls_replaced_next():
+    vm = VirtualMachine()
+    assert vm.exec(
+        """
+        local calls = 0
+        local function my_next(t, k) calls = calls + 1; return next(t, k) end
+        for k in my_next, {1, 2} do end
+        local t = setmetatable({}, {__pairs = function(t)
+            return function(_, k) if not k then return 1, 2 end end, t, nil
+        end})
+        local pairs_result
+        for k, v in pairs(t) do pairs_result = v end
+        return calls, pairs_result
+        """
+    ) == [n(3), n(2)]
+
+
+def test_keys_are_stored_unboxed():
+    table = LuaTable()
+    table.rawput(LuaString(b"a"), n(1))
+    table.rawput(LuaNumber(2.5), n(2))
+    table.rawput(n(-3), n(3))
+    table.rawput(LuaBool(True), n(4))
+    assert list(table._map) == [b"a", 2.5, -3, LuaBool(True)]
+    assert table.rawget(LuaString(b"a")) == n(1)
+    assert table.rawget(LuaNumber(-3.0)) == n(3)
+    assert table.rawget(LuaBool(True)) == n(4)
+    assert list(table.items()) == [
+        (LuaString(b"a"), n(1)),
+        (LuaNumber(2.5), n(2)),
+        (n(-3), n(3)),
+        (LuaBool(True), n(4)),
+    ]
+
+
+def test_booleans_do_not_collide_with_numbers():
+    vm = VirtualMachine()
+    assert vm.exec(
+        """
+        local t = {[0] = "zero", [false] = "false", [true] = "true"}
+        t[1] = nil
+        local after_zero = next(t, 0)
+        return t[0], t[false], t[true], after_zero, next(t, false)
+        """
+    ) == [
+        LuaString(b"zero"), LuaString(b"false"), LuaString(b"true"),
+        LuaBool(False), LuaBool(True), LuaString(b"true"),
+    ]
+
+
+def test_records_share_shapes():
+    vm = VirtualMachine()
+    a, b, c = vm.exec(
+        """
+        local function point(x, y) return {x = x, y = y} end
+        local c = {}
+        c.x = 5
+        c.y = 6
+        return point(1, 2), point(3, 4), c
+        """
+    )
+    assert a.shape is b.shape is c.shape
+    assert a.shape.keys == (b"x", b"y")
+    assert not a._map
+    assert b.rawget(LuaString(b"y")) == n(4)
+    assert list(c.items()) == [(LuaString(b"x"), n(5)), (LuaString(b"y"), n(6))]
+    assert vm.exec("return {y = 1, x = 2}")[0].shape is not a.shape
+
+
+def test_shaped_fields_can_be_cleared_and_set_again():
+    table = LuaTable()
+    for key in (b"a", b"b", b"c"):
+        table.rawput(LuaString(key), n(1))
+    shape = table.shape
+    table.rawput(LuaString(b"b"), LuaNil)
+    assert table.next(LuaString(b"a")) == (LuaString(b"c"), n(1))
+    table.rawput(LuaString(b"b"), n(2))
+    assert table.shape is shape
+    assert table.rawget(LuaString(b"b")) == n(2)
+
+
+def test_other_keys_move_fields_to_map():
+    table = LuaTable()
+    table.rawput(n(1), n(10))
+    table.rawput(LuaString(b"a"), n(1))
+    table.rawput(LuaString(b"b"), n(2))
+    assert table.shape is not None
+    table.rawput(LuaBool(True), n(3))
+    assert table.shape is None
+    assert list(table._map) == [b"a", b"b", LuaBool(True)]
+    assert list(table.items()) == [
+        (n(1), n(10)),
+        (LuaString(b"a"), n(1)),
+        (LuaString(b"b"), n(2)),
+        (LuaBool(True), n(3)),
+    ]
+    assert table.next(LuaString(b"b")) == (LuaBool(True), n(3))
+
+
+def test_many_fields_move_to_map():
+    table = LuaTable()
+    for i in range(100):
+        table.rawput(LuaString(b"field%d" % i), n(i))
+    assert table.shape is None
+    assert table.rawget(LuaString(b"field99")) == n(99)
+    assert len(list(table.items())) == 100
+
+
+def count_shapes(shape):
+    return 1 + sum(count_shapes(s) for s in shape._transitions.values())
+
+
+def test_number_of_shapes_is_bounded(monkeypatch):
+    monkeypatch.setattr(mehtap.values, "_shape_count", 1)
+    monkeypatch.setattr(mehtap.values, "MAX_SHAPES", 100)
+    root = TableShape()
+    for i in range(64):
+        for j in range(64):
+            shape = root.add(b"a%d" % i)
+            if shape is not None:
+                shape.add(b"b%d" % j)
+    # 1 + 64 + 64 * 64 shapes without the budget.
+    assert count_shapes(root) == 100
+    assert root.add(b"c") is None
+
+
+def test_tables_past_the_shape_budget_use_map(monkeypatch):
+    monkeypatch.setattr(
+        mehtap.values, "MAX_SHAPES", mehtap.values._shape_count
+    )
+    table = LuaTable()
+    table.rawput(LuaString(b"past the shape budget"), n(1))
+    table.rawput(LuaString(b"b"), n(2))
+    assert table.shape is None
+    assert table.rawget(LuaString(b"b")) == n(2)
+    assert len(list(table.items())) == 2
+
+
+def test_field_reads_follow_shape_changes():
+    vm = VirtualMachine()
+    assert vm.exec(
+        """
+        local function get_x(t) return t.x end
+        local tables = {
+            {x = 1, y = 2}, {y = 3, x = 4}, {x = 5, [true] = 6},
+            setmetatable({}, {__index = {x = 7}}), {x = 8},
+        }
+        local sum = 0
+        for i = 1, 20 do
+            for _, t in ipairs(tables) do sum = sum + get_x(t) end
+        end
+        tables[1].x = nil
+        tables[2].x = 10
+        return sum, get_x(tables[1]), get_x(tables[2])
+        """
+    ) == [n(500), LuaNil, n(10)]
+
+
+def test_map_is_a_view_with_lua_keys():
+    table = LuaTable({LuaString(b"a"): n(1), n(1): n(10), LuaNumber(2.5): n(2)})
+    assert table.map == {
+        n(1): n(10), LuaString(b"a"): n(1), LuaNumber(2.5): n(2)
+    }
+    assert table.map[LuaString(b"a")] == n(1)
+    assert n(3) not in table.map
+    table.map[n(2)] = n(20)
+    assert table.array == [n(10), n(20)]
+    del table.map[LuaString(b"a")]
+    assert table.rawget(LuaString(b"a")) is LuaNil
+    with pytest.raises(KeyError):
+        del table.map[LuaString(b"a")]
+    assert list(table.map) == [n(1), n(2), LuaNumber(2.5)]
+    assert len(table.map) == 3
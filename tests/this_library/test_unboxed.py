@@ -0,0 +1,110 @@
+import pytest
+
+from mehtap.execution import ExecutionEngine
+from mehtap.py2lua import lua_function, PyLuaRet
+from mehtap.unboxed_compiler import UnboxedFunction, box, unbox
+from mehtap.values import (
+    LuaBool,
+    LuaNil,
+    LuaNumber,
+    LuaNumberType,
+    LuaString,
+    LuaTable,
+    Variable,
+)
+from mehtap.vm import VirtualMachine
+
+
+def unboxed_vm():
+    return VirtualMachine(engine=ExecutionEngine.UNBOXED)
+
+
+@pytest.mark.parametrize("value", [
+    LuaNumber(3),
+    LuaNumber(-2.5),
+    LuaBool(True),
+    LuaBool(False),
+    LuaNil,
+    LuaString(b"x"),
+])
+def test_box_unbox_round_trip(value):
+    boxed = box(unbox(value))
+    assert boxed == value
+    assert type(boxed) is type(value)
+    if isinstance(value, LuaNumber):
+        assert boxed.type is value.type
+
+
+def test_numbers_and_booleans_are_unboxed():
+    assert unbox(LuaNumber(3)) == 3 and type(unbox(LuaNumber(3))) is int
+    assert type(unbox(LuaNumber(3.0))) is float
+    assert unbox(LuaBool(False)) is False
+    assert box(1).type is LuaNumberType.INTEGER
+    assert box(1.0).type is LuaNumberType.FLOAT
+    assert box(True) == LuaBool(True)
+
+
+def test_functions_box_values_at_the_boundary():
+    vm = unboxed_vm()
+    function, = vm.exec("return function(a, b) return a + b, a < b end")
+    assert isinstance(function, UnboxedFunction)
+    assert function.rawcall([LuaNumber(1), LuaNumber(2.5)], None) == [
+        LuaNumber(3.5), LuaBool(True)
+    ]
+
+
+def test_native_functions_receive_lua_values():
+    vm = unboxed_vm()
+    received = []
+
+    @lua_function
+    def record(*args) -> PyLuaRet:
+        received.extend(args)
+        return [LuaNumber(10), LuaBool(False)]
+
+    vm.put_nonlocal_ls(LuaString(b"record"), Variable(record))
+    assert vm.exec(
+        """
+        local n, b = record(1, 2.0, true, nil, "s")
+        return n + 1, not b
+        """
+    ) == [LuaNumber(11), LuaBool(True)]
+    assert received == [
+        LuaNumber(1), LuaNumber(2.0), LuaBool(True), LuaNil, LuaString(b"s")
+    ]
+    assert [type(v) for v in received[:3]] == [LuaNumber, LuaNumber, LuaBool]
+
+
+def test_tables_and_globals_hold_lua_values():
+    vm = unboxed_vm()
+    vm.exec("t = {1, 2.5, true, x = false}; n = 7; local m = 8")
+    table = vm.get_ls(LuaString(b"t"))
+    assert isinstance(table, LuaTable)
+    assert [type(v) for _, v in table.items()] == [
+        LuaNumber, LuaNumber, LuaBool, LuaBool
+    ]
+    assert type(vm.get_ls(LuaString(b"n"))) is LuaNumber
+    assert type(vm.get_ls(LuaString(b"m"))) is LuaNumber
+    assert vm.exec("return m + n, t[2] * 2, t.x == false") == [
+        LuaNumber(15), LuaNumber(5.0), LuaBool(True)
+    ]
+
+
+@pytest.mark.parametrize("source", [
+    "return 9223372036854775807 + 1, -9223372036854775807 * 3",
+    "return -7 // 2, -7 % 3, 1 / 0, 0/0 ~= 0/0, 2 ^ 10, 3 & 5, ~0",
+    "return 1 == 1.0, -0.0 == 0, 1 == '1', true == 1, 'a' .. 1 .. 2.5",
+    "return 'a' < 'b', 2 <= 2.0, #'abc', #{1, 2}, not nil, not 0",
+    """
+    local mt = {__add = function(a, b) return "added" end,
+                __lt = function(a, b) return true end}
+    local o = setmetatable({}, mt)
+    return o + 1, 1 + o, o < o, o == o
+    """,
+])
+def test_results_match_boxed_engine(source):
+    boxed = VirtualMachine(engine=ExecutionEngine.CLOSURES).exec(source)
+    unboxed = unboxed_vm().exec(source)
+    assert [(type(v), str(v)) for v in unboxed] == [
+        (type(v), str(v)) for v in boxed
+    ]